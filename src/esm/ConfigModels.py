@@ -36,16 +36,66 @@ class ConfigServer(BaseModel):
     sendExitInterval: int = Field(5, description="how many seconds to wait before retrying to send another 'saveandexit' to the server to stop it")
 
 class ConfigRamdisk(BaseModel):
-    drive: str = Field("R:", pattern=r"[A-Z]\:", description="the drive letter to use for the ramdisk, e.g. 'R:'")
+    drive: str = Field("R:", pattern=r"^([A-Z]\:|/.+)$", description="the drive letter to use for the ramdisk on windows, e.g. 'R:', or the directory to mount it on for the tmpfs backend, e.g. '/mnt/esm-ramdisk'")
+    backend: str = Field("auto", pattern=r"^(auto|osfmount|tmpfs)$", description="how to mount the ramdisk. 'osfmount' mounts a drive with osfmount (windows), 'tmpfs' mounts a tmpfs on the drive directory (linux), 'auto' picks the one that fits the platform")
+    tmpfsHugePages: str = Field("never", pattern=r"^(never|always|within_size|advise)$", description="tmpfs backend only: the huge pages policy of the tmpfs, see the 'huge' mount option of tmpfs. 'within_size' can speed up large files like the database")
+    tmpfsPremounted: bool = Field(False, description="tmpfs backend only: if True, the drive directory is a tmpfs mounted by someone else (e.g. via fstab), esm will use it but never mount or unmount it. Use this to run esm without root privileges")
     size: str = Field("2G", pattern=FILESIZEPATTERN, description="ramdisk size to use, e.g. '5G' or '32G', etc. If you change this, the ramdisk needs to be re-mounted, and the setup needs to run again.")
-    synchronizeRamToMirrorInterval: int = Field(3600, description="interval in seconds at which to do a ram2hdd sync for the savegame. if interval=0 the sync will be disabled! Recommended to leave at 3600 (1h)")
+    synchronizeRamToMirrorInterval: int = Field(3600, description="maximum amount of seconds the mirror may get behind the ramdisk, the ram2hdd sync for the savegame runs at least at this interval. if interval=0 the sync will be disabled! Recommended to leave at 3600 (1h)")
+    synchronizeMinInterval: int = Field(300, ge=0, description="native synchronizer only: minimum amount of seconds between two syncs triggered by the change volume or a save event")
+    synchronizeChangeThreshold: int = Field(500, ge=0, description="native synchronizer with a notifying change tracker only: sync as soon as this many folders changed on the ramdisk. Set to 0 to disable")
+    synchronizeOnSave: bool = Field(False, description="native synchronizer only: if True, the dedicated server log is followed and a sync is done when the game saved")
+    synchronizeSaveEventPattern: str = Field(r"(?i)\bsav(e|ed|ing) ?game\b", description="regular expression matching the lines of the dedicated server log that tell that the game saved")
+    synchronizeSaveEventDelay: int = Field(15, ge=0, description="amount of seconds to wait after a save event before syncing, so the game can finish writing")
+    synchronizeDeferForJobs: bool = Field(True, description="if True, syncs are deferred while io heavy jobs like backups are running in any esm process")
+    synchronizer: str = Field("robocopy", pattern=r"^(robocopy|native)$", description="the synchronizer used for the syncs between ramdisk and mirror. 'robocopy' mirrors the whole savegame with robocopy, 'native' uses esm's own incremental sync, which keeps a manifest of the last synced state so only the ramdisk needs to be scanned.")
+    synchronizerThreads: int = Field(8, gt=0, description="amount of threads the native synchronizer uses to copy files")
+    synchronizerBandwidth: Optional[str] = Field(None, pattern=FILESIZEPATTERN, description="native synchronizer only: maximum amount of bytes per second the ram to mirror sync may copy while the server is running, e.g. '50M'. Leave empty for no limit")
+    synchronizerFilesPerSecond: int = Field(0, ge=0, description="native synchronizer only: maximum amount of files per second the ram to mirror sync may copy or delete while the server is running. Set to 0 for no limit")
+    synchronizerLowPriority: bool = Field(True, description="native synchronizer only: if True, the ram to mirror sync lowers the cpu and io priority of its threads while the server is running, so it interferes less with the game")
+    captureDatabase: bool = Field(True, description="if True, the ram to mirror sync captures the database with the sqlite backup api, so the mirror (and the backups made from it) always get a consistent database, even if the game is writing to it")
+    captureDatabasePagesPerStep: int = Field(1024, gt=0, description="amount of database pages to capture in one step, the game can write to the database between the steps")
+    captureDatabaseQuickCheckProbability: float = Field(0.1, ge=0, le=1, description="probability for checking the captured database with PRAGMA quick_check, which takes a while for big databases. 1 checks every capture")
+    changeTracker: str = Field("auto", pattern=r"^(auto|polling|none)$", description="native synchronizer only: how to find out what changed since the last sync, so only the changed folders need to be scanned. 'auto' uses the file system notifications of the os (ReadDirectoryChangesW on windows, inotify on linux), 'polling' compares the modification times of the folders (which misses changes to existing files), 'none' always scans the whole savegame")
+    changeTrackerFullScanInterval: int = Field(24, ge=0, description="native synchronizer only: every n-th sync scans the whole savegame regardless of the change tracker, in case it missed something. Set to 0 to disable")
+    prioritizedRestore: bool = Field(False, description="if True, the ramdisk setup restores the mirror with esm's own synchronizer on multiple threads, copying the database and the most recently visited playfields first. If False, the configured synchronizer is used")
+    restoreHotPlayfields: int = Field(100, ge=0, description="amount of most recently visited playfields that the prioritized restore copies right after the database")
+    mirrorFormat: str = Field("plain", pattern=r"^(plain|packed)$", description="'plain' keeps the mirror as normal folder tree. 'packed' stores the ram to mirror syncs in a few large pack files plus an index, which avoids the overhead of millions of small files on a hdd. The ramdisk setup unpacks it again, rolling backups unpack it into a normal savegame tree. Use the tool-unpack-mirror command to get a normal folder tree from it")
+    packedMirrorPackSize: str = Field("1G", pattern=FILESIZEPATTERN, description="packed mirror only: size at which a new pack file is started")
+    packedMirrorCompactionThreshold: float = Field(0.5, gt=0, le=1, description="packed mirror only: packs whose share of outdated content reaches this are compacted after a sync")
+    capacityMonitorInterval: int = Field(300, ge=0, description="interval in seconds at which the usage of the ramdisk is sampled while the server is running, to warn before it is full. Set to 0 to disable")
+    capacityFitWindow: int = Field(21600, gt=0, description="the growth rate of the ramdisk usage is fitted over the samples of this many seconds")
+    capacityWarningHours: List[float] = Field([24, 6, 1], description="warn when the ramdisk will be full within this many hours at the current growth. The warning for the last threshold is an alert")
+    capacityWarningUsage: float = Field(0.9, gt=0, le=1, description="warn (as alert) when the ramdisk usage reaches this share of its size")
+    capacityAnnounce: bool = Field(True, description="if True, the capacity warnings are also announced in game, not only logged")
+    capacityFullScanInterval: int = Field(12, ge=0, description="the folders on the ramdisk are sized incrementally, only looking at folders that changed. Every n-th sample sizes them all, to notice files that just grew. Set to 0 to never do that")
+    capacityHistoryFile: Path = Field(".esm-ramdisk-capacity.tsv", description="file for the history of the ramdisk usage, relative to the esm directory")
+    capacityHistorySamples: int = Field(4000, ge=10, description="maximum amount of samples in the history, older samples are thinned out when it is reached")
+    tiering: bool = Field(False, description="if True, playfields that have not been visited for a while are moved from the ramdisk to a cold tier on the hdd and linked back, so they don't use up ramdisk space. This is done after the server shut down. Playfields that get visited again are moved back to the ramdisk.")
+    tieringColdAfterDays: int = Field(14, gt=0, description="playfields that have not been visited for this many days (measured from the last server stop) are considered cold and will be moved to the cold tier")
 
 class ConfigBackups(BaseModel):
     amount: int = Field(4, description="amount of rolling mirror backups to keep")
     marker: str = Field("esm_this_is_the_latest_backup", description="filename used for the marker that marks as backup as being the latest")
+    staticBackupArchiver: str = Field("peazip", pattern=r"^(peazip|builtin)$", description="'peazip' creates the static backups with PeaZip and the staticBackupPeaZipOptions. 'builtin' uses esm's own multithreaded zip archiver, which needs nothing installed and reports throughput and compression ratio")
     staticBackupPeaZipOptions: str = Field("a -tzip -mtp=0 -mm=Deflate64 -mmt=on -mx1 -mfb=32 -mpass=1 -sccUTF-8 -mcu=on -mem=AES256 -bb0 -bse0 -bsp2", description="make sure to use the fastest compression options")
+    staticBackupThreads: int = Field(8, gt=0, description="builtin archiver only: amount of threads compressing files at the same time")
+    staticBackupCompressionLevel: int = Field(1, ge=0, le=9, description="builtin archiver only: deflate compression level, 1 is the fastest, 9 the smallest, 0 stores everything uncompressed")
+    staticBackupStoredExtensions: List[str] = Field([".zip", ".7z", ".rar", ".gz", ".zst", ".png", ".jpg", ".jpeg", ".ogg", ".mp3", ".mp4"], description="builtin archiver only: files with these extensions are compressed already and stored as they are. Files that don't get smaller are stored too")
+    staticBackupVolumes: bool = Field(False, description="builtin archiver only: if True, every top level folder of the backup gets its own zip volume named like the static backup with the folder name appended, all volumes are written at the same time")
+    staticBackupDifferential: bool = Field(False, description="if True, a static backup only contains the files that are new or changed since the previous static backup, plus a manifest and a list of the deleted files. These are always created with the builtin archiver. Use the backup-static-restore command to restore them")
+    staticBackupFullEvery: int = Field(7, gt=0, description="with differential static backups, a full static backup is created again after this many differential ones, so the chain of zips needed for a restore stays short")
+    verifyThreads: int = Field(4, gt=0, description="amount of threads hashing files when creating the manifest of a rolling backup or verifying a backup")
+    verifyBandwidth: Optional[str] = Field(None, pattern=FILESIZEPATTERN, description="maximum amount of bytes per second the backup-verify command may read, e.g. '100M', so it can run next to the game. Leave empty for no limit")
     minDiskSpaceForStaticBackup: str = Field("2G", pattern=FILESIZEPATTERN, description="if disk space on the drive with the backups has less free space than this, do not create a backup. gnu notation")
     additionalBackupPaths: List[str] = Field([], description="list of full paths to source files or directories to backup additionally. Those will all end up in the folder 'Additional' in the backup")
+    deduplicate: bool = Field(False, description="if True, every rolling backup is built from the previous one: unchanged files are hardlinked to it and only changed files are copied, so the time and disk space a backup needs scale with the amount of changes instead of the savegame size. Requires a file system with hardlinks, like ntfs")
+    deduplicateThreads: int = Field(8, gt=0, description="amount of threads used to link and copy the files of a deduplicated backup")
+    parallelSteps: int = Field(4, gt=0, description="the savegame, tool data, game config and every additional path are backed up as separate steps, this many of them run at the same time. Set to 1 to run them one after another")
+    replicationTarget: Optional[str] = Field(None, description="path of a secondary folder, e.g. on another disk or a mounted network share, that gets a copy of the latest rolling backup with backup-replicate. Only changed files are transferred, interrupted transfers are resumed. Leave empty to disable")
+    replicationBandwidth: Optional[str] = Field(None, pattern=FILESIZEPATTERN, description="maximum amount of bytes per second the replication may transfer, e.g. '10M', so it does not take the whole uplink or disk. Leave empty for no limit")
+    replicationThreads: int = Field(2, gt=0, description="amount of files the replication transfers at the same time")
+    replicateAfterBackup: bool = Field(False, description="if True, backup-create also replicates the new backup to the replication target, which may take long when a lot changed. The backup is complete before that, a failed replication is reported on its own. Otherwise schedule backup-replicate separately")
 
 class FileOps(BaseModel):
     """ represents a file operation for the update-command with file path patterns for src and dst """
@@ -65,6 +115,27 @@ class ConfigDeletes(BaseModel):
     backupEahLogs: bool = Field(True, description="backup all eah logs on deleteall command?")
     backupEsmLogs: bool = Field(True, description="backup all esm logs on deleteall command?")
     additionalDeletes: List[str] = Field([], description="additional paths of stuff to delete when using the 'deleteall' command")
+    useTrash: bool = Field(False, description="if True, deleted stuff will just be moved into a trash folder on the same drive, which is almost instant. The trash is emptied by a background reclaimer while the server is running or with the tool-empty-trash command.")
+    purgeJournalBatchSize: int = Field(1000, gt=0, description="purge operations write a journal of what they delete, so they can be resumed with --resume if interrupted. This is the amount of journal entries written to disk at once")
+    trashReclaimRate: int = Field(2000, description="max amount of files and folders per second the background reclaimer deletes from the trash, to not slow down the running server. 0 means unlimited")
+    trashReclaimBandwidth: Optional[str] = Field("100M", pattern=FILESIZEPATTERN, description="max amount of bytes per second the background reclaimer deletes from the trash, so deleting many large files does not slow down the running server either. Leave empty for no limit")
+    cacheBudget: Optional[str] = Field(None, pattern=FILESIZEPATTERN, description="maximum size of the game's cache for the tool-prune-cache command, e.g. '50G'. The least recently used cache entries are evicted until the cache fits. Leave empty for no size limit")
+    cacheMaxAgeDays: Optional[int] = Field(None, gt=0, description="cache entries that were not used for this many days are evicted by the tool-prune-cache command. Leave empty for no age limit")
+    cacheProtectedHours: int = Field(24, ge=0, description="cache entries used within this many hours are never evicted, so the cache can be pruned while the server is running")
+    cacheEntryDepth: int = Field(1, ge=1, description="depth of the cache entries below the game's cache folder that are evicted as a whole, 1 means every folder directly in it")
+    cachePruneThreads: int = Field(8, gt=0, description="amount of threads scanning the cache entries at the same time")
+    cachePruneBatchFiles: int = Field(10000, gt=0, description="when pruning the cache, the io lease is released after deleting this many files, so backups and syncs waiting for it can run in between")
+    cachePruneRate: int = Field(2000, ge=0, description="max amount of files per second deleted when pruning the cache, to not slow down the running server. 0 means unlimited")
+
+class ConfigIo(BaseModel):
+    """
+    Io heavy jobs (ram to mirror syncs, backups, purges, zip builds) take a lease from a queue shared by all esm processes before they start,
+    so they don't fight for the same disks. Syncs always go first.
+    """
+    coordinate: bool = Field(True, description="if True, io heavy jobs of all esm processes are coordinated with leases. If False, they just run whenever they are started")
+    maxConcurrentJobs: int = Field(1, gt=0, description="amount of io heavy jobs that may run at the same time, the others wait in the queue. 1 runs them one after another")
+    queueFolder: Path = Field(".esm-io-queue", description="folder for the lease queue, relative to the esm directory. All esm processes working on the same disks have to use the same folder")
+    pollInterval: float = Field(1, gt=0, description="interval in seconds at which waiting jobs check if it's their turn")
 
 class ConfigPaths(BaseModel):
     install: Path = Field(..., description="the games main installation location")
@@ -86,7 +157,10 @@ class ConfigFoldernames(BaseModel):
     gamesmirror: str = Field("GamesMirror")
     savegamemirrorpostfix: str = Field("_Mirror")
     savegametemplatepostfix: str = Field("_Templates")
+    savegamecoldtierpostfix: str = Field("_ColdPlayfields", description="postfix of the folder in the gamesmirror that contains the cold playfields when ramdisk.tiering is enabled")
+    savegamepackedpostfix: str = Field("_Packed", description="postfix of the folder in the gamesmirror that contains the packed mirror when ramdisk.mirrorFormat is 'packed'")
     esmtests: str = Field("esm-tests", description="this folder will be used to conduct a few tests on the filesystem below the installation dir")
+    trash: str = Field(".esm-trash", description="name of the trash folder used when deletes.useTrash is enabled, it will be created on the same drive as the deleted stuff")
 
 class ConfigFilenames(BaseModel):
     globaldb: str = Field("global.db", description="the name of the global db file")
@@ -156,6 +230,10 @@ class DownloadToolConfig(BaseModel):
     maxGlobalBandwith: int = Field(50*1000*1000, description="max bandwith to use for the downloads globally in bytes, e.g. 50 MB/s")
     maxClientBandwith: int = Field(30*1000*1000, description="max bandwith to use for the download per client in bytes, e.g. 30 MB/s")
     rateLimit: str = Field("10 per minute", description="rate limit of max allowed requests per ip address per time unit, e.g. '10 per minute' or '10 per hour'")
+    downloadSliceSize: int = Field(1024*1024, description="the zip files are sent in slices of this many bytes by both the threaded and the async server, the bandwidth limits are applied between the slices. Bigger slices need less cpu, smaller ones make the rate smoother")
+    useAsyncServer: bool = Field(False, description="if true, the downloads are served by a single event loop instead of one thread per connection, sending the zip files with the os' sendfile. Use this if lots of players download the shared data at the same time")
+    asyncInMemoryMaxSize: int = Field(256*1024, description="async server only: files up to this size in bytes, like the index.html, are kept in memory")
+    asyncMaxConnections: int = Field(5000, description="async server only: max amount of open connections, any further connection is refused with a 503")
     customExternalHostNameAndPort: str = Field("", description="if set, this will be used as the host instead of the automatically generated host-part of the url. must be something like: 'https://my-server.com:12345'. The path/name of the files will be appended.")
 
     useSharedDataURLFeature: bool = Field(True, description="if true, a zip for the SharedDataURL feature will be created, served and the dedicated yaml will be automatically edited.")
@@ -180,6 +258,7 @@ class MainConfig(AppBaseModel, AppConfigMixin):
     backups: ConfigBackups = Field(ConfigBackups())
     updates: ConfigUpdates = Field(ConfigUpdates())
     deletes: ConfigDeletes = Field(ConfigDeletes())
+    io: ConfigIo = Field(ConfigIo(), description="coordination of the io heavy jobs of all esm processes")
     paths: ConfigPaths = Field(...)
     downloadtool: DownloadToolConfig = Field(DownloadToolConfig(), description="configuration for the shared data download tool")
     communication: ConfigCommunication = Field(ConfigCommunication(), description="configuration for the in-game communication")
@@ -1,3 +1,4 @@
+import os
 from enum import Enum
 from pathlib import Path
 from pydantic import BaseModel
@@ -133,6 +134,84 @@ class ZipFile:
         self.downloads = downloads
         self.wwwrootPath = wwwrootPath
 
+class PathTrie:
+    """
+    set of paths held in a trie of path segments, which only keeps the topmost paths.
+
+    adding a path that is already contained or that is below a contained path is a no-op, adding a parent of contained paths
+    replaces all of them. Inserts and lookups are O(depth) of the path. Each path may carry a value, e.g. additional info about it.
+    """
+    def __init__(self):
+        # every node is a list of [children, entry], where entry is a tuple of (path, value) or None
+        self._root = [{}, None]
+        self._size = 0
+
+    @staticmethod
+    def _segments(path: Path):
+        return [os.path.normcase(part) for part in Path(os.path.normpath(path)).parts]
+
+    def add(self, path: Path, value=None) -> bool:
+        """
+        adds the path to the trie, returns False if the path or one of its parents was already contained.
+        """
+        node = self._root
+        for segment in self._segments(path):
+            if node[1] is not None:
+                return False
+            node = node[0].setdefault(segment, [{}, None])
+        if node[1] is not None:
+            return False
+        # all descendants are covered by this path now
+        self._size -= self._countEntries(node) - 1
+        node[0] = {}
+        node[1] = (path, value)
+        return True
+
+    def contains(self, path: Path) -> bool:
+        """
+        returns True if the path or one of its parents is contained
+        """
+        node = self._root
+        for segment in self._segments(path):
+            if node[1] is not None:
+                return True
+            node = node[0].get(segment)
+            if node is None:
+                return False
+        return node[1] is not None
+
+    def _countEntries(self, node):
+        count = 0
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current[1] is not None:
+                count += 1
+            stack.extend(current[0].values())
+        return count
+
+    def items(self):
+        """
+        returns all contained paths with their values as (path, value) tuples, sorted by path
+        """
+        items = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node[1] is not None:
+                items.append(node[1])
+            stack.extend(node[0].values())
+        return sorted(items, key=lambda item: str(item[0]))
+
+    def paths(self):
+        return [path for path, value in self.items()]
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter(self.items())
+
 class ChatMessage(BaseModel):
     """
     data type for a chat message, pydantic model
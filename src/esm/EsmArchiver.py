@@ -0,0 +1,301 @@
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Tuple
+from esm.exceptions import BackupFailedError
+from esm.FsTools import FsTools
+from esm.Tools import Timer
+
+log = logging.getLogger(__name__)
+
+class ArchiveStats:
+    """
+    statistics of an archive, summed up over all its volumes
+    """
+    def __init__(self):
+        self.files = 0
+        self.folders = 0
+        self.stored = 0
+        self.bytes = 0
+        self.compressedBytes = 0
+        self.elapsedTime = timedelta(0)
+        self.volumes = []
+        self.entries = {}
+        """archived files by their relative name as (size, mtime in ns, hash, name of the zip volume)"""
+
+    def add(self, other: "ArchiveStats"):
+        self.files += other.files
+        self.folders += other.folders
+        self.stored += other.stored
+        self.bytes += other.bytes
+        self.compressedBytes += other.compressedBytes
+        self.volumes.extend(other.volumes)
+        self.entries.update(other.entries)
+
+    def getThroughput(self):
+        """returns the archived (uncompressed) bytes per second"""
+        seconds = self.elapsedTime.total_seconds()
+        return self.bytes / seconds if seconds > 0 else 0
+
+    def getRatio(self):
+        """returns the size of the archive relative to the size of the archived files"""
+        return self.compressedBytes / self.bytes if self.bytes > 0 else 1
+
+    def __str__(self):
+        return (f"archived {self.files} files and {self.folders} folders in {len(self.volumes)} volume(s), {FsTools.realToHumanFileSize(self.bytes)} -> "
+                f"{FsTools.realToHumanFileSize(self.compressedBytes)} ({self.getRatio()*100:.1f}%), {self.stored} files stored uncompressed, took {self.elapsedTime}, "
+                f"{FsTools.realToHumanFileSize(self.getThroughput())}/s")
+
+class CompressedFile:
+    """
+    the result of compressing a file on the pool: the compressed data in a spool file, or no spool if the file is to be stored as it is
+    """
+    def __init__(self, method: int, crc: int, hash: str, size: int, compressedSize: int, spool: BinaryIO = None):
+        self.method = method
+        self.crc = crc
+        self.hash = hash
+        self.size = size
+        self.compressedSize = compressedSize
+        self.spool = spool
+
+class ZipWriter:
+    """
+    minimal zip writer for entries that were compressed already, with zip64 support for large files and archives.
+    The zipfile module can only compress while it writes, which would leave all the compression to the single writing thread.
+    """
+    STORED = 0
+    DEFLATED = 8
+    LIMIT = 0xFFFFFFFF
+    """sizes and offsets from this on need zip64 records"""
+    FLAGUTF8 = 0x0800
+    CHUNKSIZE = 1024 * 1024
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.file = open(self.path, "wb")
+        self.entries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    @staticmethod
+    def getDosTime(mtime: float) -> Tuple[int, int]:
+        """returns the modification time as dos time and date, zip can't go before 1980"""
+        localTime = time.localtime(mtime)
+        if localTime.tm_year < 1980:
+            return 0, (1 << 5) | 1
+        dosTime = (localTime.tm_hour << 11) | (localTime.tm_min << 5) | (localTime.tm_sec // 2)
+        dosDate = ((localTime.tm_year - 1980) << 9) | (localTime.tm_mon << 5) | localTime.tm_mday
+        return dosTime, dosDate
+
+    def addFolder(self, name: str, mtime: float):
+        self.addEntry(f"{name}/", mtime, self.STORED, 0, 0, 0, isFolder=True)
+
+    def addEntry(self, name: str, mtime: float, method: int, crc: int, size: int, compressedSize: int, data: BinaryIO = None, isFolder=False):
+        """
+        writes the local header and the data, which must be exactly compressedSize bytes long.
+        """
+        encodedName = name.encode("utf-8")
+        offset = self.file.tell()
+        dosTime, dosDate = self.getDosTime(mtime)
+        zip64 = size >= self.LIMIT or compressedSize >= self.LIMIT
+        extra = struct.pack("<HHQQ", 0x0001, 16, size, compressedSize) if zip64 else b""
+        self.file.write(struct.pack("<IHHHHHIIIHH", 0x04034b50, 45 if zip64 else 20, self.FLAGUTF8, method, dosTime, dosDate, crc,
+                                    self.LIMIT if zip64 else compressedSize, self.LIMIT if zip64 else size, len(encodedName), len(extra)))
+        self.file.write(encodedName)
+        self.file.write(extra)
+        if data is not None:
+            remaining = compressedSize
+            while remaining > 0:
+                chunk = data.read(min(self.CHUNKSIZE, remaining))
+                if not chunk:
+                    raise BackupFailedError(f"'{name}' got shorter while it was being archived")
+                self.file.write(chunk)
+                remaining -= len(chunk)
+        self.entries.append((encodedName, method, dosTime, dosDate, crc, size, compressedSize, offset, isFolder))
+
+    def close(self):
+        """
+        writes the central directory and the end records
+        """
+        centralDirectoryOffset = self.file.tell()
+        for encodedName, method, dosTime, dosDate, crc, size, compressedSize, offset, isFolder in self.entries:
+            extraFields = [value for value in (size, compressedSize, offset) if value >= self.LIMIT]
+            extra = struct.pack(f"<HH{len(extraFields)}Q", 0x0001, 8 * len(extraFields), *extraFields) if extraFields else b""
+            self.file.write(struct.pack("<IHHHHHHIIIHHHHHII", 0x02014b50, 45, 45 if extraFields else 20, self.FLAGUTF8, method, dosTime, dosDate, crc,
+                                        min(compressedSize, self.LIMIT), min(size, self.LIMIT), len(encodedName), len(extra), 0, 0, 0,
+                                        0x10 if isFolder else 0, min(offset, self.LIMIT)))
+            self.file.write(encodedName)
+            self.file.write(extra)
+        centralDirectoryEnd = self.file.tell()
+        centralDirectorySize = centralDirectoryEnd - centralDirectoryOffset
+        entries = len(self.entries)
+        if entries >= 0xFFFF or centralDirectorySize >= self.LIMIT or centralDirectoryOffset >= self.LIMIT:
+            self.file.write(struct.pack("<IQHHIIQQQQ", 0x06064b50, 44, 45, 45, 0, 0, entries, entries, centralDirectorySize, centralDirectoryOffset))
+            self.file.write(struct.pack("<IIQI", 0x07064b50, 0, centralDirectoryEnd, 1))
+        self.file.write(struct.pack("<IHHHHIIH", 0x06054b50, 0, 0, min(entries, 0xFFFF), min(entries, 0xFFFF),
+                                    min(centralDirectorySize, self.LIMIT), min(centralDirectoryOffset, self.LIMIT), 0))
+        self.file.close()
+
+class EsmArchiver:
+    """
+    esm's own zip archiver for static backups, so there is no need for an external packer.
+
+    The files are compressed on a pool of threads (zlib releases the gil while compressing) into spool files, which stay in memory
+    unless they get large, and written to the zip by a single thread in the order of the folder tree. Only a window of files is
+    compressed ahead of the writer, so the memory and spool space used stays bounded.
+    Files that are compressed already (by their extension) are stored as they are, so are files that would not get smaller.
+    Optionally, every top level folder of the source gets its own zip volume, all volumes are written at the same time.
+    The statistics contain the hash of every archived file, so a manifest of the archive can be written without reading the files again.
+    """
+    CHUNKSIZE = 1024 * 1024
+
+    def __init__(self, threads: int = 8, compressionLevel: int = 1, storedExtensions: List[str] = None, volumes=False, spoolSize: int = 64 * 1024 * 1024):
+        self.threads = threads
+        self.compressionLevel = compressionLevel
+        self.storedExtensions = set(extension.lower() for extension in (storedExtensions or []))
+        self.volumes = volumes
+        self.spoolSize = spoolSize
+        self.spoolDirectory = None
+
+    def createArchive(self, source: Path, zipPath: Path, relativePaths: List[str] = None) -> ArchiveStats:
+        """
+        archives the content of the source folder to the zip at zipPath, with volumes these are named like the zip with the folder name
+        appended. If relative paths are given, only these files are archived. Returns the statistics, incomplete zips are deleted if something fails.
+        """
+        source = Path(source)
+        zipPath = Path(zipPath)
+        stats = ArchiveStats()
+        # large spools go next to the zip instead of the system drive
+        self.spoolDirectory = zipPath.parent
+        volumes = self.getVolumes(source, zipPath, relativePaths)
+        try:
+            with Timer() as timer, ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="EsmArchiver") as executor:
+                with ThreadPoolExecutor(max_workers=min(len(volumes), self.threads), thread_name_prefix="EsmArchiverVolume") as volumeExecutor:
+                    futures = [volumeExecutor.submit(self.writeVolume, volumePath, entries, executor) for volumePath, entries in volumes.items()]
+                    for future in futures:
+                        stats.add(future.result())
+        except Exception:
+            for volumePath in volumes.keys():
+                volumePath.unlink(missing_ok=True)
+            raise
+        stats.elapsedTime = timer.elapsedTime
+        return stats
+
+    def getVolumes(self, source: Path, zipPath: Path, relativePaths: List[str] = None) -> Dict[Path, List[Tuple[str, Path, bool]]]:
+        """
+        returns the entries of the source as (relative name, path, is folder) by the zip volume they go to, in the order of the folder tree
+        """
+        volumes = {zipPath: []}
+        if relativePaths is not None:
+            for relativePath in sorted(relativePaths):
+                self.getVolume(volumes, zipPath, relativePath, False).append((relativePath, source.joinpath(relativePath), False))
+            return volumes
+        for folder, folderNames, fileNames in os.walk(source):
+            folderNames.sort()
+            fileNames.sort()
+            relativeFolder = Path(folder).relative_to(source).as_posix()
+            prefix = "" if relativeFolder == "." else f"{relativeFolder}/"
+            for name in folderNames:
+                self.getVolume(volumes, zipPath, f"{prefix}{name}", True).append((f"{prefix}{name}", Path(folder).joinpath(name), True))
+            for name in fileNames:
+                self.getVolume(volumes, zipPath, f"{prefix}{name}", False).append((f"{prefix}{name}", Path(folder).joinpath(name), False))
+        return volumes
+
+    def getVolume(self, volumes: Dict[Path, list], zipPath: Path, relativeName: str, isFolder: bool) -> list:
+        """returns the entry list of the volume the entry belongs to, files in the top level folder stay in the main zip"""
+        if not self.volumes or ("/" not in relativeName and not isFolder):
+            return volumes[zipPath]
+        topLevelFolder = relativeName.split("/", 1)[0]
+        return volumes.setdefault(zipPath.with_name(f"{zipPath.stem}.{topLevelFolder}{zipPath.suffix}"), [])
+
+    def writeVolume(self, zipPath: Path, entries: List[Tuple[str, Path, bool]], executor: ThreadPoolExecutor) -> ArchiveStats:
+        """
+        writes the entries to the zip, compressing a window of files ahead on the executor
+        """
+        stats = ArchiveStats()
+        stats.volumes.append(zipPath)
+        window = self.threads * 2
+        pending = deque()
+        with ZipWriter(zipPath) as writer:
+            for name, path, isFolder in entries:
+                future = None if isFolder else executor.submit(self.compressFile, name, path)
+                pending.append((name, path, future))
+                while len(pending) > window:
+                    self.writeEntry(writer, *pending.popleft(), stats)
+            while pending:
+                self.writeEntry(writer, *pending.popleft(), stats)
+        stats.compressedBytes = zipPath.stat().st_size
+        log.debug(f"wrote zip volume '{zipPath}': {stats.files} files, {FsTools.realToHumanFileSize(stats.compressedBytes)}")
+        return stats
+
+    def writeEntry(self, writer: ZipWriter, name: str, path: Path, future: Future, stats: ArchiveStats):
+        stat = path.stat()
+        mtime = stat.st_mtime
+        if future is None:
+            writer.addFolder(name, mtime)
+            stats.folders += 1
+            return
+        compressed: CompressedFile = future.result()
+        stats.files += 1
+        stats.bytes += compressed.size
+        stats.entries[name] = (compressed.size, stat.st_mtime_ns, compressed.hash, writer.path.name)
+        if compressed.spool is None:
+            stats.stored += 1
+            with open(path, "rb") as file:
+                writer.addEntry(name, mtime, ZipWriter.STORED, compressed.crc, compressed.size, compressed.size, file)
+            return
+        with compressed.spool:
+            compressed.spool.seek(0)
+            writer.addEntry(name, mtime, compressed.method, compressed.crc, compressed.size, compressed.compressedSize, compressed.spool)
+
+    def isStored(self, name: str):
+        return os.path.splitext(name)[1].lower() in self.storedExtensions
+
+    def compressFile(self, name: str, path: Path) -> CompressedFile:
+        """
+        compresses the file into a spool, or just calculates its checksum if it is to be stored. Runs on the pool.
+        """
+        crc = 0
+        size = 0
+        digest = hashlib.blake2b(digest_size=16)
+        if self.isStored(name) or self.compressionLevel == 0:
+            with open(path, "rb") as file:
+                while chunk := file.read(self.CHUNKSIZE):
+                    crc = zlib.crc32(chunk, crc)
+                    digest.update(chunk)
+                    size += len(chunk)
+            return CompressedFile(ZipWriter.STORED, crc, digest.hexdigest(), size, size)
+        spool = tempfile.SpooledTemporaryFile(max_size=self.spoolSize, dir=self.spoolDirectory)
+        compressor = zlib.compressobj(self.compressionLevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+        try:
+            with open(path, "rb") as file:
+                while chunk := file.read(self.CHUNKSIZE):
+                    crc = zlib.crc32(chunk, crc)
+                    digest.update(chunk)
+                    size += len(chunk)
+                    spool.write(compressor.compress(chunk))
+            spool.write(compressor.flush())
+        except Exception:
+            spool.close()
+            raise
+        compressedSize = spool.tell()
+        if compressedSize >= size:
+            # does not get smaller, e.g. an unknown compressed format
+            spool.close()
+            return CompressedFile(ZipWriter.STORED, crc, digest.hexdigest(), size, size)
+        return CompressedFile(ZipWriter.DEFLATED, crc, digest.hexdigest(), size, compressedSize, spool)
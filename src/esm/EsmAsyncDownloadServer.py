@@ -0,0 +1,331 @@
+import asyncio
+import logging
+import mimetypes
+import threading
+import urllib.parse
+import urllib.request
+import humanize
+
+from email.utils import formatdate
+from http import HTTPStatus
+from pathlib import Path
+from typing import Dict, List, Tuple
+from urllib.error import URLError
+from limits import parse, storage, strategies
+from esm import Tools
+from esm.DataTypes import ZipFile
+from esm.EsmBandwidthScheduler import EsmBandwidthScheduler
+from esm.Tools import Timer
+
+log = logging.getLogger(__name__)
+
+class DownloadRequest:
+    """
+    a parsed http request of a client of the async download server
+    """
+    def __init__(self, method: str, path: str, version: str, headers: Dict[str, str], clientAddress: Tuple):
+        self.method = method
+        self.path = path
+        self.version = version
+        self.headers = headers
+        self.clientAddress = clientAddress
+
+    def wantsKeepAlive(self):
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.1":
+            return connection != "close"
+        return connection == "keep-alive"
+
+class EsmAsyncDownloadServer:
+    """
+    asyncio based alternative to the threaded server with the EsmHttpThrottledHandler, for when lots of players download the shared data at once.
+
+    All connections are handled by coroutines on a single event loop instead of one thread each. The zip files are sent with loop.sendfile,
+    which lets the os copy them from the page cache straight to the socket, in slices of sliceSize bytes. Before every slice the
+    connection reserves its bytes from the EsmBandwidthScheduler and sleeps as long as it says, so the bandwidth limits hold
+    without touching the data. Small files like the index.html are kept in memory.
+
+    The whitelist, redirects, rate limit and proxied paths work just like in the EsmHttpThrottledHandler and are configured the same way.
+    """
+    HEADERTIMEOUT = 30
+    MAXHEADERSIZE = 16*1024
+
+    # allowed default assets for downloads
+    defaultAssets = ['/index.html', '/favicon.ico', '/styles.css']
+
+    def __init__(self, rootDirectory: Path, zipFiles: List[ZipFile], port: int, clientBandwidthLimit: int, globalBandwidthLimit: int, rateLimit: str = "10 per minute",
+                 sliceSize: int = 1024*1024, inMemoryMaxSize: int = 256*1024, maxConnections: int = 5000, host: str = None):
+        self.rootDirectory = Path(rootDirectory).resolve()
+        self.zipFiles = zipFiles
+        self.port = port
+        self.host = host
+        """the interface to listen on, None means all of them"""
+        self.rateLimit = parse(rateLimit)
+        self.rateLimiter = strategies.MovingWindowRateLimiter(storage.MemoryStorage())
+        self.sliceSize = sliceSize
+        self.inMemoryMaxSize = inMemoryMaxSize
+        self.maxConnections = maxConnections
+
+        # same as in the EsmHttpThrottledHandler, see there
+        self.rateLimitExceptions = []
+        self.redirects: List[Dict] = None
+        self.whitelist = []
+        self.proxiedPaths = []
+
+        self.bandwidthScheduler = EsmBandwidthScheduler(globalRate=globalBandwidthLimit, clientRate=clientBandwidthLimit)
+        self.assets: Dict[Path, Tuple[int, int, bytes]] = {}
+        """path -> (size, mtime in ns, content) of the small files kept in memory"""
+        self.globalBytesSent = 0
+        self.zipDownloads = 0
+
+        self.connections: set[asyncio.Task] = set()
+        self.loop: asyncio.AbstractEventLoop = None
+        self.stopEvent: asyncio.Event = None
+        self.started = threading.Event()
+        self.stopRequested = threading.Event()
+
+    def serveForever(self):
+        """runs the server on an event loop in the calling thread until shutdown() is called"""
+        asyncio.run(self.serve())
+
+    def shutdown(self):
+        """stops the server and closes all open connections, can be called from any thread"""
+        self.stopRequested.set()
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self.stopEvent.set)
+
+    async def serve(self):
+        self.stopEvent = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        if self.stopRequested.is_set():
+            return
+        server = await asyncio.start_server(self.handleConnection, host=self.host, port=self.port, limit=self.MAXHEADERSIZE, backlog=1024)
+        self.port = server.sockets[0].getsockname()[1]
+        log.debug(f"async download server listening on port {self.port}")
+        self.started.set()
+        try:
+            await self.stopEvent.wait()
+        finally:
+            server.close()
+            if len(self.connections) > 0:
+                log.warning(f"Closing {len(self.connections)} active connections")
+            for task in list(self.connections):
+                task.cancel()
+            await asyncio.gather(*self.connections, return_exceptions=True)
+            await server.wait_closed()
+
+    async def handleConnection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        clientAddress = writer.get_extra_info("peername")
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            if len(self.connections) > self.maxConnections:
+                log.warning(f"client {clientAddress} exceeded the maximum of {self.maxConnections} connections")
+                await self.sendResponse(writer, None, 503, body=b"Too many connections, try again later.", keepAlive=False)
+                return
+            keepAlive = True
+            while keepAlive:
+                request = await self.readRequest(reader, clientAddress)
+                if request is None:
+                    return
+                keepAlive = request.wantsKeepAlive()
+                if request.method == "GET":
+                    keepAlive = await self.handleGet(request, writer, keepAlive)
+                elif request.method == "HEAD":
+                    keepAlive = await self.handleHead(request, writer, keepAlive)
+                else:
+                    await self.sendResponse(writer, request, 501, keepAlive=False)
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError) as ex:
+            log.debug(f"connection to {clientAddress} ended: {ex}")
+        except asyncio.CancelledError:
+            # the server is shutting down, the task ends normally so asyncio doesn't report it
+            log.debug(f"closing connection to {clientAddress}")
+        except Exception as ex:
+            if log.getEffectiveLevel() == logging.DEBUG:
+                log.exception(ex)
+            log.warning(f"error handling the request of {clientAddress}: {ex}. Probably some bots knocking on the door.")
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+    async def readRequest(self, reader: asyncio.StreamReader, clientAddress: Tuple) -> DownloadRequest:
+        """reads the request line and headers, returns None if the client closed the connection"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.HEADERTIMEOUT)
+        except asyncio.IncompleteReadError:
+            return None
+        lines = head.decode("iso-8859-1").split("\r\n")
+        requestLine = lines[0].split()
+        if len(requestLine) != 3 or not requestLine[2].startswith("HTTP/"):
+            raise ConnectionError(f"bad request line '{lines[0][:100]}'")
+        headers = {}
+        for line in lines[1:]:
+            name, separator, value = line.partition(":")
+            if separator:
+                headers[name.strip().lower()] = value.strip()
+        return DownloadRequest(requestLine[0], requestLine[1], requestLine[2], headers, clientAddress)
+
+    async def sendResponse(self, writer: asyncio.StreamWriter, request: DownloadRequest, code: int, headers: Dict[str, str] = None, body: bytes = b"",
+                           contentLength: int = None, keepAlive: bool = True):
+        """sends the status line, the headers and the body, if any"""
+        lines = [f"HTTP/1.1 {code} {HTTPStatus(code).phrase}", f"Date: {formatdate(usegmt=True)}"]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        lines.append(f"Content-Length: {contentLength if contentLength is not None else len(body)}")
+        lines.append(f"Connection: {'keep-alive' if keepAlive else 'close'}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("iso-8859-1") + body)
+        await writer.drain()
+        if request is not None:
+            log.debug(f"{request.clientAddress[0]} - - \"{request.method} {request.path} {request.version}\" {code}")
+
+    async def handleHead(self, request: DownloadRequest, writer: asyncio.StreamWriter, keepAlive: bool) -> bool:
+        if await self.handleRedirects(request, writer, keepAlive): return keepAlive
+        if not await self.pathInWhitelist(request, writer, keepAlive): return keepAlive
+        filePath = await self.findFile(request, writer, keepAlive)
+        if filePath is None: return keepAlive
+        stat = filePath.stat()
+        await self.sendResponse(writer, request, 200, self.getFileHeaders(filePath, stat), contentLength=stat.st_size, keepAlive=keepAlive)
+        return keepAlive
+
+    async def handleGet(self, request: DownloadRequest, writer: asyncio.StreamWriter, keepAlive: bool) -> bool:
+        if await self.redirectToIndex(request, writer, keepAlive): return keepAlive
+        if await self.hitRateLimit(request, writer, keepAlive): return keepAlive
+        if await self.handleRedirects(request, writer, keepAlive): return keepAlive
+        if not await self.pathInWhitelist(request, writer, keepAlive): return keepAlive
+        if await self.handleProxiedPath(request, writer, keepAlive): return keepAlive
+        filePath = await self.findFile(request, writer, keepAlive)
+        if filePath is None: return keepAlive
+        log.debug(f"Client {request.clientAddress} requested file '{request.path}'.")
+        await self.sendFile(request, writer, filePath, keepAlive)
+        return keepAlive
+
+    async def redirectToIndex(self, request: DownloadRequest, writer: asyncio.StreamWriter, keepAlive: bool):
+        if request.path == "/":
+            log.debug(f"redirecting {request.path} to /index.html")
+            await self.sendResponse(writer, request, 301, {"Location": "/index.html"}, keepAlive=keepAlive)
+            return True
+        return False
+
+    async def hitRateLimit(self, request: DownloadRequest, writer: asyncio.StreamWriter, keepAlive: bool):
+        if request.path in self.rateLimitExceptions: return False
+        clientIp = request.clientAddress[0]
+        # rate limit check, send 429 if the client is trying to make too many requests
+        if not self.rateLimiter.hit(self.rateLimit, "global", clientIp):
+            await self.sendResponse(writer, request, 429, body=b"Rate limit exceeded. Go away.", keepAlive=keepAlive)
+            log.warning(f"client ip {clientIp} exceeded the rate limit, requested path '{request.path}'")
+            return True
+        return False
+
+    async def handleRedirects(self, request: DownloadRequest, writer: asyncio.StreamWriter, keepAlive: bool):
+        """
+        check if the requested path equals any of the configured redirects and redirect to the destination.
+        """
+        if not self.redirects: return False
+        for redirect in self.redirects:
+            if redirect['source'] == request.path:
+                log.debug(f"redirecting {request.path} to {redirect['destination']} with code {redirect['code']}")
+                await self.sendResponse(writer, request, redirect['code'], {"Location": redirect['destination']}, keepAlive=keepAlive)
+                return True
+        return False
+
+    async def pathInWhitelist(self, request: DownloadRequest, writer: asyncio.StreamWriter, keepAlive: bool):
+        filename = request.path
+        if filename in self.defaultAssets or filename in self.whitelist:
+            return True
+        if filename in [f"/{x.name}" for x in self.zipFiles]:
+            return True
+        for proxiedPath in self.proxiedPaths:
+            if filename.startswith(proxiedPath['path']):
+                log.info(f"serving proxied path {filename}")
+                return True
+        log.debug(f"not serving {filename}")
+        await self.sendResponse(writer, request, 404, body=b"There's nothing else to see here. Go away.", keepAlive=keepAlive)
+        return False
+
+    async def findFile(self, request: DownloadRequest, writer: asyncio.StreamWriter, keepAlive: bool) -> Path:
+        """returns the path of the requested file in the www root, or None after responding with a 404 if it isn't there"""
+        path = urllib.parse.unquote(request.path.split("?", 1)[0].split("#", 1)[0])
+        filePath = self.rootDirectory.joinpath(path.lstrip("/")).resolve()
+        if filePath.is_relative_to(self.rootDirectory) and filePath.is_file():
+            return filePath
+        await self.sendResponse(writer, request, 404, body=b"Didn't find a thing.", keepAlive=keepAlive)
+        log.warning(f"file '{filePath}' not found, but is listed as default asset, make sure its still there.")
+        return None
+
+    async def handleProxiedPath(self, request: DownloadRequest, writer: asyncio.StreamWriter, keepAlive: bool):
+        for proxiedPath in self.proxiedPaths:
+            if request.path.startswith(proxiedPath['path']):
+                query = request.path[len(proxiedPath['path']):].strip("/")
+                targetUrl = f"{proxiedPath['target']}{query}"
+                try:
+                    # urllib blocks, so the request to the remote server runs on the default executor
+                    status, headers, body = await self.loop.run_in_executor(None, self.fetch, targetUrl)
+                    await self.sendResponse(writer, request, status, headers, body, keepAlive=keepAlive)
+                except URLError as e:
+                    await self.sendResponse(writer, request, 502, body=f"Proxy error: {str(e)}".encode(), keepAlive=keepAlive)
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    await self.sendResponse(writer, request, 500, body=f"Internal server error: {str(e)}".encode(), keepAlive=keepAlive)
+                return True
+        return False
+
+    @staticmethod
+    def fetch(targetUrl: str) -> Tuple[int, Dict[str, str], bytes]:
+        """returns status, headers and body of the url, without the headers that depend on the connection"""
+        with urllib.request.urlopen(targetUrl) as response:
+            body = response.read()
+            headers = {header: value for header, value in response.headers.items() if header.lower() not in ["connection", "content-length", "transfer-encoding", "keep-alive"]}
+            return response.status, headers, body
+
+    def getFileHeaders(self, filePath: Path, stat) -> Dict[str, str]:
+        contentType, _ = mimetypes.guess_type(filePath.name)
+        return {"Content-Type": contentType or "application/octet-stream", "Last-Modified": formatdate(stat.st_mtime, usegmt=True)}
+
+    def getAsset(self, filePath: Path, stat) -> bytes:
+        """returns the content of the small file from memory, reading it again only when it changed"""
+        cached = self.assets.get(filePath)
+        if cached is None or cached[:2] != (stat.st_size, stat.st_mtime_ns):
+            cached = (stat.st_size, stat.st_mtime_ns, filePath.read_bytes())
+            self.assets[filePath] = cached
+        return cached[2]
+
+    async def sendFile(self, request: DownloadRequest, writer: asyncio.StreamWriter, filePath: Path, keepAlive: bool):
+        stat = filePath.stat()
+        headers = self.getFileHeaders(filePath, stat)
+        if stat.st_size <= self.inMemoryMaxSize:
+            await self.sendResponse(writer, request, 200, headers, self.getAsset(filePath, stat), keepAlive=keepAlive)
+            return
+
+        # we'll only limit the speed of the zip files, not the rest of the files
+        zipFile = Tools.findZipFileByName(self.zipFiles, containedIn=request.path)
+        share = self.bandwidthScheduler.register(request.clientAddress) if zipFile else None
+        await self.sendResponse(writer, request, 200, headers, contentLength=stat.st_size, keepAlive=keepAlive)
+        if zipFile:
+            log.info(f"Client {request.clientAddress} started downloading the file '{zipFile.name}'.")
+        try:
+            with open(filePath, "rb") as file, Timer() as timer:
+                offset = 0
+                while offset < stat.st_size:
+                    count = min(self.sliceSize, stat.st_size - offset)
+                    if share:
+                        # the slice has to fit into the fair share of the connection as well as the global limit
+                        waitTime = self.bandwidthScheduler.reserve(share, count)
+                        if waitTime > 0:
+                            await asyncio.sleep(waitTime)
+                    sent = await self.loop.sendfile(writer.transport, file, offset, count)
+                    if sent == 0:
+                        raise ConnectionError(f"client stopped receiving '{filePath.name}' at {offset} of {stat.st_size} bytes")
+                    offset += sent
+                    if zipFile:
+                        self.globalBytesSent += sent
+        finally:
+            if share:
+                self.bandwidthScheduler.unregister(share)
+        if zipFile:
+            downloadspeed = stat.st_size / max(timer.elapsedTime.total_seconds(), 0.001)
+            self.zipDownloads += 1
+            zipFile.downloads += 1
+            log.info(f"Client {request.clientAddress} successfully downloaded the file '{zipFile.name}' in '{humanize.naturaldelta(timer.elapsedTime)}', speed '{humanize.naturalsize(downloadspeed, gnu=False)}/s'. ({zipFile.downloads} specific downloads, {self.zipDownloads} total downloads)")
@@ -1,16 +1,27 @@
 import logging
 import subprocess
-from datetime import datetime
-from functools import cached_property
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import cached_property, partial
 from pathlib import Path
+from typing import Callable, Dict, List, Tuple
 from esm.ConfigModels import MainConfig
-from esm.exceptions import AdminRequiredException, RequirementsNotFulfilledError, ServerNeedsToBeStopped
+from esm.EsmArchiver import ArchiveStats, EsmArchiver
+from esm.EsmBackupVerifier import EsmBackupVerifier, VerifyStats
+from esm.EsmDifferentialBackup import StaticManifest, createStaticArchive, restoreStaticBackup
+from esm.exceptions import AdminRequiredException, BackupFailedError, RequirementsNotFulfilledError, ServerNeedsToBeStopped, WrongParameterError
 from esm.EsmConfigService import EsmConfigService
 from esm.EsmDedicatedServer import EsmDedicatedServer
 from esm.EsmFileSystem import EsmFileSystem
+from esm.EsmIoCoordinator import EsmIoCoordinator, IoPriority
+from esm.EsmLinkedBackup import EsmLinkedBackup
+from esm.EsmPackedMirror import EsmPackedMirror
+from esm.EsmReplicator import EsmReplicator, ReplicationStats
+from esm.EsmSelectiveRestore import EsmSelectiveRestore, FolderRestoreSource, PackedRestoreSource, RestorePlanEntry, RestoreSelection, ZipRestoreSource
+from esm.EsmSyncEngine import SyncStats
 from esm.FsTools import FsTools
 from esm.ServiceRegistry import Service, ServiceRegistry
-from esm.Tools import getElapsedTime, getTimer
+from esm.Tools import Timer, getElapsedTime, getTimer
 
 log = logging.getLogger(__name__)
 
@@ -19,6 +30,7 @@ class EsmBackupService:
     """
     Provides a blazing fast backup system, keeping a configured amount of rolling mirror copies as backups in a separate folder.
     Backups are updated in a rolling fashion using robocopy, the links to the backups are created and updated in the original backup folder.
+    With deduplication enabled, each backup is built from the previous one instead, hardlinking the unchanged files to it.
 
     Automatically manages creating the file structure needed and updating it as needed. Also supports two modes, for ramdisk mode or without.
     """
@@ -35,48 +47,145 @@ class EsmBackupService:
     def dedicatedServer(self) -> EsmDedicatedServer:
         return ServiceRegistry.get(EsmDedicatedServer)
 
+    @cached_property
+    def ioCoordinator(self) -> EsmIoCoordinator:
+        return ServiceRegistry.get(EsmIoCoordinator)
+
     def createRollingBackup(self):
         """
         create a rolling mirror backup
         """
-        savegameSourceFolder = self.getSaveGameSource()
-        self.assertBackupFilestructure()
-        # find out what the target backup folder number is
-        previousBackupNumber = self.getPreviousBackupNumber()
-        if previousBackupNumber is None:
-            previousBackupNumber = 0
-        previousBackupFolder = self.getRollingBackupFolder(previousBackupNumber)
-        nextBackupNumber = self.getNextBackupNumber(previousBackupNumber)
-        targetBackupFolder = self.getRollingBackupFolder(nextBackupNumber)
-
-        start = getTimer()
-        log.info(f"Starting backup to {targetBackupFolder}")
-        self.backupSavegame(savegameSourceFolder, targetBackupFolder)
-        log.debug(f"copying tool data")
-        self.backupToolData(targetBackupFolder)
-        log.debug(f"copying server config")
-        self.backupGameConfig(targetBackupFolder)
-    
+        with self.ioCoordinator.lease("rolling backup", IoPriority.BACKUP) as lease:
+            savegameSourceFolder = self.getSaveGameSource()
+            self.assertBackupFilestructure()
+            # find out what the target backup folder number is
+            previousBackupNumber = self.getPreviousBackupNumber()
+            if previousBackupNumber is None:
+                previousBackupNumber = 0
+            previousBackupFolder = self.getRollingBackupFolder(previousBackupNumber)
+            nextBackupNumber = self.getNextBackupNumber(previousBackupNumber)
+            targetBackupFolder = self.getRollingBackupFolder(nextBackupNumber)
+            referenceBackupFolder = None
+            if previousBackupNumber > 0 and previousBackupNumber != nextBackupNumber:
+                referenceBackupFolder = previousBackupFolder
+
+            start = getTimer()
+            log.info(f"Starting backup to {targetBackupFolder}")
+            self.prepareTargetBackupFolder(targetBackupFolder)
+            steps = self.getRollingBackupSteps(savegameSourceFolder, targetBackupFolder, referenceBackupFolder)
+            timings = self.runBackupSteps(steps)
+            log.info(f"Backup steps done: {', '.join(f'{name} {elapsedTime}' for name, elapsedTime in timings.items())}")
+            self.createBackupManifest(targetBackupFolder, [previousBackupFolder] if previousBackupNumber > 0 else [])
+
+            # only now the backup is complete and may become the latest
+            self.createMarkerFile(targetBackupFolder)
+            if previousBackupNumber > 0:
+                self.removeMarkerFile(previousBackupFolder)
+
+            deletedLinks = self.removeLinksToTargetBackupFolder(targetBackupFolder)
+            if deletedLinks and len(deletedLinks) > 0:
+                linkList = ",".join(map(str,deletedLinks))
+                log.info(f"Removed now deprecated hardlinks: '{linkList}'")
+
+            linkPath = self.createBackupLink(targetBackupFolder)
+            log.info(f"Created link to latest backup as '{linkPath}' -> '{targetBackupFolder}'")
+            elapsedTime = getElapsedTime(start)
+            log.info(f"Creating rolling backup done, time needed: {elapsedTime}, waited {lease.waitTime} for the io lease")
+
+    def replicateBackup(self, backupFolder: Path) -> ReplicationStats:
+        """
+        replicates the rolling backup to the configured replication target, transferring only what changed since the last replication and
+        resuming an interrupted one. This takes no io lease, since it is limited by its own bandwidth budget and would block the syncs for too long.
+        """
+        target = Path(self.config.backups.replicationTarget)
+        bytesPerSecond = 0
+        if self.config.backups.replicationBandwidth:
+            bytesPerSecond = FsTools.humanToRealFileSize(self.config.backups.replicationBandwidth)
+        if self.config.general.debugMode:
+            log.debug(f"debugmode: replicating {backupFolder} to {target}")
+            return ReplicationStats()
+        backupParentDir = self.fileSystem.getAbsolutePathTo("backup")
+        replicator = EsmReplicator(source=backupFolder, destination=target, manifestPath=backupParentDir.joinpath("esm-replication.esm-sync-manifest"),
+                                   checkpointPath=backupParentDir.joinpath("esm-replication.checkpoint"), threads=self.config.backups.replicationThreads, bytesPerSecond=bytesPerSecond)
+        log.info(f"Replicating '{backupFolder}' to '{target}'")
+        stats = replicator.synchronize()
+        log.info(f"Replicated the backup: {stats}, {FsTools.realToHumanFileSize(stats.getThroughput())}/s")
+        if stats.failed > 0:
+            log.error(f"{stats.failed} entries could not be replicated to '{target}', they will be retried with the next replication. Please check the logs")
+        return stats
+
+    def getRollingBackupSteps(self, savegameSourceFolder: Path, targetBackupFolder: Path, referenceBackupFolder: Path = None) -> List[Tuple[str, Callable]]:
+        """
+        returns the independent steps of a rolling backup as list of (name, function)
+        """
+        steps = [
+            ("savegame", partial(self.backupSavegame, savegameSourceFolder, targetBackupFolder, referenceBackupFolder)),
+            ("tool data", partial(self.backupToolData, targetBackupFolder, referenceBackupFolder)),
+            ("game config", partial(self.backupGameConfig, targetBackupFolder)),
+        ]
         # save more stuff, as listed in configuration. Useful to backup custom mod data
         additionalBackupPaths = self.config.backups.additionalBackupPaths
         if additionalBackupPaths and len(additionalBackupPaths) > 0:
-            log.debug(f"copying additional data")
             # no globbing will be supported here, since the sources would potentially all end up in one folder, creating a mess in the backup.
-            self.backupAdditionalPaths(additionalBackupPaths, targetBackupFolder)
-
-        self.createMarkerFile(targetBackupFolder)
-        if previousBackupNumber > 0:
-            self.removeMarkerFile(previousBackupFolder)
-
-        deletedLinks = self.removeLinksToTargetBackupFolder(targetBackupFolder)
-        if deletedLinks and len(deletedLinks) > 0:
-            linkList = ",".join(map(str,deletedLinks))
-            log.info(f"Removed now deprecated hardlinks: '{linkList}'")
-
-        linkPath = self.createBackupLink(targetBackupFolder)
-        log.info(f"Created link to latest backup as '{linkPath}' -> '{targetBackupFolder}'")
-        elapsedTime = getElapsedTime(start)
-        log.info(f"Creating rolling backup done, time needed: {elapsedTime}")
+            FsTools.createDir(targetBackupFolder.joinpath("Additional"))
+            for additionalBackupPath in additionalBackupPaths:
+                steps.append((f"additional '{Path(additionalBackupPath).name}'", partial(self.backupAdditionalPath, additionalBackupPath, targetBackupFolder, referenceBackupFolder)))
+        return steps
+
+    def runBackupSteps(self, steps: List[Tuple[str, Callable]]) -> Dict[str, timedelta]:
+        """
+        runs the backup steps on a pool of backups.parallelSteps threads, since they mostly read from different folders or even disks.
+        Returns the time every step needed. All steps run to their end, if any of them failed a BackupFailedError is raised afterwards.
+        """
+        def runStep(step: Callable):
+            with Timer() as timer:
+                step()
+            return timer.elapsedTime
+
+        timings = {}
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.config.backups.parallelSteps, thread_name_prefix="EsmBackupStep") as executor:
+            futures = [(name, executor.submit(runStep, step)) for name, step in steps]
+            for name, future in futures:
+                try:
+                    timings[name] = future.result()
+                    log.debug(f"backup step '{name}' done after {timings[name]}")
+                except Exception as ex:
+                    log.error(f"backup step '{name}' failed: {ex}")
+                    failed.append(name)
+        if failed:
+            raise BackupFailedError(f"Backup steps {', '.join(failed)} failed, the backup is incomplete. Please check the logs")
+        return timings
+
+    def createBackupVerifier(self, backupFolder: Path, throttled=False) -> EsmBackupVerifier:
+        bytesPerSecond = 0
+        if throttled and self.config.backups.verifyBandwidth:
+            bytesPerSecond = FsTools.humanToRealFileSize(self.config.backups.verifyBandwidth)
+        return EsmBackupVerifier(backupFolder, threads=self.config.backups.verifyThreads, bytesPerSecond=bytesPerSecond, excluded=[self.config.backups.marker])
+
+    def createBackupManifest(self, backupFolder: Path, references: List[Path]):
+        """
+        writes the manifest used by backup-verify to the backup. Hashes of unchanged files are taken from the manifests of the reference backups,
+        also from the old one of the backup folder itself.
+        """
+        if self.config.general.debugMode:
+            log.debug(f"debugmode: backup manifest {backupFolder}")
+            return
+        hashedFiles, hashedBytes, elapsedTime = self.createBackupVerifier(backupFolder).createManifest([backupFolder] + references)
+        log.info(f"Wrote the backup manifest, hashed {hashedFiles} new or changed files ({FsTools.realToHumanFileSize(hashedBytes)}) in {elapsedTime}")
+
+    def verifyBackup(self, backupNumber: int, quick=False) -> VerifyStats:
+        """
+        verifies the rolling backup with the given number against its manifest. Returns the statistics, or None if the backup has no manifest.
+        """
+        backupFolder = self.getRollingBackupFolder(backupNumber)
+        verifier = self.createBackupVerifier(backupFolder, throttled=True)
+        if not verifier.hasManifest():
+            log.warning(f"The backup at '{backupFolder}' has no manifest, it was created before esm wrote them or is incomplete")
+            return None
+        log.info(f"Verifying the backup at '{backupFolder}'{' (quick mode, only comparing sizes and modification times)' if quick else ''}")
+        with self.ioCoordinator.lease("backup verify", IoPriority.VERIFY):
+            return verifier.verify(quick=quick)
 
     def getPreviousBackupNumber(self):
         """
@@ -141,6 +250,10 @@ class EsmBackupService:
         returns the path to the savegame to use for backup according to current configuration
         """
         if self.config.general.useRamdisk:
+            packedMirrorPath = self.fileSystem.getAbsolutePathTo("saves.gamesmirror.savegamepacked")
+            if self.config.ramdisk.mirrorFormat == "packed" and packedMirrorPath.joinpath(EsmPackedMirror.INDEXNAME).exists():
+                log.info("Ramdisk mode is enabled and the mirror is packed, will use the packed mirror as backup source")
+                return packedMirrorPath
             log.info("Ramdisk mode is enabled, will use the hdd mirror as backup source")
             savegameSource = self.fileSystem.getAbsolutePathTo("saves.gamesmirror.savegamemirror")
         else:
@@ -162,12 +275,73 @@ class EsmBackupService:
             folderName=f"{self.config.foldernames.backupmirrorprefix}{i}"
             FsTools.createDir(backupParentDir.joinpath(folderName))
 
-    def backupSavegame(self, savegameSource: Path, targetBackupFolder: Path):
+    def prepareTargetBackupFolder(self, targetBackupFolder: Path):
+        """
+        robocopy writes into the existing files of the target, which would change all backups sharing them if the target was built with
+        deduplication before or was the reference of a deduplicated backup. Delete such a target or its shared files first when not
+        deduplicating (any more).
+        """
+        if self.config.backups.deduplicate:
+            return
+        if targetBackupFolder.joinpath(EsmLinkedBackup.MANIFESTFOLDER).exists():
+            log.info(f"'{targetBackupFolder}' was created with deduplication, deleting it first since its files may be shared with other backups")
+            FsTools.quickDelete(targetBackupFolder)
+            FsTools.createDir(targetBackupFolder)
+            return
+        unlinked = EsmLinkedBackup.unlinkSharedFiles(targetBackupFolder)
+        if unlinked > 0:
+            log.info(f"Removed {unlinked} files from '{targetBackupFolder}' that are shared with other backups, they will be copied again")
+
+    def mirrorToBackup(self, sourcePath: Path, destinationPath: Path, targetBackupFolder: Path, referenceBackupFolder: Path = None):
+        """
+        mirrors the source folder to the destination in the target backup, with robocopy or, if deduplication is enabled, by hardlinking
+        the files that are unchanged in the reference backup and copying the rest.
+        """
+        relativePath = destinationPath.relative_to(targetBackupFolder)
+        logName = relativePath.as_posix().replace('/', '_')
+        if not self.config.backups.deduplicate:
+            process = self.fileSystem.executeRobocopy(sourcePath=sourcePath, destinationPath=destinationPath, logName=logName)
+            # robocopy exit codes of 8 and above mean that something could not be copied
+            if process is not None and process.returncode >= 8:
+                raise BackupFailedError(f"robocopy could not mirror '{sourcePath}' to '{destinationPath}', exit code {process.returncode}. Please check the robocopy log")
+            return
+        if self.config.general.debugMode:
+            log.debug(f"debugmode: linked backup {sourcePath} {destinationPath} {referenceBackupFolder}")
+            return
+        manifestName = f"{logName}.tsv"
+        reference = None
+        referenceManifestPath = None
+        if referenceBackupFolder is not None:
+            reference = referenceBackupFolder.joinpath(relativePath)
+            referenceManifestPath = referenceBackupFolder.joinpath(EsmLinkedBackup.MANIFESTFOLDER, manifestName)
+        linkedBackup = EsmLinkedBackup(source=sourcePath, destination=destinationPath, manifestPath=targetBackupFolder.joinpath(EsmLinkedBackup.MANIFESTFOLDER, manifestName),
+                                       reference=reference, referenceManifestPath=referenceManifestPath, threads=self.config.backups.deduplicateThreads)
+        stats = linkedBackup.synchronize()
+        log.info(f"Backed up '{sourcePath}': {stats}")
+        if stats.failed > 0:
+            raise BackupFailedError(f"{stats.failed} files of '{sourcePath}' could not be backed up to '{destinationPath}'. Please check the logs")
+
+    def backupSavegame(self, savegameSource: Path, targetBackupFolder: Path, referenceBackupFolder: Path = None):
         """
         actually back up the savegame using the source given
         """
         targetBackupFolderSaves = targetBackupFolder.joinpath(self.config.dedicatedConfig.ServerConfig.SaveDirectory).joinpath(self.config.foldernames.games).joinpath(self.config.dedicatedConfig.GameConfig.GameName)
-        self.fileSystem.executeRobocopy(sourcePath=savegameSource, destinationPath=targetBackupFolderSaves)
+        if savegameSource.joinpath(EsmPackedMirror.INDEXNAME).exists():
+            self.unpackToBackup(savegameSource, targetBackupFolderSaves)
+        else:
+            self.mirrorToBackup(savegameSource, targetBackupFolderSaves, targetBackupFolder, referenceBackupFolder)
+
+    def unpackToBackup(self, packedPath: Path, destinationPath: Path):
+        """
+        unpacks a packed mirror into the backup, so it contains a normal savegame tree that can be restored and browsed like any other.
+        The old savegame in the backup is replaced instead of written into, since its files may be shared with other deduplicated backups.
+        """
+        log.info(f"Unpacking the packed mirror '{packedPath}' to '{destinationPath}'")
+        packedMirror = EsmPackedMirror(source=None, packedPath=packedPath, threads=self.config.ramdisk.synchronizerThreads)
+        stats = packedMirror.unpack(destinationPath, verify=True, replace=True)
+        log.info(f"Unpacked {stats.copied} files ({FsTools.realToHumanFileSize(stats.copiedBytes)}) in {stats.elapsedTime}")
+        if stats.failed > 0:
+            raise BackupFailedError(f"{stats.failed} files of the packed mirror '{packedPath}' could not be unpacked to '{destinationPath}'. Please check the logs")
     
     def backupGameConfig(self, targetBackupFolder: Path):
         """
@@ -191,37 +365,43 @@ class EsmBackupService:
         else:
             log.warning(f"dedicated yaml at '{dedicatedYaml}' does not exist. This shouldn't happen")
     
-    def backupToolData(self, targetBackupFolder: Path):
+    def backupToolData(self, targetBackupFolder: Path, referenceBackupFolder: Path = None):
         """
         backs up the EAH tool data, so that can be restored too
         """
         toolDataFolder = self.config.paths.eah.joinpath("Config")
         targetBackupFolderTool = targetBackupFolder.joinpath("Tool")
-        self.fileSystem.executeRobocopy(sourcePath=toolDataFolder, destinationPath=targetBackupFolderTool)
+        self.mirrorToBackup(toolDataFolder, targetBackupFolderTool, targetBackupFolder, referenceBackupFolder)
 
-    def backupAdditionalPaths(self, additionalBackupPaths, targetBackupFolder: Path):
+    def backupAdditionalPaths(self, additionalBackupPaths, targetBackupFolder: Path, referenceBackupFolder: Path = None):
         """
         saves any configured additional paths to the backup in a "additional" folder.
         """
-        targetPath = targetBackupFolder.joinpath("Additional")
-        FsTools.createDir(targetPath)
+        FsTools.createDir(targetBackupFolder.joinpath("Additional"))
         for additionalBackupPath in additionalBackupPaths:
-            sourcePath = Path(additionalBackupPath)
-            if sourcePath.is_dir():
-                # copy dir as is
-                dirName = Path(sourcePath).name
-                targetDirPath = targetPath.joinpath(dirName)
-                log.debug(f"Copying additional dir from {sourcePath} -> {targetDirPath}")
-                self.fileSystem.executeRobocopy(sourcePath=sourcePath, destinationPath=targetDirPath)
+            self.backupAdditionalPath(additionalBackupPath, targetBackupFolder, referenceBackupFolder)
+
+    def backupAdditionalPath(self, additionalBackupPath, targetBackupFolder: Path, referenceBackupFolder: Path = None):
+        """
+        saves a single additional path to the "additional" folder of the backup, which must exist already.
+        """
+        targetPath = targetBackupFolder.joinpath("Additional")
+        sourcePath = Path(additionalBackupPath)
+        if sourcePath.is_dir():
+            # copy dir as is
+            dirName = Path(sourcePath).name
+            targetDirPath = targetPath.joinpath(dirName)
+            log.debug(f"Copying additional dir from {sourcePath} -> {targetDirPath}")
+            self.mirrorToBackup(sourcePath, targetDirPath, targetBackupFolder, referenceBackupFolder)
+        else:
+            # copy file
+            fileName = Path(sourcePath).name
+            targetFilePath = targetPath.joinpath(fileName)
+            log.debug(f"Copying additional file from {sourcePath} -> {targetFilePath}")
+            if sourcePath.exists():
+                FsTools.copyFile(source=sourcePath, destination=targetFilePath)
             else:
-                # copy file
-                fileName = Path(sourcePath).name
-                targetFilePath = targetPath.joinpath(fileName)
-                log.debug(f"Copying additional file from {sourcePath} -> {targetFilePath}")
-                if sourcePath.exists():
-                    FsTools.copyFile(source=sourcePath, destination=targetFilePath)
-                else:
-                    log.warn(f"Configured additional backup source at {sourcePath} does not exist.")
+                log.warn(f"Configured additional backup source at {sourcePath} does not exist.")
 
     def createBackupLink(self, targetBackupFolder: Path):
         """
@@ -256,20 +436,158 @@ class EsmBackupService:
 
         staticBackupFileName = self.getStaticBackupFileName()
         parentBackupDir = self.fileSystem.getAbsolutePathTo("backup")
+        previousManifest = None
+        if self.config.backups.staticBackupDifferential:
+            previousManifest = self.getPreviousStaticManifest(parentBackupDir)
+            if previousManifest is not None:
+                staticBackupFileName = self.getStaticBackupFileName(differential=True)
         log.info(f"Creating static backup from {latestBackupFolder.as_posix()} as '{parentBackupDir}/{staticBackupFileName}'. Depending on savegame size, this might take a while.")
-        self.createZip(latestBackupFolder, parentBackupDir, staticBackupFileName)
+        with self.ioCoordinator.lease("static backup", IoPriority.ZIP):
+            if self.config.backups.staticBackupDifferential:
+                self.createDifferentialZip(latestBackupFolder, parentBackupDir, staticBackupFileName, previousManifest)
+            elif self.config.backups.staticBackupArchiver == "builtin":
+                self.createBuiltinZip(latestBackupFolder, parentBackupDir, staticBackupFileName)
+            else:
+                self.createZip(latestBackupFolder, parentBackupDir, staticBackupFileName)
 
-    def getStaticBackupFileName(self, date=None):
+    def getStaticBackupFileName(self, date=None, differential=False):
         """
-        returns a filename for the static zip file looking like: 20231002_2359_savegame.zip
+        returns a filename for the static zip file looking like: 20231002_2359_savegame.zip, or 20231002_2359_savegame_diff.zip for a differential one
         """
         if date:
             date = date
         else:
             date = datetime.now()
         formattedDate = date.strftime("%Y%m%d_%H%M%S")
+        if differential:
+            return f"{formattedDate}_{self.config.dedicatedConfig.GameConfig.GameName}_diff.zip"
         return f"{formattedDate}_{self.config.dedicatedConfig.GameConfig.GameName}.zip"
 
+    def getPreviousStaticManifest(self, backupDirectory: Path):
+        """
+        returns the manifest of the latest static backup to create a differential one against, or None if a full static backup is due:
+        there is none yet, the chain reached the configured length or zips of the chain are missing.
+        """
+        manifestPaths = sorted(Path(backupDirectory).glob(f"*_{self.config.dedicatedConfig.GameConfig.GameName}*{StaticManifest.SUFFIX}"))
+        if not manifestPaths:
+            log.info("There is no previous static backup with a manifest, will create a full static backup")
+            return None
+        manifest = StaticManifest.read(manifestPaths[-1])
+        if manifest is None:
+            return None
+        if manifest.chainLength >= self.config.backups.staticBackupFullEvery:
+            log.info(f"There were {manifest.chainLength} differential static backups since the last full one, will create a full static backup")
+            return None
+        missingZips = manifest.getMissingZips()
+        if missingZips:
+            log.warning(f"The zips {', '.join(missingZips)} needed by the previous static backup '{manifest.zipName}' are missing, will create a full static backup")
+            return None
+        return manifest
+
+    def createDifferentialZip(self, source: Path, backupDirectory: Path, zipFileName: str, previousManifest: StaticManifest = None):
+        """
+        Creates a static backup with the builtin archiver and a manifest next to it. If the previous manifest is given, only the files that
+        changed since then are zipped. Returns the path of the zip.
+        """
+        self.assertEnoughFreeSpace()
+        zipFile = Path(backupDirectory).joinpath(zipFileName)
+        stats, manifest = createStaticArchive(self.createArchiver(), source, zipFile, previousManifest)
+        if previousManifest is None:
+            log.info(f"Full static zip created at '{zipFile}': {stats}")
+        else:
+            log.info(f"Differential static zip created at '{zipFile}' (number {manifest.chainLength} after the full one, restoring it needs {len(manifest.getZipNames())} zips): {stats}")
+        return zipFile
+
+    def restoreStaticBackup(self, backup: str, target: Path, verify=False):
+        """
+        restores the static backup (a zip name in the backup folder or a path to the zip) with a manifest, full or differential, to the target folder.
+        """
+        zipFile = Path(backup)
+        if not zipFile.is_absolute() and not zipFile.exists():
+            zipFile = self.fileSystem.getAbsolutePathTo("backup").joinpath(backup)
+        manifest = StaticManifest.read(StaticManifest.getPath(zipFile))
+        if manifest is None:
+            raise WrongParameterError(f"There is no static backup manifest for '{zipFile}'. Only static backups created with backups.staticBackupDifferential can be restored with esm.")
+        if target.exists() and any(target.iterdir()):
+            raise WrongParameterError(f"Target path '{target}' is not empty, please choose an empty or new folder.")
+        log.info(f"Restoring static backup '{manifest.zipName}' from {len(manifest.getZipNames())} zips to '{target}'")
+        with self.ioCoordinator.lease("static backup restore", IoPriority.ZIP):
+            stats = restoreStaticBackup(manifest, target, verify=verify, threads=self.config.backups.staticBackupThreads)
+        log.info(f"Restored static backup '{manifest.zipName}': {stats}")
+        if stats.failed > 0:
+            raise BackupFailedError(f"{stats.failed} files could not be restored, please check the logs")
+        return stats
+
+    def getRestoreSource(self, backup: str = None):
+        """
+        returns the source to restore parts of the savegame from: the latest rolling backup if backup is None, the rolling backup with the
+        given number, or a static backup (a zip name in the backup folder or the path to the zip).
+        """
+        threads = self.config.backups.staticBackupThreads
+        savegamePrefix = f"{self.config.dedicatedConfig.ServerConfig.SaveDirectory}/{self.config.foldernames.games}/{self.config.dedicatedConfig.GameConfig.GameName}"
+        if backup is None or backup.isdigit():
+            if backup is None:
+                backupNumber = self.getPreviousBackupNumber()
+                if backupNumber is None:
+                    raise AdminRequiredException("There is no valid latest rolling backup to restore from. Please choose a backup.")
+            else:
+                backupNumber = int(backup)
+                if backupNumber < 1 or backupNumber > self.config.backups.amount:
+                    raise WrongParameterError(f"There is no rolling backup number {backupNumber}, the configured amount is {self.config.backups.amount}.")
+            savegamePath = self.getRollingBackupFolder(backupNumber).joinpath(savegamePrefix)
+            if not savegamePath.exists():
+                raise WrongParameterError(f"The rolling backup {backupNumber} has no savegame at '{savegamePath}'.")
+            if savegamePath.joinpath(EsmPackedMirror.INDEXNAME).exists():
+                return PackedRestoreSource(savegamePath, threads=threads)
+            return FolderRestoreSource(savegamePath, threads=threads)
+
+        zipFile = Path(backup)
+        if not zipFile.is_absolute() and not zipFile.exists():
+            zipFile = self.fileSystem.getAbsolutePathTo("backup").joinpath(backup)
+        manifest = StaticManifest.read(StaticManifest.getPath(zipFile))
+        if manifest is not None:
+            source = ZipRestoreSource.fromManifest(manifest, f"{savegamePrefix}/", threads=threads)
+        else:
+            if not zipFile.exists():
+                raise WrongParameterError(f"There is no rolling backup or static backup zip '{backup}'.")
+            # with staticBackupVolumes, the savegame is in the volume of its top level folder
+            volume = zipFile.with_name(f"{zipFile.stem}.{savegamePrefix.split('/')[0]}.zip")
+            source = ZipRestoreSource.fromZips([zipFile, volume] if volume.exists() else [zipFile], f"{savegamePrefix}/", threads=threads)
+        if source.isPackedMirror():
+            raise WrongParameterError(f"The static backup '{zipFile.name}' contains a packed mirror, parts of it can't be restored directly. Restore it with backup-static-restore and unpack the mirror with tool-unpack-mirror first.")
+        return source
+
+    def createSelectiveRestore(self, backup: str, selection: RestoreSelection) -> EsmSelectiveRestore:
+        source = self.getRestoreSource(backup)
+        return EsmSelectiveRestore(source, selection, self.fileSystem.getAbsolutePathTo("saves.games.savegame"), discard=self.discardReplacedPath)
+
+    def planSelectiveRestore(self, backup: str, selection: RestoreSelection) -> List[RestorePlanEntry]:
+        """
+        returns what restoring the selected parts of the savegame from the backup would do, without changing anything
+        """
+        selectiveRestore = self.createSelectiveRestore(backup, selection)
+        log.info(f"Restoring from {selectiveRestore.source} would restore:")
+        return selectiveRestore.plan()
+
+    def restoreSelection(self, backup: str, selection: RestoreSelection) -> SyncStats:
+        """
+        restores the selected parts of the savegame from the backup, replacing the current ones. The server must not be running.
+        """
+        selectiveRestore = self.createSelectiveRestore(backup, selection)
+        log.info(f"Restoring {', '.join(selection.units)} from {selectiveRestore.source}")
+        with self.ioCoordinator.lease("selective restore", IoPriority.BACKUP):
+            stats = selectiveRestore.restore()
+        log.info(f"Restored the selected parts of the savegame: {stats}")
+        return stats
+
+    def discardReplacedPath(self, path: Path):
+        """
+        the replaced parts of the savegame are moved to the trash if enabled, so they can still be recovered until it is emptied
+        """
+        if self.config.deletes.useTrash and self.fileSystem.trashService.moveToTrash(path):
+            return
+        EsmSelectiveRestore.delete(path)
+
     def createZip(self, source, backupDirectory, zipFileName):
         """
         Create a zipfile of the given source folder, saved under the name given in zipFile.
@@ -320,6 +638,53 @@ class EsmBackupService:
         # on test: 500MB savegame -> 9 seconds, 66MB
         # "%zipCmdPath%" a -t7z -m0=Deflate -mmt=on -mx1 -mfb=32 -mpass=1 -ms=8m -mqs=on -sccUTF-8 -bb0 -bse0 -bsp2 "-w%backupDirPath%" "%backupDirPath%\%backupZipName%" "!backupDir!" >>%zipLogfile%
 
+    def createArchiver(self, volumes=None) -> EsmArchiver:
+        """
+        returns the builtin archiver as configured, volumes can be overridden
+        """
+        if volumes is None:
+            volumes = self.config.backups.staticBackupVolumes
+        return EsmArchiver(threads=self.config.backups.staticBackupThreads, compressionLevel=self.config.backups.staticBackupCompressionLevel,
+                           storedExtensions=self.config.backups.staticBackupStoredExtensions, volumes=volumes)
+
+    def createBuiltinZip(self, source: Path, backupDirectory: Path, zipFileName: str):
+        """
+        Create a zipfile of the given source folder with the builtin archiver, saved under the name given in zipFileName. Returns the path of the zip.
+        """
+        self.assertEnoughFreeSpace()
+        zipFile = Path(backupDirectory).joinpath(zipFileName)
+        stats = self.createArchiver().createArchive(source, zipFile)
+        log.info(f"Static zip created at '{zipFile}': {stats}")
+        return zipFile
+
+    def benchmarkArchivers(self, source: Path, workingDirectory: Path) -> List[Tuple[str, ArchiveStats]]:
+        """
+        compares the builtin archiver, with and without volumes, with PeaZip and the configured options (if it is installed) by zipping the source
+        into the working directory, which must not exist yet and is deleted afterwards. Returns a list of (archiver, statistics).
+        """
+        if workingDirectory.exists():
+            raise RequirementsNotFulfilledError(f"'{workingDirectory}' already exists, please choose a folder that does not exist yet")
+        results = []
+        try:
+            with self.ioCoordinator.lease("static backup benchmark", IoPriority.ZIP):
+                FsTools.createDir(workingDirectory)
+                results.append(("builtin", self.createArchiver(volumes=False).createArchive(source, workingDirectory.joinpath("builtin.zip"))))
+                results.append(("builtin, volumes", self.createArchiver(volumes=True).createArchive(source, workingDirectory.joinpath("volumes.zip"))))
+                if Path(self.config.paths.peazip).exists():
+                    stats = ArchiveStats()
+                    stats.bytes = results[0][1].bytes
+                    with Timer() as timer:
+                        zipFile = self.createZip(source, workingDirectory, "peazip.zip")
+                    stats.elapsedTime = timer.elapsedTime
+                    stats.compressedBytes = zipFile.stat().st_size
+                    stats.volumes.append(zipFile)
+                    results.append(("peazip", stats))
+                else:
+                    log.warning(f"PeaZip not found at '{self.config.paths.peazip}', can only benchmark the builtin archiver")
+        finally:
+            FsTools.quickDelete(workingDirectory)
+        return results
+
     def checkAndGetPeaZipPath(self):
         """
         checks that the pea zip executable exists and returns its path.
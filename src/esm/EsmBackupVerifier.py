@@ -0,0 +1,193 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Tuple
+from esm.EsmDifferentialBackup import scanFiles
+from esm.FsTools import FsTools
+from esm.Tools import Timer, TokenBucket
+
+log = logging.getLogger(__name__)
+
+class BackupManifest:
+    """
+    the manifest of a rolling backup, written when the backup is complete: every file with its size, modification time and hash
+    """
+    NAME = "esm-backup-manifest.tsv"
+    HEADER = "#esm-backup-manifest"
+    VERSION = "1"
+
+    @staticmethod
+    def read(path: Path) -> Dict[str, Tuple[int, int, str]]:
+        """returns the entries of the manifest as relative path -> (size, mtime in ns, hash), or None if there is no valid manifest"""
+        path = Path(path)
+        if not path.exists():
+            return None
+        entries = {}
+        with open(path, "r", encoding="utf-8") as file:
+            header = file.readline().rstrip("\n").split("\t")
+            if len(header) != 3 or header[0] != BackupManifest.HEADER or header[1] != BackupManifest.VERSION:
+                log.warning(f"'{path}' is not a valid backup manifest, ignoring it")
+                return None
+            for line in file:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 4:
+                    log.warning(f"backup manifest at '{path}' is corrupt, ignoring it")
+                    return None
+                entries[parts[0]] = (int(parts[1]), int(parts[2]), parts[3])
+        return entries
+
+    @staticmethod
+    def write(path: Path, entries: Dict[str, Tuple[int, int, str]]):
+        """writes the manifest to a temporary file first and replaces the old one"""
+        path = Path(path)
+        temporaryPath = path.with_name(f"{path.name}.tmp")
+        with open(temporaryPath, "w", encoding="utf-8") as file:
+            file.write(f"{BackupManifest.HEADER}\t{BackupManifest.VERSION}\t{datetime.now().isoformat(timespec='seconds')}\n")
+            for relativePath, (size, mtime, hash) in entries.items():
+                file.write(f"{relativePath}\t{size}\t{mtime}\t{hash}\n")
+        os.replace(temporaryPath, path)
+
+class VerifyStats:
+    """
+    result of a backup verification
+    """
+    def __init__(self):
+        self.checked = 0
+        self.verifiedBytes = 0
+        self.missing = []
+        self.changed = []
+        """files whose size or modification time differ from the manifest"""
+        self.corrupt = []
+        """files whose content does not match the hash in the manifest"""
+        self.unexpected = []
+        """files that are not in the manifest"""
+        self.elapsedTime = timedelta(0)
+        self.throttledTime = timedelta(0)
+
+    def isValid(self):
+        return not (self.missing or self.changed or self.corrupt or self.unexpected)
+
+    def getMismatches(self) -> List[Tuple[str, str]]:
+        """returns all mismatches as (kind, relative path)"""
+        mismatches = []
+        for kind, paths in (("missing", self.missing), ("changed", self.changed), ("corrupt", self.corrupt), ("unexpected", self.unexpected)):
+            mismatches.extend((kind, relativePath) for relativePath in sorted(paths))
+        return mismatches
+
+    def getThroughput(self):
+        """returns the verified bytes per second"""
+        seconds = self.elapsedTime.total_seconds()
+        return self.verifiedBytes / seconds if seconds > 0 else 0
+
+    def __str__(self):
+        return (f"checked {self.checked} files, {len(self.missing)} missing, {len(self.changed)} changed, {len(self.corrupt)} corrupt, {len(self.unexpected)} unexpected, "
+                f"hashed {FsTools.realToHumanFileSize(self.verifiedBytes)} in {self.elapsedTime} ({FsTools.realToHumanFileSize(self.getThroughput())}/s, throttled for {self.throttledTime})")
+
+class EsmBackupVerifier:
+    """
+    creates and checks the manifest of a rolling backup.
+
+    Creating the manifest hashes all files of the backup, but takes the hashes of files with the same size and modification time from the
+    manifests of other backups (like the previous one), so it only needs to read what changed.
+    Verifying hashes all files again on a pool of threads, limited to a budget of bytes per second so it can run next to the game.
+    The quick mode only compares sizes and modification times, which finds missing and changed files, but not corrupt ones.
+    """
+    CHUNKSIZE = 1024 * 1024
+
+    def __init__(self, backupFolder: Path, threads: int = 4, bytesPerSecond: int = 0, excluded: List[str] = None):
+        self.backupFolder = Path(backupFolder)
+        self.manifestPath = self.backupFolder.joinpath(BackupManifest.NAME)
+        self.threads = threads
+        self.bytesBucket = TokenBucket(bytesPerSecond) if bytesPerSecond > 0 else None
+        self.throttledSeconds = 0
+        self.throttledLock = Lock()
+        self.excluded = set(excluded or [])
+        self.excluded.update([BackupManifest.NAME, f"{BackupManifest.NAME}.tmp"])
+
+    def scan(self) -> Dict[str, Tuple[int, int]]:
+        """returns the files of the backup as relative path -> (size, mtime in ns), without the manifest and the excluded files in its root"""
+        return {relativePath: entry for relativePath, entry in scanFiles(self.backupFolder).items() if entry[0] >= 0 and relativePath not in self.excluded}
+
+    def hashFile(self, relativePath: str) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(self.backupFolder.joinpath(relativePath), "rb") as file:
+            while chunk := file.read(self.CHUNKSIZE):
+                if self.bytesBucket is not None:
+                    waited = self.bytesBucket.consume(len(chunk))
+                    if waited > 0:
+                        with self.throttledLock:
+                            self.throttledSeconds += waited
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def createManifest(self, references: List[Path] = None) -> Tuple[int, int, timedelta]:
+        """
+        writes the manifest of the backup, reusing the hashes of unchanged files from the manifests of the reference backups.
+        Returns the amount of hashed files, their size and the time needed.
+        """
+        with Timer() as timer:
+            known = {}
+            for reference in references or []:
+                entries = BackupManifest.read(Path(reference).joinpath(BackupManifest.NAME))
+                for relativePath, (size, mtime, hash) in (entries or {}).items():
+                    known[(relativePath, size, mtime)] = hash
+            files = self.scan()
+            entries = {}
+            toHash = []
+            for relativePath, (size, mtime) in files.items():
+                hash = known.get((relativePath, size, mtime))
+                if hash is None:
+                    toHash.append(relativePath)
+                else:
+                    entries[relativePath] = (size, mtime, hash)
+            with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="EsmBackupVerifier") as executor:
+                for relativePath, hash in zip(toHash, executor.map(self.hashFile, toHash)):
+                    entries[relativePath] = (files[relativePath][0], files[relativePath][1], hash)
+            BackupManifest.write(self.manifestPath, dict(sorted(entries.items())))
+        return len(toHash), sum(files[relativePath][0] for relativePath in toHash), timer.elapsedTime
+
+    def hasManifest(self):
+        return self.manifestPath.exists()
+
+    def verify(self, quick=False) -> VerifyStats:
+        """
+        checks the backup against its manifest, returns the statistics with all mismatches. Returns None if there is no valid manifest.
+        """
+        manifest = BackupManifest.read(self.manifestPath)
+        if manifest is None:
+            return None
+        stats = VerifyStats()
+        self.throttledSeconds = 0
+        with Timer() as timer:
+            files = self.scan()
+            stats.checked = len(manifest)
+            stats.unexpected = [relativePath for relativePath in files.keys() if relativePath not in manifest]
+            toHash = []
+            for relativePath, (size, mtime, hash) in manifest.items():
+                entry = files.get(relativePath)
+                if entry is None:
+                    stats.missing.append(relativePath)
+                elif entry != (size, mtime):
+                    stats.changed.append(relativePath)
+                elif not quick:
+                    toHash.append(relativePath)
+            with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="EsmBackupVerifier") as executor:
+                for relativePath, hash in zip(toHash, executor.map(self.hashFileSafely, toHash)):
+                    if hash != manifest[relativePath][2]:
+                        stats.corrupt.append(relativePath)
+                    stats.verifiedBytes += manifest[relativePath][0]
+        stats.elapsedTime = timer.elapsedTime
+        stats.throttledTime = timedelta(seconds=self.throttledSeconds)
+        return stats
+
+    def hashFileSafely(self, relativePath: str) -> str:
+        """returns the hash of the file, or None if it could not be read"""
+        try:
+            return self.hashFile(relativePath)
+        except OSError as ex:
+            log.error(f"could not read '{self.backupFolder.joinpath(relativePath)}': {ex}")
+            return None
@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+from typing import List
+from esm.Tools import TokenBucket
+
+log = logging.getLogger(__name__)
+
+class ClientShare:
+    """
+    the share of the bandwidth of a single client, with its own token bucket and the rate it actually used recently
+    """
+    def __init__(self, clientId, bucket: TokenBucket):
+        self.clientId = clientId
+        self.bucket = bucket
+        self.bytesSent = 0
+        self.windowBytes = 0
+        self.measuredRate = None
+        """bytes per second the client used in the last windows, None until the first rebalancing"""
+        self.saturated = True
+        """True if the client had to wait for its bucket in the current window, meaning it could use more"""
+
+class EsmBandwidthScheduler:
+    """
+    shares the global bandwidth between all clients that download at the same time.
+
+    Every client takes its bytes from its own token bucket first, then from the global one. The global bucket only holds up to
+    burstSeconds worth of bytes, so an idle server can't save up bandwidth for a burst far above the limit later.
+
+    The rate of the client buckets is the max-min fair share of the global limit, capped by the client limit: clients that use less than
+    an even split (e.g. because their own connection is slower) keep what they use, the rest is split evenly between the others.
+    This is recalculated every rebalanceInterval from the rates the clients actually used, and whenever a client comes or goes.
+    Both limits can be changed while clients are downloading. A limit of 0 means unlimited.
+    """
+
+    def __init__(self, globalRate: float, clientRate: float, burstSeconds: float = 0.25, rebalanceInterval: float = 0.5, clock=time.monotonic):
+        self.globalRate = globalRate
+        self.clientRate = clientRate
+        self.burstSeconds = burstSeconds
+        self.rebalanceInterval = rebalanceInterval
+        self.clock = clock
+        self.globalBucket = TokenBucket(globalRate, capacity=globalRate * burstSeconds, clock=clock)
+        self.clients: set[ClientShare] = set()
+        self.fairShare = clientRate
+        self.lastRebalance = clock()
+        self.lock = threading.Lock()
+
+    def register(self, clientId) -> ClientShare:
+        """adds a client that is about to download something, it gets an even share until its actual usage is known"""
+        with self.lock:
+            share = ClientShare(clientId, TokenBucket(self.fairShare, capacity=self.fairShare * self.burstSeconds, clock=self.clock))
+            self.clients.add(share)
+            self.rebalance()
+        return share
+
+    def unregister(self, share: ClientShare):
+        """removes the client after its download finished or failed, its share goes to the others"""
+        with self.lock:
+            self.clients.discard(share)
+            self.rebalance()
+
+    def reconfigure(self, globalRate: float = None, clientRate: float = None):
+        """changes the global and/or client limit, effective immediately for all clients"""
+        with self.lock:
+            if globalRate is not None:
+                self.globalRate = globalRate
+                self.globalBucket.setRate(globalRate, capacity=globalRate * self.burstSeconds)
+            if clientRate is not None:
+                self.clientRate = clientRate
+            log.debug(f"bandwidth limits changed to {self.globalRate} bytes/s in total and {self.clientRate} bytes/s per client")
+            self.rebalance()
+
+    def reserve(self, share: ClientShare, amount: int) -> float:
+        """
+        takes the amount of bytes from the client's and the global budget without waiting, returns the seconds the client has to wait
+        before sending them.
+        """
+        with self.lock:
+            share.bytesSent += amount
+            share.windowBytes += amount
+            if self.clock() - self.lastRebalance >= self.rebalanceInterval:
+                self.rebalance()
+        clientWait = share.bucket.reserve(amount)
+        if clientWait > 0:
+            share.saturated = True
+        return max(clientWait, self.globalBucket.reserve(amount))
+
+    def consume(self, share: ClientShare, amount: int, event: threading.Event = None) -> float:
+        """same as reserve, but waits as long as needed. Returns the seconds waited"""
+        waitTime = self.reserve(share, amount)
+        if waitTime > 0:
+            if event is not None:
+                event.wait(waitTime)
+            else:
+                time.sleep(waitTime)
+        return waitTime
+
+    @staticmethod
+    def calculateFairShare(demands: List[float], capacity: float) -> float:
+        """
+        returns the max-min fair share of the capacity for the given demands: every demand below it is met completely,
+        every demand above it gets exactly the fair share. If all demands can be met, the biggest one may grow into the rest.
+        """
+        remaining = capacity
+        pending = sorted(demands)
+        for index, demand in enumerate(pending):
+            share = remaining / (len(pending) - index)
+            if demand >= share:
+                return share
+            remaining -= demand
+        return (pending[-1] if pending else 0) + remaining
+
+    def rebalance(self):
+        """recalculates the fair share from what the clients used since the last time, needs to hold the lock"""
+        now = self.clock()
+        elapsed = now - self.lastRebalance
+        # clients coming and going in quick succession don't make a window long enough to measure anything
+        measure = elapsed > 0 and elapsed >= self.rebalanceInterval / 2
+        demands = []
+        for share in self.clients:
+            if measure:
+                rate = share.windowBytes / elapsed
+                share.measuredRate = rate if share.measuredRate is None else (share.measuredRate + rate) / 2
+                share.windowBytes = 0
+            if share.saturated or share.measuredRate is None:
+                # it could use more, so it wants whatever it is allowed to get
+                demands.append(self.clientRate if self.clientRate > 0 else float("inf"))
+            else:
+                demands.append(share.measuredRate)
+            if measure:
+                share.saturated = False
+        if measure:
+            self.lastRebalance = now
+
+        if self.globalRate > 0:
+            fairShare = self.calculateFairShare(demands, self.globalRate)
+            self.fairShare = min(fairShare, self.clientRate) if self.clientRate > 0 else fairShare
+        else:
+            self.fairShare = self.clientRate
+        for share in self.clients:
+            share.bucket.setRate(self.fairShare, capacity=self.fairShare * self.burstSeconds)
@@ -0,0 +1,219 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from threading import Event
+from typing import Callable, ContextManager, List, Tuple
+from esm.FsTools import FsTools
+from esm.Tools import Timer, TokenBucket, lowerThreadPriority
+
+log = logging.getLogger(__name__)
+
+class CacheEntry:
+    """
+    an entry of the cache that is evicted as a whole, with the total size of its files and when any of them was used last
+    """
+    def __init__(self, path: Path, size: int, files: int, lastUsed: float):
+        self.path = path
+        self.size = size
+        self.files = files
+        self.lastUsed = lastUsed
+        """the latest access or modification time of its files in seconds, access times are not updated on every file system"""
+
+    def getAge(self, now: float) -> timedelta:
+        return timedelta(seconds=max(0, now - self.lastUsed))
+
+class PruneStats:
+    """
+    result of a cache pruning
+    """
+    def __init__(self):
+        self.entries = 0
+        self.size = 0
+        self.evicted = 0
+        self.reclaimedBytes = 0
+        self.deletedFiles = 0
+        self.failed = 0
+        self.scanTime = timedelta(0)
+        self.elapsedTime = timedelta(0)
+
+    def getThroughput(self):
+        """returns the reclaimed bytes per second"""
+        seconds = self.elapsedTime.total_seconds()
+        return self.reclaimedBytes / seconds if seconds > 0 else 0
+
+    def __str__(self):
+        return (f"scanned {self.entries} cache entries ({FsTools.realToHumanFileSize(self.size)}) in {self.scanTime}, evicted {self.evicted} of them, "
+                f"deleted {self.deletedFiles} files ({FsTools.realToHumanFileSize(self.reclaimedBytes)}, {self.failed} failed) in {self.elapsedTime}, "
+                f"{FsTools.realToHumanFileSize(self.getThroughput())}/s")
+
+class EsmCachePruner:
+    """
+    keeps the game's ever growing cache within a budget, instead of deleting it completely.
+
+    The entries of the cache (the folders at the given depth below the cache folder) are scanned in parallel, every entry gets the total size
+    of its files and the latest time any of them was accessed or modified. Entries that were not used for longer than the maximum age are
+    evicted, then the least recently used ones (the larger one first if they were used at the same time) until the cache fits into the budget.
+    Entries that were used within the protection time are never evicted, so this can run while the game is using the cache.
+
+    Files are deleted one by one on a low priority thread, limited to a rate of files per second. If a lease is given, the deletion
+    takes it for every batch of batchFiles files only, so other io heavy jobs can get their turn in between.
+    """
+
+    def __init__(self, cachePath: Path, depth: int = 1, threads: int = 8, filesPerSecond: int = 0, event: Event = None,
+                 lease: Callable[[], ContextManager] = None, batchFiles: int = 10000):
+        self.cachePath = Path(cachePath)
+        self.depth = depth
+        self.threads = threads
+        self.filesBucket = TokenBucket(filesPerSecond) if filesPerSecond > 0 else None
+        self.event = event
+        self.lease = lease
+        self.batchFiles = batchFiles
+        self.activeLease: ContextManager = None
+        self.filesInBatch = 0
+
+    def getEntryPaths(self) -> List[Path]:
+        """returns the paths of the entries, the folders (and files) at the configured depth below the cache folder"""
+        paths = [self.cachePath]
+        for level in range(self.depth):
+            children = []
+            for path in paths:
+                if path.is_dir() and not FsTools.isHardLink(path):
+                    children.extend(Path(entry.path) for entry in os.scandir(path))
+                elif level > 0:
+                    # a file above the entry depth is an entry of its own
+                    children.append(path)
+            paths = children
+        return paths
+
+    def scanEntry(self, path: Path) -> CacheEntry:
+        size = 0
+        files = 0
+        lastUsed = 0
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            try:
+                if current.is_dir() and not FsTools.isHardLink(current):
+                    stack.extend(Path(entry.path) for entry in os.scandir(current))
+                    continue
+                stat = current.stat(follow_symlinks=False)
+                size += stat.st_size
+                files += 1
+                lastUsed = max(lastUsed, stat.st_atime, stat.st_mtime)
+            except OSError as ex:
+                log.debug(f"could not scan '{current}': {ex}")
+        if files == 0:
+            # an empty folder was used when it was created or changed last
+            try:
+                stat = path.stat(follow_symlinks=False)
+                lastUsed = max(stat.st_atime, stat.st_mtime)
+            except OSError:
+                pass
+        return CacheEntry(path, size, files, lastUsed)
+
+    def scan(self) -> List[CacheEntry]:
+        """scans all entries of the cache on the thread pool"""
+        if not self.cachePath.exists():
+            return []
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="EsmCachePruner", initializer=lowerThreadPriority) as executor:
+            return list(executor.map(self.scanEntry, self.getEntryPaths()))
+
+    @staticmethod
+    def selectEvictions(entries: List[CacheEntry], now: float, budget: int = None, maxAge: timedelta = None, protectedAge: timedelta = timedelta(0)) -> List[CacheEntry]:
+        """returns the entries to evict, the least recently used first"""
+        candidates = sorted(entries, key=lambda entry: (entry.lastUsed, -entry.size))
+        remaining = sum(entry.size for entry in entries)
+        evictions = []
+        for entry in candidates:
+            age = entry.getAge(now)
+            if age < protectedAge:
+                continue
+            tooOld = maxAge is not None and age > maxAge
+            overBudget = budget is not None and remaining > budget
+            if not tooOld and not overBudget:
+                continue
+            evictions.append(entry)
+            remaining -= entry.size
+        return evictions
+
+    def prune(self, budget: int = None, maxAge: timedelta = None, protectedAge: timedelta = timedelta(0), dryrun=False) -> Tuple[PruneStats, List[CacheEntry]]:
+        """
+        evicts cache entries until the cache fits into the budget (in bytes) and no entry is older than the maximum age.
+        Returns the statistics and the entries that were (or would be, if dryrun is True) evicted.
+        """
+        stats = PruneStats()
+        with Timer() as scanTimer:
+            entries = self.scan()
+        stats.scanTime = scanTimer.elapsedTime
+        stats.entries = len(entries)
+        stats.size = sum(entry.size for entry in entries)
+        evictions = self.selectEvictions(entries, time.time(), budget=budget, maxAge=maxAge, protectedAge=protectedAge)
+        if dryrun:
+            return stats, evictions
+        with Timer() as timer:
+            # on a thread of its own, so lowering its priority doesn't affect the caller
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="EsmCachePruner", initializer=lowerThreadPriority) as executor:
+                executor.submit(self.evictEntries, evictions, stats).result()
+        stats.elapsedTime = timer.elapsedTime
+        return stats, evictions
+
+    def evictEntries(self, evictions: List[CacheEntry], stats: PruneStats):
+        try:
+            for entry in evictions:
+                if self.event is not None and self.event.is_set():
+                    break
+                self.evictEntry(entry.path, stats)
+                stats.evicted += 1
+        finally:
+            self.endBatch()
+
+    def startBatch(self):
+        if self.lease is not None and self.activeLease is None:
+            self.activeLease = self.lease()
+            self.activeLease.__enter__()
+            self.filesInBatch = 0
+
+    def endBatch(self):
+        if self.activeLease is not None:
+            activeLease = self.activeLease
+            self.activeLease = None
+            activeLease.__exit__(None, None, None)
+
+    def countDeletion(self):
+        """ends the batch after batchFiles deletions, releasing the lease until the next deletion"""
+        self.filesInBatch += 1
+        if self.filesInBatch >= self.batchFiles:
+            self.endBatch()
+
+    def evictEntry(self, entryPath: Path, stats: PruneStats):
+        """deletes the entry bottom-up, never following links"""
+        stack = [(entryPath, False)]
+        while stack:
+            if self.event is not None and self.event.is_set():
+                return
+            path, visited = stack.pop()
+            self.startBatch()
+            try:
+                if FsTools.isHardLink(path):
+                    FsTools.deleteLink(path)
+                elif path.is_dir():
+                    if not visited:
+                        stack.append((path, True))
+                        stack.extend((Path(child.path), False) for child in os.scandir(path))
+                    else:
+                        path.rmdir()
+                    continue
+                else:
+                    if self.filesBucket is not None:
+                        self.filesBucket.consume(1, self.event)
+                    size = path.stat().st_size
+                    path.unlink()
+                    stats.deletedFiles += 1
+                    stats.reclaimedBytes += size
+                    self.countDeletion()
+            except OSError as ex:
+                log.warning(f"could not delete '{path}' from the cache: {ex}")
+                stats.failed += 1
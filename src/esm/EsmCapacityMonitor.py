@@ -0,0 +1,357 @@
+import logging
+import os
+import shutil
+import time
+from functools import cached_property
+from pathlib import Path
+from threading import Event, Thread
+from typing import Dict, List, Tuple
+from esm.ConfigModels import MainConfig
+from esm.EsmConfigService import EsmConfigService
+from esm.EsmEmpRemoteClientService import EsmEmpRemoteClientService, Priority
+from esm.EsmFileSystem import EsmFileSystem
+from esm.FsTools import FsTools
+from esm.ServiceRegistry import Service, ServiceRegistry
+
+log = logging.getLogger(__name__)
+
+class IncrementalFolderSizer:
+    """
+    measures the size of the top level folders below root, rescanning only the folders whose modification time changed since the last measurement.
+
+    A folder's modification time changes when entries are created, deleted or renamed in it, but not when an existing file grows.
+    The files directly in root (like the database) are looked at every time, everything else gets a full rescan every fullScanInterval measurements.
+    Links are not followed, what they point to is not on the same drive.
+    """
+    ROOTFILES = "(files)"
+    """name used for the files directly in root"""
+
+    def __init__(self, root: Path, fullScanInterval: int = 12):
+        self.root = Path(root)
+        self.fullScanInterval = fullScanInterval
+        self.folders: Dict[str, Tuple[int, int, List[str]]] = {}
+        self.measurements = 0
+        self.rescanned = 0
+
+    def measure(self) -> Dict[str, int]:
+        """
+        returns the size of the files below each top level folder of root, the files directly in root are summed up as ROOTFILES
+        """
+        self.measurements += 1
+        fullScan = self.fullScanInterval > 0 and self.measurements % self.fullScanInterval == 0
+        self.rescanned = 0
+        seen = set()
+        sizes = {self.ROOTFILES: 0}
+        if not self.root.is_dir():
+            self.folders = {}
+            return sizes
+        ownSize, children = self.scanFolder(str(self.root))
+        sizes[self.ROOTFILES] = ownSize
+        for child in children:
+            sizes[os.path.basename(child)] = self.getFolderSize(child, fullScan, seen)
+        # forget the folders that vanished
+        self.folders = {path: entry for path, entry in self.folders.items() if path in seen}
+        return sizes
+
+    def getFolderSize(self, path: str, fullScan: bool, seen: set) -> int:
+        size = 0
+        folders = [path]
+        while folders:
+            folder = folders.pop()
+            seen.add(folder)
+            try:
+                modificationTime = os.stat(folder).st_mtime_ns
+            except OSError:
+                continue
+            cached = self.folders.get(folder)
+            if fullScan or cached is None or cached[0] != modificationTime:
+                ownSize, children = self.scanFolder(folder)
+                self.folders[folder] = (modificationTime, ownSize, children)
+                self.rescanned += 1
+            else:
+                _, ownSize, children = cached
+            size += ownSize
+            folders.extend(children)
+        return size
+
+    def scanFolder(self, folder: str) -> Tuple[int, List[str]]:
+        """returns the size of the files in the folder and its subfolders, skipping links"""
+        ownSize = 0
+        children = []
+        try:
+            with os.scandir(folder) as iterator:
+                for entry in iterator:
+                    try:
+                        if entry.is_symlink() or FsTools.isHardLink(entry.path):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            children.append(entry.path)
+                        else:
+                            ownSize += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        # probably deleted in the meantime
+                        continue
+        except OSError as ex:
+            log.debug(f"could not scan folder '{folder}': {ex}")
+        return ownSize, children
+
+class CapacitySample:
+    """
+    usage of the ramdisk at a point in time, with the sizes of the top level folders of the savegame
+    """
+    def __init__(self, timestamp: int, used: int, total: int, folders: Dict[str, int]):
+        self.timestamp = timestamp
+        self.used = used
+        self.total = total
+        self.folders = folders
+
+class CapacityHistory:
+    """
+    the samples of the ramdisk usage as compact time series, one line of tab separated integers per sample.
+
+    When there are more than maxSamples lines, the older half is thinned out to every second sample, so the history
+    keeps a long time span at a decreasing resolution without growing forever.
+    """
+    HEADER = "#esm-capacity-history"
+    VERSION = "1"
+
+    def __init__(self, path: Path, folderNames: List[str], maxSamples: int = 4000):
+        self.path = Path(path)
+        self.folderNames = list(folderNames)
+        self.maxSamples = maxSamples
+
+    def getHeader(self):
+        return "\t".join([self.HEADER, self.VERSION, "time", "used", "total"] + self.folderNames)
+
+    def toLine(self, sample: CapacitySample):
+        values = [sample.timestamp, sample.used, sample.total] + [sample.folders.get(name, 0) for name in self.folderNames]
+        return "\t".join(str(value) for value in values)
+
+    def read(self) -> List[CapacitySample]:
+        """returns the samples, or an empty list if there is no history or it was written for other folders"""
+        if not self.path.exists():
+            return []
+        samples = []
+        with open(self.path, "r", encoding="utf-8") as file:
+            if file.readline().rstrip("\n") != self.getHeader():
+                log.info(f"The capacity history at '{self.path}' was written for other folders, starting a new one")
+                return []
+            for line in file:
+                try:
+                    values = [int(value) for value in line.rstrip("\n").split("\t")]
+                except ValueError:
+                    continue
+                if len(values) != 3 + len(self.folderNames):
+                    continue
+                samples.append(CapacitySample(values[0], values[1], values[2], dict(zip(self.folderNames, values[3:]))))
+        return samples
+
+    def append(self, sample: CapacitySample):
+        """appends the sample, compacting the history if needed"""
+        samples = self.read()
+        if len(samples) == 0:
+            self.write([sample])
+            return
+        if len(samples) + 1 > self.maxSamples:
+            self.write(self.compact(samples + [sample]))
+            return
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(f"{self.toLine(sample)}\n")
+
+    def compact(self, samples: List[CapacitySample]) -> List[CapacitySample]:
+        half = len(samples) // 2
+        return samples[:half:2] + samples[half:]
+
+    def write(self, samples: List[CapacitySample]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporaryPath = self.path.with_name(f"{self.path.name}.tmp")
+        with open(temporaryPath, "w", encoding="utf-8") as file:
+            file.write(f"{self.getHeader()}\n")
+            for sample in samples:
+                file.write(f"{self.toLine(sample)}\n")
+        os.replace(temporaryPath, self.path)
+
+def fitGrowthRate(points: List[Tuple[float, float]]) -> float:
+    """
+    returns the slope of the least squares line through the (time, value) points, or None if there are not enough points
+    """
+    if len(points) < 3:
+        return None
+    meanTime = sum(point[0] for point in points) / len(points)
+    meanValue = sum(point[1] for point in points) / len(points)
+    variance = sum((point[0] - meanTime) ** 2 for point in points)
+    if variance == 0:
+        return None
+    return sum((point[0] - meanTime) * (point[1] - meanValue) for point in points) / variance
+
+class CapacityForecast:
+    """
+    the current usage of the ramdisk, how fast it grows and when it will be full at that rate
+    """
+    def __init__(self, sample: CapacitySample, growthRate: float, folderGrowthRates: Dict[str, float]):
+        self.sample = sample
+        self.growthRate = growthRate
+        self.folderGrowthRates = folderGrowthRates
+
+    def getUsage(self):
+        return self.sample.used / self.sample.total if self.sample.total > 0 else 0
+
+    def getSecondsToFull(self):
+        """returns the seconds until the ramdisk is full, or None if it is not growing"""
+        if self.growthRate is None or self.growthRate <= 0:
+            return None
+        return max(0, self.sample.total - self.sample.used) / self.growthRate
+
+    def getFastestGrowingFolder(self):
+        if len(self.folderGrowthRates) == 0:
+            return None
+        return max(self.folderGrowthRates.keys(), key=lambda name: self.folderGrowthRates[name])
+
+    def __str__(self):
+        text = f"ramdisk usage {FsTools.realToHumanFileSize(self.sample.used)} of {FsTools.realToHumanFileSize(self.sample.total)} ({self.getUsage()*100:.1f}%)"
+        if self.growthRate is None:
+            return f"{text}, not enough history to tell the growth yet"
+        text = f"{text}, growing {FsTools.realToHumanFileSize(max(0, self.growthRate) * 3600)}/h"
+        secondsToFull = self.getSecondsToFull()
+        if secondsToFull is not None:
+            text = f"{text}, full in {secondsToFull / 3600:.1f} hours"
+        fastest = self.getFastestGrowingFolder()
+        if fastest is not None and self.folderGrowthRates[fastest] > 0:
+            text = f"{text}, mostly {fastest} ({FsTools.realToHumanFileSize(self.folderGrowthRates[fastest] * 3600)}/h)"
+        return text
+
+def forecast(samples: List[CapacitySample], window: float) -> CapacityForecast:
+    """
+    fits the growth of the usage and of every folder over the samples within the window (in seconds) before the last one
+    """
+    latest = samples[-1]
+    recent = [sample for sample in samples if sample.timestamp >= latest.timestamp - window]
+    growthRate = fitGrowthRate([(sample.timestamp, sample.used) for sample in recent])
+    folderGrowthRates = {}
+    for name in latest.folders.keys():
+        folderRate = fitGrowthRate([(sample.timestamp, sample.folders.get(name, 0)) for sample in recent])
+        if folderRate is not None:
+            folderGrowthRates[name] = folderRate
+    return CapacityForecast(latest, growthRate, folderGrowthRates)
+
+class CapacityWarner:
+    """
+    decides when to warn about the forecast: once whenever the time to full drops below the next of the thresholds (in hours),
+    and once when the usage reaches the usage threshold. Warnings are given again after the forecast recovered.
+    """
+    def __init__(self, thresholdHours: List[float], usageThreshold: float):
+        self.thresholdHours = sorted(thresholdHours, reverse=True)
+        self.usageThreshold = usageThreshold
+        self.warnedLevel = None
+        self.warnedUsage = False
+
+    def check(self, capacityForecast: CapacityForecast) -> List[Tuple[str, bool]]:
+        """returns the warnings to give as list of (message, urgent)"""
+        warnings = []
+        secondsToFull = capacityForecast.getSecondsToFull()
+        level = None
+        if secondsToFull is not None:
+            for index, hours in enumerate(self.thresholdHours):
+                if secondsToFull <= hours * 3600:
+                    level = index
+        if level is None:
+            self.warnedLevel = None
+        elif self.warnedLevel is None or level > self.warnedLevel:
+            self.warnedLevel = level
+            warnings.append((f"the ramdisk will be full in {secondsToFull / 3600:.1f} hours at the current growth", level == len(self.thresholdHours) - 1))
+        if capacityForecast.getUsage() >= self.usageThreshold:
+            if not self.warnedUsage:
+                self.warnedUsage = True
+                warnings.append((f"the ramdisk is {capacityForecast.getUsage()*100:.0f}% full", True))
+        else:
+            self.warnedUsage = False
+        return warnings
+
+@Service
+class EsmCapacityMonitor:
+    """
+    Service that watches the usage of the ramdisk while the server is running, since a full ramdisk corrupts the savegame.
+
+    Samples the usage of the drive and the sizes of the top level folders of the savegame, keeps them as history, fits the growth rate
+    and warns in the log and in game before the ramdisk will be full.
+    """
+    monitorThread: Thread = None
+    monitorShutdownEvent: Event = None
+
+    @cached_property
+    def config(self) -> MainConfig:
+        return ServiceRegistry.get(EsmConfigService).config
+
+    @cached_property
+    def fileSystem(self) -> EsmFileSystem:
+        return ServiceRegistry.get(EsmFileSystem)
+
+    @cached_property
+    def emprcClient(self) -> EsmEmpRemoteClientService:
+        return ServiceRegistry.get(EsmEmpRemoteClientService)
+
+    @cached_property
+    def sizer(self) -> IncrementalFolderSizer:
+        return IncrementalFolderSizer(self.fileSystem.getAbsolutePathTo("ramdisk.savegame", prefixInstallDir=False), self.config.ramdisk.capacityFullScanInterval)
+
+    @cached_property
+    def history(self) -> CapacityHistory:
+        folderNames = [self.config.foldernames.playfields, self.config.foldernames.shared, self.config.foldernames.templates, IncrementalFolderSizer.ROOTFILES]
+        return CapacityHistory(Path(self.config.ramdisk.capacityHistoryFile).absolute(), folderNames, self.config.ramdisk.capacityHistorySamples)
+
+    @cached_property
+    def warner(self) -> CapacityWarner:
+        return CapacityWarner(self.config.ramdisk.capacityWarningHours, self.config.ramdisk.capacityWarningUsage)
+
+    def sample(self) -> CapacitySample:
+        """measures the usage of the ramdisk and the folders of the savegame on it"""
+        usage = shutil.disk_usage(self.config.ramdisk.drive)
+        folders = self.sizer.measure()
+        log.debug(f"sampled the ramdisk usage, rescanned {self.sizer.rescanned} folders")
+        return CapacitySample(int(time.time()), usage.used, usage.total, folders)
+
+    def update(self) -> CapacityForecast:
+        """takes a sample, adds it to the history and returns the forecast"""
+        sample = self.sample()
+        self.history.append(sample)
+        samples = self.history.read() or [sample]
+        return forecast(samples, self.config.ramdisk.capacityFitWindow)
+
+    def warn(self, capacityForecast: CapacityForecast):
+        for message, urgent in self.warner.check(capacityForecast):
+            log.warning(f"Capacity warning: {message}. {capacityForecast}. Consider increasing ramdisk.size or enabling ramdisk.tiering.")
+            if self.config.ramdisk.capacityAnnounce:
+                priority = Priority.ALERT if urgent else Priority.WARNING
+                self.emprcClient.sendAnnouncement(f"Server warning: {message}, please tell the admins!", priority=priority, time=10000)
+
+    def startMonitor(self, interval):
+        """
+        starts a separate thread for the monitor, that will sample the ramdisk every $interval seconds
+        """
+        if self.monitorThread is not None and self.monitorThread.is_alive():
+            log.debug("capacity monitor is already running")
+            return
+        self.monitorShutdownEvent = Event()
+        self.monitorThread = Thread(target=self.monitorTask, args=(self.monitorShutdownEvent, interval), daemon=True)
+        self.monitorThread.start()
+        log.debug(f"capacity monitor started with an interval of {interval}")
+
+    def monitorTask(self, event: Event, interval):
+        while not event.is_set():
+            try:
+                capacityForecast = self.update()
+                log.debug(f"{capacityForecast}")
+                self.warn(capacityForecast)
+            except Exception as ex:
+                log.error(f"error while monitoring the ramdisk capacity: {ex}")
+            event.wait(interval)
+        log.debug("capacity monitor shut down")
+
+    def stopMonitor(self):
+        if not self.monitorShutdownEvent:
+            log.debug("Can not stop capacity monitor thread since there is probably none running.")
+            return
+        self.monitorShutdownEvent.set()
+        log.debug("waiting for capacity monitor thread to finish")
+        self.monitorThread.join()
+        log.debug(f"capacity monitor stopped")
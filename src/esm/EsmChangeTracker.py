@@ -0,0 +1,360 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Dict, Set
+from esm.FsTools import FsTools
+
+log = logging.getLogger(__name__)
+
+class ChangeSet:
+    """
+    the folders that changed since the last sync, as relative paths with forward slashes ("" is the root folder).
+
+    For the folders, only their direct entries need to be scanned again, subtrees need to be scanned completely.
+    """
+    def __init__(self, folders: Set[str] = None, subtrees: Set[str] = None):
+        self.folders = folders if folders is not None else set()
+        self.subtrees = subtrees if subtrees is not None else set()
+
+    def __len__(self):
+        return len(self.folders) + len(self.subtrees)
+
+def getParentFolder(relativePath: str):
+    """returns the relative path of the parent folder of the relative path, "" being the root"""
+    return relativePath.rpartition("/")[0]
+
+class ChangeTracker:
+    """
+    base class for the change trackers, which record the folders below a root folder that had changes.
+
+    After the start (or restart), an overflow of the event queue or any error, the tracker can not tell what changed
+    and takeChanges will return None once, meaning that the whole root needs to be scanned.
+    """
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.lock = Lock()
+        self.folders = set()
+        self.subtrees = set()
+        self.overflow = True
+        self.shutdownEvent = Event()
+        self.thread = None
+
+    def start(self):
+        self.shutdownEvent.clear()
+        with self.lock:
+            self.overflow = True
+        self.thread = Thread(target=self.watch, daemon=True, name=type(self).__name__)
+        self.thread.start()
+        log.debug(f"{type(self).__name__} started for '{self.root}'")
+
+    def stop(self):
+        self.shutdownEvent.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        log.debug(f"{type(self).__name__} stopped for '{self.root}'")
+
+    def watch(self):
+        """runs in the tracker thread until the shutdown event is set, recording the changes"""
+        raise NotImplementedError()
+
+    def markFolder(self, relativeFolder: str):
+        with self.lock:
+            self.folders.add(relativeFolder)
+
+    def markChanged(self, relativePath: str):
+        """marks the folder containing the changed entry as dirty"""
+        self.markFolder(getParentFolder(relativePath))
+
+    def markOverflow(self):
+        """forgets all recorded changes, the next sync will need to scan everything"""
+        with self.lock:
+            if not self.overflow:
+                log.warning(f"{type(self).__name__} for '{self.root}' lost track of the changes, the next sync will scan everything")
+            self.overflow = True
+            self.folders = set()
+            self.subtrees = set()
+
+    def countChanges(self):
+        """
+        returns the amount of folders recorded since the last takeChanges, or None if the tracker lost track of the changes
+        """
+        with self.lock:
+            if self.overflow:
+                return None
+            return len(self.folders) + len(self.subtrees)
+
+    def takeChanges(self) -> ChangeSet:
+        """
+        returns the changes recorded since the last call and starts recording anew, or None if everything needs to be scanned
+        """
+        with self.lock:
+            if self.overflow:
+                self.overflow = False
+                self.folders = set()
+                self.subtrees = set()
+                return None
+            changes = ChangeSet(self.folders, self.subtrees)
+            self.folders = set()
+            self.subtrees = set()
+            return changes
+
+class PollingChangeTracker(ChangeTracker):
+    """
+    change tracker that compares the modification times of all folders on every call of takeChanges.
+
+    This only needs to enumerate the folders, but it only notices entries that have been created, deleted or renamed,
+    since writing to an existing file does not change the modification time of its folder. Use this as fallback only.
+    """
+    def __init__(self, root: Path):
+        super().__init__(root)
+        self.folderTimes = {}
+
+    def start(self):
+        self.folderTimes = self.scanFolderTimes()
+        with self.lock:
+            self.overflow = True
+        log.debug(f"{type(self).__name__} started for '{self.root}' with {len(self.folderTimes)} folders")
+
+    def stop(self):
+        self.folderTimes = {}
+
+    def countChanges(self):
+        # the changes are only known once they are taken
+        return None
+
+    def takeChanges(self) -> ChangeSet:
+        folderTimes = self.scanFolderTimes()
+        for relativeFolder, mtime in folderTimes.items():
+            if self.folderTimes.get(relativeFolder) != mtime:
+                self.markFolder(relativeFolder)
+        for relativeFolder in self.folderTimes.keys() - folderTimes.keys():
+            if relativeFolder:
+                self.markChanged(relativeFolder)
+        self.folderTimes = folderTimes
+        return super().takeChanges()
+
+    def scanFolderTimes(self) -> Dict[str, int]:
+        folderTimes = {}
+        if not self.root.exists():
+            return folderTimes
+        folderTimes[""] = self.root.stat().st_mtime_ns
+        folders = [("", str(self.root))]
+        while folders:
+            relativeFolder, folder = folders.pop()
+            try:
+                with os.scandir(folder) as iterator:
+                    for entry in iterator:
+                        if entry.is_dir():
+                            relativePath = f"{relativeFolder}{entry.name}"
+                            folderTimes[relativePath] = entry.stat().st_mtime_ns
+                            folders.append((f"{relativePath}/", entry.path))
+            except OSError as ex:
+                log.debug(f"could not scan folder '{folder}': {ex}")
+        return folderTimes
+
+class InotifyChangeTracker(ChangeTracker):
+    """
+    change tracker using inotify on linux, with a watch for every folder below the root.
+    """
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    WATCHMASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+    EVENTHEADER = struct.Struct("iIII")
+
+    def __init__(self, root: Path):
+        super().__init__(root)
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = None
+        self.watches = {}
+
+    def watch(self):
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            log.error(f"could not initialize inotify: {os.strerror(ctypes.get_errno())}")
+            return
+        try:
+            self.addWatches("", self.root)
+            while not self.shutdownEvent.is_set():
+                readable, _, _ = select.select([self.fd], [], [], 0.5)
+                if readable:
+                    self.handleEvents(os.read(self.fd, 65536))
+        except OSError as ex:
+            log.error(f"inotify change tracker failed: {ex}")
+            self.markOverflow()
+        finally:
+            os.close(self.fd)
+            self.fd = None
+            self.watches = {}
+
+    def addWatches(self, relativeFolder: str, folder: Path):
+        """adds watches for the folder and all folders below it, following links"""
+        folders = [(relativeFolder, str(folder))]
+        while folders:
+            relativeFolder, folder = folders.pop()
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), self.WATCHMASK)
+            if wd < 0:
+                # most likely fs.inotify.max_user_watches is too low
+                log.warning(f"could not add inotify watch for '{folder}': {os.strerror(ctypes.get_errno())}")
+                self.markOverflow()
+                continue
+            self.watches[wd] = relativeFolder
+            prefix = f"{relativeFolder}/" if relativeFolder else ""
+            try:
+                with os.scandir(folder) as iterator:
+                    for entry in iterator:
+                        if entry.is_dir():
+                            folders.append((f"{prefix}{entry.name}", entry.path))
+            except OSError as ex:
+                log.debug(f"could not scan folder '{folder}': {ex}")
+
+    def handleEvents(self, buffer: bytes):
+        offset = 0
+        while offset + self.EVENTHEADER.size <= len(buffer):
+            wd, mask, cookie, length = self.EVENTHEADER.unpack_from(buffer, offset)
+            name = os.fsdecode(buffer[offset + self.EVENTHEADER.size:offset + self.EVENTHEADER.size + length].rstrip(b"\0"))
+            offset += self.EVENTHEADER.size + length
+            if mask & self.IN_Q_OVERFLOW:
+                self.markOverflow()
+                continue
+            if mask & self.IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            relativeFolder = self.watches.get(wd)
+            if relativeFolder is None:
+                continue
+            if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                if relativeFolder:
+                    self.markChanged(relativeFolder)
+                continue
+            if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                relativePath = f"{relativeFolder}/{name}" if relativeFolder else name
+                self.addWatches(relativePath, self.root.joinpath(relativePath))
+            self.markFolder(relativeFolder)
+
+class ReadDirectoryChangesTracker(ChangeTracker):
+    """
+    change tracker using ReadDirectoryChangesW on windows, watching the whole tree below the root with one handle.
+
+    Changes below junctions are not reported by windows, so the folders behind links are always scanned completely.
+    """
+    FILE_LIST_DIRECTORY = 0x0001
+    FILE_SHARE_ALL = 0x00000007
+    OPEN_EXISTING = 3
+    FILE_FLAG_BACKUP_SEMANTICS = 0x02000000
+    FILE_NOTIFY_CHANGES = 0x00000001 | 0x00000002 | 0x00000004 | 0x00000008 | 0x00000010
+    BUFFERSIZE = 64 * 1024
+    NOTIFYHEADER = struct.Struct("III")
+
+    def __init__(self, root: Path):
+        super().__init__(root)
+        from ctypes import wintypes
+        self.kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        self.kernel32.CreateFileW.restype = wintypes.HANDLE
+        self.kernel32.CreateFileW.argtypes = [wintypes.LPCWSTR, wintypes.DWORD, wintypes.DWORD, wintypes.LPVOID, wintypes.DWORD, wintypes.DWORD, wintypes.HANDLE]
+        self.kernel32.ReadDirectoryChangesW.argtypes = [wintypes.HANDLE, wintypes.LPVOID, wintypes.DWORD, wintypes.BOOL, wintypes.DWORD, ctypes.POINTER(wintypes.DWORD), wintypes.LPVOID, wintypes.LPVOID]
+        self.kernel32.CancelIoEx.argtypes = [wintypes.HANDLE, wintypes.LPVOID]
+        self.kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+        self.handle = None
+        self.links = set()
+
+    def start(self):
+        self.links = self.findLinks()
+        super().start()
+
+    def stop(self):
+        self.shutdownEvent.set()
+        if self.handle is not None:
+            # wakes up the blocking ReadDirectoryChangesW call
+            self.kernel32.CancelIoEx(self.handle, None)
+        super().stop()
+
+    def takeChanges(self) -> ChangeSet:
+        changes = super().takeChanges()
+        if changes is not None:
+            changes.subtrees.update(self.links)
+        return changes
+
+    def findLinks(self) -> Set[str]:
+        links = set()
+        folders = [("", str(self.root))]
+        while folders:
+            relativeFolder, folder = folders.pop()
+            try:
+                with os.scandir(folder) as iterator:
+                    for entry in iterator:
+                        if entry.is_dir():
+                            relativePath = f"{relativeFolder}{entry.name}"
+                            if FsTools.isHardLink(entry.path):
+                                links.add(relativePath)
+                            else:
+                                folders.append((f"{relativePath}/", entry.path))
+            except OSError as ex:
+                log.debug(f"could not scan folder '{folder}': {ex}")
+        if links:
+            log.debug(f"folders behind {len(links)} links below '{self.root}' will always be scanned completely")
+        return links
+
+    def watch(self):
+        from ctypes import wintypes
+        self.handle = self.kernel32.CreateFileW(str(self.root), self.FILE_LIST_DIRECTORY, self.FILE_SHARE_ALL, None, self.OPEN_EXISTING, self.FILE_FLAG_BACKUP_SEMANTICS, None)
+        if self.handle is None or self.handle == wintypes.HANDLE(-1).value:
+            log.error(f"could not open '{self.root}' for change tracking: {ctypes.WinError(ctypes.get_last_error())}")
+            self.handle = None
+            return
+        buffer = ctypes.create_string_buffer(self.BUFFERSIZE)
+        bytesReturned = wintypes.DWORD()
+        try:
+            while not self.shutdownEvent.is_set():
+                success = self.kernel32.ReadDirectoryChangesW(self.handle, buffer, self.BUFFERSIZE, True, self.FILE_NOTIFY_CHANGES, ctypes.byref(bytesReturned), None, None)
+                if self.shutdownEvent.is_set():
+                    break
+                if not success or bytesReturned.value == 0:
+                    # the buffer overflowed or something else went wrong, we can't tell what changed any more
+                    self.markOverflow()
+                    continue
+                self.handleEvents(buffer.raw[:bytesReturned.value])
+        finally:
+            self.kernel32.CloseHandle(self.handle)
+            self.handle = None
+
+    def handleEvents(self, buffer: bytes):
+        offset = 0
+        while True:
+            nextEntryOffset, action, length = self.NOTIFYHEADER.unpack_from(buffer, offset)
+            name = buffer[offset + self.NOTIFYHEADER.size:offset + self.NOTIFYHEADER.size + length].decode("utf-16-le")
+            self.markChanged(name.replace("\\", "/"))
+            if nextEntryOffset == 0:
+                break
+            offset += nextEntryOffset
+
+def createChangeTracker(kind: str, root: Path) -> ChangeTracker:
+    """
+    returns a change tracker for the root folder. kind 'auto' picks the native one of the os, 'polling' the fallback, 'none' returns None.
+    """
+    if kind == "none":
+        return None
+    if kind == "auto":
+        if sys.platform == "win32":
+            return ReadDirectoryChangesTracker(root)
+        if sys.platform.startswith("linux"):
+            return InotifyChangeTracker(root)
+        log.warning(f"There is no native change tracker for platform '{sys.platform}', using polling")
+    return PollingChangeTracker(root)
@@ -2,6 +2,7 @@ from datetime import datetime, timedelta
 from functools import cached_property, lru_cache
 import functools
 import logging
+import os
 from pathlib import Path
 import sqlite3
 import sys
@@ -12,6 +13,8 @@ from esm.DataTypes import Entity, EntityType, Playfield, SolarSystem
 from esm.EsmConfigService import EsmConfigService
 from esm.EsmFileSystem import EsmFileSystem
 from esm.ServiceRegistry import ServiceRegistry
+from esm.Tools import Timer
+from esm.exceptions import DatabaseCaptureError
 
 log = logging.getLogger(__name__)
 
@@ -68,7 +71,7 @@ class EsmDatabaseWrapper:
 
     def getGameDbString(self):
         if not self.dbConnectString:
-            self.dbConnectString = f"file:/{self.getGameDbPath().as_posix()}?mode={self.getDbMode()}"
+            self.dbConnectString = f"file:/{self.getGameDbPath().as_posix().lstrip('/')}?mode={self.getDbMode()}"
         return self.dbConnectString
     
     def getGameDbConnection(self) -> sqlite3.Connection:
@@ -92,6 +95,55 @@ class EsmDatabaseWrapper:
             connection = self.getGameDbConnection()
             self.gameDbCursor = connection.cursor()
         return self.gameDbCursor
+
+    def captureTo(self, destination: Path, pagesPerStep=1024, quickCheck=False, maxRestarts=10):
+        """
+        captures a consistent copy of the game database with the sqlite online backup api, while the game may still be writing to it.
+        The pages are copied in steps of pagesPerStep into a temporary file next to the destination, which then replaces the destination.
+        If the game keeps changing the database so the backup had to restart more than maxRestarts times, the rest is copied in one step.
+        Sidecar files of the destination (-wal, -shm, -journal) are removed, since they would not match the captured database.
+
+        if quickCheck is True, the captured database is checked with PRAGMA quick_check before it replaces the destination.
+
+        returns a tuple with the amount of pages copied and the time it took
+        """
+        destination = Path(destination)
+        temporaryPath = destination.with_name(f"{destination.name}.esm-capture.tmp")
+        temporaryPath.unlink(missing_ok=True)
+        progress = {"pages": 0, "lastRemaining": None, "restarts": 0}
+
+        def onProgress(status, remaining, total):
+            progress["pages"] = total
+            if progress["lastRemaining"] is not None and remaining > progress["lastRemaining"]:
+                # the source changed, the backup started over
+                progress["restarts"] += 1
+                if progress["restarts"] > maxRestarts:
+                    raise DatabaseCaptureError("database changed too often while capturing it")
+            progress["lastRemaining"] = remaining
+
+        with Timer() as timer:
+            source = self.getGameDbConnection()
+            target = sqlite3.connect(temporaryPath)
+            try:
+                try:
+                    source.backup(target, pages=pagesPerStep, progress=onProgress)
+                except DatabaseCaptureError:
+                    log.warning(f"Database '{self.gameDbPath}' changed too often while capturing it, copying the rest in one step")
+                    source.backup(target, pages=-1)
+                if quickCheck:
+                    result = target.execute("PRAGMA quick_check").fetchone()[0]
+                    if result != "ok":
+                        raise DatabaseCaptureError(f"quick check of the captured database failed: {result}")
+            except Exception:
+                target.close()
+                temporaryPath.unlink(missing_ok=True)
+                raise
+            target.close()
+            os.replace(temporaryPath, destination)
+            for suffix in ["-wal", "-shm", "-journal"]:
+                destination.with_name(f"{destination.name}{suffix}").unlink(missing_ok=True)
+        log.debug(f"captured {progress['pages']} pages of '{self.gameDbPath}' to '{destination}' in {timer.elapsedTime}, {progress['restarts']} restarts, quick check {'passed' if quickCheck else 'skipped'}")
+        return progress["pages"], timer.elapsedTime
     
     def retrievePFsDiscoveredBySolarSystems(self, solarsystems: List[SolarSystem], batchSize=10000) -> List[Playfield]:
         """return all playfields that are discovered and belong to the list of given solar systems"""
@@ -290,6 +342,23 @@ class EsmDatabaseWrapper:
             playfields.append(Playfield(pfid=row[0], name=row[1], ssid=row[2], starName=row[3]))
         return playfields
 
+    def retrievePFsLastVisit(self) -> Dict[str, int]:
+        """
+        Return the gametick of the last warp to each playfield, as dictionary of playfield name to gametick. Playfields that never were visited are not contained.
+
+        select pfs.name, max(cpfs.gametime) from ChangedPlayfields as cpfs
+        join playfields as pfs on cpfs.topfid = pfs.pfid where pfs.isinstance = 0 group by cpfs.topfid
+        """
+        cursor = self.getGameDbCursor()
+        lastVisits = {}
+        query = f"SELECT pfs.name, MAX(cpfs.gametime) from ChangedPlayfields AS cpfs"
+        query = f"{query} JOIN playfields AS pfs ON cpfs.topfid = pfs.pfid"
+        query = f"{query} WHERE pfs.isinstance = 0"
+        query = f"{query} GROUP BY cpfs.topfid"
+        for row in cursor.execute(query):
+            lastVisits[row[0]] = row[1]
+        return lastVisits
+
     def retrievePurgeableEntitiesByPlayfields(self, playfields: List[Playfield], batchSize=20000) -> List[Entity]:
         """
         retrieve all entities contained in the given playfield that can be purged, this means:
@@ -1,14 +1,17 @@
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from functools import cached_property
 import logging
 from pathlib import Path
 import shutil
+from typing import List, Tuple
 from esm.ConfigModels import MainConfig
 from esm.exceptions import AdminRequiredException
 from esm.EsmBackupService import EsmBackupService
+from esm.EsmCachePruner import CacheEntry, EsmCachePruner, PruneStats
 from esm.EsmConfigService import EsmConfigService
 from esm.EsmFileSystem import EsmFileSystem
+from esm.EsmIoCoordinator import EsmIoCoordinator, IoPriority
 from esm.EsmRamdiskManager import EsmRamdiskManager
 from esm.FsTools import FsTools
 from esm.ServiceRegistry import Service, ServiceRegistry
@@ -34,6 +37,10 @@ class EsmDeleteService:
     def backupService(self) -> EsmBackupService:
         return ServiceRegistry.get(EsmBackupService)
 
+    @cached_property
+    def ioCoordinator(self) -> EsmIoCoordinator:
+        return ServiceRegistry.get(EsmIoCoordinator)
+
     def deleteAll(self):
         """
         Marks everything that belongs to a savegame for deletion, including:
@@ -88,6 +95,18 @@ class EsmDeleteService:
         log.info(f"Marking for deletion: the cache at {cacheSavegame}")
         self.fileSystem.markForDelete(cacheSavegame)
 
+    def pruneGameCache(self, budget: int = None, maxAge: timedelta = None, dryrun=True) -> Tuple[PruneStats, List[CacheEntry]]:
+        """
+            evicts the least recently used entries of the cache until it fits into the budget in bytes and has no entries older than the maximum age.
+            Returns the statistics and the evicted entries, or the ones that would be evicted if dryrun is True.
+        """
+        cacheSavegame = self.fileSystem.getAbsolutePathTo("saves.cache").joinpath(self.config.dedicatedConfig.GameConfig.GameName)
+        # the lease is only held while deleting, for one batch of files at a time
+        pruner = EsmCachePruner(cacheSavegame, depth=self.config.deletes.cacheEntryDepth, threads=self.config.deletes.cachePruneThreads, filesPerSecond=self.config.deletes.cachePruneRate,
+                                lease=lambda: self.ioCoordinator.lease("cache prune", IoPriority.PURGE), batchFiles=self.config.deletes.cachePruneBatchFiles)
+        protectedAge = timedelta(hours=self.config.deletes.cacheProtectedHours)
+        return pruner.prune(budget=budget, maxAge=maxAge, protectedAge=protectedAge, dryrun=dryrun)
+
     def deleteEahToolData(self):
         """
             delete eah tool data
@@ -138,13 +157,13 @@ class EsmDeleteService:
             Will just unmount the ramdisk, if it exists.
         """
         ramdiskDriveLetter = self.config.ramdisk.drive
-        if Path(ramdiskDriveLetter).exists():
+        if self.ramdiskManager.checkRamdrive(simpleCheck=True):
             log.info(f"Unmounting ramdisk at {ramdiskDriveLetter}.")
             try:
                 self.ramdiskManager.unmountRamdisk(driveLetter=ramdiskDriveLetter)
             except AdminRequiredException as ex:
                 log.error(f"exception trying to unmount. Will check if its mounted at all")
-                if self.ramdiskManager.checkRamdrive(driveLetter=ramdiskDriveLetter):
+                if self.ramdiskManager.checkRamdrive(ramdiskDriveLetter=ramdiskDriveLetter):
                     raise AdminRequiredException(f"Ramdisk is still mounted, can't recuperate from the error here. Exception: {ex}")
                 else:
                     log.info(f"There is no more ramdisk mounted as {ramdiskDriveLetter}, will continue.")
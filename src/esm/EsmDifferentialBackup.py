@@ -0,0 +1,189 @@
+import hashlib
+import logging
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+from esm.EsmArchiver import ArchiveStats, EsmArchiver
+from esm.EsmSyncEngine import SyncStats
+from esm.exceptions import BackupFailedError
+from esm.Tools import Timer
+
+log = logging.getLogger(__name__)
+
+class StaticManifest:
+    """
+    sidecar of a static backup zip, describing the complete state of the backed up tree at that time: every file with its size, modification
+    time, hash and the name of the zip (volume) that contains this version of it, plus all folders.
+
+    A full static backup contains all files. A differential one only contains the files that are new or changed since the previous
+    static backup, all other files point to the zips of the previous backups. Restoring any static backup therefore only needs its own
+    manifest and the zips it points to.
+    """
+    HEADER = "#esm-static-manifest"
+    VERSION = "1"
+    SUFFIX = ".manifest.tsv"
+    DELETEDSUFFIX = ".deleted.txt"
+    FOLDER = -1
+    """size used for folders"""
+
+    def __init__(self, path: Path, zipName: str, previousZipName: str = None, chainLength: int = 0):
+        self.path = Path(path)
+        self.zipName = zipName
+        self.previousZipName = previousZipName
+        self.chainLength = chainLength
+        """amount of differential backups since the last full one, 0 for a full backup"""
+        self.entries: Dict[str, Tuple[int, int, str, str]] = {}
+        """relative path -> (size, mtime in ns, hash, zip name), folders have the size -1"""
+
+    @staticmethod
+    def getPath(zipPath: Path) -> Path:
+        """returns the path of the manifest belonging to the zip"""
+        zipPath = Path(zipPath)
+        return zipPath.with_name(f"{zipPath.stem}{StaticManifest.SUFFIX}")
+
+    @staticmethod
+    def read(path: Path):
+        """returns the manifest at path, or None if there is none or it is no valid manifest"""
+        path = Path(path)
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as file:
+            header = file.readline().rstrip("\n").split("\t")
+            if len(header) != 5 or header[0] != StaticManifest.HEADER or header[1] != StaticManifest.VERSION:
+                log.warning(f"'{path}' is not a valid static backup manifest, ignoring it")
+                return None
+            manifest = StaticManifest(path, header[2], header[3] or None, int(header[4]))
+            for line in file:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 5:
+                    log.warning(f"static backup manifest at '{path}' is corrupt, ignoring it")
+                    return None
+                manifest.entries[parts[0]] = (int(parts[1]), int(parts[2]), parts[3], parts[4])
+        return manifest
+
+    def write(self):
+        """writes the manifest to a temporary file first and replaces the old one"""
+        temporaryPath = self.path.with_name(f"{self.path.name}.tmp")
+        with open(temporaryPath, "w", encoding="utf-8") as file:
+            file.write(f"{self.HEADER}\t{self.VERSION}\t{self.zipName}\t{self.previousZipName or ''}\t{self.chainLength}\n")
+            for relativePath, (size, mtime, hash, zipName) in self.entries.items():
+                file.write(f"{relativePath}\t{size}\t{mtime}\t{hash}\t{zipName}\n")
+        os.replace(temporaryPath, self.path)
+
+    def getFiles(self) -> Dict[str, Tuple[int, int, str, str]]:
+        return {relativePath: entry for relativePath, entry in self.entries.items() if entry[0] != self.FOLDER}
+
+    def getZipNames(self) -> List[str]:
+        """returns the names of all zips needed to restore this backup"""
+        return sorted(set(entry[3] for entry in self.entries.values() if entry[0] != self.FOLDER))
+
+    def getMissingZips(self) -> List[str]:
+        """returns the names of the zips needed to restore this backup that do not exist (anymore)"""
+        return [zipName for zipName in self.getZipNames() if not self.path.parent.joinpath(zipName).exists()]
+
+def scanFiles(source: Path) -> Dict[str, Tuple[int, int]]:
+    """
+    returns all entries below source as relative path -> (size, mtime in ns), folders have the size -1
+    """
+    entries = {}
+    for folder, folderNames, fileNames in os.walk(source):
+        relativeFolder = Path(folder).relative_to(source).as_posix()
+        prefix = "" if relativeFolder == "." else f"{relativeFolder}/"
+        for name in folderNames:
+            entries[f"{prefix}{name}"] = (StaticManifest.FOLDER, 0)
+        for name in fileNames:
+            stat = Path(folder).joinpath(name).stat()
+            entries[f"{prefix}{name}"] = (stat.st_size, stat.st_mtime_ns)
+    return entries
+
+def createStaticArchive(archiver: EsmArchiver, source: Path, zipPath: Path, previous: StaticManifest = None) -> Tuple[ArchiveStats, StaticManifest]:
+    """
+    archives the source to the zip and writes the manifest next to it. If the manifest of the previous static backup is given, only
+    the files that are new or changed (by size or modification time) since then are archived, and a list of the files deleted since then
+    is written next to the zip as well. The manifest is written last, so an incomplete backup is never used as previous one.
+    """
+    zipPath = Path(zipPath)
+    sourceEntries = scanFiles(source)
+    if previous is None:
+        manifest = StaticManifest(StaticManifest.getPath(zipPath), zipPath.name)
+        stats = archiver.createArchive(source, zipPath)
+    else:
+        manifest = StaticManifest(StaticManifest.getPath(zipPath), zipPath.name, previous.zipName, previous.chainLength + 1)
+        changed = []
+        for relativePath, (size, mtime) in sourceEntries.items():
+            if size == StaticManifest.FOLDER:
+                continue
+            known = previous.entries.get(relativePath)
+            if known is None or known[0] != size or known[1] != mtime:
+                changed.append(relativePath)
+        stats = archiver.createArchive(source, zipPath, relativePaths=changed)
+        deleted = sorted(relativePath for relativePath in previous.entries.keys() if relativePath not in sourceEntries)
+        zipPath.with_name(f"{zipPath.stem}{StaticManifest.DELETEDSUFFIX}").write_text("".join(f"{relativePath}\n" for relativePath in deleted), encoding="utf-8")
+        log.debug(f"differential static backup: {len(changed)} new or changed files, {len(deleted)} deleted since '{previous.zipName}'")
+    for relativePath, (size, mtime) in sourceEntries.items():
+        if size == StaticManifest.FOLDER:
+            manifest.entries[relativePath] = (StaticManifest.FOLDER, 0, "", "")
+        elif relativePath in stats.entries:
+            manifest.entries[relativePath] = stats.entries[relativePath]
+        else:
+            manifest.entries[relativePath] = previous.entries[relativePath]
+    manifest.write()
+    return stats, manifest
+
+def restoreStaticBackup(manifest: StaticManifest, target: Path, verify=False, threads: int = 4) -> SyncStats:
+    """
+    rebuilds the tree of the static backup in the target folder, taking every file from the zip that contains its version, so every zip
+    of the chain is opened once and every file is extracted once. The modification times are restored. If verify is True, the extracted
+    files are checked against the hashes of the manifest.
+    """
+    missingZips = manifest.getMissingZips()
+    if missingZips:
+        raise BackupFailedError(f"can not restore '{manifest.zipName}', the zips {', '.join(missingZips)} of its chain are missing")
+    stats = SyncStats()
+    target = Path(target)
+    with Timer() as timer:
+        stats.scanned = len(manifest.entries)
+        for relativePath, (size, mtime, hash, zipName) in manifest.entries.items():
+            if size == StaticManifest.FOLDER:
+                target.joinpath(relativePath).mkdir(parents=True, exist_ok=True)
+        byZip = {}
+        for relativePath, entry in manifest.getFiles().items():
+            byZip.setdefault(entry[3], []).append((relativePath, entry))
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="EsmStaticRestore") as executor:
+            results = executor.map(lambda item: extractFiles(manifest.path.parent.joinpath(item[0]), item[1], target, verify), byZip.items())
+            for copied, copiedBytes, failed in results:
+                stats.copied += copied
+                stats.copiedBytes += copiedBytes
+                stats.failed += failed
+    stats.elapsedTime = timer.elapsedTime
+    return stats
+
+def extractFiles(zipPath: Path, files: List[Tuple[str, Tuple[int, int, str, str]]], target: Path, verify: bool) -> Tuple[int, int, int]:
+    """
+    extracts the files from the zip to the target, returns the amount of extracted files, their size and the amount of failed files
+    """
+    copied = copiedBytes = failed = 0
+    with zipfile.ZipFile(zipPath) as zip:
+        for relativePath, (size, mtime, hash, zipName) in files:
+            destination = target.joinpath(relativePath)
+            try:
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                digest = hashlib.blake2b(digest_size=16) if verify else None
+                with zip.open(relativePath) as source, open(destination, "wb") as file:
+                    while chunk := source.read(1024 * 1024):
+                        if digest is not None:
+                            digest.update(chunk)
+                        file.write(chunk)
+                os.utime(destination, ns=(mtime, mtime))
+                if digest is not None and digest.hexdigest() != hash:
+                    log.error(f"'{relativePath}' from '{zipName}' does not match the hash in the manifest")
+                    failed += 1
+                    continue
+                copied += 1
+                copiedBytes += size
+            except (OSError, KeyError, zipfile.BadZipFile) as ex:
+                log.error(f"could not extract '{relativePath}' from '{zipPath}': {ex}")
+                failed += 1
+    return copied, copiedBytes, failed
@@ -1,10 +1,15 @@
 import logging
 import os
+import sys
 from functools import cached_property
 from pathlib import Path
 from esm import robocopy
 from esm.ConfigModels import MainConfig
+from esm.DataTypes import PathTrie
 from esm.EsmConfigService import EsmConfigService
+from esm.EsmIoCoordinator import EsmIoCoordinator, IoPriority
+from esm.EsmPurgeJournal import EsmPurgeJournal
+from esm.EsmTrashService import EsmTrashService
 from esm.FsTools import FsTools
 from esm.ServiceRegistry import Service, ServiceRegistry
 from esm.Tools import askUser, getElapsedTime, getTimer
@@ -15,7 +20,7 @@ log = logging.getLogger(__name__)
 @Service
 class EsmFileSystem:
 
-    pendingDeletePaths = []
+    pendingDeletePaths = PathTrie()
 
     """
     Represents the filesystem with the relevant bits that we manage
@@ -27,6 +32,14 @@ class EsmFileSystem:
     def config(self) -> MainConfig:
         return ServiceRegistry.get(EsmConfigService).config
     
+    @cached_property
+    def trashService(self) -> EsmTrashService:
+        return ServiceRegistry.get(EsmTrashService)
+
+    @cached_property
+    def ioCoordinator(self) -> EsmIoCoordinator:
+        return ServiceRegistry.get(EsmIoCoordinator)
+
     @cached_property
     def structure(self) -> dict:
         return self.getStructureFromConfig(self.config)
@@ -67,7 +80,9 @@ class EsmFileSystem:
                         "_parent": f"{config.dedicatedConfig.GameConfig.GameName}{config.foldernames.savegamemirrorpostfix}",
                         "globaldb": config.filenames.globaldb
                     },
-                    "savegametemplate": f"{config.dedicatedConfig.GameConfig.GameName}{config.foldernames.savegametemplatepostfix}"
+                    "savegametemplate": f"{config.dedicatedConfig.GameConfig.GameName}{config.foldernames.savegametemplatepostfix}",
+                    "savegamecoldtier": f"{config.dedicatedConfig.GameConfig.GameName}{config.foldernames.savegamecoldtierpostfix}",
+                    "savegamepacked": f"{config.dedicatedConfig.GameConfig.GameName}{config.foldernames.savegamepackedpostfix}"
                 }
             }
         }
@@ -127,21 +142,36 @@ class EsmFileSystem:
         destinationPath = self.getAbsolutePathTo(destinationDotPath)
         self.executeRobocopy(sourcePath=sourcePath, destinationPath=destinationPath, info=info, operation=operation)
 
-    def executeRobocopy(self, sourcePath, destinationPath, info=None, operation="copy"):
+    def executeRobocopy(self, sourcePath, destinationPath, info=None, operation="copy", logName=None):
         """
-        executes a robocopy command for the given operation
+        executes a robocopy command for the given operation. Robocopies running at the same time should get their own log name, so they
+        don't write to the same log file.
         """
         if info is not None: 
             log.info(info)
         log.debug(f"will {operation} from '{sourcePath}' -> '{destinationPath}'")
+        if sys.platform != "win32":
+            return self.executePortable(sourcePath=sourcePath, destinationPath=destinationPath, operation=operation)
         options = getattr(self.config.robocopy.options, f"{operation}options")
-        logFile = Path(self.getCaller()).stem + "_robocopy.log"
+        logFile = Path(self.getCaller()).stem + (f"_{logName}" if logName else "") + "_robocopy.log"
         if not self.config.general.debugMode:
             process=robocopy.execute(sourcePath, destinationPath, [options], logFile, encoding=self.config.robocopy.encoding)
             return process
         else:
             log.debug(f"debugmode: robocopy {sourcePath} {destinationPath} {options}")
 
+    def executePortable(self, sourcePath, destinationPath, operation="copy"):
+        """
+        does what robocopy would do for the given operation with python, for platforms without robocopy
+        """
+        if self.config.general.debugMode:
+            log.debug(f"debugmode: {operation} {sourcePath} {destinationPath}")
+            return
+        if operation == "move":
+            FsTools.moveTree(sourcePath, destinationPath)
+        else:
+            FsTools.mirrorTree(sourcePath, destinationPath)
+
     def existsDotPath(self, dotPath, prefixInstallDir=True):
         path = self.getAbsolutePathTo(dotPath=dotPath, prefixInstallDir=prefixInstallDir)
         return Path(path).exists()
@@ -154,15 +184,16 @@ class EsmFileSystem:
 
     def createHardLink(self, linkPath, linkTargetPath):
         """
-        creates a hardlink (jointpoint) from given source to given destination
+        creates a hardlink (jointpoint) from given source to given destination, returns True if that was successful
         """
         log.info(f"Creating link from {linkPath} -> {linkTargetPath}")
-        FsTools.createLink(linkPath, linkTargetPath)
+        return FsTools.createLink(linkPath, linkTargetPath)
 
     def markForDelete(self, targetPath, native=False):
         """
         mark a file, folder or hardlink and all its content for deletion, use #commitDelete to actually delete the stuff
         if native is True, the path will be deleted with native shell commands on commit.
+        paths that are already marked or are below an already marked path are ignored, marking a parent replaces its marked children.
         """
         if isinstance(targetPath, Path):
             path = targetPath.absolute()
@@ -171,29 +202,31 @@ class EsmFileSystem:
           
         if not path.exists(follow_symlinks=False):
             return
-        # add path to the list of paths to delete
-        self.pendingDeletePaths.append((path, targetPath, native))
+        # add path to the set of paths to delete
+        if not self.pendingDeletePaths.add(path, (targetPath, native)):
+            log.debug(f"'{path}' is already marked for deletion")
 
     def getPendingDeletePaths(self):
-        paths = []
-        for path, targetPath, native in self.pendingDeletePaths:
-            paths.append(path)
-        return paths
+        return self.pendingDeletePaths.paths()
 
     def clearPendingDeletePaths(self):
-        self.pendingDeletePaths = []
+        self.pendingDeletePaths = PathTrie()
 
-    def commitDelete(self, override=None, additionalInfo=None):
+    def commitDelete(self, override=None, additionalInfo=None, useTrash=None, journal: EsmPurgeJournal=None):
         """
         actually deletes the list of paths that we are saving in the listOfPathstoDelete
+        if useTrash is True (defaults to the configured deletes.useTrash), the paths are just moved into the trash, which will be reclaimed later.
+        if a journal is given, the planned paths and every finished deletion are recorded in it, so an interrupted deletion can be resumed.
         returns bool, elapsedTime - bool containing True if the deletion was comitted and the time taken to delete.
         """
+        if useTrash is None:
+            useTrash = self.config.deletes.useTrash
         if len(self.pendingDeletePaths) <= 0:
             log.info("There is nothing to delete")
             return False, None
         
         print(f"List of paths marked for deletion:")
-        for path, targetPath, native in self.pendingDeletePaths:
+        for path in self.pendingDeletePaths.paths():
             print(f"   {path}")
 
         if additionalInfo:
@@ -203,24 +236,41 @@ class EsmFileSystem:
             log.info("Will not delete the listed files.")
             raise UserAbortedException("User aborted file deletion.")
 
-        start = getTimer()
-        for path, targetPath, native in self.pendingDeletePaths:
-            if FsTools.isHardLink(path):
-                log.debug(f"deleting link at '{path}'")
-                FsTools.deleteLink(path)
-            else:
-                # for some reason, Path.is_dir() somtimes returns true on files. What a crappy quirk is that!
-                # This forces us to check twice with two different implementations...
-                if path.is_dir() and os.path.isdir(path):
-                    log.debug(f"deleting dir at '{targetPath}'")
-                    if native:
-                        FsTools.quickDeleteNative(path)
+        with self.ioCoordinator.lease("delete", IoPriority.PURGE):
+            start = getTimer()
+            trashed = 0
+            if journal is not None:
+                journal.begin([(path, native) for path, (targetPath, native) in self.pendingDeletePaths])
+            try:
+                for path, (targetPath, native) in self.pendingDeletePaths:
+                    if FsTools.isHardLink(path):
+                        log.debug(f"deleting link at '{path}'")
+                        FsTools.deleteLink(path)
+                    elif useTrash and self.trashService.moveToTrash(path):
+                        trashed += 1
                     else:
-                        FsTools.quickDelete(path)
-                else:
-                    log.debug(f"deleting file '{targetPath}'")
-                    FsTools.deleteFile(path)
+                        # for some reason, Path.is_dir() somtimes returns true on files. What a crappy quirk is that!
+                        # This forces us to check twice with two different implementations...
+                        if path.is_dir() and os.path.isdir(path):
+                            log.debug(f"deleting dir at '{targetPath}'")
+                            if native:
+                                FsTools.quickDeleteNative(path)
+                            else:
+                                FsTools.quickDelete(path)
+                        else:
+                            log.debug(f"deleting file '{targetPath}'")
+                            FsTools.deleteFile(path)
+                    if journal is not None:
+                        journal.markDone(path)
+                if journal is not None:
+                    journal.logProgress()
+                    journal.finish()
+            finally:
+                if journal is not None:
+                    journal.close()
         log.debug(f"done deleting")
+        if trashed > 0:
+            log.info(f"Moved {trashed} paths to the trash, they will be reclaimed in the background while the server is running.")
         elapsedTime = getElapsedTime(start)
         # empty list of pending deletes
         self.clearPendingDeletePaths()
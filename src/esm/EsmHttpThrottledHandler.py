@@ -4,7 +4,6 @@ import urllib.request
 import humanize
 import http.server
 import threading
-import time
 import urllib
 
 from typing import Dict
@@ -12,6 +11,7 @@ from urllib.error import URLError
 from limits import parse, storage, strategies
 from pathlib import Path
 from esm import Tools
+from esm.EsmBandwidthScheduler import ClientShare, EsmBandwidthScheduler
 from esm.Tools import Timer
 
 log = logging.getLogger(__name__)
@@ -23,12 +23,13 @@ class EsmHttpThrottledHandler(http.server.SimpleHTTPRequestHandler):
     rateLimiter = strategies.MovingWindowRateLimiter(storage.MemoryStorage())
     rateLimitExceptions = []
 
-    # default bandwith limits
-    clientBandwidthLimit = 30*1024*1024 # default to 30MB/s
-    globalBandwidthLimit = 50*1024*1024 # default to 50MB/s
+    # shares the bandwidth between all downloads, defaults to 50MB/s in total and 30MB/s per client
+    bandwidthScheduler = EsmBandwidthScheduler(globalRate=50*1024*1024, clientRate=30*1024*1024)
+
+    # the zip files are sent in slices of this many bytes, every slice goes through the bandwidth scheduler once
+    sliceSize = 256*1024
 
     # global properties
-    globalStartTime = time.time()
     globalBytesSent = 0
     globalZipDownloads = 0
 
@@ -216,41 +217,30 @@ class EsmHttpThrottledHandler(http.server.SimpleHTTPRequestHandler):
             return super().copyfile(source, outputfile)
 
         log.info(f"Client {self.client_address} started downloading the file '{zipFile.name}'.")
-        with Timer() as timer:
-            self.throttle_copy(source, outputfile, self.clientBandwidthLimit)
+        share = EsmHttpThrottledHandler.bandwidthScheduler.register(self.client_address)
+        try:
+            with Timer() as timer:
+                self.throttle_copy(source, outputfile, share)
+        finally:
+            EsmHttpThrottledHandler.bandwidthScheduler.unregister(share)
         downloadspeed = zipFile.size / timer.elapsedTime.total_seconds()
         with EsmHttpThrottledHandler.globalPropertyLock:
             EsmHttpThrottledHandler.globalZipDownloads += 1
             zipFile.downloads += 1
         log.info(f"Client {self.client_address} successfully downloaded the file '{zipFile.name}' in '{humanize.naturaldelta(timer.elapsedTime)}', speed '{humanize.naturalsize(downloadspeed, gnu=False)}/s'. ({zipFile.downloads} specific downloads, {EsmHttpThrottledHandler.globalZipDownloads} total downloads)")
 
-    def throttle_copy(self, source, outputfile, limit):
-        bufsize = 8192 # the smaller, the more often we'll iterate through here so don't use a too small value
-        bytesSent = 0
-        startTime = time.time()
+    def throttle_copy(self, source, outputfile, share: ClientShare):
+        # the scheduler takes its locks once per slice, so small slices cost a lot of cpu for nothing. A slice bigger than the burst just makes the next one wait longer
         while True:
-            buf = source.read(bufsize)
+            buf = source.read(EsmHttpThrottledHandler.sliceSize)
             if not buf:
                 break
+            # waits until the slice fits into the client's fair share and the global limit
+            EsmHttpThrottledHandler.bandwidthScheduler.consume(share, len(buf))
             outputfile.write(buf)
-            bytesSent += len(buf)
             with EsmHttpThrottledHandler.globalPropertyLock:
                 EsmHttpThrottledHandler.globalBytesSent += len(buf)
 
-            # calculate if we need to sleep to conform the client bandwith limit
-            elapsedTime = time.time() - startTime
-            expectedTime = bytesSent / limit
-            suggestedSleepTimeClient = max(0, expectedTime - elapsedTime)
-
-            # calculate if we need to sleep to conform the client bandwith limit
-            elapsedGlobalTime = time.time() - EsmHttpThrottledHandler.globalStartTime
-            expectedGlobalTime = EsmHttpThrottledHandler.globalBytesSent / EsmHttpThrottledHandler.globalBandwidthLimit
-            suggestedSleepTimeglobal = max(0, expectedGlobalTime - elapsedGlobalTime)
-
-            # sleep the bigger amount of both calculations
-            sleepTime = max(suggestedSleepTimeClient, suggestedSleepTimeglobal)
-            time.sleep(sleepTime)
-
     def log_message(self, format: str, *args) -> None:
         message = format % args
         log.debug(f"{self.address_string()} - - [{self.log_date_time_string()}] {message.translate(self._control_char_table)}")
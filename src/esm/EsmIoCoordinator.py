@@ -0,0 +1,229 @@
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import timedelta
+from enum import Enum
+from functools import cached_property
+from pathlib import Path
+from typing import List
+import psutil
+from esm.ConfigModels import MainConfig
+from esm.EsmConfigService import EsmConfigService
+from esm.ServiceRegistry import Service, ServiceRegistry
+
+log = logging.getLogger(__name__)
+
+class IoPriority(int, Enum):
+    """lower values go first"""
+    SYNC = 0
+    BACKUP = 10
+    PURGE = 20
+    ZIP = 30
+    VERIFY = 40
+
+class IoTicket:
+    """
+    a lease in the queue, stored as file named like $priority-$requestedAt-$pid-$threadId.$state, containing the name of the job
+    """
+    WAITING = "waiting"
+    ACTIVE = "active"
+
+    def __init__(self, path: Path, priority: int, requestedAt: int, pid: int, threadId: int, state: str, name: str):
+        self.path = path
+        self.priority = priority
+        self.requestedAt = requestedAt
+        self.pid = pid
+        self.threadId = threadId
+        self.state = state
+        self.name = name
+
+    @staticmethod
+    def fromPath(path: Path):
+        """returns the ticket for the file at path, or None if that is not a ticket (anymore)"""
+        try:
+            priority, requestedAt, pid, threadId = path.stem.split("-")
+            name = path.read_text(encoding="utf-8")
+            return IoTicket(path, int(priority), int(requestedAt), int(pid), int(threadId), path.suffix[1:], name)
+        except (OSError, ValueError):
+            return None
+
+    def isActive(self):
+        return self.state == IoTicket.ACTIVE
+
+    def getAge(self) -> timedelta:
+        return timedelta(seconds=max(0, time.time_ns() - self.requestedAt) // 1000000000)
+
+    def __str__(self):
+        return f"'{self.name}' (pid {self.pid})"
+
+class QueueLock:
+    """
+    context manager for an exclusive lock on a file, shared by all processes
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, "a+b")
+        if sys.platform == "win32":
+            import msvcrt
+            while True:
+                try:
+                    self.file.seek(0)
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after 10 seconds
+                    continue
+        else:
+            import fcntl
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if sys.platform == "win32":
+            import msvcrt
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
+
+class IoLease:
+    """
+    context manager for a lease of the io coordinator, waits until it is this job's turn and returns the lease.
+    Usage:
+        with ioCoordinator.lease("rolling backup", IoPriority.BACKUP) as lease:
+            # do_something_io_heavy
+        print(lease.waitTime)
+    """
+    def __init__(self, coordinator: "EsmIoCoordinator", name: str, priority: IoPriority):
+        self.coordinator = coordinator
+        self.name = name
+        self.priority = priority
+        self.ticketPath = None
+        self.waitTime = timedelta(0)
+
+    def __enter__(self):
+        self.coordinator.acquire(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.coordinator.release(self)
+
+@Service
+class EsmIoCoordinator:
+    """
+    coordinates the io heavy jobs of all esm processes, e.g. a backup started by EAH while the synchronizer of the running server wants to sync.
+
+    Every job takes a lease before it starts. The leases are ticket files in a queue folder, which is locked while a job checks if it may start.
+    Up to io.maxConcurrentJobs leases are active at a time, the waiting ones get their turn by priority and then by the time they asked.
+    Tickets of processes that do not exist anymore are removed, so a crashed job doesn't block the queue.
+    A thread that already holds a lease gets nested leases right away.
+    """
+
+    def __init__(self):
+        self.threadLeases = threading.local()
+
+    @cached_property
+    def config(self) -> MainConfig:
+        return ServiceRegistry.get(EsmConfigService).config
+
+    def getQueuePath(self) -> Path:
+        return Path(self.config.io.queueFolder).absolute()
+
+    def lease(self, name: str, priority: IoPriority) -> IoLease:
+        return IoLease(self, name, priority)
+
+    def getTickets(self) -> List[IoTicket]:
+        """
+        returns the tickets of all leases in the queue, active ones first, then the waiting ones in the order they will get their turn
+        """
+        queuePath = self.getQueuePath()
+        if not queuePath.exists():
+            return []
+        tickets = []
+        for entry in os.scandir(queuePath):
+            if entry.name.endswith(f".{IoTicket.WAITING}") or entry.name.endswith(f".{IoTicket.ACTIVE}"):
+                ticket = IoTicket.fromPath(Path(entry.path))
+                if ticket is not None:
+                    tickets.append(ticket)
+        return sorted(tickets, key=lambda ticket: (not ticket.isActive(), ticket.priority, ticket.requestedAt))
+
+    def getActiveLeaseNames(self) -> List[str]:
+        """returns the names of the jobs currently holding a lease in any esm process"""
+        return [ticket.name for ticket in self.getTickets() if ticket.isActive() and psutil.pid_exists(ticket.pid)]
+
+    def removeDeadTickets(self, tickets: List[IoTicket]) -> List[IoTicket]:
+        alive = []
+        for ticket in tickets:
+            if psutil.pid_exists(ticket.pid):
+                alive.append(ticket)
+            else:
+                log.warning(f"Removing the io lease of {ticket}, the process does not exist anymore")
+                ticket.path.unlink(missing_ok=True)
+        return alive
+
+    def tryGrant(self, lease: IoLease):
+        """
+        makes the lease active if it is its turn, returns the tickets ahead of it otherwise
+        """
+        tickets = self.removeDeadTickets(self.getTickets())
+        activeCount = sum(1 for ticket in tickets if ticket.isActive())
+        waiting = [ticket for ticket in tickets if not ticket.isActive()]
+        freeSlots = self.config.io.maxConcurrentJobs - activeCount
+        for position, ticket in enumerate(waiting):
+            if ticket.path == lease.ticketPath:
+                if position < freeSlots:
+                    activePath = lease.ticketPath.with_suffix(f".{IoTicket.ACTIVE}")
+                    os.replace(lease.ticketPath, activePath)
+                    lease.ticketPath = activePath
+                    return []
+                return [ticket for ticket in tickets if ticket.path != lease.ticketPath][:activeCount + position]
+        raise FileNotFoundError(f"the io lease ticket '{lease.ticketPath}' vanished from the queue")
+
+    def acquire(self, lease: IoLease):
+        """
+        waits until it's the lease's turn and makes it active
+        """
+        heldLeases = getattr(self.threadLeases, "count", 0)
+        if not self.config.io.coordinate or heldLeases > 0:
+            self.threadLeases.count = heldLeases + 1
+            return
+        queuePath = self.getQueuePath()
+        queuePath.mkdir(parents=True, exist_ok=True)
+        lease.ticketPath = queuePath.joinpath(f"{lease.priority.value:03d}-{time.time_ns():020d}-{os.getpid()}-{threading.get_ident()}.{IoTicket.WAITING}")
+        lease.ticketPath.write_text(lease.name, encoding="utf-8")
+        start = time.monotonic()
+        announced = False
+        try:
+            while True:
+                with QueueLock(queuePath.joinpath("queue.lock")):
+                    ahead = self.tryGrant(lease)
+                if len(ahead) == 0:
+                    break
+                if not announced:
+                    log.info(f"Io lease for '{lease.name}' is queued behind {', '.join(map(str, ahead))}, waiting for its turn")
+                    announced = True
+                time.sleep(self.config.io.pollInterval)
+        except BaseException:
+            lease.ticketPath.unlink(missing_ok=True)
+            lease.ticketPath = None
+            raise
+        lease.waitTime = timedelta(seconds=time.monotonic() - start)
+        self.threadLeases.count = 1
+        if announced:
+            log.info(f"Io lease for '{lease.name}' granted after waiting {lease.waitTime}")
+        else:
+            log.debug(f"io lease for '{lease.name}' granted after waiting {lease.waitTime}")
+
+    def release(self, lease: IoLease):
+        self.threadLeases.count = getattr(self.threadLeases, "count", 1) - 1
+        if lease.ticketPath is not None:
+            lease.ticketPath.unlink(missing_ok=True)
+            lease.ticketPath = None
+            log.debug(f"io lease for '{lease.name}' released")
@@ -0,0 +1,159 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+from esm.EsmSyncEngine import EsmSyncEngine, SyncStats
+from esm.FsTools import FsTools
+from esm.Tools import lowerThreadPriority
+
+log = logging.getLogger(__name__)
+
+class LinkedBackupStats(SyncStats):
+    """
+    statistics of a single linked backup, the hardlinked files are not counted as copied
+    """
+    def __init__(self):
+        super().__init__()
+        self.linked = 0
+        self.linkedBytes = 0
+
+    def __str__(self):
+        return f"{super().__str__()}, hardlinked {self.linked} unchanged files ({FsTools.realToHumanFileSize(self.linkedBytes)})"
+
+class EsmLinkedBackup(EsmSyncEngine):
+    """
+    builds a rolling backup from the source like the sync engine does, but files that did not change since the reference backup
+    (usually the previous one) are hardlinked to the file in the reference instead of being copied, like rsync's --link-dest.
+    Time and disk space needed for a backup then scale with the amount of changes instead of the size of the savegame.
+
+    A file is unchanged if the manifest of the reference knows it with the same size and modification time as the source has now.
+    The reference manifest is written by the previous backup, if there is none the reference is scanned instead. The hardlink is checked
+    once more after creating it, so a file that was touched in the reference since then is copied instead.
+
+    Since hardlinked files share their content with all other backups linking to them, nothing may ever be written into an existing
+    file of a linked backup: files to be replaced are unlinked first, so only this backup's name for them goes away. This is also why
+    the source is never linked to, the synchronizers write into the mirror's files.
+    If the destination has no manifest it was not built by this, so it may still contain full copies or be written to by robocopy. It is
+    emptied then and built again from links and copies.
+    """
+    MANIFESTFOLDER = "EsmManifests"
+    """folder in the root of each backup, containing the manifests of all linked trees of that backup"""
+    LINKED = "linked"
+    COPIED = "copied"
+
+    def __init__(self, source: Path, destination: Path, manifestPath: Path, reference: Path = None, referenceManifestPath: Path = None, threads: int = 8):
+        super().__init__(source=source, destination=destination, manifestPath=manifestPath, threads=threads)
+        self.reference = Path(reference) if reference is not None else None
+        self.referenceManifestPath = Path(referenceManifestPath) if referenceManifestPath is not None else None
+        self.referenceEntries = {}
+
+    def synchronize(self, fullScan=False, changes=None) -> LinkedBackupStats:
+        """
+        builds the destination from the source and the reference, returns the statistics. Changes from a change tracker are not supported,
+        since the source of a backup is never tracked.
+        """
+        self.referenceEntries = self.readReference()
+        return super().synchronize(fullScan=fullScan)
+
+    def createStats(self) -> LinkedBackupStats:
+        return LinkedBackupStats()
+
+    def readReference(self) -> Dict[str, Tuple[int, int]]:
+        """
+        returns the entries of the reference from its manifest, or scans it if there is no valid manifest. Empty if there is no reference.
+        """
+        if self.reference is None or not self.reference.is_dir():
+            return {}
+        if self.referenceManifestPath is not None:
+            entries = EsmSyncEngine(source=self.source, destination=self.reference, manifestPath=self.referenceManifestPath).readManifest()
+            if entries is not None:
+                return entries
+        log.debug(f"no valid manifest for the reference '{self.reference}', scanning it")
+        return self.scanTree(self.reference)
+
+    def scanDestination(self) -> Dict[str, Tuple[int, int]]:
+        """
+        the destination was not built by this (or the manifest got lost), so its files may be full copies or be shared with other backups in
+        ways we can't know. Start over with an empty destination.
+        """
+        if self.destination.exists():
+            log.info(f"'{self.destination}' has no linked backup manifest, deleting its content so it can be built from links and copies")
+            FsTools.quickDelete(self.destination)
+        self.destination.mkdir(parents=True, exist_ok=True)
+        return {}
+
+    @staticmethod
+    def unlinkSharedFiles(folder: Path) -> int:
+        """
+        removes all files in the folder that have more than one hardlink, so a following robocopy or plain copy recreates them instead of
+        writing into content that is shared with other backups. This also catches backups without a manifest that other linked backups
+        used as reference. Returns the amount of files removed.
+        """
+        unlinked = 0
+        for dirPath, dirNames, fileNames in os.walk(folder):
+            for fileName in fileNames:
+                path = os.path.join(dirPath, fileName)
+                try:
+                    if os.lstat(path).st_nlink > 1:
+                        os.unlink(path)
+                        unlinked += 1
+                except OSError as ex:
+                    log.error(f"could not remove the shared file '{path}': {ex}")
+        return unlinked
+
+    def copyFiles(self, toCopy: List[str], sourceEntries: Dict[str, Tuple[int, int]], newManifest: Dict[str, Tuple[int, int]], stats: LinkedBackupStats):
+        """
+        links or copies the files on the thread pool
+        """
+        if not toCopy:
+            return
+        initializer = lowerThreadPriority if self.lowPriority else None
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="EsmLinkedBackup", initializer=initializer) as executor:
+            results = executor.map(lambda relativePath: self.linkOrCopyFile(relativePath, sourceEntries[relativePath]), toCopy)
+            for relativePath, result in zip(toCopy, results):
+                if result == self.LINKED:
+                    stats.linked += 1
+                    stats.linkedBytes += sourceEntries[relativePath][0]
+                elif result == self.COPIED:
+                    stats.copied += 1
+                    stats.copiedBytes += sourceEntries[relativePath][0]
+                else:
+                    stats.failed += 1
+                    newManifest[relativePath] = (self.UNKNOWN, 0)
+
+    def linkOrCopyFile(self, relativePath: str, entry: Tuple[int, int]):
+        """
+        hardlinks the file to the reference if it is unchanged there, copies it otherwise. Returns LINKED, COPIED or None if both failed.
+        """
+        destination = self.destination.joinpath(relativePath)
+        try:
+            # never write into the existing file, it may be shared with other backups
+            destination.unlink(missing_ok=True)
+        except OSError as ex:
+            log.error(f"could not remove the old '{destination}': {ex}")
+            return None
+        if self.referenceEntries.get(relativePath) == entry and self.linkFile(relativePath, entry):
+            return self.LINKED
+        if self.copyFile(relativePath):
+            return self.COPIED
+        return None
+
+    def linkFile(self, relativePath: str, entry: Tuple[int, int]):
+        """
+        hardlinks the file in the destination to the one in the reference, returns False if that was not possible or the file in the reference
+        is not the expected one.
+        """
+        reference = self.reference.joinpath(relativePath)
+        destination = self.destination.joinpath(relativePath)
+        try:
+            os.link(reference, destination)
+            stat = destination.stat()
+            if (stat.st_size, stat.st_mtime_ns) == entry:
+                return True
+            log.debug(f"'{reference}' was changed since the reference backup was created, will copy the file instead")
+            destination.unlink()
+        except OSError as ex:
+            # e.g. a different drive, a file system without hardlinks or too many links to the file already
+            log.debug(f"could not hardlink '{destination}' to '{reference}', will copy the file instead: {ex}")
+        return False
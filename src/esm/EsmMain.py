@@ -1,5 +1,7 @@
+from datetime import datetime, timedelta
 from functools import cached_property
 from pathlib import Path
+import re
 from typing import List
 import logging
 import socket
@@ -11,7 +13,7 @@ from esm.EsmGameChatService import EsmGameChatService
 from esm.EsmHaimsterConnector import EsmHaimsterConnector
 from esm.EsmSharedDataServer import EsmSharedDataServer
 from esm.exceptions import AdminRequiredException, ExitCodes, RequirementsNotFulfilledError, ServerNeedsToBeStopped, UserAbortedException, WrongParameterError
-from esm.ConfigModels import MainConfig
+from esm.ConfigModels import FILESIZEPATTERN, MainConfig
 from esm.DataTypes import Territory, WipeType
 from esm.EsmLogger import EsmLogger
 from esm.FsTools import FsTools
@@ -19,11 +21,19 @@ from esm.Tools import Timer, askUser, mergeDicts, monkeyPatchAllFSFunctionsForDe
 from esm.EsmEmpRemoteClientService import EsmEmpRemoteClientService
 from esm.EsmConfigService import EsmConfigService
 from esm.EsmBackupService import EsmBackupService
+from esm.EsmCapacityMonitor import EsmCapacityMonitor
 from esm.EsmDeleteService import EsmDeleteService
 from esm.EsmFileSystem import EsmFileSystem
+from esm.EsmIoCoordinator import EsmIoCoordinator
+from esm.EsmPackedMirror import EsmPackedMirror, benchmarkMirrorFormats
+from esm.EsmRamdiskBackend import benchmarkSavegameStorage
+from esm.EsmMaintenanceService import EsmMaintenanceService
 from esm.EsmDedicatedServer import EsmDedicatedServer
 from esm.EsmRamdiskManager import EsmRamdiskManager
+from esm.EsmSelectiveRestore import RestoreSelection
 from esm.EsmSteamService import EsmSteamService
+from esm.EsmTieringService import EsmTieringService
+from esm.EsmTrashService import EsmTrashService
 from esm.EsmWipeService import EsmWipeService
 from esm.ServiceRegistry import ServiceRegistry
 
@@ -72,6 +82,26 @@ class EsmMain:
     def haimsterConnector(self) -> EsmHaimsterConnector:
         return ServiceRegistry.get(EsmHaimsterConnector)
     
+    @cached_property
+    def maintenanceService(self) -> EsmMaintenanceService:
+        return ServiceRegistry.get(EsmMaintenanceService)
+
+    @cached_property
+    def trashService(self) -> EsmTrashService:
+        return ServiceRegistry.get(EsmTrashService)
+
+    @cached_property
+    def capacityMonitor(self) -> EsmCapacityMonitor:
+        return ServiceRegistry.get(EsmCapacityMonitor)
+
+    @cached_property
+    def ioCoordinator(self) -> EsmIoCoordinator:
+        return ServiceRegistry.get(EsmIoCoordinator)
+
+    @cached_property
+    def tieringService(self) -> EsmTieringService:
+        return ServiceRegistry.get(EsmTieringService)
+    
     @cached_property
     def configService(self) -> EsmConfigService:
         return ServiceRegistry.get(EsmConfigService)
@@ -174,8 +204,18 @@ class EsmMain:
             syncInterval = self.config.ramdisk.synchronizeRamToMirrorInterval
             if syncInterval > 0:
                 # start the synchronizer
-                log.info(f"Starting ram2mirror synchronizer with interval '{syncInterval}'")
+                log.info(f"Starting ram2mirror synchronizer with a maximum staleness of '{syncInterval}' seconds")
                 self.ramdiskManager.startSynchronizer(syncInterval)
+
+    def startCapacityMonitor(self):
+        """
+        starts the ramdisk capacity monitor if ramdisk and the monitor are enabled
+        """
+        if self.config.general.useRamdisk:
+            interval = self.config.ramdisk.capacityMonitorInterval
+            if interval > 0:
+                log.info(f"Starting ramdisk capacity monitor with an interval of '{interval}' seconds")
+                self.capacityMonitor.startMonitor(interval)
     
     def waitForEnd(self, checkInterval=5):
         """
@@ -192,6 +232,10 @@ class EsmMain:
             self.startSharedDataServer(wait=False)
 
         self.startSynchronizer()
+        self.startCapacityMonitor()
+        if self.config.deletes.useTrash:
+            log.info(f"Starting trash reclaimer with a rate of '{self.config.deletes.trashReclaimRate}' files and '{self.config.deletes.trashReclaimBandwidth}' per second")
+            self.trashService.startReclaimer()
         if haimster:
             self.startHaimsterConnector()
 
@@ -207,6 +251,10 @@ class EsmMain:
             log.info(f"Stopping synchronizer thread")
             self.ramdiskManager.stopSynchronizer()
             log.info(f"Synchronizer thread stopped")
+            self.capacityMonitor.stopMonitor()
+
+        if self.config.deletes.useTrash:
+            self.trashService.stopReclaimer()
 
         if self.config.downloadtool.startWithMainServer:
             self.sharedDataServer.stop()
@@ -223,6 +271,10 @@ class EsmMain:
             log.info(f"Stopping synchronizer thread")
             self.ramdiskManager.stopSynchronizer()
             log.info(f"Synchronizer thread stopped")
+            self.capacityMonitor.stopMonitor()
+
+        if self.config.deletes.useTrash:
+            self.trashService.stopReclaimer()
 
         # this should not be necessary, but just in case.
         if self.dedicatedServer.isRunning():
@@ -237,7 +289,11 @@ class EsmMain:
         if self.config.general.useRamdisk:
             # sync ram to mirror
             log.info("Starting final ram to mirror sync after shutdown")
-            self.ramdiskManager.syncRamToMirror()
+            # the server is down, no need to hold back
+            self.ramdiskManager.syncRamToMirror(throttled=False)
+            if self.config.ramdisk.tiering:
+                log.info("Moving playfields between the ramdisk and the cold tier")
+                self.tieringService.applyTiering(dryrun=False)
         log.info("Server shutdown complete")
 
     def startServerAndWait(self):
@@ -281,12 +337,31 @@ class EsmMain:
         log.info(f"Game server shut down. Executing shutdown tasks.")
         self.onShutdown()
 
-    def createBackup(self):
+    def createBackup(self, replicate: bool=None):
         """
-        create a backup of the savegame using the rolling mirror backup system
+        create a backup of the savegame using the rolling mirror backup system, then replicate it if requested (defaults to backups.replicateAfterBackup).
+        The backup is complete before the replication starts, so a failed replication is only reported.
         """
         log.info("creating rolling backup")
         self.backupService.createRollingBackup()
+        if replicate is None:
+            replicate = self.config.backups.replicateAfterBackup and bool(self.config.backups.replicationTarget)
+        if replicate:
+            try:
+                self.replicateBackup()
+            except Exception as ex:
+                log.error(f"The backup was created, but replicating it failed: {ex}. Use backup-replicate to resume it")
+
+    def replicateBackup(self):
+        """
+        replicates the latest rolling backup to the replication target, resuming an interrupted replication
+        """
+        if not self.config.backups.replicationTarget:
+            raise AdminRequiredException("There is no backups.replicationTarget configured to replicate the backups to.")
+        latestBackupNumber = self.backupService.getPreviousBackupNumber()
+        if latestBackupNumber is None:
+            raise AdminRequiredException("There is no valid latest rolling backup to replicate. Please create a backup first.")
+        return self.backupService.replicateBackup(self.backupService.getRollingBackupFolder(latestBackupNumber))
 
     def createStaticBackup(self):
         """
@@ -294,6 +369,72 @@ class EsmMain:
         """
         self.backupService.createStaticBackup()
 
+    def verifyBackup(self, number: int=None, all: bool=False, quick: bool=False):
+        """
+        verifies the latest (or the given, or all) rolling backups against their manifests, logs the mismatches
+        """
+        if all:
+            numbers = range(1, self.config.backups.amount + 1)
+        elif number is not None:
+            if number < 1 or number > self.config.backups.amount:
+                raise WrongParameterError(f"There is no rolling backup number {number}, the configured amount is {self.config.backups.amount}.")
+            numbers = [number]
+        else:
+            latestBackupNumber = self.backupService.getPreviousBackupNumber()
+            if latestBackupNumber is None:
+                raise AdminRequiredException("There is no valid latest rolling backup to verify. Please create a backup first.")
+            numbers = [latestBackupNumber]
+        invalid = []
+        for backupNumber in numbers:
+            stats = self.backupService.verifyBackup(backupNumber, quick=quick)
+            if stats is None:
+                continue
+            log.info(f"Backup {backupNumber}: {stats}")
+            mismatches = stats.getMismatches()
+            for kind, relativePath in mismatches[:50]:
+                log.warning(f"Backup {backupNumber}: {kind} '{relativePath}'")
+            if len(mismatches) > 50:
+                log.warning(f"Backup {backupNumber}: ... and {len(mismatches) - 50} more mismatches")
+            if not stats.isValid():
+                invalid.append(str(backupNumber))
+        if invalid:
+            log.error(f"The backups {', '.join(invalid)} do not match their manifests!")
+        else:
+            log.info("All verified backups match their manifests")
+        return not invalid
+
+    def restoreStaticBackup(self, backup: str, target: str, verify: bool=False):
+        """
+        restores a static backup with a manifest (and the chain of zips it needs) to the target folder
+        """
+        self.backupService.restoreStaticBackup(backup, Path(target).resolve(), verify=verify)
+
+    def restoreFromBackup(self, backup: str=None, playfields: List[str]=None, entities: List[str]=None, database: bool=False, dryrun: bool=True):
+        """
+        restores single playfields, entities or the database from a rolling or static backup into the current savegame
+        """
+        selection = RestoreSelection(playfields=playfields, entities=entities, database=database,
+                                     playfieldsFolder=self.config.foldernames.playfields, templatesFolder=self.config.foldernames.templates,
+                                     sharedFolder=self.config.foldernames.shared, databaseFile=self.config.filenames.globaldb)
+        if selection.isEmpty():
+            raise WrongParameterError("Nothing to restore, please select playfields, entities or the database.")
+        if dryrun:
+            for entry in self.backupService.planSelectiveRestore(backup, selection):
+                log.info(f"{entry}")
+            log.info("This was a dry run, nothing was changed. Use --nodryrun to restore.")
+            return
+
+        if self.dedicatedServer.isRunning():
+            raise ServerNeedsToBeStopped("Can not restore parts of the savegame while the server is running. Please stop it first.")
+        if self.config.general.useRamdisk:
+            self.ramdiskManager.existsRamdisk()
+        self.backupService.restoreSelection(backup, selection)
+        if self.config.general.useRamdisk:
+            # the synchronizers don't know about the restored files, so the mirror is rebuilt with a full scan right away
+            self.ramdiskManager.deleteSyncManifests()
+            log.info("Syncing the restored savegame on the ramdisk to the mirror")
+            self.ramdiskManager.syncRamToMirror(fullScan=True, throttled=False)
+
     def installGame(self):
         """
         calls steam to install the game via steam to the given installation directory
@@ -491,6 +632,47 @@ class EsmMain:
     #     log.info(f"Calling wipe empty playfields for dbLocation: '{dbLocation}' territory '{territory}', wipeType '{wipeType}', dryrun '{dryrun}', cleardiscoveredby '{cleardiscoveredby}'")
     #     self.wipeService.wipeTerritory(dbLocation, territory, WipeType.byName(wipeType), dryrun, cleardiscoveredby)
 
+    def ramdiskSync(self, synchronizer=None, fullScan=False):
+        """
+        syncs the ramdisk to the mirror once with the given or configured synchronizer, can be used to compare the synchronizers.
+        """
+        if not self.config.general.useRamdisk:
+            raise AdminRequiredException("Ramdisk usage is disabled in the configuration, there is nothing to sync.")
+
+        synchronizer = synchronizer or self.config.ramdisk.synchronizer
+        log.info(f"Synchronizing from ram to mirror using the {synchronizer} synchronizer")
+        with Timer() as timer:
+            self.ramdiskManager.syncRamToMirror(synchronizer=synchronizer, fullScan=fullScan)
+        log.info(f"Sync with the {synchronizer} synchronizer took {timer.elapsedTime}")
+
+    def ramdiskCapacity(self):
+        """
+        samples the ramdisk usage once, adds it to the history and shows the forecast
+        """
+        if not self.config.general.useRamdisk:
+            raise AdminRequiredException("Ramdisk usage is disabled in the configuration, there is no ramdisk to look at.")
+        if not self.ramdiskManager.checkRamdrive(simpleCheck=True):
+            raise AdminRequiredException(f"There is no ramdisk mounted at '{self.config.ramdisk.drive}', please run the ramdisk setup first.")
+
+        capacityForecast = self.capacityMonitor.update()
+        log.info(f"{capacityForecast}")
+        for name, size in capacityForecast.sample.folders.items():
+            growthRate = capacityForecast.folderGrowthRates.get(name)
+            growth = f", growing {FsTools.realToHumanFileSize(max(0, growthRate) * 3600)}/h" if growthRate is not None else ""
+            log.info(f"{name}: {FsTools.realToHumanFileSize(size)}{growth}")
+
+    def ramdiskTiering(self, dryrun=True):
+        """
+        moves cold playfields from the ramdisk to the cold tier on the hdd and hot ones back, reporting the tier sizes.
+        """
+        if not self.config.general.useRamdisk:
+            raise AdminRequiredException("Ramdisk usage is disabled in the configuration, tiering playfields only makes sense when using a ramdisk.")
+
+        if not dryrun and self.dedicatedServer.isRunning():
+            raise ServerNeedsToBeStopped("Can not move playfields between the ramdisk and the cold tier while the server is running. Please stop it first.")
+
+        self.tieringService.applyTiering(dryrun=dryrun)
+
     def ramdiskRemount(self):
         """
         just unmounts and mounts the ramdisk again. Can be used when the ramdisk size configuration changed. Will just unmount and call the setup.
@@ -504,13 +686,13 @@ class EsmMain:
 
         # just unmount the ramdisk, if it exists.
         ramdiskDriveLetter = self.config.ramdisk.drive
-        if Path(ramdiskDriveLetter).exists():
+        if self.ramdiskManager.checkRamdrive(simpleCheck=True):
             log.info(f"Unmounting ramdisk at '{ramdiskDriveLetter}'.")
             try:
                 self.ramdiskManager.unmountRamdisk(driveLetter=ramdiskDriveLetter)
             except AdminRequiredException as ex:
                 log.error(f"exception trying to unmount. Will check if its mounted at all")
-                if self.ramdiskManager.checkRamdrive(driveLetter=ramdiskDriveLetter):
+                if self.ramdiskManager.checkRamdrive(ramdiskDriveLetter=ramdiskDriveLetter):
                     raise AdminRequiredException(f"Ramdisk is still mounted, can't recuperate from the error here. Exception: {ex}")
                 else:
                     log.info(f"There is no more ramdisk mounted as '{ramdiskDriveLetter}', will continue.")
@@ -583,13 +765,22 @@ class EsmMain:
                 raise WrongParameterError(f"Input file at '{inputFilePath}' not found")
         return names
 
-    def purgeEmptyPlayfieldsOld(self, dbLocation=None, dryrun=True, cleardiscoveredby=True, minimumage=30, leavetemplates=False, force=False):
+    def purgeEmptyPlayfieldsOld(self, dbLocation=None, dryrun=True, cleardiscoveredby=True, minimumage=30, leavetemplates=False, force=False, resume=False):
         """
         checks for playfields that haven't been visited for the minimumage days and purges them from the filesystem
+
+        if resume is True, an interrupted purge is finished from its journal instead.
         """
-        if not dryrun and self.dedicatedServer.isRunning():
+        if (resume or not dryrun) and self.dedicatedServer.isRunning():
             raise ServerNeedsToBeStopped("Can not purge empty playfields with --nodryrun if the server is running. Please stop it first.")
 
+        if resume:
+            try:
+                self.wipeService.resumePurge(EsmWipeService.PURGEEMPTYPLAYFIELDSJOURNAL, force=force)
+            except UserAbortedException as ex:
+                log.warning(f"User aborted the operation, nothing deleted.")
+            return
+
         if dbLocation is None:
             dbLocation = self.fileSystem.getAbsolutePathTo("saves.games.savegame.globaldb")
         else:
@@ -665,12 +856,22 @@ class EsmMain:
                 except UserAbortedException as ex:
                     log.warning("User aborted operation, nothing was deleted.")
     
-    def cleanupSharedFolder(self, savegame=None, dryrun=True, force=False):
+    def cleanupSharedFolder(self, savegame=None, dryrun=True, force=False, resume=False):
         """
         will clean up the shared folder, after checking the entries against the entities table in the db.
 
         if savegame is given, will use that instead of the current savegame, also the server may keep running.
+        if resume is True, an interrupted clean up is finished from its journal instead.
         """
+        if resume:
+            if self.dedicatedServer.isRunning():
+                raise ServerNeedsToBeStopped("Can not resume the clean up of shared folders if the server is running. Please stop it first.")
+            try:
+                self.wipeService.resumePurge(EsmWipeService.CLEANUPSHAREDFOLDERJOURNAL, force=force)
+            except UserAbortedException:
+                log.info(f"User aborted clean up execution.")
+            return
+
         #log.debug(f"{__name__}.cleanupSharedFolder: savegame: '{savegame}', dryrun: '{dryrun}', force: '{force}'")
 
         savegamePath = self.getSavegamePath(savegame)
@@ -704,6 +905,137 @@ class EsmMain:
             self.fileSystem.clearPendingDeletePaths()
             log.warning("Deletion cancelled")
 
+    def pruneGameCache(self, budget: str = None, maxAgeDays: int = None, dryrun: bool = True):
+        """
+            evicts the least recently used entries of the game's cache until it fits into the budget and has no entries older than the maximum age.
+            Entries used within deletes.cacheProtectedHours are kept, so this is safe to do while the server is running.
+        """
+        budget = budget or self.config.deletes.cacheBudget
+        maxAgeDays = maxAgeDays or self.config.deletes.cacheMaxAgeDays
+        if budget is None and maxAgeDays is None:
+            raise WrongParameterError("Neither a budget nor a maximum age is given or configured (deletes.cacheBudget, deletes.cacheMaxAgeDays), there is nothing to prune.")
+        if budget is not None and not re.match(FILESIZEPATTERN, budget):
+            raise WrongParameterError(f"'{budget}' is not a valid size, use something like '50G'.")
+        budgetBytes = FsTools.humanToRealFileSize(budget.upper()) if budget is not None else None
+        maxAge = timedelta(days=maxAgeDays) if maxAgeDays is not None else None
+
+        stats, evictions = self.deleteService.pruneGameCache(budget=budgetBytes, maxAge=maxAge, dryrun=dryrun)
+        evictedSize = sum(entry.size for entry in evictions)
+        if dryrun:
+            for entry in evictions[:50]:
+                log.info(f"Would evict '{entry.path}', {FsTools.realToHumanFileSize(entry.size)}, last used {datetime.fromtimestamp(entry.lastUsed).isoformat(sep=' ', timespec='seconds')}")
+            if len(evictions) > 50:
+                log.info(f"... and {len(evictions) - 50} more entries")
+            log.info(f"The cache has {stats.entries} entries ({FsTools.realToHumanFileSize(stats.size)}), pruning would evict {len(evictions)} of them ({FsTools.realToHumanFileSize(evictedSize)}). "
+                     f"This was a dry run, use --nodryrun to actually prune the cache.")
+            return
+        log.info(f"Pruned the cache: {stats}. It has {FsTools.realToHumanFileSize(stats.size - stats.reclaimedBytes)} left.")
+
+    def runMaintenance(self, stepsFile, dryrun=True, force=False):
+        """
+            runs the maintenance steps from the given yaml file against the current savegame, sharing the database queries and folder listings
+            between all steps and committing all deletions in one pass.
+        """
+        if not dryrun and self.dedicatedServer.isRunning():
+            raise ServerNeedsToBeStopped("Can not run the maintenance with --nodryrun if the server is running. Please stop it first.")
+
+        steps = self.maintenanceService.readSteps(Path(stepsFile).resolve())
+        if len(steps) < 1:
+            log.info(f"No maintenance steps defined in '{stepsFile}'. Nothing to do.")
+            return
+
+        savegamePath = self.getSavegamePath()
+        log.info(f"Running {len(steps)} maintenance steps from '{stepsFile}' on savegame '{savegamePath}', dryrun '{dryrun}', force '{force}'")
+        try:
+            self.maintenanceService.runMaintenance(steps=steps, savegamePath=savegamePath, dryrun=dryrun, force=force)
+        except UserAbortedException:
+            log.warning(f"User aborted the maintenance, nothing was deleted.")
+
+    def emptyTrash(self, unlimited: bool = False):
+        """
+            empties the trash folders used by the deferred deletion right away. This is safe to do while the server is running.
+        """
+        rate = 0 if unlimited else None
+        log.info(f"Emptying trash folders: {[str(folder) for folder in self.trashService.getKnownTrashFolders()]}")
+        deleted, elapsedTime = self.trashService.reclaim(rate=rate, bytesPerSecond=rate)
+        log.info(f"Deleted {deleted} files and folders from the trash in {elapsedTime}")
+
+    def showIoQueue(self):
+        """
+            logs the io heavy jobs of all esm processes that are running or waiting for their turn
+        """
+        tickets = self.ioCoordinator.getTickets()
+        if len(tickets) == 0:
+            log.info(f"There are no io heavy jobs running or waiting in the queue at '{self.ioCoordinator.getQueuePath()}'")
+            return
+        for ticket in tickets:
+            if ticket.isActive():
+                log.info(f"Running: {ticket}, asked for its lease {ticket.getAge()} ago")
+            else:
+                log.info(f"Waiting: {ticket}, priority {ticket.priority}, waiting for {ticket.getAge()}")
+
+    def unpackMirror(self, source: str=None, target: str=None, verify: bool=False):
+        """
+            unpacks a packed mirror (the configured one if source is None) to a normal folder tree at target
+        """
+        if source is None:
+            sourcePath = self.fileSystem.getAbsolutePathTo("saves.gamesmirror.savegamepacked")
+        else:
+            sourcePath = Path(source).resolve()
+        targetPath = Path(target).resolve()
+        if targetPath.exists() and any(targetPath.iterdir()):
+            raise WrongParameterError(f"Target path '{targetPath}' is not empty, please choose an empty or new folder.")
+        packedMirror = EsmPackedMirror(source=None, packedPath=sourcePath, threads=self.config.ramdisk.synchronizerThreads)
+        if not packedMirror.exists():
+            raise WrongParameterError(f"There is no packed mirror at '{sourcePath}'.")
+        log.info(f"Unpacking the packed mirror at '{sourcePath}' to '{targetPath}'")
+        stats = packedMirror.unpack(targetPath, verify=verify)
+        log.info(f"Unpacked the packed mirror: {stats}")
+        if stats.failed > 0:
+            log.error(f"{stats.failed} files could not be unpacked, please check the logs")
+
+    def benchmarkMirror(self, path: str, folders: int, files: int, size: str):
+        """
+            compares the plain and the packed mirror format on a synthetic tree at path
+        """
+        results = benchmarkMirrorFormats(Path(path).resolve(), folders=folders, filesPerFolder=files, fileSize=FsTools.humanToRealFileSize(size),
+                                         threads=self.config.ramdisk.synchronizerThreads)
+        for step, plainTime, packedTime in results:
+            log.info(f"{step:<32} plain: {plainTime}, packed: {packedTime}")
+
+    def benchmarkRamdisk(self, path: str, folders: int, files: int, size: str):
+        """
+            compares the ramdisk with a disk backed folder at path on a synthetic savegame
+        """
+        if not self.ramdiskManager.checkRamdrive(simpleCheck=True):
+            raise AdminRequiredException(f"There is no ramdisk mounted at '{self.config.ramdisk.drive}', please run the ramdisk setup first.")
+        locations = {
+            f"ramdisk ({self.ramdiskManager.backend.name})": Path(self.config.ramdisk.drive).joinpath("esm-benchmark"),
+            "disk": Path(path).resolve()
+        }
+        results = benchmarkSavegameStorage(locations, folders=folders, filesPerFolder=files, fileSize=FsTools.humanToRealFileSize(size))
+        for step, times in results:
+            log.info(f"{step:<8} {', '.join(f'{name}: {elapsedTime}' for name, elapsedTime in times.items())}")
+
+    def benchmarkStaticBackup(self, source: str=None, path: str=None):
+        """
+            compares the builtin archiver with PeaZip on the latest rolling backup (or the given source folder), writing the zips to path
+        """
+        if source is None:
+            latestBackupNumber = self.backupService.getPreviousBackupNumber()
+            if latestBackupNumber is None:
+                raise AdminRequiredException("There is no valid latest rolling backup to use. Please create a backup first or provide a source.")
+            sourcePath = self.backupService.getRollingBackupFolder(latestBackupNumber)
+        else:
+            sourcePath = Path(source).resolve()
+        if path is None:
+            workingPath = self.fileSystem.getAbsolutePathTo("backup").joinpath("esm-benchmark-zip")
+        else:
+            workingPath = Path(path).resolve()
+        log.info(f"Benchmarking the static backup archivers on '{sourcePath}', the zips are written to '{workingPath}'")
+        for name, stats in self.backupService.benchmarkArchivers(sourcePath, workingPath):
+            log.info(f"{name:<18} {stats.elapsedTime}, {FsTools.realToHumanFileSize(stats.compressedBytes)} ({stats.getRatio()*100:.1f}%), {FsTools.realToHumanFileSize(stats.getThroughput())}/s")
+
     def getSavegamePath(self, savegame=None):
         if savegame is None:
             return self.fileSystem.getAbsolutePathTo("saves.games.savegame")
@@ -765,18 +1097,21 @@ class EsmMain:
 
         if self.config.general.useRamdisk:
             try:
-                path = self.ramdiskManager.checkAndGetOsfMountPath()
-                log.info(f"'{path}' found")
+                found = self.ramdiskManager.checkBackendRequirements()
+                log.info(f"ramdisk backend '{self.ramdiskManager.backend.name}': {found}")
             except RequirementsNotFulfilledError as ex:
                 log.error(f"{ex}")
         else:
             log.info("ramdisk usage is disabled")
 
-        try:
-            path = self.backupService.checkAndGetPeaZipPath()
-            log.info(f"'{path}' found")
-        except RequirementsNotFulfilledError as ex:
-            log.error(f"{ex}")
+        if self.config.backups.staticBackupArchiver == "builtin":
+            log.info("static backups use the builtin archiver, PeaZip is not needed")
+        else:
+            try:
+                path = self.backupService.checkAndGetPeaZipPath()
+                log.info(f"'{path}' found")
+            except RequirementsNotFulfilledError as ex:
+                log.error(f"{ex}")
 
         emprc = ServiceRegistry.get(EsmEmpRemoteClientService)
         try:
@@ -818,7 +1153,7 @@ class EsmMain:
             log.info(f"Checking if you have the required privileges to run access ramdisks at all")
             ramdriveMounted = self.ramdiskManager.checkRamdrive(simpleCheck=False)
             if not ramdriveMounted:
-                log.warning(f"Could either not execute or not access the ramdisk with osf mount. Either it is not mounted yet or you may not have admin privileges to execute osfmount.")
+                log.warning(f"Could either not execute or not access the ramdisk with {self.ramdiskManager.backend.name}. Either it is not mounted yet or you may not have admin privileges to execute it.")
 
         if self.config.dedicatedConfig.GameConfig.SharedDataURL is not None:
             log.info(f"checking if the shared data url is available")
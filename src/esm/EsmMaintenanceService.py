@@ -0,0 +1,294 @@
+import logging
+import os
+import yaml
+from datetime import timedelta
+from enum import Enum
+from functools import cached_property
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+from pydantic import BaseModel, Field
+from esm.ConfigModels import MainConfig
+from esm.DataTypes import Playfield, Territory, WipeType
+from esm.EsmConfigService import EsmConfigService
+from esm.EsmDatabaseWrapper import EsmDatabaseWrapper
+from esm.EsmFileSystem import EsmFileSystem
+from esm.EsmWipeService import EsmWipeService
+from esm.ServiceRegistry import Service, ServiceRegistry
+from esm.Tools import Timer
+from esm.exceptions import WrongParameterError
+
+log = logging.getLogger(__name__)
+
+class MaintenanceStepType(str, Enum):
+    WIPE = "wipe"
+    PURGEEMPTYPLAYFIELDS = "purge-empty-playfields"
+    CLEANUPREMOVEDENTITIES = "cleanup-removed-entities"
+    CLEANUPSHARED = "cleanup-shared"
+
+class MaintenanceStep(BaseModel):
+    """represents a single step of a maintenance steps file, the options correspond to the ones of the related tool command"""
+    step: MaintenanceStepType = Field(..., description="the tool to run in this step")
+    territory: Optional[str] = Field(None, description="wipe: territory to wipe, use GALAXY for the whole galaxy")
+    listfile: Optional[str] = Field(None, description="wipe: text file with the system/playfield names to wipe, see tool-wipe")
+    wipetype: Optional[str] = Field(None, description="wipe: the wipe type to apply")
+    minage: Optional[int] = Field(None, ge=1, description="wipe: only wipe playfields not visited for this many days, purge-empty-playfields: minimum age in days (default 30)")
+    cleardiscoveredby: bool = Field(True, description="wipe, purge-empty-playfields: clear the discovered-by infos of the affected playfields")
+    leavetemplates: bool = Field(False, description="purge-empty-playfields: do not delete the related templates")
+
+class MaintenanceSteps(BaseModel):
+    """represents a maintenance steps file"""
+    steps: List[MaintenanceStep] = Field([], description="the steps to execute, in order")
+
+class MaintenancePlan:
+    """
+    shared plan for a maintenance run, everything in here is computed once and then reused by all steps.
+
+    contains the database query results, the folder listings of the savegame and the resolved territories.
+    since all changes are applied after all steps ran, every step sees the same state of the savegame.
+    """
+    def __init__(self, database: EsmDatabaseWrapper, savegamePath: Path, config: MainConfig):
+        self.database = database
+        self.savegamePath = savegamePath
+        self.config = config
+        self.playfieldsOlderThan: Dict[int, Set[Playfield]] = {}
+        self.territoryPlayfields: Dict[str, List[Playfield]] = {}
+        self.clearDiscoveredPlayfields: Set[Playfield] = set()
+        self.wipes: Dict[WipeType, Set[Playfield]] = {}
+
+    @cached_property
+    def playfieldsPath(self) -> Path:
+        return self.savegamePath.joinpath(self.config.foldernames.playfields)
+
+    @cached_property
+    def templatesPath(self) -> Path:
+        return self.savegamePath.joinpath(self.config.foldernames.templates)
+
+    @cached_property
+    def sharedPath(self) -> Path:
+        return self.savegamePath.joinpath(self.config.foldernames.shared)
+
+    @cached_property
+    def playfieldFolders(self) -> Set[str]:
+        return self.listFolder(self.playfieldsPath)
+
+    @cached_property
+    def templateFolders(self) -> Set[str]:
+        return self.listFolder(self.templatesPath)
+
+    @cached_property
+    def sharedFolders(self) -> Set[str]:
+        return self.listFolder(self.sharedPath)
+
+    @cached_property
+    def nonEmptyPlayfields(self) -> Set[Playfield]:
+        return set(self.database.retrievePFsAllNonEmpty())
+
+    @cached_property
+    def nonRemovedEntityIds(self) -> Set[str]:
+        return set(self.database.retrieveNonRemovedEntities())
+
+    @cached_property
+    def removedEntities(self):
+        return self.database.retrievePurgeableRemovedEntities()
+
+    def listFolder(self, path: Path) -> Set[str]:
+        if not path.exists():
+            log.debug(f"folder '{path}' does not exist")
+            return set()
+        with Timer() as timer:
+            names = set(entry.name for entry in os.scandir(path))
+        log.debug(f"listed {len(names)} entries in '{path}' in {timer.elapsedTime}")
+        return names
+
+    def getPlayfieldsOlderThan(self, minimumage: int) -> Set[Playfield]:
+        if minimumage not in self.playfieldsOlderThan:
+            self.playfieldsOlderThan[minimumage] = set(self.database.retrievePFsDiscoveredOlderThanAge(minimumage))
+        return self.playfieldsOlderThan[minimumage]
+
+    def addWipe(self, wipeType: WipeType, playfields: List[Playfield]):
+        self.wipes.setdefault(wipeType, set()).update(playfields)
+
+@Service
+class EsmMaintenanceService:
+    """
+    Service that runs a list of maintenance steps (wipes, purges and cleanups) against a shared plan,
+    so the database queries and folder listings are only done once and all deletions are committed in one pass.
+    """
+    @cached_property
+    def config(self) -> MainConfig:
+        return ServiceRegistry.get(EsmConfigService).config
+
+    @cached_property
+    def fileSystem(self) -> EsmFileSystem:
+        return ServiceRegistry.get(EsmFileSystem)
+
+    @cached_property
+    def wipeService(self) -> EsmWipeService:
+        return ServiceRegistry.get(EsmWipeService)
+
+    def readSteps(self, stepsFilePath: Path) -> List[MaintenanceStep]:
+        """
+        reads and validates the maintenance steps file
+        """
+        if not stepsFilePath.exists():
+            raise WrongParameterError(f"Maintenance steps file at '{stepsFilePath}' not found")
+        with open(stepsFilePath, "r", encoding="utf-8") as file:
+            content = yaml.safe_load(file)
+        steps = MaintenanceSteps.model_validate(content).steps
+        for index, step in enumerate(steps):
+            if step.step == MaintenanceStepType.WIPE:
+                if step.wipetype is None or WipeType.byName(step.wipetype) is None:
+                    raise WrongParameterError(f"Step {index+1} ({step.step.value}) needs a valid wipetype, one of {WipeType.valueList()}")
+                if (step.territory is None) == (step.listfile is None):
+                    raise WrongParameterError(f"Step {index+1} ({step.step.value}) needs either a territory or a listfile")
+        return steps
+
+    def runMaintenance(self, steps: List[MaintenanceStep], savegamePath: Path, dryrun=True, force=False):
+        """
+        runs all given steps against one shared plan, then applies all changes: clearing the discovered-by infos, writing the wipe infos
+        and deleting all the marked files in one pass.
+
+        returns the list of (step, elapsedTime, info) tuples
+        """
+        database = EsmDatabaseWrapper(savegamePath.joinpath(self.config.filenames.globaldb))
+        if not dryrun and any(step.cleardiscoveredby for step in steps if step.step in [MaintenanceStepType.WIPE, MaintenanceStepType.PURGEEMPTYPLAYFIELDS]):
+            database.setWriteMode()
+        plan = MaintenancePlan(database=database, savegamePath=savegamePath, config=self.config)
+
+        timings = []
+        try:
+            for index, step in enumerate(steps):
+                log.info(f"Running maintenance step {index+1}/{len(steps)}: {step.step.value}")
+                with Timer() as timer:
+                    info = self.runStep(plan, step)
+                log.info(f"Maintenance step {index+1}/{len(steps)} {step.step.value} took {timer.elapsedTime}: {info}")
+                timings.append((step, timer.elapsedTime, info))
+
+            if dryrun:
+                database.closeDbConnection()
+                self.writeDryrunResults(plan)
+                self.fileSystem.clearPendingDeletePaths()
+            else:
+                with Timer() as timer:
+                    if len(plan.clearDiscoveredPlayfields) > 0:
+                        log.info(f"Clearing discovered-by infos for {len(plan.clearDiscoveredPlayfields)} playfields")
+                        database.deleteFromDiscoveredPlayfields(list(plan.clearDiscoveredPlayfields))
+                    database.closeDbConnection()
+                    for wipeType, playfields in plan.wipes.items():
+                        self.wipeService.createWipeInfoForPlayfields(playfields=list(playfields), wipeType=wipeType)
+                timings.append(("apply database changes and wipes", timer.elapsedTime, f"{len(plan.clearDiscoveredPlayfields)} discovered-by infos cleared, {sum(len(p) for p in plan.wipes.values())} playfields wiped"))
+
+                additionalInfo = f"{len(self.fileSystem.getPendingDeletePaths())} paths of {len(steps)} maintenance steps marked for deletion."
+                journal = self.wipeService.getPurgeJournal("maintenance")
+                journal.reset()
+                override = "yes" if force else None
+                with Timer() as timer:
+                    comitted, elapsedTime = self.fileSystem.commitDelete(override=override, additionalInfo=additionalInfo, journal=journal)
+                timings.append(("commit deletions", timer.elapsedTime, f"{additionalInfo}"))
+        finally:
+            database.closeDbConnection()
+
+        self.logTimings(timings)
+        return timings
+
+    def runStep(self, plan: MaintenancePlan, step: MaintenanceStep) -> str:
+        """
+        runs a single step against the plan, returns a short info about what the step did
+        """
+        if step.step == MaintenanceStepType.WIPE:
+            return self.stepWipe(plan, step)
+        if step.step == MaintenanceStepType.PURGEEMPTYPLAYFIELDS:
+            return self.stepPurgeEmptyPlayfields(plan, step)
+        if step.step == MaintenanceStepType.CLEANUPREMOVEDENTITIES:
+            return self.stepCleanupRemovedEntities(plan)
+        if step.step == MaintenanceStepType.CLEANUPSHARED:
+            return self.stepCleanupShared(plan)
+
+    def stepWipe(self, plan: MaintenancePlan, step: MaintenanceStep):
+        if step.territory:
+            if step.territory not in plan.territoryPlayfields:
+                plan.territoryPlayfields[step.territory] = self.wipeService.resolvePlayfieldsFromTerritory(plan.database, self.getTerritory(step.territory))
+            playfields = plan.territoryPlayfields[step.territory]
+        else:
+            names = self.readNamesFromFile(Path(step.listfile))
+            playfields = self.wipeService.resolvePlayfieldsFromList(database=plan.database, systemAndPlayfieldNames=names)
+
+        if step.minage:
+            playfields = list(set(playfields).intersection(plan.getPlayfieldsOlderThan(step.minage)))
+
+        wipeType = WipeType.byName(step.wipetype)
+        plan.addWipe(wipeType, playfields)
+        if step.cleardiscoveredby:
+            plan.clearDiscoveredPlayfields.update(playfields)
+        return f"{len(playfields)} playfields selected for wipe type '{wipeType.value.name}'"
+
+    def stepPurgeEmptyPlayfields(self, plan: MaintenancePlan, step: MaintenanceStep):
+        minimumage = step.minage if step.minage else 30
+        playfields = list(plan.getPlayfieldsOlderThan(minimumage) - plan.nonEmptyPlayfields)
+        entities = plan.database.retrievePurgeableEntitiesByPlayfields(playfields)
+
+        pfCounter = 0
+        tpCounter = 0
+        for playfield in playfields:
+            if playfield.name in plan.playfieldFolders:
+                self.fileSystem.markForDelete(plan.playfieldsPath.joinpath(playfield.name))
+                pfCounter += 1
+            if not step.leavetemplates and playfield.name in plan.templateFolders:
+                self.fileSystem.markForDelete(plan.templatesPath.joinpath(playfield.name))
+                tpCounter += 1
+        enCounter = self.markSharedFolders(plan, [entity.id for entity in entities])
+        if step.cleardiscoveredby:
+            plan.clearDiscoveredPlayfields.update(playfields)
+        return f"{pfCounter} playfield folders, {tpCounter} template folders and {enCounter} entity folders of {len(playfields)} playfields marked for deletion"
+
+    def stepCleanupRemovedEntities(self, plan: MaintenancePlan):
+        counter = self.markSharedFolders(plan, [entity.id for entity in plan.removedEntities])
+        return f"{counter} folders of {len(plan.removedEntities)} removed entities marked for deletion"
+
+    def stepCleanupShared(self, plan: MaintenancePlan):
+        danglingIds = plan.sharedFolders - plan.nonRemovedEntityIds
+        counter = self.markSharedFolders(plan, danglingIds)
+        return f"{counter} dangling folders in the shared folder marked for deletion"
+
+    def markSharedFolders(self, plan: MaintenancePlan, ids):
+        counter = 0
+        for id in ids:
+            if str(id) in plan.sharedFolders:
+                self.fileSystem.markForDelete(plan.sharedPath.joinpath(str(id)))
+                counter += 1
+        return counter
+
+    def getTerritory(self, territoryName) -> Territory:
+        if territoryName == Territory.GALAXY:
+            return Territory(Territory.GALAXY, 0,0,0,99999999)
+        territory = self.wipeService.getCustomTerritoryByName(territoryName)
+        if territory is None:
+            raise WrongParameterError(f"Territory '{territoryName}' not found, use tool-wipe --showterritories to list the available ones")
+        return territory
+
+    def readNamesFromFile(self, inputFilePath: Path):
+        inputFilePath = inputFilePath.resolve()
+        if not inputFilePath.is_file():
+            raise WrongParameterError(f"Input file at '{inputFilePath}' not found")
+        with open(inputFilePath, "r") as file:
+            return [line.rstrip('\n') for line in file.readlines()]
+
+    def writeDryrunResults(self, plan: MaintenancePlan):
+        for wipeType, playfields in plan.wipes.items():
+            csvFilename = Path(f"esm-maintenance-wipe-{wipeType.value.name}.csv").absolute()
+            log.info(f"Will output the list of {len(playfields)} playfields that would have been wiped with '{wipeType.value.name}' as '{csvFilename}'")
+            self.wipeService.printListOfPlayfieldsAsCSV(csvFilename=csvFilename, playfields=list(playfields))
+        fileName = Path("esm-maintenance-deletes.lst").absolute()
+        paths = self.fileSystem.getPendingDeletePaths()
+        log.info(f"Will output the list of {len(paths)} paths that would have been deleted as '{fileName}'")
+        with open(fileName, "w", encoding="utf-8") as file:
+            file.writelines([f"{path}\n" for path in paths])
+
+    def logTimings(self, timings):
+        total = timedelta()
+        log.info("Maintenance timings:")
+        for step, elapsedTime, info in timings:
+            name = step.step.value if isinstance(step, MaintenanceStep) else step
+            log.info(f"  {name}: {elapsedTime} - {info}")
+            total += elapsedTime
+        log.info(f"  total: {total}")
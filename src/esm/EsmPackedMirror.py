@@ -0,0 +1,432 @@
+import hashlib
+import logging
+import os
+import random
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from threading import Event
+from typing import Dict, List, Tuple
+from esm.EsmSyncEngine import EsmSyncEngine, SyncStats
+from esm.exceptions import PackedMirrorError
+from esm.FsTools import FsTools
+from esm.Tools import Timer, getElapsedTime
+
+log = logging.getLogger(__name__)
+
+class PackedEntry:
+    """
+    where the content of a file is stored in the packs, together with the size and modification time of the source file it was packed from.
+    Directories have the pack -1.
+    """
+    DIRECTORY = -1
+
+    def __init__(self, pack: int, offset: int, length: int, size: int, mtime: int, hash: str):
+        self.pack = pack
+        self.offset = offset
+        self.length = length
+        self.size = size
+        self.mtime = mtime
+        self.hash = hash
+
+    @staticmethod
+    def directory():
+        return PackedEntry(PackedEntry.DIRECTORY, 0, 0, EsmSyncEngine.DIRECTORY, 0, "-")
+
+    def isDirectory(self):
+        return self.pack == PackedEntry.DIRECTORY
+
+class EsmPackedMirror(EsmSyncEngine):
+    """
+    mirror of a folder tree that is stored in a few large append-only pack files plus an index, instead of millions of small files.
+
+    The index maps every relative path to the pack, offset and length of its content, together with the size and modification time
+    of the source file and a hash of the content. Synchronizing works like the native sync engine, using the index as manifest:
+    changed files are appended to the newest pack, deleted files just vanish from the index. The packs are flushed to disk before
+    the index is replaced, so an interrupted sync only leaves some unreferenced bytes at the end of a pack.
+
+    Packs that consist mostly of unreferenced bytes are compacted after a sync, by appending their remaining entries to the newest pack
+    and deleting them. Unpacking streams every pack sequentially, packs are read in parallel.
+    """
+    INDEXHEADER = "#esm-packed-index"
+    INDEXVERSION = "1"
+    INDEXNAME = "index.tsv"
+    PACKNAMEPATTERN = re.compile(r"^pack-(\d{6})\.pack$")
+
+    def __init__(self, source: Path, packedPath: Path, packSize: int = 1024**3, compactionThreshold: float = 0.5, threads: int = 8,
+                 bytesPerSecond: int = 0, filesPerSecond: int = 0, lowPriority=False,
+                 databaseFiles: List[str] = None, databasePagesPerStep: int = 1024, databaseQuickCheckProbability: float = 0,
+                 priorityPaths: List[str] = None, readyEvent: Event = None):
+        super().__init__(source=source, destination=packedPath, manifestPath=Path(packedPath).joinpath(self.INDEXNAME), threads=threads,
+                         bytesPerSecond=bytesPerSecond, filesPerSecond=filesPerSecond, lowPriority=lowPriority,
+                         databaseFiles=databaseFiles, databasePagesPerStep=databasePagesPerStep, databaseQuickCheckProbability=databaseQuickCheckProbability,
+                         priorityPaths=priorityPaths, readyEvent=readyEvent)
+        self.packSize = packSize
+        self.compactionThreshold = compactionThreshold
+        self.index: Dict[str, PackedEntry] = {}
+        self.appended: Dict[str, PackedEntry] = {}
+        self.packFile = None
+        self.packNumber = None
+
+    def exists(self):
+        """returns True if there is a packed mirror with an index"""
+        return self.manifestPath.exists()
+
+    def getPackPath(self, packNumber: int) -> Path:
+        return self.destination.joinpath(f"pack-{packNumber:06d}.pack")
+
+    def listPacks(self) -> List[int]:
+        """returns the numbers of all packs, sorted"""
+        if not self.destination.exists():
+            return []
+        numbers = []
+        for entry in os.scandir(self.destination):
+            match = self.PACKNAMEPATTERN.match(entry.name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def readIndex(self) -> Dict[str, PackedEntry]:
+        """
+        returns the index as dictionary, or None if there is none
+        """
+        if not self.manifestPath.exists():
+            return None
+        index = {}
+        with open(self.manifestPath, "r", encoding="utf-8") as file:
+            header = file.readline().rstrip("\n").split("\t")
+            if header != [self.INDEXHEADER, self.INDEXVERSION]:
+                raise PackedMirrorError(f"'{self.manifestPath}' is not an index of a packed mirror this version understands")
+            for line in file:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 7:
+                    raise PackedMirrorError(f"the index of the packed mirror at '{self.manifestPath}' is corrupt")
+                index[parts[0]] = PackedEntry(int(parts[1]), int(parts[2]), int(parts[3]), int(parts[4]), int(parts[5]), parts[6])
+        return index
+
+    def writeIndex(self, index: Dict[str, PackedEntry]):
+        """
+        writes the index to a temporary file first and replaces the old one, so there is always a complete index on disk.
+        """
+        self.destination.mkdir(parents=True, exist_ok=True)
+        temporaryPath = self.manifestPath.with_name(f"{self.manifestPath.name}.tmp")
+        with open(temporaryPath, "w", encoding="utf-8") as file:
+            file.write(f"{self.INDEXHEADER}\t{self.INDEXVERSION}\n")
+            for relativePath, entry in index.items():
+                file.write(f"{relativePath}\t{entry.pack}\t{entry.offset}\t{entry.length}\t{entry.size}\t{entry.mtime}\t{entry.hash}\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporaryPath, self.manifestPath)
+
+    def readManifest(self) -> Dict[str, Tuple[int, int]]:
+        index = self.readIndex()
+        if index is None:
+            self.index = {}
+            return None
+        self.index = index
+        return {relativePath: (entry.size, entry.mtime) for relativePath, entry in index.items()}
+
+    def writeManifest(self, manifest: Dict[str, Tuple[int, int]]):
+        """
+        writes the index for the synced state and compacts the packs if needed
+        """
+        index = {}
+        for relativePath, (size, mtime) in manifest.items():
+            if size == self.DIRECTORY:
+                index[relativePath] = PackedEntry.directory()
+            elif size != self.UNKNOWN:
+                entry = self.appended.get(relativePath) or self.index.get(relativePath)
+                if entry is not None:
+                    index[relativePath] = entry
+        self.appended = {}
+        self.index = index
+        self.writeIndex(index)
+        self.compact()
+
+    def scanDestination(self) -> Dict[str, Tuple[int, int]]:
+        # without an index, the content of the packs is unknown and everything is packed again
+        return {}
+
+    def createFolders(self, toCreate: List[str]):
+        # folders only exist in the index
+        pass
+
+    def deleteEntries(self, toDelete: List[str], manifest: Dict[str, Tuple[int, int]], newManifest: Dict[str, Tuple[int, int]], stats: SyncStats):
+        # deleted entries just vanish from the index, their bytes in the packs are reclaimed by the compaction
+        stats.deleted += len(toDelete)
+
+    def copyFiles(self, toCopy: List[str], sourceEntries: Dict[str, Tuple[int, int]], newManifest: Dict[str, Tuple[int, int]], stats: SyncStats):
+        """
+        appends the files to the newest pack, one after another, since the pack is written sequentially anyway.
+        """
+        if not toCopy:
+            return
+        try:
+            for relativePath in toCopy:
+                if self.appendFile(relativePath, sourceEntries[relativePath]):
+                    stats.copied += 1
+                    stats.copiedBytes += sourceEntries[relativePath][0]
+                else:
+                    stats.failed += 1
+                    newManifest[relativePath] = (self.UNKNOWN, 0)
+        finally:
+            self.closePack()
+
+    def getPackForAppend(self):
+        """returns the pack file to append to, starting a new pack once the current one is full"""
+        if self.packFile is not None and self.packFile.tell() >= self.packSize:
+            self.closePack()
+            self.packNumber += 1
+        if self.packFile is None:
+            if self.packNumber is None:
+                packs = self.listPacks()
+                self.packNumber = packs[-1] if packs else 1
+            self.destination.mkdir(parents=True, exist_ok=True)
+            self.packFile = open(self.getPackPath(self.packNumber), "ab")
+            if self.packFile.tell() >= self.packSize:
+                self.closePack()
+                self.packNumber += 1
+                self.packFile = open(self.getPackPath(self.packNumber), "ab")
+        return self.packFile
+
+    def closePack(self):
+        """flushes the pack to disk, so the index never points to bytes that are not there"""
+        if self.packFile is None:
+            return
+        self.packFile.flush()
+        os.fsync(self.packFile.fileno())
+        self.packFile.close()
+        self.packFile = None
+
+    def appendStream(self, stream, length: int = None):
+        """
+        appends the stream (up to length bytes) to the newest pack, returns the pack number, offset, length and hash of the appended content
+        """
+        packFile = self.getPackForAppend()
+        offset = packFile.tell()
+        digest = hashlib.blake2b(digest_size=16)
+        written = 0
+        while length is None or written < length:
+            chunk = stream.read(self.CHUNKSIZE if length is None else min(self.CHUNKSIZE, length - written))
+            if not chunk:
+                break
+            self.throttle(self.bytesBucket, len(chunk))
+            digest.update(chunk)
+            packFile.write(chunk)
+            written += len(chunk)
+        return self.packNumber, offset, written, digest.hexdigest()
+
+    def appendFile(self, relativePath: str, sourceEntry: Tuple[int, int]):
+        """appends the file to the newest pack, returns True if that worked"""
+        self.throttle(self.filesBucket, 1)
+        sourcePath = self.source.joinpath(relativePath)
+        capturePath = None
+        try:
+            if relativePath in self.databaseFiles:
+                capturePath = self.destination.joinpath(f"{relativePath.replace('/', '_')}.esm-capture")
+                if not self.captureDatabase(relativePath, capturePath):
+                    return False
+                sourcePath = capturePath
+            with open(sourcePath, "rb") as file:
+                pack, offset, length, hash = self.appendStream(file)
+            self.appended[relativePath] = PackedEntry(pack, offset, length, sourceEntry[0], sourceEntry[1], hash)
+            return True
+        except OSError as ex:
+            # whatever made it into the pack is unreferenced and will be reclaimed by the compaction
+            log.error(f"could not pack '{sourcePath}': {ex}")
+            return False
+        finally:
+            if capturePath is not None:
+                capturePath.unlink(missing_ok=True)
+
+    def getPackUsage(self) -> Dict[int, Tuple[int, int]]:
+        """returns the size and the amount of referenced bytes for every pack"""
+        referenced = {}
+        for entry in self.index.values():
+            if not entry.isDirectory():
+                referenced[entry.pack] = referenced.get(entry.pack, 0) + entry.length
+        return {packNumber: (self.getPackPath(packNumber).stat().st_size, referenced.get(packNumber, 0)) for packNumber in self.listPacks()}
+
+    def compact(self):
+        """
+        appends the entries of the packs that consist of more unreferenced bytes than the compaction threshold to the newest pack,
+        then deletes those packs. Returns the amount of reclaimed bytes.
+        """
+        usage = self.getPackUsage()
+        if not usage:
+            return 0
+        newestPack = max(usage.keys())
+        candidates = set()
+        for packNumber, (size, referenced) in usage.items():
+            if referenced == 0 or (packNumber != newestPack and size > 0 and (size - referenced) / size >= self.compactionThreshold):
+                candidates.add(packNumber)
+        if not candidates:
+            return 0
+        with Timer() as timer:
+            moved = 0
+            movedBytes = 0
+            # the entries are moved to the newest pack, or to a new one if the newest is compacted too
+            self.packNumber = newestPack + 1 if newestPack in candidates else newestPack
+            entries = sorted(((relativePath, entry) for relativePath, entry in self.index.items() if entry.pack in candidates), key=lambda item: (item[1].pack, item[1].offset))
+            try:
+                currentPack = None
+                packFile = None
+                for relativePath, entry in entries:
+                    if entry.pack != currentPack:
+                        if packFile is not None:
+                            packFile.close()
+                        packFile = open(self.getPackPath(entry.pack), "rb")
+                        currentPack = entry.pack
+                    packFile.seek(entry.offset)
+                    pack, offset, length, hash = self.appendStream(packFile, entry.length)
+                    if length != entry.length:
+                        raise PackedMirrorError(f"pack {entry.pack} ends within the entry for '{relativePath}'")
+                    self.index[relativePath] = PackedEntry(pack, offset, length, entry.size, entry.mtime, entry.hash)
+                    moved += 1
+                    movedBytes += length
+                if packFile is not None:
+                    packFile.close()
+            finally:
+                self.closePack()
+            self.writeIndex(self.index)
+            reclaimed = 0
+            for packNumber in candidates:
+                reclaimed += usage[packNumber][0]
+                self.getPackPath(packNumber).unlink(missing_ok=True)
+            reclaimed -= movedBytes
+        log.info(f"Compacted {len(candidates)} packs of the packed mirror at '{self.destination}', moved {moved} entries ({FsTools.realToHumanFileSize(movedBytes)}) and reclaimed {FsTools.realToHumanFileSize(reclaimed)} in {timer.elapsedTime}")
+        return reclaimed
+
+    def unpack(self, destination: Path, verify=False, replace=False) -> SyncStats:
+        """
+        writes the content of the packed mirror as normal folder tree to the destination, restoring the modification times.
+        The priority paths are unpacked first, the ready event is set once they are in place.
+        If verify is True, the content is checked against the hashes in the index.
+        If replace is True, the destination is deleted first instead of being written into, so no stale files remain and files that are
+        hardlinks shared with other folders (like in deduplicated backups) are left alone.
+        """
+        stats = SyncStats()
+        destination = Path(destination)
+        with Timer() as timer:
+            index = self.readIndex()
+            if index is None:
+                raise PackedMirrorError(f"there is no packed mirror at '{self.destination}'")
+            stats.scanned = len(index)
+            if replace and destination.exists():
+                FsTools.quickDelete(destination)
+            destination.mkdir(parents=True, exist_ok=True)
+            for relativePath, entry in sorted(index.items()):
+                if entry.isDirectory():
+                    destination.joinpath(relativePath).mkdir(parents=True, exist_ok=True)
+            files = [relativePath for relativePath, entry in index.items() if not entry.isDirectory()]
+            if self.priorityPaths:
+                priorityFiles, files = self.splitByPriority(files)
+                self.unpackFiles(priorityFiles, index, destination, verify, stats)
+                stats.timeToReady = getElapsedTime(timer.start)
+                if self.readyEvent is not None:
+                    self.readyEvent.set()
+            self.unpackFiles(files, index, destination, verify, stats)
+        stats.elapsedTime = timer.elapsedTime
+        return stats
+
+    def unpackFiles(self, files: List[str], index: Dict[str, PackedEntry], destination: Path, verify: bool, stats: SyncStats):
+        """unpacks the files, every pack is read sequentially on its own thread"""
+        byPack = {}
+        for relativePath in files:
+            byPack.setdefault(index[relativePath].pack, []).append(relativePath)
+        if not byPack:
+            return
+        jobs = [(sorted(paths, key=lambda relativePath: index[relativePath].offset), index, destination, verify) for paths in byPack.values()]
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="EsmPackedMirror") as executor:
+            for copied, copiedBytes, failed in executor.map(lambda job: self.unpackPack(*job), jobs):
+                stats.copied += copied
+                stats.copiedBytes += copiedBytes
+                stats.failed += failed
+
+    def unpackPack(self, files: List[str], index: Dict[str, PackedEntry], destination: Path, verify: bool):
+        """unpacks the files of one pack, sorted by offset. Returns the amount of files and bytes written and failed files"""
+        copied = 0
+        copiedBytes = 0
+        failed = 0
+        packPath = self.getPackPath(index[files[0]].pack)
+        with open(packPath, "rb") as packFile:
+            for relativePath in files:
+                entry = index[relativePath]
+                path = destination.joinpath(relativePath)
+                try:
+                    packFile.seek(entry.offset)
+                    digest = hashlib.blake2b(digest_size=16) if verify else None
+                    remaining = entry.length
+                    with open(path, "wb") as file:
+                        while remaining > 0:
+                            chunk = packFile.read(min(self.CHUNKSIZE, remaining))
+                            if not chunk:
+                                raise PackedMirrorError(f"'{packPath}' ends within the entry for '{relativePath}'")
+                            if digest is not None:
+                                digest.update(chunk)
+                            file.write(chunk)
+                            remaining -= len(chunk)
+                    if digest is not None and digest.hexdigest() != entry.hash:
+                        raise PackedMirrorError(f"the content of '{relativePath}' does not match its hash")
+                    os.utime(path, ns=(entry.mtime, entry.mtime))
+                    copied += 1
+                    copiedBytes += entry.length
+                except (OSError, PackedMirrorError) as ex:
+                    log.error(f"could not unpack '{relativePath}' from '{packPath}': {ex}")
+                    failed += 1
+        return copied, copiedBytes, failed
+
+def createSyntheticTree(root: Path, folders: int, filesPerFolder: int, fileSize: int):
+    """creates a tree of folders with small random files, looking roughly like the playfields of a savegame"""
+    for folder in range(folders):
+        folderPath = root.joinpath(f"Playfields/Playfield{folder:05d}")
+        folderPath.mkdir(parents=True, exist_ok=True)
+        for file in range(filesPerFolder):
+            folderPath.joinpath(f"file{file:04d}.dat").write_bytes(os.urandom(fileSize))
+
+def changeSyntheticTree(root: Path, ratio: float):
+    """rewrites the given ratio of files of the synthetic tree, returns the amount of changed files"""
+    files = sorted(root.rglob("*.dat"))
+    changed = random.sample(files, max(1, int(len(files) * ratio)))
+    for path in changed:
+        path.write_bytes(os.urandom(path.stat().st_size))
+    return len(changed)
+
+def benchmarkMirrorFormats(workPath: Path, folders: int = 100, filesPerFolder: int = 100, fileSize: int = 4096, changeRatio: float = 0.01, threads: int = 8) -> List[Tuple[str, timedelta, timedelta]]:
+    """
+    compares the plain mirror (as written by the native sync engine) with the packed mirror on a synthetic tree below workPath,
+    which should be on the same drive as the real mirror. Returns a list of (step, time for the plain mirror, time for the packed mirror).
+    """
+    workPath = Path(workPath)
+    if workPath.exists():
+        raise PackedMirrorError(f"'{workPath}' already exists, please choose a folder that does not exist yet")
+    source = workPath.joinpath("source")
+    plainPath = workPath.joinpath("plain")
+    packedPath = workPath.joinpath("packed")
+    results = []
+    try:
+        log.info(f"Creating a synthetic tree of {folders * filesPerFolder} files with {FsTools.realToHumanFileSize(fileSize)} each at '{source}'")
+        createSyntheticTree(source, folders, filesPerFolder, fileSize)
+
+        def measure(step, plainFunction, packedFunction):
+            with Timer() as plainTimer:
+                plainFunction()
+            with Timer() as packedTimer:
+                packedFunction()
+            log.info(f"{step}: plain {plainTimer.elapsedTime}, packed {packedTimer.elapsedTime}")
+            results.append((step, plainTimer.elapsedTime, packedTimer.elapsedTime))
+
+        plain = lambda: EsmSyncEngine(source, plainPath, workPath.joinpath("plain.esm-sync-manifest"), threads=threads).synchronize()
+        packed = lambda: EsmPackedMirror(source, packedPath, threads=threads).synchronize()
+        measure("initial sync", plain, packed)
+        changed = changeSyntheticTree(source, changeRatio)
+        measure(f"sync of {changed} changed files", plain, packed)
+        measure("restore",
+                lambda: EsmSyncEngine(plainPath, workPath.joinpath("restoredplain"), workPath.joinpath("restoredplain.esm-sync-manifest"), threads=threads).synchronize(),
+                lambda: EsmPackedMirror(None, packedPath, threads=threads).unpack(workPath.joinpath("restoredpacked")))
+        measure("delete", lambda: shutil.rmtree(plainPath), lambda: shutil.rmtree(packedPath))
+    finally:
+        shutil.rmtree(workPath, ignore_errors=True)
+    return results
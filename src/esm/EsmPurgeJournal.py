@@ -0,0 +1,152 @@
+import logging
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import List
+
+log = logging.getLogger(__name__)
+
+class EsmPurgeJournal:
+    """
+    append-only journal for purge operations, so an interrupted purge can be finished without recomputing the plan.
+
+    the journal contains a line for every planned target and a completion mark for every target that has been deleted:
+
+        P<tab><native><tab><path>
+        D<tab><path>
+        C
+
+    lines are buffered and flushed (and synced to disk) in batches. A torn last line after a crash is just ignored,
+    the affected target will be checked again on resume.
+    """
+    PLANNED = "P"
+    DONE = "D"
+    COMPLETE = "C"
+
+    def __init__(self, journalPath: Path, batchSize: int=1000):
+        self.journalPath = Path(journalPath).absolute()
+        self.batchSize = batchSize
+        self.file = None
+        self.buffered = 0
+        self.planned = set()
+        self.done = set()
+        self.complete = False
+        self.replaceOnBegin = False
+        self.sessionStart = None
+        self.sessionDone = 0
+
+    def read(self):
+        """
+        reads the journal from disk, returns the list of (path, native) tuples that are planned but not yet done
+        """
+        self.planned = set()
+        self.done = set()
+        self.complete = False
+        plannedOrdered = []
+        if not self.journalPath.exists():
+            return plannedOrdered
+        with open(self.journalPath, "r", encoding="utf-8") as file:
+            for line in file:
+                if not line.endswith("\n"):
+                    log.debug(f"ignoring incomplete last line in journal '{self.journalPath}'")
+                    break
+                parts = line.rstrip("\n").split("\t", 2)
+                if parts[0] == self.PLANNED and len(parts) == 3:
+                    if parts[2] not in self.planned:
+                        self.planned.add(parts[2])
+                        plannedOrdered.append((Path(parts[2]), parts[1] == "1"))
+                elif parts[0] == self.DONE and len(parts) == 2:
+                    self.done.add(parts[1])
+                elif parts[0] == self.COMPLETE:
+                    self.complete = True
+        return [(path, native) for path, native in plannedOrdered if str(path) not in self.done]
+
+    def isUnfinished(self):
+        """
+        returns True if there is a journal on disk of a purge that did not complete
+        """
+        if not self.journalPath.exists():
+            return False
+        remaining = self.read()
+        return not self.complete and len(remaining) > 0
+
+    def reset(self):
+        """
+        forgets the current journal content, use this before starting a new purge.
+        the file on disk is only replaced once the new purge begins, so an aborted purge keeps the old journal.
+        """
+        self.close()
+        self.replaceOnBegin = True
+        self.planned = set()
+        self.done = set()
+        self.complete = False
+
+    def begin(self, entries: List[tuple]):
+        """
+        opens the journal for appending and writes all entries that are not planned yet. entries are (path, native) tuples.
+        """
+        if self.file is None:
+            self.file = open(self.journalPath, "w" if self.replaceOnBegin else "a", encoding="utf-8")
+            self.replaceOnBegin = False
+        for path, native in entries:
+            if str(path) not in self.planned:
+                self.planned.add(str(path))
+                self.file.write(f"{self.PLANNED}\t{1 if native else 0}\t{path}\n")
+        self.flush()
+        self.sessionStart = time.time()
+        self.sessionDone = 0
+        log.debug(f"purge journal '{self.journalPath}' contains {len(self.planned)} planned targets, {len(self.done)} already done")
+
+    def markDone(self, path: Path):
+        """
+        appends the completion mark for the path, flushing and reporting the progress every batchSize entries
+        """
+        self.file.write(f"{self.DONE}\t{path}\n")
+        self.done.add(str(path))
+        self.sessionDone += 1
+        self.buffered += 1
+        if self.buffered >= self.batchSize:
+            self.flush()
+            self.logProgress()
+
+    def finish(self):
+        """
+        marks the purge as complete and closes the journal. The journal is kept as a record of what has been deleted.
+        """
+        if self.file is not None:
+            self.file.write(f"{self.COMPLETE}\n")
+            self.complete = True
+        self.close()
+
+    def flush(self):
+        if self.file is None:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.buffered = 0
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def getProgress(self):
+        """
+        returns done, total, throughput in targets per second and the estimated time left as timedelta (or None if unknown)
+        """
+        total = len(self.planned)
+        done = len(self.done & self.planned)
+        throughput = 0
+        eta = None
+        if self.sessionStart is not None:
+            elapsed = time.time() - self.sessionStart
+            if elapsed > 0 and self.sessionDone > 0:
+                throughput = self.sessionDone / elapsed
+                eta = timedelta(seconds=round((total - done) / throughput))
+        return done, total, throughput, eta
+
+    def logProgress(self):
+        done, total, throughput, eta = self.getProgress()
+        log.info(f"Purged {done} of {total} targets, {throughput:.1f} targets/s, estimated time left: {eta}")
@@ -0,0 +1,205 @@
+import logging
+import os
+import shutil
+import subprocess
+import sys
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple
+import psutil
+from esm.ConfigModels import MainConfig
+from esm.EsmPackedMirror import createSyntheticTree
+from esm.exceptions import AdminRequiredException, RequirementsNotFulfilledError
+from esm.FsTools import FsTools
+from esm.Tools import Timer
+
+log = logging.getLogger(__name__)
+
+class RamdiskBackend:
+    """
+    mounts, unmounts and checks the ramdisk, so the ramdisk manager does not need to know how that works on the current platform.
+    The links from the savegame to the ramdisk are created by FsTools.createLink, which knows the platform too.
+    """
+    name = None
+
+    def mount(self, mountPoint: Path, size: str):
+        """mounts a ramdisk with the given size (gnu notation) at the mount point"""
+        raise NotImplementedError()
+
+    def unmount(self, mountPoint: Path):
+        """unmounts the ramdisk at the mount point, deleting all its content in the process"""
+        raise NotImplementedError()
+
+    def isMounted(self, mountPoint: Path, simpleCheck=False) -> bool:
+        """returns True if there is a ramdisk mounted at the mount point. A simple check may only check that the mount point exists"""
+        raise NotImplementedError()
+
+    def checkRequirements(self) -> str:
+        """raises a RequirementsNotFulfilledError if the backend can not work, returns what was found otherwise"""
+        raise NotImplementedError()
+
+class OsfMountBackend(RamdiskBackend):
+    """
+    ramdisk mounted as drive letter with osfmount, windows only. Requires admin privileges
+    """
+    name = "osfmount"
+
+    def __init__(self, osfMountPath: Path):
+        self.osfMountPath = osfMountPath
+
+    def checkRequirements(self) -> str:
+        """
+        returns the path to osfmount, making sure the target file exists. raises a exception if it doesn't, since we won't be able to continue without it.
+        """
+        if Path(self.osfMountPath).exists():
+            return f"'{self.osfMountPath}' found"
+        raise RequirementsNotFulfilledError(f"osfmount not found in the configured path at {self.osfMountPath}. Please make sure it is installed and the configuration points to it.")
+
+    def mount(self, mountPoint: Path, size: str):
+        self.checkRequirements()
+        cmd = [str(self.osfMountPath)]
+        #-a -t vm -m T -o format:ntfs:'Ramdisk',logical -s 2G
+        args = f"-a -t vm -m {mountPoint} -o format:ntfs:'Ramdisk',logical -s {size}"
+        cmd.extend(args.split(" "))
+        log.info(f"Executing {cmd}. This will require admin privileges")
+        process = subprocess.run(cmd, capture_output=True, shell=True)
+        if process.check_returncode():
+            log.info(f"Successfully mounted ramdisk as {mountPoint} with size {size}")
+
+    def unmount(self, mountPoint: Path):
+        self.checkRequirements()
+        cmd = [str(self.osfMountPath), "-d", "-m", str(mountPoint)]
+        log.info(f"Executing {cmd}. This could require admin privileges")
+        try:
+            process = subprocess.run(cmd, capture_output=True, shell=True, check=True)
+            if process.check_returncode():
+                log.info(f"Ramdisk {mountPoint} unmounted!")
+                return True
+        except subprocess.CalledProcessError:
+            log.debug(f"No osf mounted ramdrive found as {mountPoint} or some other error happened.")
+            raise AdminRequiredException(f"could not unmount ramdrive at {mountPoint}. Please check the logs")
+
+    def isMounted(self, mountPoint: Path, simpleCheck=False) -> bool:
+        if simpleCheck:
+            # just check if the drive is there, no way to check if its proper osf mounted ramdrive?
+            return Path(mountPoint).exists()
+        self.checkRequirements()
+        cmd = [str(self.osfMountPath), "-l", "-m", str(mountPoint)]
+        log.info(f"Executing {cmd}. This will require admin privileges")
+        try:
+            subprocess.run(cmd, capture_output=True, shell=True, check=True)
+            log.debug(f"There is an osf mounted ramdrive as {mountPoint}")
+            return True
+        except subprocess.CalledProcessError as ex:
+            log.debug(f"No osf mounted ramdrive found as '{mountPoint}'. Ex: {ex}")
+            return False
+
+class TmpfsBackend(RamdiskBackend):
+    """
+    ramdisk mounted as tmpfs on a directory, linux only. Mounting requires root privileges, unless the directory was mounted already
+    (e.g. by fstab), then esm just uses it and never unmounts it.
+    Tmpfs only uses as much memory as its content needs, the size is the upper limit.
+    """
+    name = "tmpfs"
+    FILESYSTEMTYPES = ["tmpfs", "ramfs"]
+
+    def __init__(self, hugePages: str = "never", premounted=False):
+        self.hugePages = hugePages
+        self.premounted = premounted
+
+    def checkRequirements(self) -> str:
+        if self.premounted:
+            return "using a premounted tmpfs"
+        mount = shutil.which("mount")
+        if mount is None:
+            raise RequirementsNotFulfilledError("the mount command was not found, can not mount a tmpfs.")
+        if os.geteuid() != 0:
+            log.warning("Mounting a tmpfs requires root privileges, consider mounting it via fstab and setting ramdisk.tmpfsPremounted")
+        return f"'{mount}' found"
+
+    def getMountOptions(self, size: str) -> str:
+        options = f"size={FsTools.humanToRealFileSize(size)},mode=0755"
+        if self.hugePages != "never":
+            options = f"{options},huge={self.hugePages}"
+        return options
+
+    def mount(self, mountPoint: Path, size: str):
+        mountPoint = Path(mountPoint)
+        if self.premounted:
+            if not self.isMounted(mountPoint):
+                raise RequirementsNotFulfilledError(f"ramdisk.tmpfsPremounted is set, but there is no tmpfs mounted at '{mountPoint}'. Please mount it first.")
+            log.info(f"Using the premounted tmpfs at '{mountPoint}'")
+            return
+        self.checkRequirements()
+        mountPoint.mkdir(parents=True, exist_ok=True)
+        cmd = ["mount", "-t", "tmpfs", "-o", self.getMountOptions(size), "tmpfs", str(mountPoint)]
+        log.info(f"Executing {cmd}. This will require root privileges")
+        try:
+            subprocess.run(cmd, capture_output=True, check=True)
+            log.info(f"Successfully mounted tmpfs at {mountPoint} with size {size}")
+        except subprocess.CalledProcessError as ex:
+            raise AdminRequiredException(f"could not mount tmpfs at {mountPoint}: {ex.stderr}")
+
+    def unmount(self, mountPoint: Path):
+        if self.premounted:
+            log.info(f"The tmpfs at '{mountPoint}' was mounted by someone else, will not unmount it")
+            return False
+        cmd = ["umount", str(mountPoint)]
+        log.info(f"Executing {cmd}. This could require root privileges")
+        try:
+            subprocess.run(cmd, capture_output=True, check=True)
+            log.info(f"Tmpfs {mountPoint} unmounted!")
+            return True
+        except subprocess.CalledProcessError as ex:
+            raise AdminRequiredException(f"could not unmount tmpfs at {mountPoint}: {ex.stderr}")
+
+    def isMounted(self, mountPoint: Path, simpleCheck=False) -> bool:
+        # an existing directory tells nothing here, but looking at the mounts is cheap anyway
+        mountPoint = os.path.realpath(mountPoint)
+        for partition in psutil.disk_partitions(all=True):
+            if partition.mountpoint == mountPoint and partition.fstype in self.FILESYSTEMTYPES:
+                return True
+        return False
+
+def createRamdiskBackend(config: MainConfig) -> RamdiskBackend:
+    """
+    returns the configured ramdisk backend, 'auto' picks osfmount on windows and tmpfs everywhere else
+    """
+    backend = config.ramdisk.backend
+    if backend == "auto":
+        backend = "osfmount" if sys.platform == "win32" else "tmpfs"
+    if backend == "osfmount":
+        return OsfMountBackend(config.paths.osfmount)
+    return TmpfsBackend(hugePages=config.ramdisk.tmpfsHugePages, premounted=config.ramdisk.tmpfsPremounted)
+
+def benchmarkSavegameStorage(locations: Dict[str, Path], folders: int = 100, filesPerFolder: int = 100, fileSize: int = 4096) -> List[Tuple[str, Dict[str, timedelta]]]:
+    """
+    compares the given locations (e.g. a folder on the ramdisk and one on the disk with the savegame) by creating, scanning, reading and
+    deleting a synthetic tree in each. The folders must not exist yet and are deleted afterwards.
+    Returns a list of (step, time per location name).
+    """
+    for path in locations.values():
+        if Path(path).exists():
+            raise RequirementsNotFulfilledError(f"'{path}' already exists, please choose a folder that does not exist yet")
+    steps = ["create", "scan", "read", "delete"]
+    results = {step: {} for step in steps}
+    for name, path in locations.items():
+        path = Path(path)
+        try:
+            with Timer() as timer:
+                createSyntheticTree(path, folders, filesPerFolder, fileSize)
+            results["create"][name] = timer.elapsedTime
+            with Timer() as timer:
+                files = [entry for entry in path.rglob("*") if entry.is_file()]
+            results["scan"][name] = timer.elapsedTime
+            with Timer() as timer:
+                for file in files:
+                    file.read_bytes()
+            results["read"][name] = timer.elapsedTime
+            with Timer() as timer:
+                shutil.rmtree(path)
+            results["delete"][name] = timer.elapsedTime
+            log.info(f"{name}: {', '.join(f'{step} {results[step][name]}' for step in steps)}")
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+    return [(step, results[step]) for step in steps]
@@ -1,14 +1,23 @@
 from functools import cached_property
 import logging
-import subprocess
-import time
+import random
+import sqlite3
 from pathlib import Path
 from threading import Event, Thread
+from typing import List
 from esm.ConfigModels import MainConfig
+from esm.EsmChangeTracker import ChangeSet, ChangeTracker, createChangeTracker
 from esm.EsmCommunicationService import EsmCommunicationService
-from esm.exceptions import AdminRequiredException, NoSaveGameFoundException, NoSaveGameMirrorFoundException, RequirementsNotFulfilledError, NoSaveGameMirrorFoundException, SaveGameFoundException
+from esm.exceptions import AdminRequiredException, DatabaseCaptureError, NoSaveGameFoundException, PackedMirrorError, NoSaveGameMirrorFoundException, NoSaveGameMirrorFoundException, SaveGameFoundException
 from esm.EsmConfigService import EsmConfigService
+from esm.EsmDatabaseWrapper import EsmDatabaseWrapper
 from esm.EsmFileSystem import EsmFileSystem
+from esm.EsmIoCoordinator import EsmIoCoordinator, IoPriority
+from esm.EsmPackedMirror import EsmPackedMirror
+from esm.EsmRamdiskBackend import RamdiskBackend, createRamdiskBackend
+from esm.EsmSyncEngine import EsmSyncEngine, SyncStats
+from esm.EsmSyncScheduler import NextSync, SyncScheduler
+from esm.EsmTieringService import EsmTieringService
 from esm.FsTools import FsTools
 from esm.ServiceRegistry import Service, ServiceRegistry
 from esm.Tools import Timer
@@ -29,6 +38,8 @@ class EsmRamdiskManager:
 
         self.synchronizerShutdownEvent = None
         self.synchronizerThread = None
+        self.changeTracker: ChangeTracker = None
+        self.syncScheduler: SyncScheduler = None
 
     @cached_property
     def config(self) -> MainConfig:
@@ -42,6 +53,18 @@ class EsmRamdiskManager:
     def communication(self) -> EsmCommunicationService:
         return ServiceRegistry.get(EsmCommunicationService)
 
+    @cached_property
+    def tieringService(self) -> EsmTieringService:
+        return ServiceRegistry.get(EsmTieringService)
+
+    @cached_property
+    def ioCoordinator(self) -> EsmIoCoordinator:
+        return ServiceRegistry.get(EsmIoCoordinator)
+
+    @cached_property
+    def backend(self) -> RamdiskBackend:
+        return createRamdiskBackend(self.config)
+
     def prepare(self):
         """
         Actually takes a non-ramdisk filestructure and converts it into a ramdisk filestructure
@@ -68,6 +91,12 @@ class EsmRamdiskManager:
             log.error(f"Savegame mirror does exist already at '{mirrorFolderPath}'. Either the configuration is wrong or this has been installed already, or the folder needs to be deleted.")
             raise NoSaveGameMirrorFoundException(f"savegame mirror at '{mirrorFolderPath}' already exists.")
 
+        # a manifest or packed mirror of an earlier installation would describe a different state
+        self.deleteSyncManifests()
+        if self.existsPackedMirror():
+            self.fileSystem.markForDelete(self.getPackedMirror().destination)
+            self.fileSystem.commitDelete()
+
         # move the savegame to the hddmirror folder
         self.fileSystem.moveFileTree("saves.games.savegame", "saves.gamesmirror.savegamemirror", 
                             f"Moving savegame to new location, this may take some time if your savegame is large already!")
@@ -80,8 +109,8 @@ class EsmRamdiskManager:
         # check and mount the ramdisk
         log.debug("check and mount ramdisk")
         ramdiskDrive = Path(self.config.ramdisk.drive)
-        ramdiskSize = Path(self.config.ramdisk.size)
-        if ramdiskDrive.exists(): 
+        ramdiskSize = self.config.ramdisk.size
+        if self.checkRamdrive(simpleCheck=True):
             log.info(f"{ramdiskDrive} already exists as a drive, assuming this is our ramdrive. If its not, please use another drive letter in the configuration.")
         else:
             log.info(f"{ramdiskDrive} does not exist")
@@ -108,9 +137,20 @@ class EsmRamdiskManager:
         mirrorExists, mirrorPath = self.existsMirror()
         if not mirrorExists:
             raise NoSaveGameMirrorFoundException(f"{mirrorPath} does not exist! Is the configuration correct? Did you call the install action before calling the setup?")
+
+        # link the cold playfields first, so the sync updates them on the hdd instead of copying them to the ramdisk
+        if self.config.ramdisk.tiering:
+            self.tieringService.relinkColdPlayfields()
+        elif self.tieringService.getColdTierPath().exists():
+            log.warning(f"Tiering is disabled, but there is a cold tier at '{self.tieringService.getColdTierPath()}'. All playfields will be copied to the ramdisk, the cold tier is outdated and can be deleted.")
+
         log.info("Syncing mirror to ram")
         with Timer() as timer:
-            self.syncMirrorToRam()
+            if self.config.ramdisk.prioritizedRestore:
+                stats = self.restoreMirrorToRam()
+                log.info(f"Database and hot playfields were in place after {stats.timeToReady}, restored {FsTools.realToHumanFileSize(stats.copiedBytes)} at {FsTools.realToHumanFileSize(stats.getThroughput())}/s")
+            else:
+                self.syncMirrorToRam()
         log.info(f"Syncing mirror to ram took {timer.elapsedTime}.")
         log.info("Setup completed, you may now start the server")
 
@@ -148,65 +188,240 @@ class EsmRamdiskManager:
 
     def mountRamdrive(self, driveLetter, driveSize):
         """
-        mounts a ramdrive as driveLetter with driveSize with osfmount, will call a subprocess for this
-        requires osfmount to be available at the path and admin privileges
+        mounts a ramdrive as driveLetter (or on the directory, for tmpfs) with driveSize with the configured backend
+        requires admin privileges
         """
-        osfMount = self.checkAndGetOsfMountPath()
-        cmd = [osfMount]
-        #-a -t vm -m T -o format:ntfs:'Ramdisk',logical -s 2G
-        args = f"-a -t vm -m {driveLetter} -o format:ntfs:'Ramdisk',logical -s {driveSize}"
-        cmd.extend(args.split(" "))
-        log.info(f"Executing {cmd}. This will require admin privileges")
-        process = subprocess.run(cmd, capture_output=True, shell=True)
-        if process.check_returncode():
-            log.info(f"Successfully mounted ramdisk as {driveLetter} with size {driveSize}")
+        self.backend.mount(driveLetter, driveSize)
 
     def checkRamdrive(self, ramdiskDriveLetter=None, simpleCheck=False):
         """
-        returns True if there is a drive mounted as 'driveLetter' and it is a osfmount ramdrive, by calling osfmount (requires admin privileges)
-        if simpleCheck==True, will only check if the driveletter exists.
+        returns True if there is a ramdrive mounted as 'driveLetter', by asking the backend (osfmount requires admin privileges for this)
+        if simpleCheck==True, osfmount will only check if the driveletter exists.
         """
         driveLetter = ramdiskDriveLetter
         if ramdiskDriveLetter == None:
             driveLetter = self.config.ramdisk.drive
+        return self.backend.isMounted(driveLetter, simpleCheck=simpleCheck)
 
-        if simpleCheck: 
-            # just check if the drive is there, no way to check if its proper osf mounted ramdrive?
-            return Path(driveLetter).exists()
-
-        osfMount = self.checkAndGetOsfMountPath()
-        cmd = [osfMount, "-l", "-m", driveLetter]
-        log.info(f"Executing {cmd}. This will require admin privileges")
-        try:
-            subprocess.run(cmd, capture_output=True, shell=True, check=True)
-            log.debug(f"There is an osf mounted ramdrive as {driveLetter}")
-            return True
-        except subprocess.CalledProcessError as ex:
-            log.debug(f"No osf mounted ramdrive found as '{driveLetter}'. Ex: {ex}")
-            return False
-        
-    def checkAndGetOsfMountPath(self):
+    def checkBackendRequirements(self) -> str:
         """
-        returns the path to osfmount, making sure the target file exists. raises a exception if it doesn't, since we won't be able to continue without it.
+        makes sure the ramdisk backend can work, returns what was found. Raises a RequirementsNotFulfilledError if it can't
         """
-        osfMount = self.config.paths.osfmount
-        if Path(osfMount).exists(): 
-            return osfMount
-        raise RequirementsNotFulfilledError(f"osfmount not found in the configured path at {osfMount}. Please make sure it is installed and the configuration points to it.")
+        return self.backend.checkRequirements()
 
-    def syncMirrorToRam(self):
+    def syncMirrorToRam(self, synchronizer=None):
         """
-        syncs the mirror to ram once
+        syncs the mirror to ram once, returns the sync stats when using the native synchronizer or a packed mirror
         """
+        if self.existsPackedMirror():
+            return self.unpackMirrorToRam()
+        if (synchronizer or self.config.ramdisk.synchronizer) == "native":
+            # the manifest lives on the ramdisk, so it vanishes together with the ramdisk content
+            return self.syncNative(
+                source=self.fileSystem.getAbsolutePathTo("saves.gamesmirror.savegamemirror"),
+                destination=self.fileSystem.getAbsolutePathTo("saves.games.savegame"),
+                manifestPath=self.getSyncManifestPath("ramdisk.savegame", prefixInstallDir=False)
+                )
         # the target should be the hardlink to ramdisk at this point, so we'll use the link as target
         self.fileSystem.copyFileTree("saves.gamesmirror.savegamemirror", "saves.games.savegame")
 
-    def syncRamToMirror(self):
+    def restoreMirrorToRam(self, readyEvent: Event=None) -> SyncStats:
+        """
+        restores the mirror to the ram with the native synchronizer on multiple threads, copying the database and the most recently visited
+        playfields first. The ready event is set once those are in place, while the rest is still being copied.
         """
-        syncs the ram to mirror once
+        if self.existsPackedMirror():
+            return self.unpackMirrorToRam(priorityPaths=self.getRestorePriorityPaths(), readyEvent=readyEvent)
+        return self.syncNative(
+            source=self.fileSystem.getAbsolutePathTo("saves.gamesmirror.savegamemirror"),
+            destination=self.fileSystem.getAbsolutePathTo("saves.games.savegame"),
+            manifestPath=self.getSyncManifestPath("ramdisk.savegame", prefixInstallDir=False),
+            priorityPaths=self.getRestorePriorityPaths(),
+            readyEvent=readyEvent
+            )
+
+    def getRestorePriorityPaths(self) -> List[str]:
         """
-        # the source should be the hardlink to ramdisk at this point, so we'll use the link as target
-        self.fileSystem.copyFileTree("saves.games.savegame", "saves.gamesmirror.savegamemirror")
+        returns the relative paths in the savegame to restore first: the database and the most recently visited playfields, as told by the database in the mirror
+        """
+        priorityPaths = [self.config.filenames.globaldb]
+        mirrorDbPath = self.fileSystem.getAbsolutePathTo("saves.gamesmirror.savegamemirror.globaldb")
+        if not mirrorDbPath.exists():
+            return priorityPaths
+        database = EsmDatabaseWrapper(mirrorDbPath)
+        try:
+            lastVisits = database.retrievePFsLastVisit()
+        except sqlite3.Error as ex:
+            log.warning(f"Could not read the last visits of the playfields from '{mirrorDbPath}', only the database will be restored first: {ex}")
+            return priorityPaths
+        finally:
+            database.closeDbConnection()
+        hotPlayfields = sorted(lastVisits.keys(), key=lambda name: lastVisits[name], reverse=True)[:self.config.ramdisk.restoreHotPlayfields]
+        log.debug(f"restoring the {len(hotPlayfields)} most recently visited playfields first")
+        priorityPaths.extend(f"{self.config.foldernames.playfields}/{name}" for name in hotPlayfields)
+        return priorityPaths
+
+    def syncRamToMirror(self, synchronizer=None, fullScan=False, changes: ChangeSet=None, throttled=True):
+        """
+        syncs the ram to mirror once, returns the sync stats when using the native synchronizer.
+        the native synchronizer only scans the changed folders if changes are given, and sticks to the configured budget if throttled is True.
+        """
+        with self.ioCoordinator.lease("ram to mirror sync", IoPriority.SYNC):
+            if self.config.ramdisk.mirrorFormat == "packed":
+                return self.syncRamToPackedMirror(fullScan=fullScan, changes=changes, throttled=throttled)
+            if (synchronizer or self.config.ramdisk.synchronizer) == "native":
+                return self.syncNative(
+                    source=self.fileSystem.getAbsolutePathTo("saves.games.savegame"),
+                    destination=self.fileSystem.getAbsolutePathTo("saves.gamesmirror.savegamemirror"),
+                    manifestPath=self.getSyncManifestPath("saves.gamesmirror.savegamemirror"),
+                    fullScan=fullScan,
+                    changes=changes,
+                    throttled=throttled,
+                    captureDatabase=self.config.ramdisk.captureDatabase
+                    )
+            # the source should be the hardlink to ramdisk at this point, so we'll use the link as target
+            self.fileSystem.copyFileTree("saves.games.savegame", "saves.gamesmirror.savegamemirror")
+            if self.config.ramdisk.captureDatabase and not self.config.general.debugMode:
+                # robocopy just copied whatever state the database file was in, replace it with a consistent one
+                self.captureDatabase()
+
+    def captureDatabase(self):
+        """
+        replaces the database in the mirror with a consistent capture of the database in the savegame
+        """
+        database = EsmDatabaseWrapper(self.fileSystem.getAbsolutePathTo("saves.games.savegame.globaldb"))
+        quickCheck = random.random() < self.config.ramdisk.captureDatabaseQuickCheckProbability
+        try:
+            pages, elapsedTime = database.captureTo(self.fileSystem.getAbsolutePathTo("saves.gamesmirror.savegamemirror.globaldb"),
+                                                    pagesPerStep=self.config.ramdisk.captureDatabasePagesPerStep, quickCheck=quickCheck)
+            log.info(f"Captured {pages} database pages in {elapsedTime}{' (quick check passed)' if quickCheck else ''}")
+        except (DatabaseCaptureError, sqlite3.Error, OSError) as ex:
+            # the mirror still has the copy robocopy made, the next sync will try again
+            log.warning(f"Could not capture the database, the mirror keeps the plain copy: {ex}")
+        finally:
+            database.closeDbConnection()
+
+    def syncNative(self, source: Path, destination: Path, manifestPath: Path, fullScan=False, changes: ChangeSet=None, throttled=False, captureDatabase=False,
+                   priorityPaths: List[str]=None, readyEvent: Event=None) -> SyncStats:
+        """
+        syncs source to destination with the native synchronizer, which only needs to scan the source.
+        if throttled is True, the configured budget and priority are applied.
+        if captureDatabase is True, the database is captured with the sqlite backup api instead of being copied.
+        if priorityPaths are given, they are copied first and the readyEvent is set once they are in place.
+        """
+        if self.config.general.debugMode:
+            log.debug(f"debugmode: native sync {source} {destination}")
+            return SyncStats()
+        bytesPerSecond = 0
+        filesPerSecond = 0
+        lowPriority = False
+        if throttled:
+            if self.config.ramdisk.synchronizerBandwidth:
+                bytesPerSecond = FsTools.humanToRealFileSize(self.config.ramdisk.synchronizerBandwidth)
+            filesPerSecond = self.config.ramdisk.synchronizerFilesPerSecond
+            lowPriority = self.config.ramdisk.synchronizerLowPriority
+        databaseFiles = [self.config.filenames.globaldb] if captureDatabase else None
+        engine = EsmSyncEngine(source=source, destination=destination, manifestPath=manifestPath, threads=self.config.ramdisk.synchronizerThreads,
+                               bytesPerSecond=bytesPerSecond, filesPerSecond=filesPerSecond, lowPriority=lowPriority,
+                               databaseFiles=databaseFiles, databasePagesPerStep=self.config.ramdisk.captureDatabasePagesPerStep,
+                               databaseQuickCheckProbability=self.config.ramdisk.captureDatabaseQuickCheckProbability,
+                               priorityPaths=priorityPaths, readyEvent=readyEvent)
+        stats = engine.synchronize(fullScan=fullScan, changes=changes)
+        log.info(f"Synchronized '{source}' -> '{destination}': {stats}")
+        return stats
+
+    def getPackedMirror(self, source: Path=None, throttled=False, captureDatabase=False, priorityPaths: List[str]=None, readyEvent: Event=None) -> EsmPackedMirror:
+        """
+        returns the packed mirror of the savegame, packing from source if given.
+        if throttled is True, the configured budget and priority of the native synchronizer are applied.
+        """
+        bytesPerSecond = 0
+        filesPerSecond = 0
+        lowPriority = False
+        if throttled:
+            if self.config.ramdisk.synchronizerBandwidth:
+                bytesPerSecond = FsTools.humanToRealFileSize(self.config.ramdisk.synchronizerBandwidth)
+            filesPerSecond = self.config.ramdisk.synchronizerFilesPerSecond
+            lowPriority = self.config.ramdisk.synchronizerLowPriority
+        databaseFiles = [self.config.filenames.globaldb] if captureDatabase else None
+        return EsmPackedMirror(source=source, packedPath=self.fileSystem.getAbsolutePathTo("saves.gamesmirror.savegamepacked"),
+                               packSize=FsTools.humanToRealFileSize(self.config.ramdisk.packedMirrorPackSize),
+                               compactionThreshold=self.config.ramdisk.packedMirrorCompactionThreshold, threads=self.config.ramdisk.synchronizerThreads,
+                               bytesPerSecond=bytesPerSecond, filesPerSecond=filesPerSecond, lowPriority=lowPriority,
+                               databaseFiles=databaseFiles, databasePagesPerStep=self.config.ramdisk.captureDatabasePagesPerStep,
+                               databaseQuickCheckProbability=self.config.ramdisk.captureDatabaseQuickCheckProbability,
+                               priorityPaths=priorityPaths, readyEvent=readyEvent)
+
+    def existsPackedMirror(self):
+        """returns True if there is a packed mirror of the savegame"""
+        return self.getPackedMirror().exists()
+
+    def syncRamToPackedMirror(self, fullScan=False, changes: ChangeSet=None, throttled=True) -> SyncStats:
+        """
+        packs the changes of the savegame on the ramdisk into the packed mirror
+        """
+        source = self.fileSystem.getAbsolutePathTo("saves.games.savegame")
+        if self.config.general.debugMode:
+            log.debug(f"debugmode: packing {source}")
+            return SyncStats()
+        packedMirror = self.getPackedMirror(source=source, throttled=throttled, captureDatabase=self.config.ramdisk.captureDatabase)
+        stats = packedMirror.synchronize(fullScan=fullScan, changes=changes)
+        log.info(f"Packed '{source}' -> '{packedMirror.destination}': {stats}")
+        return stats
+
+    def unpackMirrorToRam(self, priorityPaths: List[str]=None, readyEvent: Event=None) -> SyncStats:
+        """
+        unpacks the packed mirror to the savegame on the ramdisk, the priority paths first
+        """
+        destination = self.fileSystem.getAbsolutePathTo("saves.games.savegame")
+        if self.config.general.debugMode:
+            log.debug(f"debugmode: unpacking to {destination}")
+            return SyncStats()
+        packedMirror = self.getPackedMirror(priorityPaths=priorityPaths, readyEvent=readyEvent)
+        stats = packedMirror.unpack(destination)
+        # the manifest of the ramdisk does not describe what was unpacked
+        manifestPath = self.getSyncManifestPath("ramdisk.savegame", prefixInstallDir=False)
+        if manifestPath.exists():
+            manifestPath.unlink()
+        log.info(f"Unpacked '{packedMirror.destination}' -> '{destination}': {stats}")
+        return stats
+
+    def unpackMirrorInPlace(self):
+        """
+        replaces the plain mirror with the content of the packed mirror, which is newer, and deletes the packed mirror
+        """
+        mirrorPath = self.fileSystem.getAbsolutePathTo("saves.gamesmirror.savegamemirror")
+        unpackedPath = mirrorPath.with_name(f"{mirrorPath.name}.unpacking")
+        packedMirror = self.getPackedMirror()
+        log.info(f"Unpacking the packed mirror at '{packedMirror.destination}' to '{mirrorPath}', this may take some time if your savegame is large!")
+        if unpackedPath.exists():
+            self.fileSystem.markForDelete(unpackedPath)
+            self.fileSystem.commitDelete()
+        stats = packedMirror.unpack(unpackedPath, verify=True)
+        if stats.failed > 0:
+            raise PackedMirrorError(f"{stats.failed} files could not be unpacked from '{packedMirror.destination}', leaving the mirror as it is")
+        self.fileSystem.markForDelete(mirrorPath)
+        self.fileSystem.commitDelete()
+        unpackedPath.rename(mirrorPath)
+        self.fileSystem.markForDelete(packedMirror.destination)
+        self.fileSystem.commitDelete()
+        log.info(f"Unpacked the packed mirror: {stats}")
+
+    def getSyncManifestPath(self, destinationDotPath, prefixInstallDir=True) -> Path:
+        """
+        returns the path of the native synchronizers manifest for the given destination, which is a file next to it
+        """
+        destination = self.fileSystem.getAbsolutePathTo(destinationDotPath, prefixInstallDir=prefixInstallDir)
+        return destination.with_name(f"{destination.name}.esm-sync-manifest")
+
+    def deleteSyncManifests(self):
+        """
+        deletes the manifests of the native synchronizer, use this whenever the savegame or mirror was changed by something else
+        """
+        for manifestPath in [self.getSyncManifestPath("saves.gamesmirror.savegamemirror"), self.getSyncManifestPath("ramdisk.savegame", prefixInstallDir=False)]:
+            if manifestPath.exists():
+                log.debug(f"Deleting sync manifest at '{manifestPath}'")
+                manifestPath.unlink()
 
     def uninstall(self, force=False):
         """
@@ -238,7 +453,7 @@ class EsmRamdiskManager:
 
         # check and unmount ramdrive, if its there
         ramdiskDriveLetter = self.config.ramdisk.drive
-        if Path(ramdiskDriveLetter).exists():
+        if self.checkRamdrive(simpleCheck=True):
             log.info(f"Unmounting ramdisk at {ramdiskDriveLetter}.")
             try:
                 self.unmountRamdisk(driveLetter=ramdiskDriveLetter)
@@ -248,6 +463,11 @@ class EsmRamdiskManager:
         isLink = FsTools.isHardLink(savegameFolderPath)
         if isLink:
             FsTools.deleteLink(savegameFolderPath)
+        self.deleteSyncManifests()
+
+        # the packed mirror is more recent than the plain one
+        if self.existsPackedMirror():
+            self.unpackMirrorInPlace()
 
         # move the mirror to the savegame folder
         self.fileSystem.moveFileTree("saves.gamesmirror.savegamemirror", "saves.games.savegame", 
@@ -268,28 +488,78 @@ class EsmRamdiskManager:
         if syncInterval==0:
             log.debug(f"synchronizer is disabled, syncInterval was {syncInterval}")
             return False
+        self.changeTracker = self.createChangeTracker()
+        if self.changeTracker is not None:
+            self.changeTracker.start()
+        self.syncScheduler = self.createSyncScheduler(syncInterval)
         self.synchronizerShutdownEvent = Event()
         self.synchronizerThread = Thread(target=self.syncTask, args=(self.synchronizerShutdownEvent, syncInterval), daemon=True)
         self.synchronizerThread.start()
-        log.debug(f"ram to mirror synchronizer started with an interval of {syncInterval}")
-    
+        log.debug(f"ram to mirror synchronizer started with a maximum staleness of {syncInterval}")
+
+    def createSyncScheduler(self, syncInterval) -> SyncScheduler:
+        """
+        returns the scheduler that decides when to sync, syncing at least every syncInterval seconds
+        """
+        countChanges = self.changeTracker.countChanges if self.changeTracker is not None else None
+        return SyncScheduler.fromConfig(self.config.ramdisk, maxStaleness=syncInterval, logsPath=self.config.paths.install.joinpath("Logs"),
+                                        countChanges=countChanges, getRunningJobs=self.ioCoordinator.getActiveLeaseNames)
+
+    def getNextSync(self) -> NextSync:
+        """
+        returns when the next sync is due and why, or None if the synchronizer is not running
+        """
+        if self.syncScheduler is None:
+            return None
+        return self.syncScheduler.getNextSync()
+
+    def createChangeTracker(self) -> ChangeTracker:
+        """
+        returns the configured change tracker for the savegame on the ramdisk, or None if the synchronizer can't make use of one
+        """
+        if self.config.ramdisk.synchronizer != "native" and self.config.ramdisk.mirrorFormat != "packed":
+            return None
+        return createChangeTracker(self.config.ramdisk.changeTracker, self.fileSystem.getAbsolutePathTo("saves.games.savegame"))
+
+    def takeChanges(self, syncCount) -> ChangeSet:
+        """
+        returns the changes recorded by the change tracker, or None if the whole savegame needs to be scanned.
+        """
+        if self.changeTracker is None:
+            return None
+        changes = self.changeTracker.takeChanges()
+        fullScanInterval = self.config.ramdisk.changeTrackerFullScanInterval
+        if fullScanInterval > 0 and syncCount % fullScanInterval == 0:
+            log.debug(f"sync {syncCount} is a full scan, in case the change tracker missed something")
+            return None
+        return changes
+
     def syncTask(self, event: Event, syncInterval):
-        timePassed = 0
-        while True:
-            time.sleep(1)
-            timePassed = timePassed + 1
-            if timePassed % syncInterval == 0:
-                announceSync = self.communication.shallAnnounceSync()
-                if announceSync:
-                    self.communication.announceSyncStart()
-                log.info(f"Synchronizing from ram to mirror")
+        syncCount = 0
+        while not event.wait(1):
+            reason = self.syncScheduler.poll()
+            if reason is None:
+                continue
+            announceSync = self.communication.shallAnnounceSync()
+            if announceSync:
+                self.communication.announceSyncStart()
+            log.info(f"Synchronizing from ram to mirror due to {reason.value}")
+            syncCount += 1
+            changes = self.takeChanges(syncCount)
+            try:
                 with Timer() as timer:
-                    self.syncRamToMirror()
-                log.info(f"Sync done, will wait for {syncInterval} seconds. Time needed {timer.elapsedTime}")
-                if announceSync:
-                    self.communication.announceSyncEnd()
-            if event.is_set():
-                break
+                    try:
+                        self.syncRamToMirror(changes=changes)
+                    finally:
+                        self.syncScheduler.syncDone()
+                log.info(f"Sync done, time needed {timer.elapsedTime}, {self.syncScheduler.getNextSync()}")
+            except Exception as ex:
+                log.error(f"error while synchronizing from ram to mirror, will try again with the next sync ({self.syncScheduler.getNextSync()}): {ex}")
+                # the taken changes are lost now, so the next sync has to scan everything
+                if self.changeTracker is not None:
+                    self.changeTracker.markOverflow()
+            if announceSync:
+                self.communication.announceSyncEnd()
         log.debug("synchronizer shut down")
 
     def stopSynchronizer(self):
@@ -302,23 +572,17 @@ class EsmRamdiskManager:
         # wait for the thread to join the main thread
         log.debug("waiting for synchronizer thread to finish")
         self.synchronizerThread.join()
+        if self.changeTracker is not None:
+            self.changeTracker.stop()
+            self.changeTracker = None
+        self.syncScheduler = None
         log.debug(f"ram to mirror synchronizer stopped")
 
     def unmountRamdisk(self, driveLetter):
         """
         dismount ramdisk, deleting all its content in the process.
         """
-        osfMount = self.checkAndGetOsfMountPath()
-        cmd = [osfMount, "-d", "-m", driveLetter]
-        log.info(f"Executing {cmd}. This could require admin privileges")
-        try:
-            process = subprocess.run(cmd, capture_output=True, shell=True, check=True)
-            if process.check_returncode():
-                log.info(f"Ramdisk {driveLetter} unmounted!")
-                return True
-        except subprocess.CalledProcessError:
-            log.debug(f"No osf mounted ramdrive found as {driveLetter} or some other error happened.")
-            raise AdminRequiredException(f"could not unmount ramdrive at {driveLetter}. Please check the logs")
+        return self.backend.unmount(driveLetter)
 
     def existsSavegame(self, checkGlobalDb=True):
         """
@@ -0,0 +1,173 @@
+import logging
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Tuple
+from esm.EsmSyncEngine import EsmSyncEngine, SyncStats
+from esm.FsTools import FsTools
+
+log = logging.getLogger(__name__)
+
+class ReplicationStats(SyncStats):
+    """
+    statistics of a single replication, the bytes transferred differ from the copied bytes when transfers were resumed
+    """
+    def __init__(self):
+        super().__init__()
+        self.resumed = 0
+        self.transferredBytes = 0
+        self.lock = Lock()
+
+    def addTransferred(self, amount: int):
+        with self.lock:
+            self.transferredBytes += amount
+
+    def getThroughput(self):
+        """returns the transferred bytes per second"""
+        seconds = self.elapsedTime.total_seconds()
+        return self.transferredBytes / seconds if seconds > 0 else 0
+
+    def __str__(self):
+        return f"{super().__str__()}, resumed {self.resumed} interrupted files, transferred {FsTools.realToHumanFileSize(self.transferredBytes)}"
+
+class EsmReplicator(EsmSyncEngine):
+    """
+    replicates a rolling backup to a secondary target, like another disk or a mounted network share, keeping the target a mirror of
+    the latest backup. Like the sync engine, only files that changed since the last replication (by size and modification time) are
+    transferred. The manifest belongs to the target only, since every replication comes from a different rolling backup folder.
+
+    Files are transferred in chunks into a partial file next to their destination, within the budget of bytes per second. A checkpoint
+    with the progress of every unfinished file is written every CHECKPOINTINTERVAL bytes, after the partial file has been flushed to disk.
+    If the replication is interrupted, the next one continues these files where the checkpoint says, as long as the source file
+    did not change in the meantime. Finished files are renamed into place, so the target never has half written files under their name.
+    """
+    PARTIALSUFFIX = ".esm-partial"
+    CHECKPOINTHEADER = "#esm-replication-checkpoint"
+    CHECKPOINTVERSION = "1"
+    CHECKPOINTINTERVAL = 16 * 1024 * 1024
+
+    def __init__(self, source: Path, destination: Path, manifestPath: Path, checkpointPath: Path, threads: int = 2, bytesPerSecond: int = 0):
+        super().__init__(source=source, destination=destination, manifestPath=manifestPath, threads=threads, bytesPerSecond=bytesPerSecond)
+        self.checkpointPath = Path(checkpointPath)
+        self.checkpoint: Dict[str, Tuple[int, int, int]] = {}
+        """relative path -> (size, mtime in ns of the source, bytes in the partial file that are on disk)"""
+        self.checkpointLock = Lock()
+        self.stats = None
+
+    def createStats(self) -> SyncStats:
+        self.stats = ReplicationStats()
+        return self.stats
+
+    def getManifestKey(self) -> List[str]:
+        return [str(self.destination)]
+
+    def synchronize(self, fullScan=False, changes=None) -> ReplicationStats:
+        self.checkpoint = self.readCheckpoint()
+        if self.checkpoint:
+            log.info(f"resuming {len(self.checkpoint)} interrupted transfers to '{self.destination}'")
+        stats = super().synchronize(fullScan=fullScan, changes=changes)
+        # partial files of source files that vanished since the interruption are not needed anymore
+        for relativePath in list(self.checkpoint.keys()):
+            if not self.source.joinpath(relativePath).is_file():
+                self.getPartialPath(relativePath).unlink(missing_ok=True)
+                del self.checkpoint[relativePath]
+        self.writeCheckpoint()
+        return stats
+
+    def readManifest(self) -> Dict[str, Tuple[int, int]]:
+        manifest = super().readManifest()
+        # it is written again when the replication is done, an interrupted one scans the target next time instead of trusting an outdated manifest
+        self.manifestPath.unlink(missing_ok=True)
+        return manifest
+
+    def scanDestination(self) -> Dict[str, Tuple[int, int]]:
+        # the partial files are kept for resuming, they must not be deleted as entries that are not in the source
+        return {relativePath: entry for relativePath, entry in super().scanDestination().items() if not relativePath.endswith(self.PARTIALSUFFIX)}
+
+    def getPartialPath(self, relativePath: str) -> Path:
+        destination = self.destination.joinpath(relativePath)
+        return destination.with_name(f"{destination.name}{self.PARTIALSUFFIX}")
+
+    def copyFile(self, relativePath: str):
+        source = self.source.joinpath(relativePath)
+        destination = self.destination.joinpath(relativePath)
+        partial = self.getPartialPath(relativePath)
+        try:
+            stat = source.stat()
+            offset = 0
+            with self.checkpointLock:
+                known = self.checkpoint.get(relativePath)
+            if known is not None and known[:2] == (stat.st_size, stat.st_mtime_ns) and partial.exists() and partial.stat().st_size >= known[2]:
+                offset = known[2]
+                with self.stats.lock:
+                    self.stats.resumed += 1
+                log.debug(f"resuming '{relativePath}' at {FsTools.realToHumanFileSize(offset)}")
+            with open(source, "rb") as sourceFile, open(partial, "r+b" if offset > 0 else "wb") as partialFile:
+                # anything after the checkpoint may not have made it to the disk completely
+                partialFile.truncate(offset)
+                partialFile.seek(offset)
+                sourceFile.seek(offset)
+                unsaved = 0
+                while chunk := sourceFile.read(self.CHUNKSIZE):
+                    self.throttle(self.bytesBucket, len(chunk))
+                    partialFile.write(chunk)
+                    offset += len(chunk)
+                    unsaved += len(chunk)
+                    self.stats.addTransferred(len(chunk))
+                    if unsaved >= self.CHECKPOINTINTERVAL:
+                        partialFile.flush()
+                        os.fsync(partialFile.fileno())
+                        self.saveProgress(relativePath, (stat.st_size, stat.st_mtime_ns, offset))
+                        unsaved = 0
+                partialFile.flush()
+                os.fsync(partialFile.fileno())
+            shutil.copystat(source, partial)
+            os.replace(partial, destination)
+            self.saveProgress(relativePath, None)
+            return True
+        except OSError as ex:
+            log.error(f"could not replicate '{relativePath}' from '{self.source}' to '{self.destination}': {ex}")
+            return False
+
+    def saveProgress(self, relativePath: str, progress: Tuple[int, int, int]):
+        """updates the checkpoint with the progress of the file, None removes it. Only writes the checkpoint if there is progress"""
+        with self.checkpointLock:
+            if progress is None:
+                if self.checkpoint.pop(relativePath, None) is None:
+                    return
+            else:
+                self.checkpoint[relativePath] = progress
+            self.writeCheckpoint()
+
+    def readCheckpoint(self) -> Dict[str, Tuple[int, int, int]]:
+        """returns the checkpoint of an interrupted replication to this destination, or an empty one if there is none"""
+        if not self.checkpointPath.exists():
+            return {}
+        checkpoint = {}
+        with open(self.checkpointPath, "r", encoding="utf-8") as file:
+            header = file.readline().rstrip("\n").split("\t")
+            if header[:3] != [self.CHECKPOINTHEADER, self.CHECKPOINTVERSION, str(self.destination)]:
+                log.debug(f"checkpoint at '{self.checkpointPath}' does not belong to this replication, ignoring it")
+                return {}
+            for line in file:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 4:
+                    log.warning(f"checkpoint at '{self.checkpointPath}' is corrupt, ignoring it")
+                    return {}
+                checkpoint[parts[0]] = (int(parts[1]), int(parts[2]), int(parts[3]))
+        return checkpoint
+
+    def writeCheckpoint(self):
+        """writes the checkpoint to a temporary file first and replaces the old one, deletes it if there is nothing to resume"""
+        if not self.checkpoint:
+            self.checkpointPath.unlink(missing_ok=True)
+            return
+        self.checkpointPath.parent.mkdir(parents=True, exist_ok=True)
+        temporaryPath = self.checkpointPath.with_name(f"{self.checkpointPath.name}.tmp")
+        with open(temporaryPath, "w", encoding="utf-8") as file:
+            file.write(f"{self.CHECKPOINTHEADER}\t{self.CHECKPOINTVERSION}\t{self.destination}\t{datetime.now().isoformat(timespec='seconds')}\n")
+            for relativePath, (size, mtime, done) in self.checkpoint.items():
+                file.write(f"{relativePath}\t{size}\t{mtime}\t{done}\n")
+        os.replace(temporaryPath, self.checkpointPath)
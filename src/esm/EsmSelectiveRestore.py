@@ -0,0 +1,315 @@
+import hashlib
+import logging
+import os
+import shutil
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+from esm.EsmDifferentialBackup import StaticManifest, scanFiles
+from esm.EsmPackedMirror import EsmPackedMirror
+from esm.EsmSyncEngine import SyncStats
+from esm.exceptions import BackupFailedError, WrongParameterError
+from esm.FsTools import FsTools
+from esm.Tools import Timer
+
+log = logging.getLogger(__name__)
+
+FOLDER = StaticManifest.FOLDER
+"""size used for folders in the listings of the restore sources"""
+
+class RestoreSelection:
+    """
+    the parts of a savegame to restore. Every part is a unit that is replaced as a whole: the folder of a playfield and the one of its
+    template, the folder of an entity in Shared, or the database file with its journal files.
+    """
+    DATABASECOMPANIONS = ["-journal", "-wal", "-shm"]
+
+    def __init__(self, playfields: List[str] = None, entities: List[str] = None, database=False,
+                 playfieldsFolder="Playfields", templatesFolder="Templates", sharedFolder="Shared", databaseFile="global.db"):
+        units = []
+        for name in playfields or []:
+            self.assertValidName(name)
+            units.extend([f"{playfieldsFolder}/{name}", f"{templatesFolder}/{name}"])
+        for entityId in entities or []:
+            self.assertValidName(entityId)
+            units.append(f"{sharedFolder}/{entityId}")
+        self.databaseUnits = []
+        if database:
+            self.databaseUnits = [databaseFile] + [f"{databaseFile}{suffix}" for suffix in self.DATABASECOMPANIONS]
+            units.extend(self.databaseUnits)
+        self.units = list(dict.fromkeys(units))
+
+    @staticmethod
+    def assertValidName(name: str):
+        if not name or name in (".", "..") or "/" in name or "\\" in name:
+            raise WrongParameterError(f"'{name}' is not a valid playfield name or entity id")
+
+    def isEmpty(self):
+        return len(self.units) == 0
+
+    def getUnit(self, relativePath: str) -> str:
+        """returns the unit the relative path belongs to, or None if it is not selected"""
+        for unit in self.units:
+            if relativePath == unit or relativePath.startswith(f"{unit}/"):
+                return unit
+        return None
+
+class FolderRestoreSource:
+    """
+    a savegame as plain folder tree, like in a rolling backup. Only the folders of the selected units are scanned.
+    """
+    def __init__(self, savegamePath: Path, threads: int = 4):
+        self.savegamePath = Path(savegamePath)
+        self.threads = threads
+
+    def __str__(self):
+        return f"'{self.savegamePath}'"
+
+    def list(self, selection: RestoreSelection) -> Dict[str, Tuple[int, int]]:
+        """returns the entries of the selected units as relative path -> (size, mtime in ns), folders have the size -1"""
+        entries = {}
+        for unit in selection.units:
+            path = self.savegamePath.joinpath(unit)
+            if path.is_dir():
+                entries[unit] = (FOLDER, 0)
+                entries.update({f"{unit}/{relativePath}": entry for relativePath, entry in scanFiles(path).items()})
+            elif path.is_file():
+                stat = path.stat()
+                entries[unit] = (stat.st_size, stat.st_mtime_ns)
+        return entries
+
+    def extract(self, files: List[str], target: Path, stats: SyncStats):
+        """copies the files to the target, keeping their modification times"""
+        def copy(relativePath):
+            try:
+                shutil.copy2(self.savegamePath.joinpath(relativePath), target.joinpath(relativePath))
+                return target.joinpath(relativePath).stat().st_size
+            except OSError as ex:
+                log.error(f"could not copy '{relativePath}' from '{self.savegamePath}': {ex}")
+                return None
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="EsmSelectiveRestore") as executor:
+            for size in executor.map(copy, files):
+                if size is None:
+                    stats.failed += 1
+                else:
+                    stats.copied += 1
+                    stats.copiedBytes += size
+
+class PackedRestoreSource:
+    """
+    a savegame in a packed mirror, like in a rolling backup of a packed mirror. Only the index is read completely, the selected files are
+    read from the packs at their offsets.
+    """
+    def __init__(self, packedPath: Path, threads: int = 4):
+        self.packedMirror = EsmPackedMirror(source=None, packedPath=packedPath, threads=threads)
+        self.index = None
+
+    def __str__(self):
+        return f"the packed mirror at '{self.packedMirror.destination}'"
+
+    def list(self, selection: RestoreSelection) -> Dict[str, Tuple[int, int]]:
+        if self.index is None:
+            self.index = self.packedMirror.readIndex()
+            if self.index is None:
+                raise BackupFailedError(f"there is no valid packed mirror index at '{self.packedMirror.manifestPath}'")
+        return {relativePath: (FOLDER, 0) if entry.isDirectory() else (entry.size, entry.mtime)
+                for relativePath, entry in self.index.items() if selection.getUnit(relativePath) is not None}
+
+    def extract(self, files: List[str], target: Path, stats: SyncStats):
+        self.packedMirror.unpackFiles(files, self.index, target, verify=True, stats=stats)
+
+class ZipRestoreSource:
+    """
+    a savegame in static backup zips. The members are found in the central directory at the end of the zips, so only the members of the
+    selected units are read and decompressed, no matter how large the zips are.
+    """
+    def __init__(self, members: Dict[str, Tuple[Path, str, int, int, str]], name: str, threads: int = 4):
+        self.members = members
+        """relative path in the savegame -> (zip path, member name, size, mtime in ns, hash or None), folders have the size -1"""
+        self.name = name
+        self.threads = threads
+
+    def __str__(self):
+        return self.name
+
+    @staticmethod
+    def fromZips(zipPaths: List[Path], prefix: str, threads: int = 4):
+        """reads the members below prefix (the path of the savegame in the zips, ending with a slash) from the central directories of the zips"""
+        members = {}
+        for zipPath in zipPaths:
+            with zipfile.ZipFile(zipPath) as zip:
+                for info in zip.infolist():
+                    name = info.filename.replace("\\", "/")
+                    relativePath = name[len(prefix):].rstrip("/") if name.startswith(prefix) else ""
+                    if not relativePath:
+                        continue
+                    # zips store the local time with a precision of two seconds
+                    mtime = int(datetime(*info.date_time).timestamp()) * 1000000000
+                    members[relativePath] = (zipPath, info.filename, FOLDER if info.is_dir() else info.file_size, mtime, None)
+        return ZipRestoreSource(members, ", ".join(f"'{zipPath.name}'" for zipPath in zipPaths), threads)
+
+    @staticmethod
+    def fromManifest(manifest: StaticManifest, prefix: str, threads: int = 4):
+        """takes the members below prefix from the manifest of a (differential) static backup, every file from the zip of the chain that has its version"""
+        missingZips = manifest.getMissingZips()
+        if missingZips:
+            raise BackupFailedError(f"can not restore from '{manifest.zipName}', the zips {', '.join(missingZips)} of its chain are missing")
+        members = {}
+        for relativePath, (size, mtime, hash, zipName) in manifest.entries.items():
+            if relativePath.startswith(prefix):
+                zipPath = manifest.path.parent.joinpath(zipName) if size != FOLDER else None
+                members[relativePath[len(prefix):]] = (zipPath, relativePath, size, mtime, hash or None)
+        return ZipRestoreSource(members, f"'{manifest.zipName}' and its chain of {len(manifest.getZipNames())} zips", threads)
+
+    def isPackedMirror(self):
+        """returns True if the zips contain a packed mirror instead of a savegame"""
+        return EsmPackedMirror.INDEXNAME in self.members
+
+    def list(self, selection: RestoreSelection) -> Dict[str, Tuple[int, int]]:
+        return {relativePath: (size, mtime) for relativePath, (zipPath, memberName, size, mtime, hash) in self.members.items() if selection.getUnit(relativePath) is not None}
+
+    def extract(self, files: List[str], target: Path, stats: SyncStats):
+        """extracts the files, every zip is opened once on its own thread"""
+        byZip = {}
+        for relativePath in files:
+            byZip.setdefault(self.members[relativePath][0], []).append(relativePath)
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="EsmSelectiveRestore") as executor:
+            for copied, copiedBytes, failed in executor.map(lambda item: self.extractFromZip(item[0], item[1], target), byZip.items()):
+                stats.copied += copied
+                stats.copiedBytes += copiedBytes
+                stats.failed += failed
+
+    def extractFromZip(self, zipPath: Path, files: List[str], target: Path) -> Tuple[int, int, int]:
+        """extracts the files from one zip, returns the amount of extracted files, their size and the amount of failed files"""
+        copied = copiedBytes = failed = 0
+        try:
+            zip = zipfile.ZipFile(zipPath)
+        except (OSError, zipfile.BadZipFile) as ex:
+            log.error(f"could not open '{zipPath}': {ex}")
+            return 0, 0, len(files)
+        with zip:
+            for relativePath in files:
+                zipPath, memberName, size, mtime, hash = self.members[relativePath]
+                destination = target.joinpath(relativePath)
+                try:
+                    digest = hashlib.blake2b(digest_size=16) if hash is not None else None
+                    with zip.open(memberName) as source, open(destination, "wb") as file:
+                        while chunk := source.read(1024 * 1024):
+                            if digest is not None:
+                                digest.update(chunk)
+                            file.write(chunk)
+                    os.utime(destination, ns=(mtime, mtime))
+                    if digest is not None and digest.hexdigest() != hash:
+                        log.error(f"'{relativePath}' from '{zipPath.name}' does not match the hash in the manifest")
+                        failed += 1
+                        continue
+                    copied += 1
+                    copiedBytes += size
+                except (OSError, KeyError, zipfile.BadZipFile) as ex:
+                    log.error(f"could not extract '{memberName}' from '{zipPath}': {ex}")
+                    failed += 1
+        return copied, copiedBytes, failed
+
+class RestorePlanEntry:
+    """what restoring a unit would do"""
+    def __init__(self, unit: str, files: int, size: int, inBackup: bool, inSavegame: bool):
+        self.unit = unit
+        self.files = files
+        self.size = size
+        self.inBackup = inBackup
+        self.inSavegame = inSavegame
+
+    def __str__(self):
+        if not self.inBackup:
+            return f"'{self.unit}' is not in the backup, the savegame is left as it is"
+        action = "replacing the current one" if self.inSavegame else "which does not exist in the savegame"
+        return f"'{self.unit}' with {self.files} files ({FsTools.realToHumanFileSize(self.size)}), {action}"
+
+class EsmSelectiveRestore:
+    """
+    restores single units of a savegame (playfields, entities, the database) from a backup source into the savegame.
+
+    The files of the units are extracted into a staging folder next to the savegame first, so a failing or incomplete backup leaves the
+    savegame untouched. Then every unit found in the backup is swapped: the current version is discarded by the given function (e.g. into
+    the trash) and the restored one is renamed into its place. Units that are not in the backup are left as they are, except for the
+    journal files of the database, which would otherwise be applied to the restored database.
+    Units that are links, like playfields on the cold tier, are restored into the folder the link points to.
+    """
+    STAGINGSUFFIX = ".esm-restore"
+
+    def __init__(self, source, selection: RestoreSelection, savegamePath: Path, discard: Callable[[Path], None] = None):
+        self.source = source
+        self.selection = selection
+        savegamePath = Path(savegamePath)
+        # a savegame linked to the ramdisk gets its staging folder on the ramdisk, so the units can be renamed into place
+        self.savegamePath = FsTools.getLinkTarget(savegamePath) if FsTools.isHardLink(savegamePath) else savegamePath
+        self.stagingPath = self.savegamePath.with_name(f"{self.savegamePath.name}{self.STAGINGSUFFIX}")
+        self.discard = discard or self.delete
+
+    def getUnitPath(self, unit: str) -> Path:
+        path = self.savegamePath.joinpath(unit)
+        if FsTools.isHardLink(path):
+            return FsTools.getLinkTarget(path)
+        return path
+
+    def plan(self) -> List[RestorePlanEntry]:
+        """returns what restoring would do, unit by unit, without changing anything"""
+        entries = self.source.list(self.selection)
+        plan = []
+        for unit in self.selection.units:
+            unitEntries = [entry for relativePath, entry in entries.items() if self.selection.getUnit(relativePath) == unit]
+            files = [size for size, mtime in unitEntries if size != FOLDER]
+            plan.append(RestorePlanEntry(unit, len(files), sum(files), len(unitEntries) > 0, os.path.lexists(self.savegamePath.joinpath(unit))))
+        return plan
+
+    def restore(self) -> SyncStats:
+        """restores the selected units, returns the statistics with the extracted files and the discarded units as deleted"""
+        stats = SyncStats()
+        with Timer() as timer:
+            entries = self.source.list(self.selection)
+            stats.scanned = len(entries)
+            self.deleteStaging()
+            self.stagingPath.mkdir(parents=True)
+            try:
+                files = []
+                for relativePath, (size, mtime) in sorted(entries.items()):
+                    if size == FOLDER:
+                        self.stagingPath.joinpath(relativePath).mkdir(parents=True, exist_ok=True)
+                    else:
+                        self.stagingPath.joinpath(relativePath).parent.mkdir(parents=True, exist_ok=True)
+                        files.append(relativePath)
+                self.source.extract(files, self.stagingPath, stats)
+                if stats.failed > 0:
+                    raise BackupFailedError(f"{stats.failed} files could not be extracted from {self.source}, the savegame was not changed. Please check the logs")
+                restoredUnits = set(self.selection.getUnit(relativePath) for relativePath in entries.keys())
+                databaseRestored = len(self.selection.databaseUnits) > 0 and self.selection.databaseUnits[0] in restoredUnits
+                for unit in self.selection.units:
+                    current = self.getUnitPath(unit)
+                    if unit in restoredUnits:
+                        if os.path.lexists(current):
+                            self.discard(current)
+                            stats.deleted += 1
+                        current.parent.mkdir(parents=True, exist_ok=True)
+                        shutil.move(self.stagingPath.joinpath(unit), current)
+                        log.debug(f"restored '{unit}'")
+                    elif databaseRestored and unit in self.selection.databaseUnits and os.path.lexists(current):
+                        self.discard(current)
+                        stats.deleted += 1
+            finally:
+                self.deleteStaging()
+        stats.elapsedTime = timer.elapsedTime
+        return stats
+
+    def deleteStaging(self):
+        # the staging folder may be right below the root of the ramdisk, which is too shallow for FsTools.quickDelete
+        if self.stagingPath.exists():
+            shutil.rmtree(self.stagingPath, ignore_errors=True)
+
+    @staticmethod
+    def delete(path: Path):
+        if path.is_dir() and not FsTools.isHardLink(path):
+            FsTools.quickDelete(path)
+        else:
+            FsTools.deleteFile(path)
@@ -18,9 +18,12 @@ from limits import parse
 from esm import Tools
 from esm.ConfigModels import MainConfig
 from esm.DataTypes import ZipFile
+from esm.EsmAsyncDownloadServer import EsmAsyncDownloadServer
+from esm.EsmBandwidthScheduler import EsmBandwidthScheduler
 from esm.EsmConfigService import EsmConfigService
 from esm.EsmDedicatedServer import EsmDedicatedServer
 from esm.EsmHttpThrottledHandler import EsmHttpThrottledHandler
+from esm.EsmIoCoordinator import EsmIoCoordinator, IoPriority
 from esm.FsTools import FsTools
 from esm.ServiceRegistry import Service, ServiceRegistry
 from esm.exceptions import RequirementsNotFulfilledError, SafetyException
@@ -35,7 +38,7 @@ class EsmSharedDataServer:
     This supports files for manual download as well as the new SharedDataURL-Feature since v1.11.7
     """
     _httpServerWorker: threading.Thread = None
-    _httpServer: socketserver.BaseServer = None
+    _httpServer: socketserver.BaseServer | EsmAsyncDownloadServer = None
     _activeConnections: set[socket.socket] = set()
 
     @cached_property
@@ -49,6 +52,10 @@ class EsmSharedDataServer:
     def dedicatedServer(self) -> EsmDedicatedServer:
         return ServiceRegistry.get(EsmDedicatedServer)
 
+    @cached_property
+    def ioCoordinator(self) -> EsmIoCoordinator:
+        return ServiceRegistry.get(EsmIoCoordinator)
+
     def start(self, wait: bool = False, forceRecreate: bool=False):
         """
             prepare the files and start the shared data server
@@ -143,7 +150,7 @@ class EsmSharedDataServer:
         except KeyboardInterrupt:
             log.info(f"SharedData server shutting down.")
         finally:
-            log.info(f"SharedData server stopped serving. Total downloads: {EsmHttpThrottledHandler.globalZipDownloads}")
+            log.info(f"SharedData server stopped serving. Total downloads: {self.getTotalDownloads()}")
             
             if self.config.downloadtool.useSharedDataURLFeature and self.config.downloadtool.autoEditDedicatedYaml:
                 self.configService.removeSharedDataUrl()
@@ -158,12 +165,31 @@ class EsmSharedDataServer:
         self._httpServerWorker.start()
 
     def stopServing(self):
-        log.info(f"SharedData server stopped serving. Total downloads: {EsmHttpThrottledHandler.globalZipDownloads}")
+        log.info(f"SharedData server stopped serving. Total downloads: {self.getTotalDownloads()}")
         if self.config.downloadtool.useSharedDataURLFeature and self.config.downloadtool.autoEditDedicatedYaml:
             self.configService.removeSharedDataUrl()
             if not self.config.downloadtool.startWithMainServer:
                 log.warning(f"The dedicated yaml has been rolled back to its original state, make sure to restart the server for it to take effect!")
 
+    def getTotalDownloads(self):
+        if isinstance(self._httpServer, EsmAsyncDownloadServer):
+            return self._httpServer.zipDownloads
+        return EsmHttpThrottledHandler.globalZipDownloads
+
+    def setBandwidthLimits(self, maxGlobalBandwith: int = None, maxClientBandwith: int = None):
+        """
+        changes the bandwidth limits of the running server, downloads in progress adapt to them right away
+        """
+        if isinstance(self._httpServer, EsmAsyncDownloadServer):
+            scheduler = self._httpServer.bandwidthScheduler
+        else:
+            scheduler = EsmHttpThrottledHandler.bandwidthScheduler
+        scheduler.reconfigure(globalRate=maxGlobalBandwith, clientRate=maxClientBandwith)
+        if maxGlobalBandwith is not None:
+            log.info(f"Server now allows max {humanize.naturalsize(maxGlobalBandwith, gnu=False)}/s in total network bandwidth.")
+        if maxClientBandwith is not None:
+            log.info(f"Server now allows max {humanize.naturalsize(maxClientBandwith, gnu=False)}/s network bandwith per connection.")
+
     def getSharedDataURL(self, servingUrlRoot, autoZipFile: ZipFile):
         if len(self.config.downloadtool.customSharedDataURL) > 1:
             log.warning(f"Server configured to use a custom shared data url: '{self.config.downloadtool.customSharedDataURL}', make sure it is reachable for all your players, or it might break the game!")
@@ -238,7 +264,8 @@ class EsmSharedDataServer:
             prepare the zip files for download by creating them and moving them to the wwwroot folder
         """
         log.info(f"Creating new shared data zip files from '{pathToSharedDataFolder}' for download.")
-        zipFiles = self.createSharedDataZipFiles(pathToSharedDataFolder)
+        with self.ioCoordinator.lease("shared data zip", IoPriority.ZIP):
+            zipFiles = self.createSharedDataZipFiles(pathToSharedDataFolder)
         zipFiles = self.moveSharedDataZipFilesToWwwroot(zipFiles)
         self.writeHashfile(pathToSharedDataFolder)
 
@@ -492,25 +519,19 @@ class EsmSharedDataServer:
         starts the httpd server using the different configurations for the given zipFiles
         """
         serverPort = self.config.downloadtool.serverPort
-        handler = self._setUpSharedDataHandler(zipFiles)
+        if self.config.downloadtool.useAsyncServer:
+            asyncServer = self._setUpAsyncServer(zipFiles)
+            self._setUpChatlogViewer(asyncServer)
+            log.info(f"Using the async download server, allowing up to {self.config.downloadtool.asyncMaxConnections} connections.")
+            try:
+                self._httpServer = asyncServer
+                asyncServer.serveForever()
+            except Exception as e:
+                log.debug(e)
+            return
 
-        if self.config.communication.chatlogViewerEnabled:
-            servingUrlRoot = self.getServingUrlRoot()
-            pSgmt = self.config.communication.chatlogViewerPathSegment
-            log.info(f"Enabling chat log viewer on path '{servingUrlRoot}{pSgmt}'")
-
-            chatLogViewerFiles = [f"{pSgmt}", f"{pSgmt}/index.html", f"{pSgmt}/script.js", f"{pSgmt}/styles.css"]
-            handler.whitelist = chatLogViewerFiles
-            handler.rateLimitExceptions = chatLogViewerFiles
-            handler.redirects = [
-                {"source": f"{pSgmt}", "destination": f"{pSgmt}/index.html", "code": 301},
-                {"source": f"{pSgmt}/", "destination": f"{pSgmt}/index.html", "code": 301},
-            ]
-            haimsterChatLog = f"{self.config.communication.haimsterHost}{self.config.communication.chatlogPath}"
-            log.info(f"Will proxy chatlog url at: '{haimsterChatLog}'")
-            handler.proxiedPaths = [
-                {"path": f"{pSgmt}/chatlog.json", "target": haimsterChatLog},
-            ]
+        handler = self._setUpSharedDataHandler(zipFiles)
+        self._setUpChatlogViewer(handler)
 
         try:
             with socketserver.ThreadingTCPServer(("", serverPort), handler) as httpd:
@@ -519,12 +540,42 @@ class EsmSharedDataServer:
         except Exception as e:
             log.debug(e)
 
+    def _setUpChatlogViewer(self, server: EsmHttpThrottledHandler | EsmAsyncDownloadServer):
+        """
+        configures the whitelist, redirects and proxied paths of the handler or async server for the chat log viewer, if enabled
+        """
+        if not self.config.communication.chatlogViewerEnabled:
+            return
+        servingUrlRoot = self.getServingUrlRoot()
+        pSgmt = self.config.communication.chatlogViewerPathSegment
+        log.info(f"Enabling chat log viewer on path '{servingUrlRoot}{pSgmt}'")
+
+        chatLogViewerFiles = [f"{pSgmt}", f"{pSgmt}/index.html", f"{pSgmt}/script.js", f"{pSgmt}/styles.css"]
+        server.whitelist = chatLogViewerFiles
+        server.rateLimitExceptions = chatLogViewerFiles
+        server.redirects = [
+            {"source": f"{pSgmt}", "destination": f"{pSgmt}/index.html", "code": 301},
+            {"source": f"{pSgmt}/", "destination": f"{pSgmt}/index.html", "code": 301},
+        ]
+        haimsterChatLog = f"{self.config.communication.haimsterHost}{self.config.communication.chatlogPath}"
+        log.info(f"Will proxy chatlog url at: '{haimsterChatLog}'")
+        server.proxiedPaths = [
+            {"path": f"{pSgmt}/chatlog.json", "target": haimsterChatLog},
+        ]
+
+    def _setUpAsyncServer(self, zipFiles) -> EsmAsyncDownloadServer:
+        downloadtool = self.config.downloadtool
+        return EsmAsyncDownloadServer(rootDirectory=Path(downloadtool.wwwroot).resolve(), zipFiles=zipFiles, port=downloadtool.serverPort,
+                                      clientBandwidthLimit=downloadtool.maxClientBandwith, globalBandwidthLimit=downloadtool.maxGlobalBandwith,
+                                      rateLimit=downloadtool.rateLimit, sliceSize=downloadtool.downloadSliceSize,
+                                      inMemoryMaxSize=downloadtool.asyncInMemoryMaxSize, maxConnections=downloadtool.asyncMaxConnections)
+
     def _setUpSharedDataHandler(self, zipFiles) -> EsmHttpThrottledHandler:
         wwwroot = Path(self.config.downloadtool.wwwroot).resolve()
         sharedDataHandler = EsmHttpThrottledHandler
         EsmHttpThrottledHandler.rootDirectory = wwwroot.resolve() # this is the root of the webserver
-        EsmHttpThrottledHandler.globalBandwidthLimit = self.config.downloadtool.maxGlobalBandwith
-        EsmHttpThrottledHandler.clientBandwidthLimit = self.config.downloadtool.maxClientBandwith
+        EsmHttpThrottledHandler.bandwidthScheduler = EsmBandwidthScheduler(globalRate=self.config.downloadtool.maxGlobalBandwith, clientRate=self.config.downloadtool.maxClientBandwith)
+        EsmHttpThrottledHandler.sliceSize = self.config.downloadtool.downloadSliceSize
         EsmHttpThrottledHandler.rateLimit = parse(self.config.downloadtool.rateLimit)
         EsmHttpThrottledHandler.zipFiles = zipFiles
         EsmHttpThrottledHandler.activeConnections = self._activeConnections
@@ -0,0 +1,457 @@
+import logging
+import os
+import random
+import shutil
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from threading import Event, Lock
+from typing import Dict, List, Tuple
+from esm.EsmChangeTracker import ChangeSet, getParentFolder
+from esm.EsmDatabaseWrapper import EsmDatabaseWrapper
+from esm.exceptions import DatabaseCaptureError
+from esm.FsTools import FsTools
+from esm.Tools import LagProbe, Timer, TokenBucket, getElapsedTime, lowerThreadPriority
+
+log = logging.getLogger(__name__)
+
+class SyncStats:
+    """
+    statistics of a single synchronization
+    """
+    def __init__(self):
+        self.scanned = 0
+        self.copied = 0
+        self.copiedBytes = 0
+        self.deleted = 0
+        self.failed = 0
+        self.elapsedTime = timedelta(0)
+        self.throttledTime = timedelta(0)
+        self.maxLag = timedelta(0)
+        self.averageLag = timedelta(0)
+        self.databasePages = 0
+        self.databaseCaptureTime = timedelta(0)
+        self.databaseChecked = False
+        self.timeToReady = None
+
+    def getThroughput(self):
+        """returns the copied bytes per second"""
+        seconds = self.elapsedTime.total_seconds()
+        return self.copiedBytes / seconds if seconds > 0 else 0
+
+    def __str__(self):
+        text = (f"scanned {self.scanned} entries, copied {self.copied} files ({FsTools.realToHumanFileSize(self.copiedBytes)}), deleted {self.deleted} entries, {self.failed} failed, took {self.elapsedTime}"
+                f" (throttled for {self.throttledTime} over all threads), added scheduling lag max {self.maxLag.total_seconds()*1000:.1f}ms, average {self.averageLag.total_seconds()*1000:.1f}ms")
+        if self.copiedBytes > 0:
+            text = f"{text}, {FsTools.realToHumanFileSize(self.getThroughput())}/s"
+        if self.timeToReady is not None:
+            text = f"{text}, priority files in place after {self.timeToReady}"
+        if self.databasePages > 0:
+            text = f"{text}, captured {self.databasePages} database pages in {self.databaseCaptureTime}{' (quick check passed)' if self.databaseChecked else ''}"
+        return text
+
+class EsmSyncEngine:
+    """
+    incremental one-way synchronization of a folder tree, the native alternative to robocopy /MIR.
+
+    The engine keeps a manifest of the last synced state (relative path -> size, modification time) next to the destination,
+    so a sync only needs to scan the source and compare it with the manifest instead of scanning the destination too.
+    Changed files are copied on a thread pool, entries that vanished from the source are deleted in the destination.
+    Links in the source are followed, just like robocopy does.
+
+    If there is no manifest (or it belongs to a different source or destination), the destination is scanned once to create it.
+    Changes done to the destination by anything else than the engine won't be noticed, use a full scan to rebuild the manifest then.
+
+    If a change tracker provides the folders that changed since the last sync, only those are scanned in the source,
+    everything else is assumed to be unchanged since the last sync.
+
+    To keep the sync from starving the game server, the copies and deletes can be limited to a budget of bytes and files per second,
+    and the threads doing the work can lower their own cpu and io priority.
+
+    Database files are not copied but captured with the sqlite backup api, so the destination gets a consistent database even if
+    the game is writing to it. Their sidecar files are not synced, since they would not match the captured database.
+
+    If priority paths are given, the files at or below them are copied first, in the order of the priority paths, and the ready event
+    is set as soon as they are in place, while the rest is still being copied.
+    """
+    MANIFESTHEADER = "#esm-sync-manifest"
+    MANIFESTVERSION = "1"
+    DIRECTORY = -1
+    """size used in the manifest for directories"""
+    UNKNOWN = -2
+    """size used in the manifest for entries whose state in the destination is unknown, e.g. after a failed copy"""
+    CHUNKSIZE = 1024 * 1024
+    """files are copied in chunks of this size when there is a bytes per second budget"""
+    DATABASESIDECARS = ["-wal", "-shm", "-journal"]
+
+    def __init__(self, source: Path, destination: Path, manifestPath: Path, threads: int = 8, bytesPerSecond: int = 0, filesPerSecond: int = 0, lowPriority=False,
+                 databaseFiles: List[str] = None, databasePagesPerStep: int = 1024, databaseQuickCheckProbability: float = 0,
+                 priorityPaths: List[str] = None, readyEvent: Event = None):
+        self.source = Path(source) if source is not None else None
+        self.destination = Path(destination)
+        self.manifestPath = Path(manifestPath)
+        self.threads = threads
+        self.bytesBucket = TokenBucket(bytesPerSecond) if bytesPerSecond > 0 else None
+        self.filesBucket = TokenBucket(filesPerSecond) if filesPerSecond > 0 else None
+        self.lowPriority = lowPriority
+        self.throttledSeconds = 0
+        self.throttledLock = Lock()
+        self.databaseFiles = set(databaseFiles or [])
+        self.databasePagesPerStep = databasePagesPerStep
+        self.databaseQuickCheckProbability = databaseQuickCheckProbability
+        self.databaseStats = None
+        self.priorityPaths = {}
+        for index, relativePath in enumerate(priorityPaths or []):
+            self.priorityPaths.setdefault(relativePath, index)
+        self.readyEvent = readyEvent
+
+    def synchronize(self, fullScan=False, changes: ChangeSet=None) -> SyncStats:
+        """
+        synchronizes the destination with the source once, returns the statistics of the sync.
+        if fullScan is True, the manifest is ignored and rebuilt by scanning the destination.
+        if changes are given, only the changed folders of the source are scanned.
+        """
+        if self.lowPriority:
+            # on a thread of its own, so lowering its priority doesn't affect the caller
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="EsmSyncEngine", initializer=lowerThreadPriority) as executor:
+                return executor.submit(self.runSynchronize, fullScan, changes).result()
+        return self.runSynchronize(fullScan, changes)
+
+    def runSynchronize(self, fullScan: bool, changes: ChangeSet) -> SyncStats:
+        """does the actual sync on the calling thread"""
+        stats = self.createStats()
+        self.throttledSeconds = 0
+        self.databaseStats = stats
+        with Timer() as timer, LagProbe() as lagProbe:
+            manifest = None if fullScan else self.readManifest()
+            if manifest is None:
+                log.debug(f"no valid manifest at '{self.manifestPath}', scanning destination '{self.destination}'")
+                manifest = self.scanDestination()
+                changes = None
+            if changes is None:
+                sourceEntries = self.scanTree(self.source)
+                stats.scanned = len(sourceEntries)
+            else:
+                sourceEntries, stats.scanned = self.scanChanges(manifest, changes)
+            for databaseFile in self.databaseFiles:
+                for suffix in self.DATABASESIDECARS:
+                    sourceEntries.pop(f"{databaseFile}{suffix}", None)
+
+            toDelete, toCreate, toCopy = self.compare(sourceEntries, manifest)
+            log.debug(f"sync '{self.source}' -> '{self.destination}': {len(toCopy)} files to copy, {len(toCreate)} folders to create, {len(toDelete)} entries to delete")
+
+            newManifest = dict(sourceEntries)
+            self.deleteEntries(toDelete, manifest, newManifest, stats)
+            self.createFolders(toCreate)
+            if self.priorityPaths:
+                priorityFiles, otherFiles = self.splitByPriority(toCopy)
+                log.debug(f"copying {len(priorityFiles)} priority files first")
+                self.copyFiles(priorityFiles, sourceEntries, newManifest, stats)
+                stats.timeToReady = getElapsedTime(timer.start)
+                log.debug(f"priority files are in place after {stats.timeToReady}")
+                if self.readyEvent is not None:
+                    self.readyEvent.set()
+                toCopy = otherFiles
+            self.copyFiles(toCopy, sourceEntries, newManifest, stats)
+            self.writeManifest(newManifest)
+        stats.elapsedTime = timer.elapsedTime
+        stats.throttledTime = timedelta(seconds=self.throttledSeconds)
+        stats.maxLag = lagProbe.maxLag
+        stats.averageLag = lagProbe.averageLag
+        return stats
+
+    def createStats(self) -> SyncStats:
+        return SyncStats()
+
+    def getPriority(self, relativePath: str):
+        """returns the index of the first priority path the relative path is at or below, or None"""
+        while relativePath:
+            index = self.priorityPaths.get(relativePath)
+            if index is not None:
+                return index
+            relativePath = getParentFolder(relativePath)
+        return None
+
+    def splitByPriority(self, toCopy: List[str]):
+        """
+        returns the files at or below the priority paths in the order of the priority paths, and the other files
+        """
+        priorityFiles = []
+        otherFiles = []
+        for relativePath in toCopy:
+            priority = self.getPriority(relativePath)
+            if priority is None:
+                otherFiles.append(relativePath)
+            else:
+                priorityFiles.append((priority, relativePath))
+        return [relativePath for priority, relativePath in sorted(priorityFiles)], otherFiles
+
+    def throttle(self, bucket: TokenBucket, amount: int):
+        """waits until the amount fits into the budget of the bucket, if there is one"""
+        if bucket is None:
+            return
+        waited = bucket.consume(amount)
+        if waited > 0:
+            with self.throttledLock:
+                self.throttledSeconds += waited
+
+    def compare(self, sourceEntries: Dict[str, Tuple[int, int]], manifest: Dict[str, Tuple[int, int]]):
+        """
+        returns the lists of relative paths to delete, folders to create and files to copy, all sorted so parents come first
+        """
+        toDelete = set()
+        for relativePath, entry in manifest.items():
+            sourceEntry = sourceEntries.get(relativePath)
+            if sourceEntry is None or self.isDirectory(sourceEntry) != self.isDirectory(entry) or entry[0] == self.UNKNOWN:
+                toDelete.add(relativePath)
+        toCreate = []
+        toCopy = []
+        for relativePath, entry in sourceEntries.items():
+            if self.isDirectory(entry):
+                if relativePath not in manifest or relativePath in toDelete:
+                    toCreate.append(relativePath)
+            elif manifest.get(relativePath) != entry:
+                toCopy.append(relativePath)
+        return sorted(toDelete), sorted(toCreate), sorted(toCopy)
+
+    def scanDestination(self) -> Dict[str, Tuple[int, int]]:
+        """returns the current state of the destination, used when there is no manifest"""
+        return self.scanTree(self.destination)
+
+    def createFolders(self, toCreate: List[str]):
+        for relativePath in toCreate:
+            self.destination.joinpath(relativePath).mkdir(parents=True, exist_ok=True)
+
+    def isDirectory(self, entry: Tuple[int, int]):
+        return entry[0] == self.DIRECTORY
+
+    def scanChanges(self, manifest: Dict[str, Tuple[int, int]], changes: ChangeSet):
+        """
+        returns the current entries of the source and the amount of scanned entries, by taking the manifest and scanning only the changed folders.
+        New folders found in a changed folder are scanned completely.
+        """
+        children = {}
+        for relativePath in manifest.keys():
+            children.setdefault(getParentFolder(relativePath), []).append(relativePath)
+
+        entries = dict(manifest)
+        folders = set(changes.folders)
+        # entries that failed last time need to be looked at again
+        folders.update(getParentFolder(relativePath) for relativePath, entry in manifest.items() if entry[0] == self.UNKNOWN)
+        scanned = 0
+
+        for relativeFolder in sorted(changes.subtrees):
+            self.forgetBelow(entries, children, relativeFolder)
+            subtree = self.scanTree(self.source.joinpath(relativeFolder), prefix=f"{relativeFolder}/")
+            entries.update(subtree)
+            scanned += len(subtree)
+
+        for relativeFolder in sorted(folders):
+            if self.isBelowAny(f"{relativeFolder}/", changes.subtrees):
+                continue
+            folderPath = self.source.joinpath(relativeFolder)
+            if not folderPath.is_dir():
+                # the parent folder will be marked as changed too and take care of this
+                continue
+            prefix = f"{relativeFolder}/" if relativeFolder else ""
+            found = set()
+            try:
+                with os.scandir(folderPath) as iterator:
+                    for entry in iterator:
+                        relativePath = f"{prefix}{entry.name}"
+                        scanned += 1
+                        try:
+                            isDirectory = entry.is_dir()
+                            known = manifest.get(relativePath)
+                            if known is not None and self.isDirectory(known) and not isDirectory:
+                                self.forgetBelow(entries, children, relativePath)
+                            if isDirectory:
+                                entries[relativePath] = (self.DIRECTORY, 0)
+                                if known is None or not self.isDirectory(known):
+                                    subtree = self.scanTree(Path(entry.path), prefix=f"{relativePath}/")
+                                    entries.update(subtree)
+                                    scanned += len(subtree)
+                            else:
+                                stat = entry.stat()
+                                entries[relativePath] = (stat.st_size, stat.st_mtime_ns)
+                            found.add(relativePath)
+                        except OSError as ex:
+                            log.debug(f"could not stat '{entry.path}': {ex}")
+            except OSError as ex:
+                log.warning(f"could not scan folder '{folderPath}': {ex}")
+                continue
+            for relativePath in children.get(relativeFolder, []):
+                if relativePath not in found:
+                    entries.pop(relativePath, None)
+                    self.forgetBelow(entries, children, relativePath)
+        return entries, scanned
+
+    def forgetBelow(self, entries: Dict[str, Tuple[int, int]], children: Dict[str, List[str]], relativeFolder: str):
+        """removes all entries below the relative folder, as known from the manifest"""
+        folders = [relativeFolder]
+        while folders:
+            for relativePath in children.get(folders.pop(), []):
+                entries.pop(relativePath, None)
+                folders.append(relativePath)
+
+    def scanTree(self, root: Path, prefix: str = "") -> Dict[str, Tuple[int, int]]:
+        """
+        returns all entries below root as dictionary of the relative path (with forward slashes) to (size, mtime in ns), folders have the size -1.
+        """
+        entries = {}
+        if not root.is_dir():
+            return entries
+        folders = [(prefix, str(root))]
+        while folders:
+            relativeFolder, folder = folders.pop()
+            try:
+                with os.scandir(folder) as iterator:
+                    for entry in iterator:
+                        relativePath = f"{relativeFolder}{entry.name}"
+                        try:
+                            if entry.is_dir():
+                                entries[relativePath] = (self.DIRECTORY, 0)
+                                folders.append((f"{relativePath}/", entry.path))
+                            else:
+                                stat = entry.stat()
+                                entries[relativePath] = (stat.st_size, stat.st_mtime_ns)
+                        except OSError as ex:
+                            # probably deleted in the meantime, or a broken link
+                            log.debug(f"could not stat '{entry.path}': {ex}")
+            except OSError as ex:
+                log.warning(f"could not scan folder '{folder}': {ex}")
+        return entries
+
+    def deleteEntries(self, toDelete: List[str], manifest: Dict[str, Tuple[int, int]], newManifest: Dict[str, Tuple[int, int]], stats: SyncStats):
+        """
+        deletes the entries in the destination, entries below a deleted folder are just counted. Entries that fail to delete are
+        kept in the new manifest as unknown, so they are retried on the next sync.
+        """
+        deletedFolders = set()
+        for relativePath in toDelete:
+            if self.isBelowAny(relativePath, deletedFolders):
+                stats.deleted += 1
+                continue
+            path = self.destination.joinpath(relativePath)
+            self.throttle(self.filesBucket, 1)
+            try:
+                if FsTools.isHardLink(path):
+                    FsTools.deleteLink(path)
+                elif path.is_dir():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink(missing_ok=True)
+                if self.isDirectory(manifest[relativePath]):
+                    deletedFolders.add(relativePath)
+                stats.deleted += 1
+            except OSError as ex:
+                log.error(f"could not delete '{path}': {ex}")
+                stats.failed += 1
+                newManifest[relativePath] = (self.UNKNOWN, 0)
+
+    def isBelowAny(self, relativePath: str, folders: set):
+        if not folders:
+            return False
+        index = relativePath.rfind("/")
+        while index > 0:
+            relativePath = relativePath[:index]
+            if relativePath in folders:
+                return True
+            index = relativePath.rfind("/")
+        return False
+
+    def copyFiles(self, toCopy: List[str], sourceEntries: Dict[str, Tuple[int, int]], newManifest: Dict[str, Tuple[int, int]], stats: SyncStats):
+        """
+        copies the files on the thread pool. The manifest gets the state of the source as it was scanned, so a file that changed while
+        being copied will be copied again on the next sync.
+        """
+        if not toCopy:
+            return
+        initializer = lowerThreadPriority if self.lowPriority else None
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="EsmSyncEngine", initializer=initializer) as executor:
+            for relativePath, success in zip(toCopy, executor.map(self.copyFile, toCopy)):
+                if success:
+                    stats.copied += 1
+                    stats.copiedBytes += sourceEntries[relativePath][0]
+                else:
+                    stats.failed += 1
+                    newManifest[relativePath] = (self.UNKNOWN, 0)
+
+    def copyFile(self, relativePath: str):
+        source = self.source.joinpath(relativePath)
+        destination = self.destination.joinpath(relativePath)
+        self.throttle(self.filesBucket, 1)
+        if relativePath in self.databaseFiles:
+            return self.captureDatabase(relativePath)
+        try:
+            if self.bytesBucket is None:
+                shutil.copy2(source, destination)
+                return True
+            with open(source, "rb") as sourceFile, open(destination, "wb") as destinationFile:
+                while True:
+                    chunk = sourceFile.read(self.CHUNKSIZE)
+                    if not chunk:
+                        break
+                    self.throttle(self.bytesBucket, len(chunk))
+                    destinationFile.write(chunk)
+            shutil.copystat(source, destination)
+            return True
+        except OSError as ex:
+            log.error(f"could not copy '{relativePath}' from '{self.source}' to '{self.destination}': {ex}")
+            return False
+
+    def captureDatabase(self, relativePath: str, target: Path = None):
+        """
+        captures the database with the sqlite backup api, checking the result with a quick check now and then.
+        The capture is written to target, or to the relative path in the destination if there is none.
+        """
+        quickCheck = random.random() < self.databaseQuickCheckProbability
+        database = EsmDatabaseWrapper(self.source.joinpath(relativePath))
+        try:
+            pages, elapsedTime = database.captureTo(target or self.destination.joinpath(relativePath), pagesPerStep=self.databasePagesPerStep, quickCheck=quickCheck)
+            self.databaseStats.databasePages += pages
+            self.databaseStats.databaseCaptureTime += elapsedTime
+            self.databaseStats.databaseChecked = quickCheck
+            return True
+        except (DatabaseCaptureError, sqlite3.Error, OSError) as ex:
+            log.error(f"could not capture database '{relativePath}' from '{self.source}' to '{self.destination}': {ex}")
+            return False
+        finally:
+            database.closeDbConnection()
+
+    def readManifest(self) -> Dict[str, Tuple[int, int]]:
+        """
+        returns the manifest as dictionary, or None if there is none or it does not belong to this source and destination.
+        """
+        if not self.manifestPath.exists():
+            return None
+        manifest = {}
+        with open(self.manifestPath, "r", encoding="utf-8") as file:
+            header = file.readline().rstrip("\n").split("\t")
+            if header != [self.MANIFESTHEADER, self.MANIFESTVERSION] + self.getManifestKey():
+                log.debug(f"manifest at '{self.manifestPath}' does not belong to this sync, ignoring it")
+                return None
+            for line in file:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 3:
+                    log.warning(f"manifest at '{self.manifestPath}' is corrupt, ignoring it")
+                    return None
+                manifest[parts[0]] = (int(parts[1]), int(parts[2]))
+        return manifest
+
+    def getManifestKey(self) -> List[str]:
+        """returns what the manifest belongs to, a manifest written for anything else is ignored"""
+        return [str(self.source), str(self.destination)]
+
+    def writeManifest(self, manifest: Dict[str, Tuple[int, int]]):
+        """
+        writes the manifest to a temporary file first and replaces the old one, so there is always a complete manifest on disk.
+        """
+        self.manifestPath.parent.mkdir(parents=True, exist_ok=True)
+        temporaryPath = self.manifestPath.with_name(f"{self.manifestPath.name}.tmp")
+        with open(temporaryPath, "w", encoding="utf-8") as file:
+            file.write("\t".join([self.MANIFESTHEADER, self.MANIFESTVERSION] + self.getManifestKey()) + "\n")
+            for relativePath, (size, mtime) in manifest.items():
+                file.write(f"{relativePath}\t{size}\t{mtime}\n")
+        os.replace(temporaryPath, self.manifestPath)
@@ -0,0 +1,215 @@
+import logging
+import re
+import time
+from enum import Enum
+from pathlib import Path
+from typing import Callable, List
+from esm.ConfigModels import ConfigRamdisk
+
+log = logging.getLogger(__name__)
+
+class SyncReason(str, Enum):
+    STALENESS = "staleness"
+    CHANGEVOLUME = "change volume"
+    SAVEEVENT = "save event"
+
+class GameLogSaveDetector:
+    """
+    follows the newest log of the dedicated server and tells if the game saved since the last poll.
+
+    The logs are in $logsPath/$buildNumber/Dedicated_*.log, a new one is created with every server start.
+    The log that already exists when the detector is created is only followed from its current end.
+    """
+    def __init__(self, logsPath: Path, pattern: str, rescanInterval: float = 30, clock: Callable[[], float] = time.monotonic):
+        self.logsPath = Path(logsPath)
+        self.pattern = re.compile(pattern)
+        self.rescanInterval = rescanInterval
+        self.clock = clock
+        self.logFile = None
+        self.offset = 0
+        self.remainder = ""
+        self.lastRescan = None
+
+    def findNewestLog(self) -> Path:
+        newest = None
+        newestTime = None
+        for path in self.logsPath.glob("*/Dedicated_*.log"):
+            try:
+                modificationTime = path.stat().st_mtime
+            except OSError:
+                continue
+            if newestTime is None or modificationTime > newestTime:
+                newest = path
+                newestTime = modificationTime
+        return newest
+
+    def poll(self) -> bool:
+        """
+        returns True if a line matching the pattern was written to the log since the last poll
+        """
+        now = self.clock()
+        if self.lastRescan is None or now - self.lastRescan >= self.rescanInterval:
+            self.lastRescan = now
+            newest = self.findNewestLog()
+            if newest is not None and newest != self.logFile:
+                log.debug(f"following the dedicated server log '{newest}' for save events")
+                try:
+                    # a log created after the detector started is read from the beginning
+                    self.offset = 0 if self.logFile is not None else newest.stat().st_size
+                except OSError:
+                    return False
+                self.logFile = newest
+                self.remainder = ""
+        if self.logFile is None:
+            return False
+        try:
+            size = self.logFile.stat().st_size
+            if size < self.offset:
+                # the log was truncated or replaced
+                self.offset = 0
+                self.remainder = ""
+            if size == self.offset:
+                return False
+            with open(self.logFile, "rb") as file:
+                file.seek(self.offset)
+                data = file.read(size - self.offset)
+        except OSError as ex:
+            log.debug(f"could not read the dedicated server log '{self.logFile}': {ex}")
+            return False
+        self.offset += len(data)
+        lines = (self.remainder + data.decode("utf-8", errors="replace")).split("\n")
+        # the last line may not be complete yet
+        self.remainder = lines.pop()
+        return any(self.pattern.search(line) for line in lines)
+
+class NextSync:
+    """
+    when the next sync is due and why, as far as can be told now
+    """
+    def __init__(self, reason: SyncReason, dueIn: float, deferredBy: List[str] = None):
+        self.reason = reason
+        self.dueIn = dueIn
+        self.deferredBy = deferredBy if deferredBy is not None else []
+
+    def __str__(self):
+        text = f"next sync due in {int(self.dueIn)} seconds ({self.reason.value})"
+        if len(self.deferredBy) > 0:
+            text = f"{text}, deferred while {', '.join(self.deferredBy)} is running"
+        return text
+
+class SyncScheduler:
+    """
+    decides when the ram to mirror synchronizer should sync, instead of syncing at a fixed interval.
+
+    A sync is due when:
+        - the mirror is older than maxStaleness seconds
+        - at least changeThreshold folders changed since the last sync (as told by countChanges)
+        - the game saved (as told by the saveDetector) saveEventDelay seconds ago, to let it finish the save
+
+    The last two only trigger a sync if the last one is at least minInterval seconds ago. Due syncs are deferred
+    while the io heavy jobs told by getRunningJobs are running, e.g. a backup reading the mirror. A sync due to staleness is
+    deferred for maxDeferral seconds at most (maxStaleness by default), so a job that takes hours can't leave the mirror behind that long.
+    """
+    def __init__(self, maxStaleness: float, minInterval: float = 0, changeThreshold: int = 0, countChanges: Callable[[], int] = None,
+                 saveDetector: GameLogSaveDetector = None, saveEventDelay: float = 0, getRunningJobs: Callable[[], List[str]] = None,
+                 maxDeferral: float = None, clock: Callable[[], float] = time.monotonic):
+        self.maxStaleness = maxStaleness
+        self.maxDeferral = maxDeferral if maxDeferral is not None else maxStaleness
+        self.minInterval = minInterval
+        self.changeThreshold = changeThreshold
+        self.countChanges = countChanges
+        self.saveDetector = saveDetector
+        self.saveEventDelay = saveEventDelay
+        self.getRunningJobs = getRunningJobs
+        self.clock = clock
+        self.lastSync = clock()
+        self.saveEventAt = None
+        self.deferredSince = None
+
+    @staticmethod
+    def fromConfig(settings: ConfigRamdisk, maxStaleness: float, logsPath: Path, countChanges: Callable[[], int] = None,
+                   getRunningJobs: Callable[[], List[str]] = None, clock: Callable[[], float] = time.monotonic) -> "SyncScheduler":
+        """
+        returns the scheduler for the ramdisk configuration. The change volume and save events only trigger syncs for the native synchronizer,
+        since every sync of the robocopy synchronizer mirrors the whole savegame, so it just syncs at the interval like it always did.
+        """
+        if settings.synchronizer != "native":
+            return SyncScheduler(maxStaleness=maxStaleness, getRunningJobs=getRunningJobs if settings.synchronizeDeferForJobs else None, clock=clock)
+        saveDetector = None
+        if settings.synchronizeOnSave:
+            saveDetector = GameLogSaveDetector(logsPath, settings.synchronizeSaveEventPattern, clock=clock)
+        return SyncScheduler(maxStaleness=maxStaleness, minInterval=settings.synchronizeMinInterval, changeThreshold=settings.synchronizeChangeThreshold,
+                             countChanges=countChanges, saveDetector=saveDetector, saveEventDelay=settings.synchronizeSaveEventDelay,
+                             getRunningJobs=getRunningJobs if settings.synchronizeDeferForJobs else None, clock=clock)
+
+    def getChangeCount(self):
+        """returns the amount of changed folders, or None if they are not known"""
+        if self.changeThreshold <= 0 or self.countChanges is None:
+            return None
+        return self.countChanges()
+
+    def getRunningJobNames(self) -> List[str]:
+        if self.getRunningJobs is None:
+            return []
+        return self.getRunningJobs()
+
+    def getDueReason(self, now: float) -> SyncReason:
+        """returns the reason why a sync is due now, or None if none is due"""
+        sinceLastSync = now - self.lastSync
+        if sinceLastSync >= self.maxStaleness:
+            return SyncReason.STALENESS
+        if sinceLastSync < self.minInterval:
+            return None
+        if self.saveEventAt is not None and now - self.saveEventAt >= self.saveEventDelay:
+            return SyncReason.SAVEEVENT
+        changeCount = self.getChangeCount()
+        if changeCount is not None and changeCount >= self.changeThreshold:
+            return SyncReason.CHANGEVOLUME
+        return None
+
+    def poll(self) -> SyncReason:
+        """
+        call this regularly, returns the reason if a sync should be done now, None otherwise.
+        """
+        now = self.clock()
+        if self.saveDetector is not None and self.saveDetector.poll() and self.saveEventAt is None:
+            log.debug("the game saved, scheduling a sync")
+            self.saveEventAt = now
+        reason = self.getDueReason(now)
+        if reason is None:
+            return None
+        runningJobs = self.getRunningJobNames()
+        if len(runningJobs) > 0 and reason == SyncReason.STALENESS and now - self.lastSync - self.maxStaleness >= self.maxDeferral:
+            log.warning(f"Syncing while {', '.join(runningJobs)} is running, the mirror is {int(now - self.lastSync)} seconds old and can't wait any longer")
+            self.deferredSince = None
+            return reason
+        if len(runningJobs) > 0:
+            if self.deferredSince is None:
+                log.info(f"Deferring the sync due to {reason.value} while {', '.join(runningJobs)} is running")
+                self.deferredSince = now
+            return None
+        if self.deferredSince is not None:
+            log.info(f"Resuming the sync due to {reason.value}, it was deferred for {int(now - self.deferredSince)} seconds")
+            self.deferredSince = None
+        return reason
+
+    def syncDone(self):
+        """call this after a sync finished"""
+        self.lastSync = self.clock()
+        self.saveEventAt = None
+
+    def getNextSync(self) -> NextSync:
+        """
+        returns when the next sync is due at the latest, and why
+        """
+        now = self.clock()
+        sinceLastSync = now - self.lastSync
+        earliest = max(0, self.minInterval - sinceLastSync)
+        candidates = [(self.maxStaleness - sinceLastSync, SyncReason.STALENESS)]
+        if self.saveEventAt is not None:
+            candidates.append((max(earliest, self.saveEventAt + self.saveEventDelay - now), SyncReason.SAVEEVENT))
+        changeCount = self.getChangeCount()
+        if changeCount is not None and changeCount >= self.changeThreshold:
+            candidates.append((earliest, SyncReason.CHANGEVOLUME))
+        dueIn, reason = min(candidates, key=lambda candidate: candidate[0])
+        return NextSync(reason, max(0, dueIn), self.getRunningJobNames())
@@ -0,0 +1,175 @@
+import logging
+import os
+import shutil
+from datetime import timedelta
+from functools import cached_property
+from pathlib import Path
+from typing import List, Set
+from esm.ConfigModels import MainConfig
+from esm.EsmConfigService import EsmConfigService
+from esm.EsmDatabaseWrapper import EsmDatabaseWrapper
+from esm.EsmFileSystem import EsmFileSystem
+from esm.FsTools import FsTools
+from esm.ServiceRegistry import Service, ServiceRegistry
+from esm.Tools import Timer
+
+log = logging.getLogger(__name__)
+
+@Service
+class EsmTieringService:
+    """
+    service that keeps only the hot playfields on the ramdisk.
+
+    Playfields that have not been visited for a while are moved to a cold tier folder on the hdd and linked back into the savegame,
+    so the game can still load them, just slower. Once they get visited again, they are moved back to the ramdisk.
+    Moving playfields around is only safe while the server is stopped.
+    """
+
+    @cached_property
+    def config(self) -> MainConfig:
+        return ServiceRegistry.get(EsmConfigService).config
+
+    @cached_property
+    def fileSystem(self) -> EsmFileSystem:
+        return ServiceRegistry.get(EsmFileSystem)
+
+    def getColdTierPath(self) -> Path:
+        return self.fileSystem.getAbsolutePathTo("saves.gamesmirror.savegamecoldtier")
+
+    def getHotPlayfieldNames(self, database: EsmDatabaseWrapper, coldAfterDays: int = None) -> Set[str]:
+        """
+        returns the names of all playfields that have been visited within the last coldAfterDays days, or that contain players.
+
+        The age is measured against the last time the server was stopped, so a server that was not running for a while won't
+        declare all of its playfields cold.
+        """
+        if coldAfterDays is None:
+            coldAfterDays = self.config.ramdisk.tieringColdAfterDays
+        stopticks, stoptime = database.retrieveLatestGametime()
+        cutoffTick, cutoffTime = database.retrieveLatestGameStoptickWithinDatetime(stoptime - timedelta(days=coldAfterDays))
+        log.debug(f"playfields not visited since gametick {cutoffTick} ({cutoffTime}) are considered cold")
+        lastVisits = database.retrievePFsLastVisit()
+        hotPlayfields = {name for name, gametime in lastVisits.items() if gametime >= cutoffTick}
+        hotPlayfields.update(playfield.name for playfield in database.retrievePFsWithPlayers())
+        return hotPlayfields
+
+    def planTiering(self, playfieldsPath: Path, hotPlayfields: Set[str]):
+        """
+        compares the playfield folders in the savegame with the given hot playfields
+
+        returns a tuple with the list of playfield folders to demote to the cold tier and the list of links to promote back to the ramdisk
+        """
+        demote = []
+        promote = []
+        if not playfieldsPath.exists():
+            return demote, promote
+        for entry in sorted(os.scandir(playfieldsPath), key=lambda entry: entry.name):
+            path = Path(entry.path)
+            if FsTools.isHardLink(path):
+                if entry.name in hotPlayfields:
+                    promote.append(path)
+            elif entry.is_dir() and entry.name not in hotPlayfields:
+                demote.append(path)
+        return demote, promote
+
+    def applyTiering(self, savegamePath: Path = None, coldTierPath: Path = None, dryrun=True):
+        """
+        moves cold playfields from the savegame to the cold tier and promotes playfields that became hot again back to the savegame.
+        Make sure the server is stopped when calling this.
+
+        returns a tuple with the lists of demoted and promoted playfield paths
+        """
+        if savegamePath is None:
+            savegamePath = self.fileSystem.getAbsolutePathTo("saves.games.savegame")
+        if coldTierPath is None:
+            coldTierPath = self.getColdTierPath()
+        playfieldsPath = savegamePath.joinpath(self.config.foldernames.playfields)
+
+        database = EsmDatabaseWrapper(savegamePath.joinpath(self.config.filenames.globaldb))
+        try:
+            hotPlayfields = self.getHotPlayfieldNames(database)
+        finally:
+            database.closeDbConnection()
+        demote, promote = self.planTiering(playfieldsPath, hotPlayfields)
+        log.info(f"Found {len(hotPlayfields)} hot playfields, {len(demote)} playfields to move to the cold tier, {len(promote)} playfields to move back to the ramdisk")
+
+        if dryrun:
+            for path in demote:
+                log.info(f"Would move cold playfield '{path.name}' to the cold tier")
+            for path in promote:
+                log.info(f"Would move hot playfield '{path.name}' back to the ramdisk")
+            self.logTierSizes(playfieldsPath, coldTierPath)
+            return demote, promote
+
+        with Timer() as timer:
+            demoted = [path for path in demote if self.demotePlayfield(path, coldTierPath)]
+            promoted = [path for path in promote if self.promotePlayfield(path, coldTierPath)]
+        log.info(f"Moved {len(demoted)} playfields to the cold tier and {len(promoted)} playfields back to the ramdisk in {timer.elapsedTime}")
+        self.logTierSizes(playfieldsPath, coldTierPath)
+        return demoted, promoted
+
+    def demotePlayfield(self, playfieldPath: Path, coldTierPath: Path):
+        """
+        moves the playfield folder to the cold tier and replaces it with a link. Returns True if that worked.
+        """
+        coldPath = coldTierPath.joinpath(playfieldPath.name)
+        if coldPath.exists():
+            # left over from an earlier tiering, the savegame is the current state
+            log.debug(f"Replacing outdated cold tier copy at '{coldPath}'")
+            shutil.rmtree(coldPath)
+        coldTierPath.mkdir(parents=True, exist_ok=True)
+        shutil.move(playfieldPath, coldPath)
+        if self.fileSystem.createHardLink(linkPath=playfieldPath, linkTargetPath=coldPath):
+            log.debug(f"Moved playfield '{playfieldPath.name}' to the cold tier")
+            return True
+        log.error(f"Could not link playfield '{playfieldPath.name}' to the cold tier, moving it back to the ramdisk")
+        shutil.move(coldPath, playfieldPath)
+        return False
+
+    def promotePlayfield(self, linkPath: Path, coldTierPath: Path):
+        """
+        replaces the link with the playfield folder from the cold tier. Returns True if that worked.
+        """
+        coldPath = coldTierPath.joinpath(linkPath.name)
+        if not coldPath.exists():
+            log.error(f"Playfield '{linkPath.name}' is linked to the cold tier, but there is nothing at '{coldPath}'. Leaving the link as it is.")
+            return False
+        FsTools.deleteLink(linkPath)
+        shutil.move(coldPath, linkPath)
+        log.debug(f"Moved playfield '{linkPath.name}' back to the ramdisk")
+        return True
+
+    def relinkColdPlayfields(self, savegamePath: Path = None, coldTierPath: Path = None) -> List[Path]:
+        """
+        creates the links for all playfields in the cold tier in the (fresh) savegame, call this before syncing the mirror to the ramdisk
+        so the cold playfields are synced through the links instead of being copied to the ramdisk.
+
+        returns the list of created links
+        """
+        if savegamePath is None:
+            savegamePath = self.fileSystem.getAbsolutePathTo("saves.games.savegame")
+        if coldTierPath is None:
+            coldTierPath = self.getColdTierPath()
+        links = []
+        if not coldTierPath.exists():
+            return links
+        playfieldsPath = savegamePath.joinpath(self.config.foldernames.playfields)
+        playfieldsPath.mkdir(parents=True, exist_ok=True)
+        for entry in os.scandir(coldTierPath):
+            linkPath = playfieldsPath.joinpath(entry.name)
+            if not entry.is_dir() or linkPath.exists():
+                continue
+            if self.fileSystem.createHardLink(linkPath=linkPath, linkTargetPath=Path(entry.path)):
+                links.append(linkPath)
+        log.info(f"Linked {len(links)} playfields from the cold tier at '{coldTierPath}'")
+        return links
+
+    def getTierSizes(self, playfieldsPath: Path, coldTierPath: Path):
+        """
+        returns the size in bytes of the hot tier (playfields in the savegame, not following the links) and the cold tier
+        """
+        return FsTools.getFolderSize(playfieldsPath), FsTools.getFolderSize(coldTierPath)
+
+    def logTierSizes(self, playfieldsPath: Path, coldTierPath: Path):
+        hotSize, coldSize = self.getTierSizes(playfieldsPath, coldTierPath)
+        log.info(f"Hot tier (ramdisk) playfields: {FsTools.realToHumanFileSize(hotSize)}, cold tier (hdd) playfields: {FsTools.realToHumanFileSize(coldSize)}")
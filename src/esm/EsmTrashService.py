@@ -0,0 +1,208 @@
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from functools import cached_property
+from pathlib import Path
+from threading import Event, Thread
+from typing import List
+
+from esm.ConfigModels import MainConfig
+from esm.EsmConfigService import EsmConfigService
+from esm.FsTools import FsTools
+from esm.ServiceRegistry import Service, ServiceRegistry
+from esm.Tools import Timer, TokenBucket, lowerThreadPriority
+from esm.exceptions import SafetyException
+
+log = logging.getLogger(__name__)
+
+@Service
+class EsmTrashService:
+    """
+    Service that provides the deferred "rename-to-trash" deletion.
+
+    Instead of deleting millions of files while the server is down, the targets are renamed into a trash folder on the same volume,
+    which is an O(1) operation per target. The trash is then emptied by a throttled background reclaimer while the server is running.
+
+    Since everything inside a trash folder is garbage, the reclaimer just picks up whatever is left in there after a crash or restart.
+    """
+    reclaimerThread: Thread = None
+    reclaimerShutdownEvent: Event = None
+
+    def __init__(self):
+        self.usedTrashFolders: set[Path] = set()
+        """trash folders this instance moved something into, so the reclaimer also empties them"""
+
+    @cached_property
+    def config(self) -> MainConfig:
+        return ServiceRegistry.get(EsmConfigService).config
+
+    def getInstallTrashFolder(self) -> Path:
+        return Path(f"{self.config.paths.install}/{self.config.foldernames.trash}").absolute()
+
+    def getKnownTrashFolders(self) -> List[Path]:
+        """
+        returns the list of trash folders that may contain something to reclaim, including the ones used by this process
+        """
+        trashFolders = [self.getInstallTrashFolder()]
+        if self.config.general.useRamdisk:
+            trashFolders.append(Path(f"{self.config.ramdisk.drive}/{self.config.foldernames.trash}"))
+        for additionalDelete in self.config.deletes.additionalDeletes:
+            trashFolders.append(Path(Path(additionalDelete).anchor).joinpath(self.config.foldernames.trash))
+        for usedTrashFolder in self.usedTrashFolders:
+            if usedTrashFolder not in trashFolders:
+                trashFolders.append(usedTrashFolder)
+        return trashFolders
+
+    def getTrashFolderFor(self, path: Path) -> Path:
+        """
+        returns the trash folder on the same volume as the given path, or None if there is no usable one.
+        """
+        installTrash = self.getInstallTrashFolder()
+        try:
+            pathDevice = os.stat(path, follow_symlinks=False).st_dev
+            if installTrash.parent.exists() and os.stat(installTrash.parent).st_dev == pathDevice:
+                return installTrash
+            anchorTrash = Path(path.anchor).joinpath(self.config.foldernames.trash)
+            if os.stat(anchorTrash.parent).st_dev == pathDevice:
+                return anchorTrash
+        except OSError as ex:
+            log.debug(f"could not determine the volume of '{path}': {ex}")
+        return None
+
+    def moveToTrash(self, path: Path) -> bool:
+        """
+        atomically renames the given path into the trash folder on the same volume.
+
+        returns True if the path was moved, False if this was not possible and the caller should delete the path directly.
+        """
+        path = Path(path).absolute()
+        trashFolder = self.getTrashFolderFor(path)
+        if trashFolder is None:
+            log.debug(f"no trash folder on the same volume as '{path}' found")
+            return False
+        if trashFolder == path or path in trashFolder.parents:
+            log.debug(f"will not move '{path}' into the trash folder '{trashFolder}', since that is part of it")
+            return False
+        try:
+            trashFolder.mkdir(parents=True, exist_ok=True)
+            trashEntry = trashFolder.joinpath(f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}_{path.name}")
+            log.debug(f"moving '{path}' to trash at '{trashEntry}'")
+            os.rename(path, trashEntry)
+        except OSError as ex:
+            log.warning(f"could not move '{path}' into the trash at '{trashFolder}', it will be deleted directly. Reason: {ex}")
+            return False
+        self.usedTrashFolders.add(trashFolder)
+        return True
+
+    def reclaim(self, trashFolders: List[Path]=None, rate: int=None, event: Event=None, bytesPerSecond: int=None):
+        """
+        deletes the content of the given trash folders (or all known ones), deleting at most $rate files and folders and $bytesPerSecond bytes
+        per second. If the event is set, the reclaim will stop as soon as possible, the rest will be reclaimed on the next call.
+
+        returns the amount of deleted files and folders and the elapsed time
+        """
+        if trashFolders is None:
+            trashFolders = self.getKnownTrashFolders()
+        if rate is None:
+            rate = self.config.deletes.trashReclaimRate
+        if bytesPerSecond is None:
+            bytesPerSecond = 0
+            if self.config.deletes.trashReclaimBandwidth:
+                bytesPerSecond = FsTools.humanToRealFileSize(self.config.deletes.trashReclaimBandwidth)
+        bandwidth = TokenBucket(bytesPerSecond)
+
+        deleted = 0
+        with Timer() as timer:
+            start = time.time()
+            for trashFolder in trashFolders:
+                if not trashFolder.exists():
+                    continue
+                if trashFolder.name != self.config.foldernames.trash:
+                    raise SafetyException(f"prevented reclaiming '{trashFolder}' since it is not a trash folder")
+                for entry in list(os.scandir(trashFolder)):
+                    deleted = self.reclaimEntry(Path(entry.path), deleted, start, rate, event, bandwidth)
+                    if event is not None and event.is_set():
+                        break
+        if deleted > 0:
+            log.info(f"Reclaimed {deleted} files and folders from the trash in {timer.elapsedTime}")
+        return deleted, timer.elapsedTime
+
+    def reclaimEntry(self, entryPath: Path, deleted: int, start: float, rate: int, event: Event=None, bandwidth: TokenBucket=None):
+        """
+        deletes the given trash entry bottom-up, throttled to the given rate and the bytes the bandwidth allows. Links are just removed, never followed.
+
+        returns the updated amount of deleted files and folders
+        """
+        stack = [(entryPath, False)]
+        while stack:
+            if event is not None and event.is_set():
+                return deleted
+            path, visited = stack.pop()
+            try:
+                if FsTools.isHardLink(path):
+                    FsTools.deleteLink(path)
+                elif path.is_dir():
+                    if visited:
+                        path.rmdir()
+                    else:
+                        stack.append((path, True))
+                        stack.extend((Path(child.path), False) for child in os.scandir(path))
+                        continue
+                else:
+                    size = path.lstat().st_size
+                    self.deleteFile(path)
+                    if bandwidth is not None:
+                        bandwidth.consume(size, event)
+            except OSError as ex:
+                log.debug(f"could not reclaim '{path}', will retry on the next run: {ex}")
+                continue
+            deleted += 1
+            if rate > 0 and deleted % 100 == 0:
+                ahead = deleted / rate - (time.time() - start)
+                if ahead > 0:
+                    if event is not None:
+                        event.wait(ahead)
+                    else:
+                        time.sleep(ahead)
+        return deleted
+
+    def deleteFile(self, path: Path):
+        try:
+            path.unlink(missing_ok=True)
+        except PermissionError:
+            # read-only files can not be deleted on windows, so just remove the flag and try again.
+            os.chmod(path, 0o666)
+            path.unlink(missing_ok=True)
+
+    def startReclaimer(self, interval=60):
+        """
+        starts a separate thread for the reclaimer, that will empty the trash folders every $interval seconds
+        """
+        if self.reclaimerThread is not None and self.reclaimerThread.is_alive():
+            log.debug("trash reclaimer is already running")
+            return
+        self.reclaimerShutdownEvent = Event()
+        self.reclaimerThread = Thread(target=self.reclaimerTask, args=(self.reclaimerShutdownEvent, interval), daemon=True)
+        self.reclaimerThread.start()
+        log.debug(f"trash reclaimer started with an interval of {interval}, a rate of {self.config.deletes.trashReclaimRate} and a bandwidth of {self.config.deletes.trashReclaimBandwidth}")
+
+    def reclaimerTask(self, event: Event, interval):
+        lowerThreadPriority()
+        while not event.is_set():
+            try:
+                self.reclaim(event=event)
+            except Exception as ex:
+                log.error(f"error while reclaiming the trash: {ex}")
+            event.wait(interval)
+        log.debug("trash reclaimer shut down")
+
+    def stopReclaimer(self):
+        if not self.reclaimerShutdownEvent:
+            log.debug("Can not stop trash reclaimer thread since there is probably none running.")
+            return
+        self.reclaimerShutdownEvent.set()
+        log.debug("waiting for trash reclaimer thread to finish")
+        self.reclaimerThread.join()
+        log.debug(f"trash reclaimer stopped")
@@ -10,6 +10,7 @@ from esm.DataTypes import Entity, Playfield, SolarSystem, Territory, WipeType
 from esm.EsmConfigService import EsmConfigService
 from esm.EsmDatabaseWrapper import EsmDatabaseWrapper
 from esm.EsmFileSystem import EsmFileSystem
+from esm.EsmPurgeJournal import EsmPurgeJournal
 from esm.ServiceRegistry import Service, ServiceRegistry
 from esm.Tools import Timer
 
@@ -22,6 +23,9 @@ class EsmWipeService:
 
     optimized for huge savegames, just when you need to wipe a whole galaxy without affecting players.
     """
+    PURGEEMPTYPLAYFIELDSJOURNAL = "purge-empty-playfields"
+    CLEANUPSHAREDFOLDERJOURNAL = "cleanup-shared-folder"
+
     @cached_property
     def config(self) -> MainConfig:
         return ServiceRegistry.get(EsmConfigService).config
@@ -204,21 +208,67 @@ class EsmWipeService:
             self.printListOfEntitiesAsCSV(csvFilename=csvFilename, entities=entities)
 
         else:
+            journal = self.getPurgeJournal(self.PURGEEMPTYPLAYFIELDSJOURNAL)
+            self.warnOnUnfinishedJournal(journal)
             log.info(f"Purging {len(playfields)} playfields and {len(entities)} contained entities from the file system.")
             if cleardiscoveredby and len(playfields) > 0:
                 self.clearDiscoveredByInfoForPlayfields(playfields=playfields, database=database, dryrun=dryrun, closeConnection=True, doPrint=False)
             log.debug(f"Purging {len(playfields)} playfields")
             pfCounter, tpCounter = self.deletePlayfieldFiles(playfields, leavetemplates)
             log.debug(f"Purging {len(entities)} entities")
-            enCounter = self.deleteEntityFiles(entities)
+            enCounter = self.deleteEntityFiles(self.fileSystem.getAbsolutePathTo("saves.games.savegame.shared"), entities)
 
             additionalInfo = f"{pfCounter} playfield folders, {tpCounter} template folders and {enCounter} entity folders marked for deletion."
+            journal.reset()
             if force:
-                result, elapsedTime = self.fileSystem.commitDelete(override="yes", additionalInfo=additionalInfo)
+                result, elapsedTime = self.fileSystem.commitDelete(override="yes", additionalInfo=additionalInfo, journal=journal)
             else:
-                result, elapsedTime = self.fileSystem.commitDelete(additionalInfo=additionalInfo)
+                result, elapsedTime = self.fileSystem.commitDelete(additionalInfo=additionalInfo, journal=journal)
             log.info(f"Deleting took {elapsedTime}")
 
+    def getPurgeJournal(self, name) -> EsmPurgeJournal:
+        """
+        returns the purge journal for the purge operation with the given name
+        """
+        return EsmPurgeJournal(Path(f"esm-{name}.journal").absolute(), batchSize=self.config.deletes.purgeJournalBatchSize)
+
+    def warnOnUnfinishedJournal(self, journal: EsmPurgeJournal):
+        if journal.isUnfinished():
+            log.warning(f"Found the journal of an unfinished purge at '{journal.journalPath}'. You could have finished it with --resume, it will be replaced by this purge now.")
+
+    def resumePurge(self, name, force=False):
+        """
+        finishes an interrupted purge operation from its journal, without recomputing what to delete.
+        """
+        journal = self.getPurgeJournal(name)
+        remaining = journal.read()
+        if journal.complete or len(remaining) < 1:
+            log.info(f"There is no unfinished purge in journal '{journal.journalPath}'. Nothing to resume.")
+            return
+        log.info(f"Resuming purge from journal '{journal.journalPath}': {len(journal.done)} of {len(journal.planned)} targets were already deleted.")
+
+        # targets that were deleted right before the interruption do not have their completion mark yet
+        journal.begin([])
+        for path, native in remaining:
+            if path.exists(follow_symlinks=False):
+                self.fileSystem.markForDelete(path, native=native)
+            else:
+                journal.markDone(path)
+        if len(self.fileSystem.getPendingDeletePaths()) < 1:
+            journal.finish()
+            log.info(f"All targets of the journal have already been deleted.")
+            return
+
+        additionalInfo = f"{len(self.fileSystem.getPendingDeletePaths())} remaining targets of the interrupted purge marked for deletion."
+        try:
+            if force:
+                result, elapsedTime = self.fileSystem.commitDelete(override="yes", additionalInfo=additionalInfo, journal=journal)
+            else:
+                result, elapsedTime = self.fileSystem.commitDelete(additionalInfo=additionalInfo, journal=journal)
+        finally:
+            journal.close()
+        log.info(f"Resumed purge done, deleting took {elapsedTime}")
+
     def deletePlayfieldFiles(self, playfields: List[Playfield], leavetemplates=False):
         """marks the folders associated with the given playfields from 'Playfields' and 'Templates' for deletion
 
@@ -355,13 +405,16 @@ class EsmWipeService:
             with open(filename, "w", encoding="utf-8") as file:
                 file.writelines([line + '\n' for line in idsOnFsNotInDb])
         else:
+            journal = self.getPurgeJournal(self.CLEANUPSHAREDFOLDERJOURNAL)
+            self.warnOnUnfinishedJournal(journal)
             for id in idsOnFsNotInDb:
                 self.fileSystem.markForDelete(sharedFolderPath.joinpath(id))
 
+            journal.reset()
             if force:
-                result, elapsedTime = self.fileSystem.commitDelete(override="yes", additionalInfo=additionalInfo)
+                result, elapsedTime = self.fileSystem.commitDelete(override="yes", additionalInfo=additionalInfo, journal=journal)
             else:
-                result, elapsedTime = self.fileSystem.commitDelete(additionalInfo=additionalInfo)
+                result, elapsedTime = self.fileSystem.commitDelete(additionalInfo=additionalInfo, journal=journal)
 
             if result:
                 log.info(f"Deleted {len(idsOnFsNotInDb)} folders in {elapsedTime}")
@@ -3,6 +3,7 @@ import os
 import re
 import shutil
 import subprocess
+import sys
 import logging
 from glob import glob
 from pathlib import Path
@@ -25,10 +26,18 @@ class FsTools:
     @staticmethod
     def createLink(linkPath, targetPath):
         """
-        create a windows hardlink (jointpoint) as link to the linktarget using mklink
+        create a windows hardlink (jointpoint) as link to the linktarget using mklink, or a symlink on other platforms
 
         return True if creating the link was successful
         """
+        if sys.platform != "win32":
+            log.debug(f"symlink \"{linkPath}\" -> \"{targetPath}\"")
+            try:
+                os.symlink(targetPath, linkPath, target_is_directory=True)
+                return True
+            except OSError as ex:
+                log.error(f"error creating the symlink: {ex}")
+                return False
         # looks like none of the python-libraries can do this without running into problems
         # calling the shell command works flawlessly...
         log.debug(f"mklink /H /J \"{linkPath}\" \"{targetPath}\"")
@@ -47,7 +56,10 @@ class FsTools:
     @staticmethod
     def deleteLink(linkPath):
         linkPath = Path(linkPath)
-        if linkPath.is_dir():
+        if linkPath.is_symlink():
+            # symlinks to directories can not be removed with rmdir outside of windows
+            linkPath.unlink()
+        elif linkPath.is_dir():
             linkPath.rmdir()
         else:
             linkPath.unlink(missing_ok=True)
@@ -83,8 +95,11 @@ class FsTools:
         """
         returns the link target path of a given link
         """
-        linkInfo = link.readlink()
-        linkTarget = Path(linkInfo.as_posix()[4:]).resolve()
+        linkInfo = str(Path(link).readlink())
+        # junctions are read with the \\?\ prefix
+        if linkInfo.startswith("\\\\?\\"):
+            linkInfo = linkInfo[4:]
+        linkTarget = Path(link).parent.joinpath(linkInfo).resolve()
         return linkTarget
 
     # @staticmethod
@@ -112,6 +127,10 @@ class FsTools:
             log.warn(f"prevented delete of path {targetPath} since it has a depth lower than {FsTools.MIN_PATH_DEPTH_FOR_DELETE}")
             raise SafetyException(f"prevented delete of path {targetPath} since it has a depth lower than {FsTools.MIN_PATH_DEPTH_FOR_DELETE}")
 
+        if sys.platform != "win32":
+            shutil.rmtree(targetPath, ignore_errors=True)
+            return
+
         cmd = ["del", "/F", "/Q", "/S", targetPath]
         log.debug(f"executing {cmd}")
         process = subprocess.run(cmd, shell=True)
@@ -168,6 +187,78 @@ class FsTools:
             destination = Path(f"{destination}/{source.name}")
         shutil.copytree(source, destination, dirs_exist_ok=True)
 
+    @staticmethod
+    def moveTree(source: Path, destination: Path):
+        """
+        moves the content of source into destination, merging it with what is there already, and removes source.
+        the portable alternative to robocopy /MOVE /E
+        """
+        source = Path(source)
+        destination = Path(destination)
+        if not destination.exists() and not FsTools.isHardLink(source):
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(source, destination)
+            return
+        destination.mkdir(parents=True, exist_ok=True)
+        for entry in os.scandir(source):
+            target = destination.joinpath(entry.name)
+            if entry.is_dir() and target.is_dir():
+                FsTools.moveTree(Path(entry.path), target)
+            else:
+                if target.is_dir() and not FsTools.isHardLink(target):
+                    shutil.rmtree(target)
+                shutil.move(entry.path, target)
+        if FsTools.isHardLink(source):
+            FsTools.deleteLink(source)
+        else:
+            source.rmdir()
+
+    @staticmethod
+    def mirrorTree(source: Path, destination: Path):
+        """
+        makes destination an exact copy of source, only copying files that differ in size or modification time
+        and deleting what is not in source. The portable alternative to robocopy /MIR
+        """
+        source = Path(source)
+        destination = Path(destination)
+        destination.mkdir(parents=True, exist_ok=True)
+        sourceEntries = {entry.name: entry for entry in os.scandir(source)}
+        for entry in os.scandir(destination):
+            sourceEntry = sourceEntries.get(entry.name)
+            if sourceEntry is None or sourceEntry.is_dir() != entry.is_dir():
+                if entry.is_dir() and not FsTools.isHardLink(entry.path):
+                    shutil.rmtree(entry.path)
+                else:
+                    FsTools.deleteLink(entry.path)
+        for name, entry in sourceEntries.items():
+            target = destination.joinpath(name)
+            if entry.is_dir():
+                FsTools.mirrorTree(Path(entry.path), target)
+            else:
+                stat = entry.stat()
+                if target.exists():
+                    targetStat = target.stat()
+                    if targetStat.st_size == stat.st_size and targetStat.st_mtime_ns == stat.st_mtime_ns:
+                        continue
+                shutil.copy2(entry.path, target)
+
+    @staticmethod
+    def getFolderSize(folderPath: Path) -> int:
+        """ returns the size in bytes of all files below the folder, links are not followed """
+        size = 0
+        if not Path(folderPath).exists():
+            return size
+        folders = [folderPath]
+        while folders:
+            for entry in os.scandir(folders.pop()):
+                if FsTools.isHardLink(entry.path):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                else:
+                    size += entry.stat(follow_symlinks=False).st_size
+        return size
+
     @staticmethod
     def realToHumanFileSize(size: int) -> str:
         return humanize.naturalsize(size, gnu=True)
@@ -4,7 +4,11 @@ import re
 import shutil
 import socket
 import subprocess
+import sys
+import threading
+import time
 import traceback
+import psutil
 from ruamel.yaml import YAML
 from datetime import timedelta
 from pathlib import Path
@@ -74,6 +78,119 @@ class Timer:
     def __exit__(self, exc_type, exc_value, traceback):
         self.elapsedTime = getElapsedTime(self.start)
 
+class TokenBucket:
+    """
+    thread safe token bucket that limits something to a rate per second, allowing bursts of up to capacity.
+    A rate of 0 means unlimited. Consuming more tokens than available books them as debt, so the caller (and everyone
+    coming after) has to wait until the debt is paid back, which makes it work for amounts larger than the capacity too.
+    """
+    def __init__(self, rate: float, capacity: float = None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.clock = clock
+        self.lastRefill = clock()
+        self.lock = threading.Lock()
+
+    def consume(self, amount: float, event: threading.Event = None) -> float:
+        """
+        takes the amount of tokens, waiting until they are available. Returns the seconds waited.
+        If the event is given and gets set, the waiting is cut short.
+        """
+        waitTime = self.reserve(amount)
+        if waitTime > 0:
+            if event is not None:
+                event.wait(waitTime)
+            else:
+                time.sleep(waitTime)
+        return waitTime
+
+    def reserve(self, amount: float) -> float:
+        """
+        takes the amount of tokens without waiting and returns the seconds the caller has to wait before using them, for callers that
+        can't block, like coroutines on an event loop.
+        """
+        if self.rate <= 0:
+            return 0
+        with self.lock:
+            self.refill()
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def setRate(self, rate: float, capacity: float = None):
+        """changes the rate and capacity, the tokens gathered until now still count with the old rate"""
+        with self.lock:
+            if self.rate > 0:
+                self.refill()
+            else:
+                # coming from unlimited, start with a full bucket
+                self.tokens = capacity if capacity is not None else rate
+                self.lastRefill = self.clock()
+            self.rate = rate
+            self.capacity = capacity if capacity is not None else rate
+            self.tokens = min(self.capacity, self.tokens)
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.lastRefill) * self.rate)
+        self.lastRefill = now
+
+def lowerThreadPriority():
+    """
+    lowers the cpu and io priority of the calling thread, so it interferes less with the game server.
+    Uses the background mode for threads on windows, since psutil can only change the priority of whole processes there.
+    """
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+            kernel32 = ctypes.windll.kernel32
+            if not kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN):
+                log.debug(f"could not set background mode for thread {threading.current_thread().name}")
+        else:
+            # on linux, threads are processes too, so psutil can change the priority of just this thread
+            thread = psutil.Process(threading.get_native_id())
+            thread.nice(10)
+            if hasattr(psutil, "IOPRIO_CLASS_IDLE"):
+                thread.ionice(psutil.IOPRIO_CLASS_IDLE)
+    except (OSError, psutil.Error) as ex:
+        log.debug(f"could not lower the priority of thread {threading.current_thread().name}: {ex}")
+
+class LagProbe:
+    """
+    context manager that measures how late a thread that sleeps for short intervals wakes up, while the statements within are executed.
+    This is a rough measure for the scheduling lag something adds to the system.
+    Usage:
+        with LagProbe() as probe:
+            # do_something_heavy
+        print(probe.maxLag, probe.averageLag)
+    """
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples = []
+        self.stopEvent = threading.Event()
+        self.thread = None
+        self.maxLag = timedelta(0)
+        self.averageLag = timedelta(0)
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.probe, daemon=True, name="LagProbe")
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stopEvent.set()
+        self.thread.join()
+        if self.samples:
+            self.maxLag = timedelta(seconds=max(self.samples))
+            self.averageLag = timedelta(seconds=sum(self.samples) / len(self.samples))
+
+    def probe(self):
+        while not self.stopEvent.is_set():
+            start = getTimer()
+            time.sleep(self.interval)
+            self.samples.append(max(0, getTimer() - start - self.interval))
+
 def mergeDicts(a: dict, b: dict, path=[], logOverwrites=False, allowOverwrites=True):
     """
     deep merges dict b into dict a, will mutate dict a in the process. same keys will be overwritten by default.
@@ -34,6 +34,15 @@ class SafetyException(EsmException):
 class WrongParameterError(EsmException):
     pass
 
+class DatabaseCaptureError(EsmException):
+    pass
+
+class PackedMirrorError(EsmException):
+    pass
+
+class BackupFailedError(EsmException):
+    pass
+
 
 class ExitCodes:
     """
@@ -47,3 +56,5 @@ class ExitCodes:
     """when the script was interrupted by the user, probably by ctrl+c (sigint)"""
     MISSING_CONFIG = 20
     """no config file found"""
+    BACKUP_INVALID = 30
+    """a verified backup does not match its manifest"""
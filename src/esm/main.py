@@ -40,11 +40,11 @@ click.rich_click.COMMAND_GROUPS = {
         },
         {
             "name": "Ramdisk commands",
-            "commands": ["ramdisk-install", "ramdisk-setup", "ramdisk-remount", "ramdisk-uninstall"],
+            "commands": ["ramdisk-install", "ramdisk-setup", "ramdisk-remount", "ramdisk-uninstall", "ramdisk-sync", "ramdisk-tiering", "ramdisk-capacity"],
         },
         {
             "name": "Server commands",
-            "commands": ["server-start", "server-resume", "server-stop", "backup-create", "backup-static-create"],
+            "commands": ["server-start", "server-resume", "server-stop", "backup-create", "backup-replicate", "backup-verify", "backup-static-create", "backup-static-restore", "backup-restore"],
         },
         {
             "name": "Game commands",
@@ -54,6 +54,14 @@ click.rich_click.COMMAND_GROUPS = {
             "name": "Tool commands",
             "commands": [
                 "tool-deletecache",
+                "tool-prune-cache",
+                "tool-empty-trash",
+                "tool-io-queue",
+                "tool-unpack-mirror",
+                "tool-benchmark-mirror",
+                "tool-benchmark-ramdisk",
+                "tool-benchmark-static-backup",
+                "tool-maintenance",
                 "tool-wipe", 
                 "tool-cleanup-removed-entities", 
                 "tool-cleanup-shared", 
@@ -145,6 +153,44 @@ def ramdiskRemount():
         esm.ramdiskRemount()
 
 
+@cli.command(name="ramdisk-sync", short_help="syncs the ramdisk to the mirror once")
+@click.option("--synchronizer", type=click.Choice(["robocopy", "native"]), default=None, help="the synchronizer to use, defaults to the configured one")
+@click.option("--fullscan", is_flag=True, default=False, help="native synchronizer only: ignore the manifest and compare with the mirror, use this if the mirror was changed by something else")
+def ramdiskSync(synchronizer, fullscan):
+    """Syncs the ramdisk to the mirror once, just like the synchronizer does while the server is running. Shows how long that took, which can be used to compare the synchronizers.\n
+    \n
+    This can be done while the server is running.
+    """
+    with LogContext():
+        esm = ServiceRegistry.get(EsmMain)
+        esm.ramdiskSync(synchronizer=synchronizer, fullScan=fullscan)
+
+
+@cli.command(name="ramdisk-capacity", short_help="shows the ramdisk usage, its growth and when it will be full")
+def ramdiskCapacity():
+    """Samples the usage of the ramdisk and the size of the top level folders of the savegame, adds that to the capacity history and shows how fast it grows and when it will be full at that rate.\n
+    \n
+    While the server is running, this is done every ramdisk.capacityMonitorInterval seconds, warning in the log and in game before the ramdisk is full.
+    """
+    with LogContext():
+        esm = ServiceRegistry.get(EsmMain)
+        esm.ramdiskCapacity()
+
+
+@cli.command(name="ramdisk-tiering", short_help="moves cold playfields from the ramdisk to the hdd and hot ones back")
+@click.option("--nodryrun", is_flag=True, default=False, help="set to actually move the playfields, otherwise it will just show what would be moved")
+def ramdiskTiering(nodryrun):
+    """Moves playfields that have not been visited for ramdisk.tieringColdAfterDays days from the ramdisk to a cold tier on the hdd, leaving a link behind. Playfields that got visited again are moved back to the ramdisk. Shows the size of both tiers afterwards.\n
+    \n
+    If ramdisk.tiering is enabled, this is done automatically after the server shut down.\n
+    The server needs to be stopped when using --nodryrun.
+    """
+    with LogContext():
+        esm = ServiceRegistry.get(EsmMain)
+        esm.checkAndWaitForOtherInstances()
+        esm.ramdiskTiering(dryrun=not nodryrun)
+
+
 @cli.command(name="ramdisk-uninstall", short_help="reverts the changes done by ramdisk-install")
 @click.option("--force", is_flag=True, default=False, help="force uninstall even if the configuration says to use a ramdisk")
 def ramdiskUninstall(force):
@@ -207,11 +253,39 @@ def resumeServer():
 
 
 @cli.command(name="backup-create", short_help="creates a fast rolling backup from the savegame mirror")
-def createBackup():
+@click.option('--replicate/--noreplicate', default=None, help="replicate the new backup to backups.replicationTarget afterwards, defaults to backups.replicateAfterBackup")
+def createBackup(replicate):
     """Creates a new rolling mirror backup of the savegame mirror, can be done while the server is running if it is in ramdisk mode."""
     with LogContext():
         esm = ServiceRegistry.get(EsmMain)
-        esm.createBackup()
+        esm.createBackup(replicate=replicate)
+
+
+@cli.command(name="backup-replicate", short_help="copies the latest rolling backup to the replication target")
+def replicateBackup():
+    """
+        Replicates the latest rolling backup to backups.replicationTarget, e.g. another disk or a mounted network share. Only files that changed since the last replication are transferred, limited to backups.replicationBandwidth. An interrupted replication is resumed where it stopped.
+        Schedule this on its own, or let backup-create do it with --replicate or backups.replicateAfterBackup.
+    """
+    with LogContext():
+        esm = ServiceRegistry.get(EsmMain)
+        esm.replicateBackup()
+
+
+@cli.command(name="backup-verify", short_help="checks that rolling backups are complete and not corrupted")
+@click.option('--number', type=int, metavar='<number>', help="number of the rolling backup to verify, defaults to the latest one")
+@click.option('--all', 'all', is_flag=True, help="verify all rolling backups")
+@click.option('--quick', is_flag=True, help="only compare sizes and modification times instead of hashing the files, finds missing and changed files but not corrupted ones")
+def verifyBackup(number, all, quick):
+    """
+        Verifies rolling backups against the manifest that was written when they were created, by hashing all their files again on multiple threads.
+        The read bandwidth can be limited with backups.verifyBandwidth, so this can run while the server is running. Shows the verified bytes per second and all files that are missing, changed, corrupt or unexpected.
+        Backups created before esm wrote manifests can't be verified.
+    """
+    with LogContext():
+        esm = ServiceRegistry.get(EsmMain)
+        if not esm.verifyBackup(number=number, all=all, quick=quick):
+            sys.exit(ExitCodes.BACKUP_INVALID)
 
 
 @cli.command(name="backup-static-create", short_help="creates a static zipped backup from the latest rolling backup")
@@ -222,6 +296,40 @@ def createStaticBackup():
         esm.createStaticBackup()
 
 
+@cli.command(name="backup-static-restore", short_help="restores a (differential) static backup to a folder")
+@click.option('--backup', metavar='<zip>', required=True, help="file name of the static backup zip in the backup folder, or the path to it")
+@click.option('--target', metavar='<path>', required=True, help="the folder to restore the backup to, must be empty or not exist yet")
+@click.option('--verify', is_flag=True, help="check the restored files against the hashes in the manifest")
+def restoreStaticBackup(backup, target, verify):
+    """
+        Restores a static backup that was created with backups.staticBackupDifferential to the given folder, exactly as the rolling backup looked like when the static backup was created.
+        For a differential backup, every file is taken from the zip of the chain that contains its latest version, so all zips of the chain back to the last full static backup need to be there.
+        Copy what you need from the restored folder afterwards.
+    """
+    with LogContext():
+        esm = ServiceRegistry.get(EsmMain)
+        esm.restoreStaticBackup(backup=backup, target=target, verify=verify)
+
+
+@cli.command(name="backup-restore", short_help="restores single playfields, entities or the database from a backup")
+@click.option('--backup', metavar='<backup>', help="number of the rolling backup, or file name of a static backup zip in the backup folder, or the path to it. Defaults to the latest rolling backup")
+@click.option('--playfield', 'playfields', metavar='<name>', multiple=True, help="name of a playfield to restore together with its template, can be given multiple times")
+@click.option('--entity', 'entities', metavar='<id>', multiple=True, help="id of an entity to restore from the Shared folder, can be given multiple times")
+@click.option('--db', is_flag=True, help="restore the database")
+@click.option('--nodryrun', is_flag=True, help="set to actually restore, otherwise it will just list what would be restored")
+def restoreFromBackup(backup, playfields, entities, db, nodryrun):
+    """
+        Restores single playfields (with their templates), entities from the Shared folder or the database from a backup into the current savegame, replacing the current ones.
+        Only the selected parts are read: from a rolling backup (also a packed one) just their folders, from a static zip just their members, found through the central directory of the zip. Static backups created with backups.staticBackupDifferential are restored from the zips of their chain.\n
+        \n
+        Defaults to a dry run that lists what would be restored. The server needs to be stopped when using --nodryrun. The replaced parts go into the trash if deletes.useTrash is enabled. In ramdisk mode, the mirror is synced right after.
+    """
+    with LogContext():
+        esm = ServiceRegistry.get(EsmMain)
+        esm.checkAndWaitForOtherInstances()
+        esm.restoreFromBackup(backup=backup, playfields=list(playfields), entities=list(entities), database=db, dryrun=not nodryrun)
+
+
 @cli.command(name="game-install", short_help="installs the Empyrion Galactic Survival Dedicated Server via steam")
 def installGame():
     """Installs the game via steam using the configured paths."""
@@ -296,7 +404,8 @@ def deleteAll(doit):
 @click.option('--minimumage', default=30, show_default=True, help=f"age a playfield has to have for it to get purged in *days*")
 @click.option('--leavetemplates', is_flag=True, help=f"if set, do not delete the related templates")
 @click.option('--force', is_flag=True, help=f"if set, do not ask interactively before file deletion")
-def purgeEmptyPlayfieldsOld(dblocation, nodryrun, nocleardiscoveredby, minimumage, leavetemplates, force):
+@click.option('--resume', is_flag=True, help=f"if set, finish an interrupted purge from its journal instead of starting a new one")
+def purgeEmptyPlayfieldsOld(dblocation, nodryrun, nocleardiscoveredby, minimumage, leavetemplates, force, resume):
     """Will *purge* playfields without players, player owned structures, terrain placeables for the whole galaxy.
     This requires the server to be shut down, since it needs access to the current state of the savegame and the filesystem.
 
@@ -306,6 +415,8 @@ def purgeEmptyPlayfieldsOld(dblocation, nodryrun, nocleardiscoveredby, minimumag
     Defaults to use a dryrun, so the results are only written to a csv file for you to check.
     If you use the dry mode just to see how it works, you may aswell define a different savegame database.
     When NOT in dry mode, you can NOT specify a different database to make sure you do not accidentally purge the wrong playfields folder.
+
+    Every purge writes a journal of what it deletes. If a purge got interrupted, use --resume to finish it without recalculating everything.
     """
     # TODO: this needs to also clean up the related data in the DB, mark entities and structures as deleted, etc.
     with LogContext():
@@ -317,7 +428,7 @@ def purgeEmptyPlayfieldsOld(dblocation, nodryrun, nocleardiscoveredby, minimumag
         if nodryrun and dblocation:
             log.error(f"--nodryrun and --dblocation can not be used together for safety reasons.")
         else:
-            esm.purgeEmptyPlayfieldsOld(dbLocation=dblocation, dryrun=not nodryrun, cleardiscoveredby=not nocleardiscoveredby, minimumage=minimumage, leavetemplates=leavetemplates, force=force)
+            esm.purgeEmptyPlayfieldsOld(dbLocation=dblocation, dryrun=not nodryrun, cleardiscoveredby=not nocleardiscoveredby, minimumage=minimumage, leavetemplates=leavetemplates, force=force, resume=resume)
 
 
 @cli.command(name="tool-purge-wiped-playfields", short_help="purges all playfields that are marked to be completely wiped")
@@ -362,16 +473,19 @@ def toolCleanupRemovedEntities(savegame, nodryrun, force):
 @click.option('--savegame', metavar='<path>', help="location of savegame to use, e.g. to use this on a different savegame or savegame copy") 
 @click.option('--nodryrun', is_flag=True, help="set to actually execute the purge on the disk")
 @click.option('--force', is_flag=True, help=f"if set, do not ask interactively before file deletion, use with caution")
-def toolCleanupShared(savegame, nodryrun, force):
+@click.option('--resume', is_flag=True, help=f"if set, finish an interrupted clean up from its journal instead of starting a new one")
+def toolCleanupShared(savegame, nodryrun, force, resume):
     """Will check all entries in the Shared-Folder against the database and remove all the ones that shouldn't exist any more since there is no more related data in the database.\n
     \n
     If --savegame is the current savegame, this requires the server to be shut down, since it modifies the files on the filesystem. Make sure to have a recent backup aswell.\n
     \n
     Defaults to use a dryrun, so the results are only written to a csv file for you to check.\n
+    \n
+    Every clean up writes a journal of what it deletes. If a clean up got interrupted, use --resume to finish it without recalculating everything.\n
     """
     with LogContext():
         esm = ServiceRegistry.get(EsmMain)  
-        esm.cleanupSharedFolder(savegame=savegame, dryrun=not nodryrun, force=force)
+        esm.cleanupSharedFolder(savegame=savegame, dryrun=not nodryrun, force=force, resume=resume)
 
 
 @cli.command(name="tool-clear-discovered", short_help="clears the discovered-by info for systems/playields")
@@ -585,6 +699,119 @@ def deleteGameCache(noconfirm):
         esm.deleteGameCache(not noconfirm)
 
 
+@cli.command(name="tool-prune-cache", short_help="evicts the least recently used entries of the cache until it fits into a budget")
+@click.option('--budget', metavar='<size>', help="maximum size of the cache, e.g. '50G'. Defaults to deletes.cacheBudget")
+@click.option('--maxage', type=int, metavar='<days>', help="evict cache entries that were not used for this many days. Defaults to deletes.cacheMaxAgeDays")
+@click.option('--nodryrun', is_flag=True, help="set to actually delete the cache entries, otherwise it will just list what would be evicted")
+def pruneGameCache(budget, maxage, nodryrun):
+    """
+        Keeps the ever growing cache within limits instead of deleting it completely, so the game does not have to regenerate it and clients don't have to download everything again.\n
+        \n
+        The cache entries are scanned in parallel, then the entries older than --maxage and the least recently used ones are evicted until the cache fits into --budget. Entries used within deletes.cacheProtectedHours are kept, so this can run while the server is running.
+        The deletion is throttled to deletes.cachePruneRate files per second on a low priority thread, the reclaimed bytes per second are shown at the end.
+    """
+    with LogContext():
+        esm = ServiceRegistry.get(EsmMain)
+        esm.pruneGameCache(budget=budget, maxAgeDays=maxage, dryrun=not nodryrun)
+
+
+@cli.command(name="tool-maintenance", short_help="runs a list of wipe, purge and cleanup steps from a yaml file in one go", no_args_is_help=True)
+@click.option('--steps', metavar='<file>', required=True, help="yaml file with the list of maintenance steps, see data/esm-maintenance.example.yaml")
+@click.option('--nodryrun', is_flag=True, help="set to actually execute the changes on the disk and in the database")
+@click.option('--force', is_flag=True, help=f"if set, do not ask interactively before file deletion, use with caution")
+def toolMaintenance(steps, nodryrun, force):
+    """Runs a list of maintenance steps (wipe, purge-empty-playfields, cleanup-removed-entities, cleanup-shared) defined in a yaml file.\n
+    \n
+    This is way faster than calling the single tools one after another, since the database queries, folder listings and territories are only
+    computed once and shared between all steps. All deletions are committed in one pass at the end, the time needed by each step is reported.\n
+    \n
+    Requires the server to be shut down when not in dry mode. Make sure to have a recent backup aswell.\n
+    \n
+    Defaults to use a dryrun, so the results are only written to files for you to check.\n
+    """
+    with LogContext():
+        esm = ServiceRegistry.get(EsmMain)
+        esm.checkAndWaitForOtherInstances()
+        esm.runMaintenance(stepsFile=steps, dryrun=not nodryrun, force=force)
+
+
+@cli.command(name="tool-empty-trash", short_help="empties the trash folders of the deferred deletion (deletes.useTrash) right away.")
+@click.option('--unlimited', is_flag=True, default=False, help="set to ignore the configured reclaim rate and bandwidth and delete as fast as possible")
+def emptyTrash(unlimited):
+    """
+        Empties the trash folders of the deferred deletion right away. Usually the trash is emptied in the background while the server is running, so you only need this if you want the space back immediately.
+    """
+    with LogContext():
+        esm = ServiceRegistry.get(EsmMain)
+        esm.emptyTrash(unlimited)
+
+
+@cli.command(name="tool-io-queue", short_help="shows the io heavy jobs (syncs, backups, purges, zips) of all esm processes that are running or waiting")
+def showIoQueue():
+    """
+        Shows the io heavy jobs of all esm processes that are running or waiting for their turn, and how long they have been waiting. Syncs always go first, then backups, purges and zips.
+    """
+    with LogContext():
+        esm = ServiceRegistry.get(EsmMain)
+        esm.showIoQueue()
+
+
+@cli.command(name="tool-unpack-mirror", short_help="unpacks a packed mirror to a normal folder tree")
+@click.option('--source', metavar='<path>', help="the packed mirror to unpack. Defaults to the packed mirror of the current savegame")
+@click.option('--target', metavar='<path>', required=True, help="the folder to unpack to, must be empty or not exist yet")
+@click.option('--verify', is_flag=True, help="if set, the content of every file is checked against the hash in the index")
+def toolUnpackMirror(source, target, verify):
+    """
+        Unpacks a packed mirror (see ramdisk.mirrorFormat) to a normal folder tree, e.g. to look at a savegame or to use a rolling backup of a packed mirror.
+    """
+    with LogContext():
+        esm = ServiceRegistry.get(EsmMain)
+        esm.unpackMirror(source=source, target=target, verify=verify)
+
+
+@cli.command(name="tool-benchmark-mirror", short_help="compares the plain and the packed mirror format on a synthetic savegame")
+@click.option('--path', metavar='<path>', required=True, help="the folder to run the benchmark in, must not exist yet. Use a folder on the drive of your mirror")
+@click.option('--folders', default=100, show_default=True, help="amount of folders in the synthetic savegame")
+@click.option('--files', default=100, show_default=True, help="amount of files per folder")
+@click.option('--size', default="4K", show_default=True, help="size of every file, gnu notation")
+def toolBenchmarkMirror(path, folders, files, size):
+    """
+        Creates a synthetic savegame with lots of small files and measures the initial sync, an incremental sync, the restore and the delete for the plain and the packed mirror format.
+        The folder is deleted afterwards.
+    """
+    with LogContext():
+        esm = ServiceRegistry.get(EsmMain)
+        esm.benchmarkMirror(path=path, folders=folders, files=files, size=size)
+
+
+@cli.command(name="tool-benchmark-ramdisk", short_help="compares the ramdisk with a disk backed savegame on a synthetic savegame")
+@click.option('--path', metavar='<path>', required=True, help="the folder on the disk to compare with, must not exist yet. Use a folder on the drive the savegame would be on without ramdisk")
+@click.option('--folders', default=100, show_default=True, help="amount of folders in the synthetic savegame")
+@click.option('--files', default=100, show_default=True, help="amount of files per folder")
+@click.option('--size', default="4K", show_default=True, help="size of every file, gnu notation")
+def toolBenchmarkRamdisk(path, folders, files, size):
+    """
+        Creates a synthetic savegame with lots of small files on the ramdisk and in the given folder, and measures creating, scanning, reading and deleting it.
+        Both folders are deleted afterwards. The ramdisk needs to be mounted.
+    """
+    with LogContext():
+        esm = ServiceRegistry.get(EsmMain)
+        esm.benchmarkRamdisk(path=path, folders=folders, files=files, size=size)
+
+
+@cli.command(name="tool-benchmark-static-backup", short_help="compares the builtin static backup archiver with PeaZip")
+@click.option('--source', metavar='<path>', help="the folder to zip, defaults to the latest rolling backup")
+@click.option('--path', metavar='<path>', help="the folder to write the zips to, must not exist yet. Defaults to a folder in the backup directory")
+def toolBenchmarkStaticBackup(source, path):
+    """
+        Zips the latest rolling backup with the builtin archiver, with and without volumes, and with PeaZip and the configured options, if it is installed.
+        Shows time needed, size, compression ratio and throughput of each. The zips are deleted afterwards.
+    """
+    with LogContext():
+        esm = ServiceRegistry.get(EsmMain)
+        esm.benchmarkStaticBackup(source=source, path=path)
+
+
 @cli.command(name="tool-wipe", short_help="provides a lot of options to wipe empty playfields, check the help for details", no_args_is_help=True)
 @click.option('--listfile', metavar='<file>', help="if this is given, use the text file as input for the system/playfield names. Syntax: <S:Systemname> for systems, <Playfield> for playfields. The textfile has to be a simple list with one string per line containing either a system or a playfield name with no quotes or special characters.")
 @click.option('--territory', metavar='<territory>', type=str, help=f"territory to wipe, use {Territory.GALAXY} for the whole galaxy or any of the configured ones, use --showterritories to get the list")
@@ -1,5 +1,7 @@
 import logging
+import tempfile
 from pathlib import Path
+from typing import Tuple
 
 log = logging.getLogger(__name__)
 
@@ -30,7 +32,8 @@ class TestTools:
         structure is a dictionary that will be walked through recursively. if a value is a dictionary, a directory will be created, otherwise a file and the string will be the content.
         """
         basedir.mkdir(parents=True, exist_ok=True)
-        callback(basedir, ctime)
+        if callback:
+            callback(basedir, ctime)
 
         for key in structure.keys():
             subStructure = structure.get(key)
@@ -40,6 +43,19 @@ class TestTools:
             else:
                 # no dict, then create a file
                 subPath.write_text(str(subStructure))
-                callback(subPath, ctime)
+                if callback:
+                    callback(subPath, ctime)
         return True
+
+    def createSavegameFixture(prefix: str, savegamePath: str, amount: int = 10, repeat: int = 1) -> Tuple[Path, Path]:
+        """
+        creates a new temporary base dir with a savegame at savegamePath below it, that has $amount playfields with a terrain.dat each.
+        The content of the terrain.dat of playfield i is f"terrain{i}" repeated $repeat times.
+        Returns the base dir and the savegame, delete the base dir after the test.
+        """
+        baseDir = Path(tempfile.mkdtemp(prefix=prefix))
+        savegame = baseDir.joinpath(savegamePath)
+        playfields = {f"Playfield{i}": {"terrain.dat": f"terrain{i}" * repeat} for i in range(amount)}
+        TestTools.createFileStructure({"Playfields": playfields}, savegame)
+        return baseDir, savegame
         
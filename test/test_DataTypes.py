@@ -1,7 +1,9 @@
 import logging
 import unittest
 
-from esm.DataTypes import EntityType, WipeType
+from pathlib import Path
+
+from esm.DataTypes import EntityType, PathTrie, WipeType
 
 log = logging.getLogger(__name__)
 
@@ -22,4 +24,32 @@ class test_DataTypes(unittest.TestCase):
         test = EntityType.byNumber(2)
         self.assertEqual(EntityType.BA, test)
 
-        
\ No newline at end of file
+        
+
+    def test_PathTrie_dropsDuplicatesAndDescendants(self):
+        trie = PathTrie()
+        self.assertTrue(trie.add(Path("/games/mirror/foo/bar"), "child"))
+        self.assertTrue(trie.add(Path("/games/mirror/baz"), "otherchild"))
+        self.assertTrue(trie.add(Path("/games/savegame"), "savegame"))
+        self.assertEqual(3, len(trie))
+
+        # duplicates and descendants of marked paths are ignored
+        self.assertFalse(trie.add(Path("/games/savegame"), "duplicate"))
+        self.assertFalse(trie.add(Path("/games/savegame/Playfields/foo"), "descendant"))
+        self.assertEqual(3, len(trie))
+
+        # a parent replaces all its marked descendants
+        self.assertTrue(trie.add(Path("/games/mirror"), "mirror"))
+        self.assertEqual(2, len(trie))
+        self.assertListEqual([(Path("/games/mirror"), "mirror"), (Path("/games/savegame"), "savegame")], trie.items())
+
+        self.assertTrue(trie.contains(Path("/games/mirror/foo/bar")))
+        self.assertTrue(trie.contains(Path("/games/savegame")))
+        self.assertFalse(trie.contains(Path("/games")))
+        self.assertFalse(trie.contains(Path("/games/other")))
+
+    def test_PathTrie_normalizesPaths(self):
+        trie = PathTrie()
+        self.assertTrue(trie.add(Path("/games/mirror/../savegame")))
+        self.assertFalse(trie.add(Path("/games/./savegame/Shared")))
+        self.assertEqual(1, len(trie))
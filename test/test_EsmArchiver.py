@@ -0,0 +1,71 @@
+import logging
+import os
+import shutil
+import sys
+import unittest
+import zipfile
+from pathlib import Path
+
+from esm.EsmArchiver import EsmArchiver
+from TestTools import TestTools
+
+log = logging.getLogger(__name__)
+
+class test_EsmArchiver(unittest.TestCase):
+
+    def setUp(self):
+        self.baseDir, savegame = TestTools.createSavegameFixture("esm-archiver-test-", "rollingMirrorBackup1/Saves/Games/EsmDediGame", amount=20, repeat=1000)
+        self.source = self.baseDir.joinpath("rollingMirrorBackup1")
+        savegame.joinpath("Empty").mkdir()
+        # random bytes don't compress, neither do files that are compressed already
+        savegame.joinpath("random.bin").write_bytes(os.urandom(100000))
+        self.source.joinpath("Tool").mkdir()
+        self.source.joinpath("Tool/map.png").write_text("png" * 1000)
+        self.source.joinpath("esm-dedicated.yaml").write_text("dedicated: true\n" * 10)
+        self.output = self.baseDir.joinpath("Backup")
+        self.output.mkdir()
+
+    def tearDown(self):
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+    def assertZipContains(self, zipPath: Path, expectedFiles):
+        with zipfile.ZipFile(zipPath) as zip:
+            self.assertIsNone(zip.testzip())
+            names = [info.filename for info in zip.infolist() if not info.is_dir()]
+            self.assertListEqual(sorted(expectedFiles), sorted(names))
+            for name in names:
+                self.assertEqual(self.source.joinpath(name).read_bytes(), zip.read(name))
+            return {info.filename: info for info in zip.infolist()}
+
+    def test_createArchive(self):
+        zipPath = self.output.joinpath("20231002_235900_EsmDediGame.zip")
+        stats = EsmArchiver(threads=4, storedExtensions=[".png"]).createArchive(self.source, zipPath)
+        self.assertEqual(23, stats.files)
+        self.assertEqual(2, stats.stored)
+        self.assertLess(stats.getRatio(), 1)
+
+        allFiles = [path.relative_to(self.source).as_posix() for path in self.source.rglob("*") if path.is_file()]
+        infos = self.assertZipContains(zipPath, allFiles)
+        self.assertEqual(zipfile.ZIP_STORED, infos["Tool/map.png"].compress_type)
+        self.assertEqual(zipfile.ZIP_STORED, infos["Saves/Games/EsmDediGame/random.bin"].compress_type)
+        self.assertEqual(zipfile.ZIP_DEFLATED, infos["esm-dedicated.yaml"].compress_type)
+        self.assertIn("Saves/Games/EsmDediGame/Empty/", infos)
+
+    def test_createVolumes(self):
+        zipPath = self.output.joinpath("static.zip")
+        stats = EsmArchiver(threads=4, volumes=True).createArchive(self.source, zipPath)
+        self.assertListEqual(sorted([zipPath, self.output.joinpath("static.Saves.zip"), self.output.joinpath("static.Tool.zip")]), sorted(stats.volumes))
+        self.assertEqual(sum(volume.stat().st_size for volume in stats.volumes), stats.compressedBytes)
+
+        self.assertZipContains(zipPath, ["esm-dedicated.yaml"])
+        self.assertZipContains(self.output.joinpath("static.Tool.zip"), ["Tool/map.png"])
+        saves = [path.relative_to(self.source).as_posix() for path in self.source.joinpath("Saves").rglob("*") if path.is_file()]
+        self.assertZipContains(self.output.joinpath("static.Saves.zip"), saves)
+
+    @unittest.skipIf(sys.platform == "win32", "creating symlinks needs privileges on windows")
+    def test_failingArchiveIsDeleted(self):
+        # a file that can't be read, like one that vanished while archiving
+        os.symlink(self.baseDir.joinpath("missing"), self.source.joinpath("Saves/Games/EsmDediGame/Playfields/Playfield3/vanished.dat"))
+        with self.assertRaises(OSError):
+            EsmArchiver(threads=4, volumes=True).createArchive(self.source, self.output.joinpath("failing.zip"))
+        self.assertListEqual([], list(self.output.iterdir()))
@@ -0,0 +1,74 @@
+import http.client
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from esm.DataTypes import ZipFile
+from esm.EsmAsyncDownloadServer import EsmAsyncDownloadServer
+
+log = logging.getLogger(__name__)
+
+class test_EsmAsyncDownloadServer(unittest.TestCase):
+
+    def setUp(self):
+        self.wwwroot = Path(tempfile.mkdtemp(prefix="esm-async-server-test-"))
+        self.wwwroot.joinpath("index.html").write_text("<html>shared data</html>")
+        self.wwwroot.joinpath("secret.txt").write_text("nope")
+        self.zipContent = os.urandom(2 * 1024 * 1024)
+        self.wwwroot.joinpath("SharedData_20231001_000000.zip").write_bytes(self.zipContent)
+        self.zipFile = ZipFile("SharedData_20231001_000000.zip", size=len(self.zipContent), wwwrootPath=self.wwwroot)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.worker.join(5)
+        shutil.rmtree(self.wwwroot, ignore_errors=True)
+
+    def startServer(self, **kwargs):
+        parameters = dict(rootDirectory=self.wwwroot, zipFiles=[self.zipFile], host="127.0.0.1", port=0, clientBandwidthLimit=0, globalBandwidthLimit=0, sliceSize=256*1024)
+        parameters.update(kwargs)
+        self.server = EsmAsyncDownloadServer(**parameters)
+        self.worker = threading.Thread(target=self.server.serveForever, daemon=True)
+        self.worker.start()
+        self.assertTrue(self.server.started.wait(5))
+        return http.client.HTTPConnection("127.0.0.1", self.server.port, timeout=10)
+
+    def request(self, connection, path, method="GET"):
+        connection.request(method, path)
+        response = connection.getresponse()
+        return response.status, response.getheader("Location"), response.read()
+
+    def test_whitelistRedirectsAndRateLimit(self):
+        connection = self.startServer(rateLimit="4 per minute")
+        self.server.redirects = [{"source": "/GimmeTheSharedData", "destination": f"/{self.zipFile.name}", "code": 301}]
+        # all of these use the same kept alive connection
+        self.assertEqual((301, "/index.html", b""), self.request(connection, "/"))
+        self.assertEqual((200, None, b"<html>shared data</html>"), self.request(connection, "/index.html"))
+        self.assertEqual(404, self.request(connection, "/secret.txt")[0])
+        self.assertEqual(404, self.request(connection, "/../../etc/passwd")[0])
+        self.assertEqual((301, f"/{self.zipFile.name}", b""), self.request(connection, "/GimmeTheSharedData"))
+        status, _, body = self.request(connection, f"/{self.zipFile.name}", method="HEAD")
+        self.assertEqual((200, b""), (status, body))
+        self.assertEqual(429, self.request(connection, "/index.html")[0])
+        self.assertEqual(0, self.server.zipDownloads)
+
+    def test_downloadIsThrottled(self):
+        connection = self.startServer(clientBandwidthLimit=4*1024*1024, globalBandwidthLimit=8*1024*1024)
+        start = time.monotonic()
+        status, _, body = self.request(connection, f"/{self.zipFile.name}")
+        elapsed = time.monotonic() - start
+        self.assertEqual(200, status)
+        self.assertEqual(self.zipContent, body)
+        # 2 MB at 4 MB/s, minus the burst of a quarter second that is available right away
+        self.assertGreater(elapsed, 0.2)
+        # the client may have all the bytes before the server finished the download
+        for _ in range(50):
+            if self.server.zipDownloads > 0: break
+            time.sleep(0.02)
+        self.assertEqual(1, self.server.zipDownloads)
+        self.assertEqual(1, self.zipFile.downloads)
+        self.assertEqual(len(self.zipContent), self.server.globalBytesSent)
@@ -1,10 +1,13 @@
 
 import logging
+import threading
 from pathlib import Path
 import unittest
+from esm.ConfigModels import MainConfig
 from esm.EsmBackupService import EsmBackupService
 
 from esm.EsmConfigService import EsmConfigService
+from esm.exceptions import BackupFailedError
 from esm.FsTools import FsTools
 from TestTools import TestTools
 
@@ -67,4 +70,28 @@ class test_EsmBackupService(unittest.TestCase):
         self.assertEqual(bm.getNextBackupNumber(3), 4)
         self.assertEqual(bm.getNextBackupNumber(4), 1)
 
+class test_EsmBackupServiceSteps(unittest.TestCase):
+
+    def createBackupService(self, parallelSteps):
+        bs = EsmBackupService()
+        bs.config = MainConfig.model_validate({"server": {"dedicatedYaml": "esm-dedicated.yaml"}, "paths": {"install": "."}, "backups": {"parallelSteps": parallelSteps}})
+        return bs
+
+    def test_runBackupStepsConcurrently(self):
+        # both steps can only finish if they run at the same time
+        barrier = threading.Barrier(2, timeout=5)
+        steps = [("savegame", barrier.wait), ("tool data", barrier.wait), ("game config", lambda: None)]
+        timings = self.createBackupService(parallelSteps=2).runBackupSteps(steps)
+        self.assertListEqual(["savegame", "tool data", "game config"], list(timings.keys()))
+
+        done = []
+        def fail():
+            raise OSError("disk full")
+        steps = [("savegame", fail), ("tool data", lambda: done.append("tool data"))]
+        with self.assertRaises(BackupFailedError) as context:
+            self.createBackupService(parallelSteps=1).runBackupSteps(steps)
+        self.assertIn("savegame", str(context.exception))
+        # the other steps still run to their end
+        self.assertListEqual(["tool data"], done)
+
     
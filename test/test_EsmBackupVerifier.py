@@ -0,0 +1,60 @@
+import logging
+import os
+import shutil
+import unittest
+
+from esm.EsmBackupVerifier import BackupManifest, EsmBackupVerifier
+from TestTools import TestTools
+
+log = logging.getLogger(__name__)
+
+class test_EsmBackupVerifier(unittest.TestCase):
+
+    def setUp(self):
+        self.baseDir, _ = TestTools.createSavegameFixture("esm-verify-test-", "rollingMirrorBackup1/Saves/Games/EsmDediGame", repeat=100)
+        self.backup = self.baseDir.joinpath("rollingMirrorBackup1")
+        self.backup.joinpath("esm_this_is_the_latest_backup").write_text("marker")
+
+    def tearDown(self):
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+    def createVerifier(self, backup=None):
+        return EsmBackupVerifier(backup or self.backup, threads=4, excluded=["esm_this_is_the_latest_backup"])
+
+    def test_verify(self):
+        hashedFiles, hashedBytes, elapsedTime = self.createVerifier().createManifest()
+        self.assertEqual(10, hashedFiles)
+        self.assertEqual(10 * 800, hashedBytes)
+        self.assertNotIn("esm_this_is_the_latest_backup", BackupManifest.read(self.backup.joinpath(BackupManifest.NAME)))
+
+        stats = self.createVerifier().verify()
+        self.assertTrue(stats.isValid())
+        self.assertEqual(10 * 800, stats.verifiedBytes)
+
+        # corrupt the content without changing size and modification time
+        corrupted = self.backup.joinpath("Saves/Games/EsmDediGame/Playfields/Playfield1/terrain.dat")
+        stat = corrupted.stat()
+        corrupted.write_text("x" * 800)
+        os.utime(corrupted, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.remove(self.backup.joinpath("Saves/Games/EsmDediGame/Playfields/Playfield2/terrain.dat"))
+        self.backup.joinpath("Saves/Games/EsmDediGame/Playfields/Playfield2/new.dat").write_text("new")
+
+        stats = self.createVerifier().verify(quick=True)
+        self.assertListEqual([("missing", "Saves/Games/EsmDediGame/Playfields/Playfield2/terrain.dat"), ("unexpected", "Saves/Games/EsmDediGame/Playfields/Playfield2/new.dat")], stats.getMismatches())
+        self.assertEqual(0, stats.verifiedBytes)
+
+        stats = self.createVerifier().verify()
+        self.assertListEqual(["Saves/Games/EsmDediGame/Playfields/Playfield1/terrain.dat"], stats.corrupt)
+        self.assertFalse(stats.isValid())
+
+    def test_manifestReusesHashes(self):
+        self.createVerifier().createManifest()
+        # the next backup is a copy with one changed file
+        nextBackup = self.baseDir.joinpath("rollingMirrorBackup2")
+        shutil.copytree(self.backup, nextBackup)
+        nextBackup.joinpath("Saves/Games/EsmDediGame/Playfields/Playfield1/terrain.dat").write_text("changed")
+
+        hashedFiles, hashedBytes, elapsedTime = self.createVerifier(nextBackup).createManifest([self.backup])
+        self.assertEqual(1, hashedFiles)
+        self.assertEqual(len("changed"), hashedBytes)
+        self.assertTrue(self.createVerifier(nextBackup).verify().isValid())
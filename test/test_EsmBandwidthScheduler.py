@@ -0,0 +1,92 @@
+import logging
+import unittest
+from typing import List
+
+from esm.EsmBandwidthScheduler import EsmBandwidthScheduler
+
+log = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class test_EsmBandwidthScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+
+    def simulate(self, scheduler: EsmBandwidthScheduler, links: List[float], duration: float = 10, warmup: float = 2, chunk: int = 64*1024) -> List[float]:
+        """
+        lets clients download chunks as fast as the scheduler and their own link speed (0 for unlimited) allow, in virtual time.
+        Returns the rate each client got after the warmup.
+        """
+        shares = [scheduler.register(index) for index in range(len(links))]
+        start = self.clock.now
+        nextRequests = [start] * len(links)
+        received = [0] * len(links)
+        while True:
+            index = min(range(len(links)), key=lambda i: nextRequests[i])
+            if nextRequests[index] >= start + duration:
+                break
+            self.clock.now = nextRequests[index]
+            sendTime = self.clock.now + scheduler.reserve(shares[index], chunk)
+            if start + warmup <= sendTime < start + duration:
+                received[index] += chunk
+            nextRequests[index] = sendTime + (chunk / links[index] if links[index] > 0 else 0)
+        self.clock.now = start + duration
+        for share in shares:
+            scheduler.unregister(share)
+        return [amount / (duration - warmup) for amount in received]
+
+    def assertRate(self, expected, actual, tolerance=0.05):
+        self.assertAlmostEqual(expected, actual, delta=expected * tolerance, msg=f"expected {expected / MB:.2f} MB/s, got {actual / MB:.2f} MB/s")
+
+    def test_calculateFairShare(self):
+        self.assertEqual(4, EsmBandwidthScheduler.calculateFairShare([1, 5, 5], 9))
+        self.assertEqual(3, EsmBandwidthScheduler.calculateFairShare([5, 5, 5], 9))
+        # everyone gets what he wants, the biggest one may grow into the rest
+        self.assertEqual(9, EsmBandwidthScheduler.calculateFairShare([1, 1], 10))
+        self.assertEqual(10, EsmBandwidthScheduler.calculateFairShare([], 10))
+
+    def test_evenShareAndLimits(self):
+        scheduler = EsmBandwidthScheduler(globalRate=8*MB, clientRate=4*MB, clock=self.clock)
+        rates = self.simulate(scheduler, [0] * 6)
+        self.assertRate(8*MB, sum(rates))
+        for rate in rates:
+            self.assertRate(8*MB / 6, rate)
+
+        # the client limit applies when the global one would allow more
+        rates = self.simulate(scheduler, [0] * 2)
+        self.assertRate(8*MB, sum(rates))
+        rates = self.simulate(scheduler, [0])
+        self.assertRate(4*MB, rates[0])
+
+    def test_unusedShareIsRedistributed(self):
+        scheduler = EsmBandwidthScheduler(globalRate=8*MB, clientRate=6*MB, clock=self.clock)
+        # one client can't take more than 1 MB/s, the other ones split what it leaves
+        rates = self.simulate(scheduler, [1*MB, 0, 0, 0])
+        self.assertRate(1*MB, rates[0])
+        for rate in rates[1:]:
+            self.assertRate(7*MB / 3, rate)
+        self.assertRate(8*MB, sum(rates))
+
+    def test_noBurstAfterIdleAndReconfigure(self):
+        scheduler = EsmBandwidthScheduler(globalRate=8*MB, clientRate=0, burstSeconds=0.25, clock=self.clock)
+        # an idle hour must not allow more than the burst on top of the limit
+        self.clock.now += 3600
+        rates = self.simulate(scheduler, [0] * 4, duration=1, warmup=0)
+        self.assertLessEqual(sum(rates), 8*MB + 0.25 * 8*MB + 4 * 64*1024)
+
+        shares = [scheduler.register(index) for index in range(4)]
+        scheduler.reconfigure(globalRate=2*MB)
+        for share in shares:
+            scheduler.unregister(share)
+        rates = self.simulate(scheduler, [0] * 4)
+        self.assertRate(2*MB, sum(rates))
+        for rate in rates:
+            self.assertRate(2*MB / 4, rate)
@@ -0,0 +1,79 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from esm.EsmCachePruner import EsmCachePruner
+
+log = logging.getLogger(__name__)
+
+class test_EsmCachePruner(unittest.TestCase):
+
+    DAY = 24 * 3600
+
+    def setUp(self):
+        self.cache = Path(tempfile.mkdtemp(prefix="esm-cache-test-")).joinpath("Cache/EsmDediGame")
+        self.now = time.time()
+        # ten entries of 1000 bytes each, entry i was used i days ago
+        for i in range(10):
+            self.createEntry(f"Playfield{i}", 1000, self.now - i * self.DAY)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache.parent.parent, ignore_errors=True)
+
+    def createEntry(self, name, size, lastUsed):
+        entry = self.cache.joinpath(name)
+        entry.joinpath("sub").mkdir(parents=True)
+        for index, path in enumerate([entry.joinpath("a.dat"), entry.joinpath("sub/b.dat")]):
+            path.write_bytes(b"x" * (size // 2))
+            # only the newest file of an entry counts
+            used = lastUsed if index == 0 else lastUsed - self.DAY
+            os.utime(path, (used, used))
+
+    def remaining(self):
+        return sorted(path.name for path in self.cache.iterdir())
+
+    def test_pruneToBudget(self):
+        pruner = EsmCachePruner(self.cache, threads=4)
+        stats, evictions = pruner.prune(budget=6500, dryrun=True)
+        self.assertEqual(10, stats.entries)
+        self.assertEqual(10000, stats.size)
+        self.assertListEqual(["Playfield9", "Playfield8", "Playfield7", "Playfield6"], [entry.path.name for entry in evictions])
+        self.assertEqual(10, len(self.remaining()))
+
+        stats, evictions = pruner.prune(budget=6500)
+        self.assertEqual(4, stats.evicted)
+        self.assertEqual(4000, stats.reclaimedBytes)
+        self.assertEqual(8, stats.deletedFiles)
+        self.assertListEqual([f"Playfield{i}" for i in range(6)], self.remaining())
+
+    def test_pruneByAgeKeepsProtectedEntries(self):
+        pruner = EsmCachePruner(self.cache, threads=4)
+        stats, evictions = pruner.prune(maxAge=timedelta(days=4, hours=12))
+        self.assertListEqual([f"Playfield{i}" for i in range(5)], self.remaining())
+
+        # the budget can't be met without evicting entries that were used just now
+        stats, evictions = pruner.prune(budget=0, protectedAge=timedelta(days=1, hours=12))
+        self.assertListEqual(["Playfield0", "Playfield1"], self.remaining())
+
+    def test_leaseIsTakenPerBatchOnAnotherThread(self):
+        leases = []
+        @contextmanager
+        def lease():
+            leases.append(threading.current_thread())
+            yield
+        pruner = EsmCachePruner(self.cache, threads=4, lease=lease, batchFiles=3)
+        pruner.prune(budget=6500, dryrun=True)
+        self.assertListEqual([], leases)
+
+        stats, evictions = pruner.prune(budget=6500)
+        self.assertEqual(8, stats.deletedFiles)
+        # 8 files in batches of 3, the deleting thread is not the caller's
+        self.assertEqual(3, len(leases))
+        self.assertNotIn(threading.current_thread(), leases)
@@ -0,0 +1,63 @@
+import logging
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from esm.EsmCapacityMonitor import CapacityHistory, CapacitySample, CapacityWarner, IncrementalFolderSizer, forecast
+
+log = logging.getLogger(__name__)
+
+class test_EsmCapacityMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.baseDir = Path(tempfile.mkdtemp(prefix="esm-capacity-test-"))
+
+    def tearDown(self):
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+    def test_incrementalSizing(self):
+        savegame = self.baseDir.joinpath("EsmDediGame")
+        for i in range(10):
+            playfield = savegame.joinpath(f"Playfields/Playfield{i}")
+            playfield.mkdir(parents=True)
+            playfield.joinpath("terrain.dat").write_bytes(b"x" * 100)
+        savegame.joinpath("Shared").mkdir()
+        savegame.joinpath("global.db").write_bytes(b"x" * 50)
+
+        sizer = IncrementalFolderSizer(savegame, fullScanInterval=0)
+        sizes = sizer.measure()
+        self.assertEqual({"Playfields": 1000, "Shared": 0, IncrementalFolderSizer.ROOTFILES: 50}, sizes)
+        self.assertEqual(12, sizer.rescanned)
+
+        savegame.joinpath("Playfields/Playfield3/new.dat").write_bytes(b"x" * 30)
+        savegame.joinpath("global.db").write_bytes(b"x" * 80)
+        shutil.rmtree(savegame.joinpath("Playfields/Playfield4"))
+        sizes = sizer.measure()
+        self.assertEqual({"Playfields": 1030 - 100, "Shared": 0, IncrementalFolderSizer.ROOTFILES: 80}, sizes)
+        # only the changed playfield and the playfields folder were looked at
+        self.assertEqual(2, sizer.rescanned)
+
+    def test_historyForecastAndWarnings(self):
+        history = CapacityHistory(self.baseDir.joinpath("capacity.tsv"), ["Playfields", "Shared"], maxSamples=10)
+        gigabyte = 1024**3
+        for hour in range(12):
+            # the playfields grow 50M per hour on a 2G ramdisk that is half full
+            used = gigabyte + hour * 50 * 1024**2
+            history.append(CapacitySample(hour * 3600, used, 2 * gigabyte, {"Playfields": used, "Shared": 1000}))
+        samples = history.read()
+        self.assertLessEqual(len(samples), 10)
+        self.assertEqual(11 * 3600, samples[-1].timestamp)
+
+        capacityForecast = forecast(samples, window=6 * 3600)
+        self.assertAlmostEqual(50 * 1024**2 / 3600, capacityForecast.growthRate)
+        self.assertEqual("Playfields", capacityForecast.getFastestGrowingFolder())
+        # 2048M - 1574M left at 50M per hour
+        self.assertAlmostEqual((2048 - 1574) / 50, capacityForecast.getSecondsToFull() / 3600)
+
+        warner = CapacityWarner([24, 6, 1], usageThreshold=0.9)
+        warnings = warner.check(capacityForecast)
+        self.assertEqual(1, len(warnings))
+        self.assertFalse(warnings[0][1])
+        # no repeated warning for the same threshold
+        self.assertEqual([], warner.check(capacityForecast))
@@ -0,0 +1,112 @@
+import logging
+import shutil
+import sys
+import time
+import unittest
+from pathlib import Path
+
+from esm.EsmChangeTracker import ChangeSet, InotifyChangeTracker, PollingChangeTracker
+from esm.EsmSyncEngine import EsmSyncEngine
+from TestTools import TestTools
+
+log = logging.getLogger(__name__)
+
+class test_EsmChangeTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.baseDir, self.source = TestTools.createSavegameFixture("esm-tracker-test-", "ram/EsmDediGame", amount=5)
+        self.destination = self.baseDir.joinpath("mirror/EsmDediGame_Mirror")
+        self.source.joinpath("global.db").write_text("db")
+        self.engine = EsmSyncEngine(source=self.source, destination=self.destination, manifestPath=self.baseDir.joinpath("mirror/manifest"), threads=2)
+        self.engine.synchronize()
+
+    def tearDown(self):
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+    def makeChanges(self):
+        self.source.joinpath("Playfields/Playfield1/terrain.dat").write_text("changed terrain")
+        self.source.joinpath("Playfields/Playfield2/new.dat").write_text("new")
+        shutil.rmtree(self.source.joinpath("Playfields/Playfield3"))
+        newPlayfield = self.source.joinpath("Playfields/Playfield9")
+        newPlayfield.mkdir()
+        newPlayfield.joinpath("terrain.dat").write_text("terrain9")
+
+    def assertTreesEqual(self, first: Path, second: Path):
+        firstEntries = sorted((path.relative_to(first).as_posix(), path.read_text() if path.is_file() else None) for path in first.rglob("*"))
+        secondEntries = sorted((path.relative_to(second).as_posix(), path.read_text() if path.is_file() else None) for path in second.rglob("*"))
+        self.assertListEqual(firstEntries, secondEntries)
+
+    def test_syncOnlyScansChangedFolders(self):
+        self.makeChanges()
+        # a change that is not part of the change set will not be noticed
+        self.source.joinpath("Playfields/Playfield4/terrain.dat").write_text("unnoticed")
+
+        changes = ChangeSet(folders={"Playfields", "Playfields/Playfield1", "Playfields/Playfield2"})
+        stats = self.engine.synchronize(changes=changes)
+        # Playfields has 5 folders, Playfield1 one file, Playfield2 two files, Playfield9 one file
+        self.assertEqual(9, stats.scanned)
+        self.assertEqual(3, stats.copied)
+        self.assertEqual(2, stats.deleted)
+        self.assertEqual("terrain4", self.destination.joinpath("Playfields/Playfield4/terrain.dat").read_text())
+
+        stats = self.engine.synchronize()
+        self.assertEqual(1, stats.copied)
+        self.assertTreesEqual(self.source, self.destination)
+
+    def test_subtreesAreScannedCompletely(self):
+        self.source.joinpath("Playfields/Playfield4/terrain.dat").write_text("changed behind a link")
+        stats = self.engine.synchronize(changes=ChangeSet(subtrees={"Playfields/Playfield4"}))
+        self.assertEqual(1, stats.scanned)
+        self.assertEqual(1, stats.copied)
+        self.assertTreesEqual(self.source, self.destination)
+
+    def test_pollingTracker(self):
+        tracker = PollingChangeTracker(self.source)
+        tracker.start()
+        self.assertIsNone(tracker.takeChanges())
+        self.assertEqual(0, len(tracker.takeChanges()))
+
+        self.makeChanges()
+        changes = tracker.takeChanges()
+        self.assertIn("Playfields", changes.folders)
+        self.assertIn("Playfields/Playfield2", changes.folders)
+        self.engine.synchronize(changes=changes)
+        tracker.stop()
+
+        # polling does not notice the changed terrain in Playfield1
+        self.assertEqual("terrain1", self.destination.joinpath("Playfields/Playfield1/terrain.dat").read_text())
+        self.assertTrue(self.destination.joinpath("Playfields/Playfield9/terrain.dat").exists())
+        self.assertFalse(self.destination.joinpath("Playfields/Playfield3").exists())
+
+    def waitForChanges(self, tracker, expectedFolders, timeout=5):
+        changes = ChangeSet()
+        deadline = time.time() + timeout
+        while not expectedFolders.issubset(changes.folders) and time.time() < deadline:
+            time.sleep(0.1)
+            changes.folders.update(tracker.takeChanges().folders)
+        return changes
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is only available on linux")
+    def test_inotifyTracker(self):
+        tracker = InotifyChangeTracker(self.source)
+        tracker.start()
+        try:
+            # give the tracker thread time to set up its watches
+            time.sleep(0.5)
+            self.assertIsNone(tracker.takeChanges())
+
+            self.makeChanges()
+            expected = {"Playfields", "Playfields/Playfield1", "Playfields/Playfield2", "Playfields/Playfield3"}
+            changes = self.waitForChanges(tracker, expected)
+            self.assertTrue(expected.issubset(changes.folders))
+            self.engine.synchronize(changes=changes)
+            self.assertTreesEqual(self.source, self.destination)
+
+            # the new folder is being watched too
+            self.source.joinpath("Playfields/Playfield9/later.dat").write_text("later")
+            changes = self.waitForChanges(tracker, {"Playfields/Playfield9"})
+            self.assertSetEqual({"Playfields/Playfield9"}, changes.folders)
+            self.engine.synchronize(changes=changes)
+            self.assertTreesEqual(self.source, self.destination)
+        finally:
+            tracker.stop()
@@ -0,0 +1,72 @@
+import logging
+import os
+import shutil
+import unittest
+
+from esm.EsmArchiver import EsmArchiver
+from esm.EsmDifferentialBackup import StaticManifest, createStaticArchive, restoreStaticBackup
+from esm.exceptions import BackupFailedError
+from TestTools import TestTools
+
+log = logging.getLogger(__name__)
+
+class test_EsmDifferentialBackup(unittest.TestCase):
+
+    def setUp(self):
+        self.baseDir, savegame = TestTools.createSavegameFixture("esm-differential-test-", "rollingMirrorBackup1/Saves/Games/EsmDediGame", repeat=100)
+        self.source = self.baseDir.joinpath("rollingMirrorBackup1")
+        savegame.joinpath("global.db").write_text("db")
+        self.backupDir = self.baseDir.joinpath("Backup")
+        self.backupDir.mkdir()
+
+    def tearDown(self):
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+    def change(self, relativePath, content):
+        path = self.source.joinpath(relativePath)
+        mtime = path.stat().st_mtime_ns if path.exists() else 0
+        path.write_text(content)
+        os.utime(path, ns=(mtime + 1000000000, mtime + 1000000000))
+
+    def snapshot(self):
+        return {path.relative_to(self.source).as_posix(): (path.read_bytes() if path.is_file() else None) for path in self.source.rglob("*")}
+
+    def restored(self, manifest, name):
+        target = self.baseDir.joinpath(name)
+        stats = restoreStaticBackup(manifest, target, verify=True)
+        self.assertEqual(0, stats.failed)
+        return {path.relative_to(target).as_posix(): (path.read_bytes() if path.is_file() else None) for path in target.rglob("*")}
+
+    def test_restoreChain(self):
+        archiver = EsmArchiver(threads=4)
+        stats, full = createStaticArchive(archiver, self.source, self.backupDir.joinpath("20231001_000000_EsmDediGame.zip"))
+        self.assertEqual(11, stats.files)
+        self.assertEqual(0, full.chainLength)
+        fullState = self.snapshot()
+
+        self.change("Saves/Games/EsmDediGame/global.db", "changed db")
+        shutil.rmtree(self.source.joinpath("Saves/Games/EsmDediGame/Playfields/Playfield3"))
+        self.source.joinpath("Saves/Games/EsmDediGame/Playfields/Playfield10").mkdir()
+        self.change("Saves/Games/EsmDediGame/Playfields/Playfield10/terrain.dat", "new terrain")
+        stats, firstDiff = createStaticArchive(archiver, self.source, self.backupDir.joinpath("20231002_000000_EsmDediGame_diff.zip"), full)
+        self.assertEqual(2, stats.files)
+        self.assertEqual(1, firstDiff.chainLength)
+        deleted = self.backupDir.joinpath("20231002_000000_EsmDediGame_diff.deleted.txt").read_text().splitlines()
+        self.assertListEqual(["Saves/Games/EsmDediGame/Playfields/Playfield3", "Saves/Games/EsmDediGame/Playfields/Playfield3/terrain.dat"], deleted)
+        firstDiffState = self.snapshot()
+
+        self.change("Saves/Games/EsmDediGame/global.db", "changed again")
+        stats, secondDiff = createStaticArchive(archiver, self.source, self.backupDir.joinpath("20231003_000000_EsmDediGame_diff.zip"), StaticManifest.read(firstDiff.path))
+        self.assertEqual(1, stats.files)
+        self.assertEqual(3, len(secondDiff.getZipNames()))
+
+        # every point in time can be restored from its manifest
+        self.assertDictEqual(fullState, self.restored(full, "restoredFull"))
+        self.assertDictEqual(firstDiffState, self.restored(firstDiff, "restoredFirst"))
+        self.assertDictEqual(self.snapshot(), self.restored(secondDiff, "restoredSecond"))
+
+        # but not without the whole chain
+        self.backupDir.joinpath("20231001_000000_EsmDediGame.zip").unlink()
+        self.assertListEqual(["20231001_000000_EsmDediGame.zip"], secondDiff.getMissingZips())
+        with self.assertRaises(BackupFailedError):
+            restoreStaticBackup(secondDiff, self.baseDir.joinpath("restoredBroken"))
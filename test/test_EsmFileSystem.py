@@ -2,10 +2,13 @@ import logging
 import os
 from pathlib import Path
 import shutil
+import tempfile
 import time
 import unittest
 
+from esm.ConfigModels import MainConfig
 from esm.EsmFileSystem import EsmFileSystem
+from esm.EsmIoCoordinator import EsmIoCoordinator
 from esm.FsTools import FsTools
 from TestTools import TestTools
 
@@ -66,7 +69,9 @@ class test_EsmFileSystem(unittest.TestCase):
         self.cleanTestFolders(target, link)
 
     def cleanTestFolders(self, target, link):
-        if link.exists():
+        if FsTools.isHardLink(link):
+            FsTools.deleteLink(link)
+        elif link.exists():
             if link.is_dir():
                 link.rmdir()
             else:
@@ -137,6 +142,39 @@ class test_EsmFileSystem(unittest.TestCase):
 
         FsTools.quickDelete("delete_test")
 
+    def test_markForDeleteCollapsesNestedPaths(self):
+        esmfs = EsmFileSystem()
+        esmfs.config = MainConfig.model_validate({"server": {"dedicatedYaml": "esm-dedicated.yaml"}, "paths": {"install": "."}})
+        esmfs.clearPendingDeletePaths()
+        baseDir = Path(tempfile.mkdtemp(prefix="esm-delete-test-"))
+        try:
+            mirror = baseDir.joinpath("GamesMirror")
+            mirrorFile = mirror.joinpath("EsmDediGame_Mirror/global.db")
+            mirrorFile.parent.mkdir(parents=True)
+            mirrorFile.write_text("db")
+            other = baseDir.joinpath("other.txt")
+            other.write_text("other")
+            esmfs.ioCoordinator = EsmIoCoordinator()
+            esmfs.ioCoordinator.config = MainConfig.model_validate({"server": {"dedicatedYaml": "esm-dedicated.yaml"}, "paths": {"install": "."}, "io": {"queueFolder": str(baseDir.joinpath("queue"))}})
+
+            esmfs.markForDelete(mirrorFile)
+            esmfs.markForDelete(mirror, native=True)
+            esmfs.markForDelete(mirror)
+            esmfs.markForDelete(mirrorFile.parent)
+            self.assertListEqual([mirror.absolute()], esmfs.getPendingDeletePaths())
+
+            esmfs.clearPendingDeletePaths()
+            esmfs.markForDelete(mirrorFile)
+            esmfs.markForDelete(mirrorFile)
+            comitted, elapsedTime = esmfs.commitDelete(override="yes")
+            self.assertTrue(comitted)
+            self.assertFalse(mirrorFile.exists())
+            self.assertTrue(other.exists())
+            self.assertEqual(0, len(esmfs.getPendingDeletePaths()))
+        finally:
+            esmfs.clearPendingDeletePaths()
+            shutil.rmtree(baseDir, ignore_errors=True)
+
     @unittest.skip("TODO: need to inject custom configuration here")
     def test_testLinkGeneration(self):
         esmfs = EsmFileSystem()
@@ -0,0 +1,69 @@
+import logging
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from esm.ConfigModels import MainConfig
+from esm.EsmIoCoordinator import EsmIoCoordinator, IoPriority
+
+log = logging.getLogger(__name__)
+
+class test_EsmIoCoordinator(unittest.TestCase):
+
+    def setUp(self):
+        self.baseDir = Path(tempfile.mkdtemp(prefix="esm-io-test-"))
+        self.queuePath = self.baseDir.joinpath("queue")
+        config = MainConfig.model_validate({"server": {"dedicatedYaml": "esm-dedicated.yaml"}, "paths": {"install": str(self.baseDir)}, "io": {"queueFolder": str(self.queuePath), "pollInterval": 0.05}})
+        # one coordinator per thread, like separate esm processes
+        self.coordinators = []
+        for i in range(3):
+            coordinator = EsmIoCoordinator()
+            coordinator.config = config
+            self.coordinators.append(coordinator)
+
+    def tearDown(self):
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+    def test_syncGoesFirst(self):
+        order = []
+
+        def runJob(coordinator: EsmIoCoordinator, name, priority):
+            with coordinator.lease(name, priority) as lease:
+                order.append((name, lease.waitTime.total_seconds()))
+
+        with self.coordinators[0].lease("rolling backup", IoPriority.BACKUP):
+            self.assertEqual(["rolling backup"], self.coordinators[0].getActiveLeaseNames())
+            zipJob = threading.Thread(target=runJob, args=(self.coordinators[1], "static backup", IoPriority.ZIP))
+            zipJob.start()
+            time.sleep(0.2)
+            sync = threading.Thread(target=runJob, args=(self.coordinators[2], "ram to mirror sync", IoPriority.SYNC))
+            sync.start()
+            time.sleep(0.2)
+            self.assertEqual(3, len(self.coordinators[0].getTickets()))
+            self.assertEqual([], order)
+        zipJob.join()
+        sync.join()
+
+        # the sync asked later, but goes first
+        self.assertEqual(["ram to mirror sync", "static backup"], [name for name, waitTime in order])
+        self.assertGreaterEqual(order[1][1], 0.3)
+        self.assertEqual([], self.coordinators[0].getTickets())
+
+    def test_nestedAndDeadLeases(self):
+        # a ticket of a process that does not exist anymore
+        self.queuePath.mkdir(parents=True)
+        deadTicket = self.queuePath.joinpath(f"010-{time.time_ns():020d}-999999999-1.active")
+        deadTicket.write_text("crashed backup")
+
+        coordinator = self.coordinators[0]
+        with coordinator.lease("delete", IoPriority.PURGE) as outer:
+            self.assertFalse(deadTicket.exists())
+            # nested leases of the same thread don't wait for themselves
+            with coordinator.lease("shared data zip", IoPriority.ZIP) as inner:
+                self.assertIsNone(inner.ticketPath)
+            self.assertEqual(["delete"], coordinator.getActiveLeaseNames())
+            self.assertIsNotNone(outer.ticketPath)
+        self.assertEqual([], coordinator.getActiveLeaseNames())
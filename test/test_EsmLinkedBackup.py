@@ -0,0 +1,101 @@
+import logging
+import os
+import shutil
+import unittest
+from pathlib import Path
+
+from esm.EsmLinkedBackup import EsmLinkedBackup
+from TestTools import TestTools
+
+log = logging.getLogger(__name__)
+
+class test_EsmLinkedBackup(unittest.TestCase):
+
+    def setUp(self):
+        self.baseDir, self.source = TestTools.createSavegameFixture("esm-linked-test-", "GamesMirror/EsmDediGame_Mirror", amount=5)
+        self.source.joinpath("global.db").write_text("db")
+
+    def tearDown(self):
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+    def getBackupFolder(self, number):
+        return self.baseDir.joinpath(f"BackupMirrors/rollingMirrorBackup{number}")
+
+    def backup(self, number, referenceNumber=None):
+        backupFolder = self.getBackupFolder(number)
+        reference = None
+        referenceManifestPath = None
+        if referenceNumber is not None:
+            reference = self.getBackupFolder(referenceNumber).joinpath("Saves")
+            referenceManifestPath = self.getBackupFolder(referenceNumber).joinpath(EsmLinkedBackup.MANIFESTFOLDER, "Saves.tsv")
+        return EsmLinkedBackup(source=self.source, destination=backupFolder.joinpath("Saves"), manifestPath=backupFolder.joinpath(EsmLinkedBackup.MANIFESTFOLDER, "Saves.tsv"),
+                               reference=reference, referenceManifestPath=referenceManifestPath, threads=4).synchronize()
+
+    def change(self, relativePath, content):
+        path = self.source.joinpath(relativePath)
+        mtime = path.stat().st_mtime_ns if path.exists() else 0
+        path.write_text(content)
+        os.utime(path, ns=(mtime + 1000000000, mtime + 1000000000))
+
+    def test_unchangedFilesAreLinked(self):
+        stats = self.backup(1)
+        self.assertEqual(6, stats.copied)
+        self.assertEqual(0, stats.linked)
+
+        self.change("Playfields/Playfield1/terrain.dat", "changed terrain")
+        shutil.rmtree(self.source.joinpath("Playfields/Playfield2"))
+        stats = self.backup(2, referenceNumber=1)
+        self.assertEqual(1, stats.copied)
+        self.assertEqual(4, stats.linked)
+        self.assertEqual(0, stats.failed)
+
+        first = self.getBackupFolder(1).joinpath("Saves")
+        second = self.getBackupFolder(2).joinpath("Saves")
+        self.assertTrue(os.path.samefile(first.joinpath("global.db"), second.joinpath("global.db")))
+        self.assertFalse(os.path.samefile(first.joinpath("Playfields/Playfield1/terrain.dat"), second.joinpath("Playfields/Playfield1/terrain.dat")))
+        self.assertEqual("changed terrain", second.joinpath("Playfields/Playfield1/terrain.dat").read_text())
+        self.assertFalse(second.joinpath("Playfields/Playfield2").exists())
+
+        # rolling over to the first backup again must not write through the links into the second one
+        self.change("global.db", "changed db")
+        stats = self.backup(1, referenceNumber=2)
+        self.assertEqual(1, stats.copied)
+        self.assertEqual(1, stats.linked)
+        self.assertEqual(2, stats.deleted)
+        self.assertEqual("changed db", first.joinpath("global.db").read_text())
+        self.assertEqual("db", second.joinpath("global.db").read_text())
+        self.assertTrue(os.path.samefile(first.joinpath("Playfields/Playfield1/terrain.dat"), second.joinpath("Playfields/Playfield1/terrain.dat")))
+
+    def test_unknownDestinationIsRebuilt(self):
+        self.backup(1)
+        # a backup created by robocopy, that has full copies and no manifest
+        robocopied = self.getBackupFolder(2).joinpath("Saves")
+        shutil.copytree(self.source, robocopied)
+        robocopied.joinpath("stale.txt").write_text("stale")
+
+        stats = self.backup(2, referenceNumber=1)
+        self.assertEqual(0, stats.copied)
+        self.assertEqual(6, stats.linked)
+        self.assertFalse(robocopied.joinpath("stale.txt").exists())
+        self.assertTrue(os.path.samefile(self.getBackupFolder(1).joinpath("Saves/global.db"), robocopied.joinpath("global.db")))
+
+        # a reference that was touched since its manifest was written is not linked to
+        self.getBackupFolder(1).joinpath("Saves/global.db").write_text("touched")
+        stats = self.backup(3, referenceNumber=1)
+        self.assertEqual(1, stats.copied)
+        self.assertEqual("db", self.getBackupFolder(3).joinpath("Saves/global.db").read_text())
+
+    def test_sharedFilesAreUnlinkedBeforeCopying(self):
+        # a backup created by robocopy without a manifest, used as reference by a linked one
+        robocopied = self.getBackupFolder(1).joinpath("Saves")
+        shutil.copytree(self.source, robocopied)
+        robocopied.joinpath("own.txt").write_text("own")
+        stats = self.backup(2, referenceNumber=1)
+        self.assertEqual(6, stats.linked)
+
+        self.assertEqual(6, EsmLinkedBackup.unlinkSharedFiles(self.getBackupFolder(1)))
+        self.assertTrue(robocopied.joinpath("own.txt").exists())
+        self.assertFalse(robocopied.joinpath("global.db").exists())
+        # the linked backup keeps its content when the files are copied again
+        robocopied.joinpath("global.db").write_text("changed db")
+        self.assertEqual("db", self.getBackupFolder(2).joinpath("Saves/global.db").read_text())
@@ -0,0 +1,84 @@
+import logging
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from esm.ConfigModels import MainConfig
+from esm.EsmFileSystem import EsmFileSystem
+from esm.EsmIoCoordinator import EsmIoCoordinator
+from esm.EsmMaintenanceService import EsmMaintenanceService, MaintenanceStep, MaintenanceStepType
+from esm.EsmPurgeJournal import EsmPurgeJournal
+from esm.EsmWipeService import EsmWipeService
+from esm.exceptions import WrongParameterError
+
+log = logging.getLogger(__name__)
+
+class test_EsmMaintenanceService(unittest.TestCase):
+
+    def setUp(self):
+        self.baseDir = Path(tempfile.mkdtemp(prefix="esm-maintenance-test-"))
+        self.savegamePath = self.baseDir.joinpath("Saves/Games/EsmDediGame")
+        self.savegamePath.mkdir(parents=True)
+        shutil.copy(Path("test/test.db"), self.savegamePath.joinpath("global.db"))
+
+        config = MainConfig.model_validate({"server": {"dedicatedYaml": "esm-dedicated.yaml"}, "paths": {"install": str(self.baseDir)}, "io": {"queueFolder": str(self.baseDir.joinpath("queue"))}})
+        self.fileSystem = EsmFileSystem()
+        self.fileSystem.config = config
+        self.fileSystem.ioCoordinator = EsmIoCoordinator()
+        self.fileSystem.ioCoordinator.config = config
+        self.fileSystem.clearPendingDeletePaths()
+        wipeService = EsmWipeService()
+        wipeService.config = config
+        wipeService.fileSystem = self.fileSystem
+        wipeService.getPurgeJournal = lambda name: EsmPurgeJournal(self.baseDir.joinpath(f"esm-{name}.journal"))
+        self.maintenanceService = EsmMaintenanceService()
+        self.maintenanceService.config = config
+        self.maintenanceService.fileSystem = self.fileSystem
+        self.maintenanceService.wipeService = wipeService
+
+    def tearDown(self):
+        self.fileSystem.clearPendingDeletePaths()
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+    def test_cleanupStepsShareThePlanAndCommitOnce(self):
+        shared = self.savegamePath.joinpath("Shared")
+        existing = shared.joinpath("37052")
+        removed = shared.joinpath("19001")
+        dangling = shared.joinpath("99999999")
+        for folder in [existing, removed, dangling]:
+            folder.mkdir(parents=True)
+            folder.joinpath("ents.dat").write_text("data")
+
+        steps = [MaintenanceStep(step=MaintenanceStepType.CLEANUPREMOVEDENTITIES), MaintenanceStep(step=MaintenanceStepType.CLEANUPSHARED)]
+        timings = self.maintenanceService.runMaintenance(steps=steps, savegamePath=self.savegamePath, dryrun=False, force=True)
+
+        self.assertTrue(existing.exists())
+        self.assertFalse(removed.exists())
+        self.assertFalse(dangling.exists())
+        # one timing per step, plus applying the db changes and the commit of the deletions
+        self.assertEqual(4, len(timings))
+        self.assertEqual(0, len(self.fileSystem.getPendingDeletePaths()))
+
+    def test_dryrunDoesNotDelete(self):
+        dangling = self.savegamePath.joinpath("Shared/99999999")
+        dangling.mkdir(parents=True)
+
+        steps = [MaintenanceStep(step=MaintenanceStepType.CLEANUPSHARED)]
+        self.maintenanceService.runMaintenance(steps=steps, savegamePath=self.savegamePath, dryrun=True)
+
+        self.assertTrue(dangling.exists())
+        self.assertEqual(0, len(self.fileSystem.getPendingDeletePaths()))
+        Path("esm-maintenance-deletes.lst").unlink(missing_ok=True)
+
+    def test_readStepsValidatesWipeSteps(self):
+        stepsFile = self.baseDir.joinpath("steps.yaml")
+        stepsFile.write_text("steps:\n  - step: cleanup-shared\n  - step: purge-empty-playfields\n    minage: 10\n")
+        steps = self.maintenanceService.readSteps(stepsFile)
+        self.assertEqual(2, len(steps))
+        self.assertEqual(MaintenanceStepType.PURGEEMPTYPLAYFIELDS, steps[1].step)
+        self.assertEqual(10, steps[1].minage)
+
+        stepsFile.write_text("steps:\n  - step: wipe\n    territory: GALAXY\n    wipetype: doesnotexist\n")
+        with self.assertRaises(WrongParameterError):
+            self.maintenanceService.readSteps(stepsFile)
@@ -0,0 +1,80 @@
+import logging
+import os
+import shutil
+import unittest
+from pathlib import Path
+
+from esm.EsmPackedMirror import EsmPackedMirror
+from TestTools import TestTools
+
+log = logging.getLogger(__name__)
+
+class test_EsmPackedMirror(unittest.TestCase):
+
+    def setUp(self):
+        self.baseDir, self.source = TestTools.createSavegameFixture("esm-packed-test-", "ram/EsmDediGame", repeat=100)
+        self.packedPath = self.baseDir.joinpath("mirror/EsmDediGame_Packed")
+        self.source.joinpath("Shared").mkdir()
+
+    def tearDown(self):
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+    def createPackedMirror(self, source=None):
+        # tiny packs, so a few changes make a pack worth compacting
+        return EsmPackedMirror(source=source, packedPath=self.packedPath, packSize=2000, compactionThreshold=0.5, threads=4)
+
+    def assertUnpackedEqualsSource(self, unpackedPath: Path):
+        sourceEntries = sorted(path.relative_to(self.source).as_posix() for path in self.source.rglob("*"))
+        unpackedEntries = sorted(path.relative_to(unpackedPath).as_posix() for path in unpackedPath.rglob("*"))
+        self.assertListEqual(sourceEntries, unpackedEntries)
+        for path in self.source.rglob("*"):
+            if path.is_file():
+                unpacked = unpackedPath.joinpath(path.relative_to(self.source))
+                self.assertEqual(path.read_bytes(), unpacked.read_bytes())
+                self.assertEqual(path.stat().st_mtime_ns, unpacked.stat().st_mtime_ns)
+
+    def test_syncAndUnpack(self):
+        stats = self.createPackedMirror(self.source).synchronize()
+        self.assertEqual(10, stats.copied)
+        self.assertEqual(0, stats.failed)
+        # 10 files with 800 bytes each in packs of 2000 bytes
+        self.assertEqual(4, len(self.createPackedMirror().listPacks()))
+
+        stats = self.createPackedMirror(self.source).synchronize()
+        self.assertEqual(0, stats.copied)
+
+        changed = self.source.joinpath("Playfields/Playfield1/terrain.dat")
+        changed.write_text("changed terrain")
+        os.utime(changed, ns=(changed.stat().st_atime_ns, changed.stat().st_mtime_ns + 1000000000))
+        shutil.rmtree(self.source.joinpath("Playfields/Playfield3"))
+        stats = self.createPackedMirror(self.source).synchronize()
+        self.assertEqual(1, stats.copied)
+        self.assertEqual(2, stats.deleted)
+
+        unpackedPath = self.baseDir.joinpath("unpacked")
+        stats = self.createPackedMirror().unpack(unpackedPath, verify=True)
+        self.assertEqual(9, stats.copied)
+        self.assertEqual(0, stats.failed)
+        self.assertUnpackedEqualsSource(unpackedPath)
+
+    def test_compaction(self):
+        self.createPackedMirror(self.source).synchronize()
+        packsBefore = self.createPackedMirror().listPacks()
+
+        # remove most of the content of the first pack
+        shutil.rmtree(self.source.joinpath("Playfields/Playfield0"))
+        shutil.rmtree(self.source.joinpath("Playfields/Playfield1"))
+        self.createPackedMirror(self.source).synchronize()
+
+        packsAfter = self.createPackedMirror().listPacks()
+        self.assertNotIn(packsBefore[0], packsAfter)
+        packedMirror = self.createPackedMirror()
+        packedMirror.index = packedMirror.readIndex()
+        for packNumber, (size, referenced) in packedMirror.getPackUsage().items():
+            if packNumber != max(packsAfter):
+                self.assertGreater(referenced / size, 0.5)
+
+        unpackedPath = self.baseDir.joinpath("unpacked")
+        stats = self.createPackedMirror().unpack(unpackedPath, verify=True)
+        self.assertEqual(0, stats.failed)
+        self.assertUnpackedEqualsSource(unpackedPath)
@@ -0,0 +1,95 @@
+import logging
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from esm.ConfigModels import MainConfig
+from esm.EsmFileSystem import EsmFileSystem
+from esm.EsmIoCoordinator import EsmIoCoordinator
+from esm.EsmPurgeJournal import EsmPurgeJournal
+from esm.EsmWipeService import EsmWipeService
+
+log = logging.getLogger(__name__)
+
+class test_EsmPurgeJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.baseDir = Path(tempfile.mkdtemp(prefix="esm-journal-test-"))
+        self.config = MainConfig.model_validate({"server": {"dedicatedYaml": "esm-dedicated.yaml"}, "paths": {"install": str(self.baseDir)}, "io": {"queueFolder": str(self.baseDir.joinpath("queue"))}})
+        self.fileSystem = EsmFileSystem()
+        self.fileSystem.config = self.config
+        self.fileSystem.ioCoordinator = EsmIoCoordinator()
+        self.fileSystem.ioCoordinator.config = self.config
+        self.fileSystem.clearPendingDeletePaths()
+
+    def tearDown(self):
+        self.fileSystem.clearPendingDeletePaths()
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+    def createFolders(self, amount):
+        folders = []
+        for i in range(amount):
+            folder = self.baseDir.joinpath(f"Shared/{i}")
+            folder.mkdir(parents=True)
+            folder.joinpath("ents.dat").write_text("data")
+            folders.append(folder)
+        return folders
+
+    def test_commitDeleteWritesJournal(self):
+        folders = self.createFolders(5)
+        journal = EsmPurgeJournal(self.baseDir.joinpath("test.journal"), batchSize=2)
+        for folder in folders:
+            self.fileSystem.markForDelete(folder)
+        self.fileSystem.commitDelete(override="yes", journal=journal)
+
+        journal = EsmPurgeJournal(self.baseDir.joinpath("test.journal"))
+        remaining = journal.read()
+        self.assertEqual(0, len(remaining))
+        self.assertTrue(journal.complete)
+        self.assertEqual(5, len(journal.planned))
+        self.assertEqual(5, len(journal.done))
+        self.assertFalse(journal.isUnfinished())
+
+    def test_readIgnoresTornLastLine(self):
+        journalPath = self.baseDir.joinpath("test.journal")
+        journalPath.write_text("P\t0\t/a/b/1\nP\t1\t/a/b/2\nP\t0\t/a/b/3\nD\t/a/b/1\nD\t/a/b/")
+        journal = EsmPurgeJournal(journalPath)
+        remaining = journal.read()
+        self.assertListEqual([(Path("/a/b/2"), True), (Path("/a/b/3"), False)], remaining)
+        self.assertTrue(journal.isUnfinished())
+
+    def test_resumeFinishesInterruptedPurge(self):
+        folders = self.createFolders(6)
+        journalPath = self.baseDir.joinpath("esm-cleanup-shared-folder.journal")
+
+        # simulate a purge that got interrupted after deleting the first two folders and flushing only one completion mark
+        lines = [f"P\t0\t{folder}\n" for folder in folders]
+        lines.append(f"D\t{folders[0]}\n")
+        journalPath.write_text("".join(lines))
+        shutil.rmtree(folders[0])
+        shutil.rmtree(folders[1])
+
+        wipeService = EsmWipeService()
+        wipeService.config = self.config
+        wipeService.fileSystem = self.fileSystem
+        wipeService.getPurgeJournal = lambda name: EsmPurgeJournal(self.baseDir.joinpath(f"esm-{name}.journal"))
+        wipeService.resumePurge(EsmWipeService.CLEANUPSHAREDFOLDERJOURNAL, force=True)
+
+        for folder in folders:
+            self.assertFalse(folder.exists())
+        journal = EsmPurgeJournal(journalPath)
+        self.assertEqual(0, len(journal.read()))
+        self.assertTrue(journal.complete)
+
+    def test_resetKeepsOldJournalUntilBegin(self):
+        journalPath = self.baseDir.joinpath("test.journal")
+        journalPath.write_text("P\t0\t/a/b/1\n")
+        journal = EsmPurgeJournal(journalPath)
+        journal.reset()
+        self.assertTrue(journal.isUnfinished())
+
+        journal.reset()
+        journal.begin([(Path("/a/b/2"), False)])
+        journal.close()
+        self.assertListEqual([(Path("/a/b/2"), False)], EsmPurgeJournal(journalPath).read())
@@ -0,0 +1,69 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from esm.ConfigModels import MainConfig
+from esm.EsmRamdiskBackend import OsfMountBackend, TmpfsBackend, createRamdiskBackend
+from esm.FsTools import FsTools
+
+log = logging.getLogger(__name__)
+
+class test_EsmRamdiskBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.baseDir = Path(tempfile.mkdtemp(prefix="esm-backend-test-"))
+
+    def tearDown(self):
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+    def test_backendSelection(self):
+        config = MainConfig.model_validate({"server": {"dedicatedYaml": "esm-dedicated.yaml"}, "paths": {"install": str(self.baseDir)}, "ramdisk": {"drive": "/mnt/esm-ramdisk", "tmpfsHugePages": "within_size"}})
+        backend = createRamdiskBackend(config)
+        if sys.platform == "win32":
+            self.assertIsInstance(backend, OsfMountBackend)
+        else:
+            self.assertIsInstance(backend, TmpfsBackend)
+            self.assertEqual("size=2147483648,mode=0755,huge=within_size", backend.getMountOptions(config.ramdisk.size))
+
+        config.ramdisk.backend = "osfmount"
+        self.assertIsInstance(createRamdiskBackend(config), OsfMountBackend)
+
+        # a plain directory is not a mounted tmpfs, not even for the simple check
+        self.assertFalse(TmpfsBackend().isMounted(self.baseDir, simpleCheck=True))
+
+    @unittest.skipIf(sys.platform == "win32", "robocopy and junctions are used on windows")
+    def test_portableTreeOperations(self):
+        ramdisk = self.baseDir.joinpath("ramdisk/EsmDediGame")
+        ramdisk.mkdir(parents=True)
+        link = self.baseDir.joinpath("Saves/Games/EsmDediGame")
+        link.parent.mkdir(parents=True)
+        self.assertTrue(FsTools.createLink(link, ramdisk))
+        self.assertTrue(FsTools.isHardLink(link))
+        self.assertEqual(ramdisk.resolve(), FsTools.getLinkTarget(link))
+
+        mirror = self.baseDir.joinpath("Saves/GamesMirror/EsmDediGame_Mirror")
+        mirror.joinpath("Playfields/Playfield1").mkdir(parents=True)
+        mirror.joinpath("Playfields/Playfield1/terrain.dat").write_text("terrain")
+        mirror.joinpath("global.db").write_text("db")
+
+        # the mirror to ram sync copies through the link
+        FsTools.mirrorTree(mirror, link)
+        self.assertEqual("terrain", ramdisk.joinpath("Playfields/Playfield1/terrain.dat").read_text())
+
+        # and the ram to mirror sync removes what vanished
+        shutil.rmtree(ramdisk.joinpath("Playfields/Playfield1"))
+        ramdisk.joinpath("Playfields/Playfield2").mkdir()
+        FsTools.mirrorTree(link, mirror)
+        self.assertFalse(mirror.joinpath("Playfields/Playfield1").exists())
+        self.assertTrue(mirror.joinpath("Playfields/Playfield2").is_dir())
+
+        # uninstall moves the mirror back in place of the link
+        FsTools.deleteLink(link)
+        FsTools.moveTree(mirror, link)
+        self.assertFalse(mirror.exists())
+        self.assertFalse(FsTools.isHardLink(link))
+        self.assertEqual("db", link.joinpath("global.db").read_text())
@@ -0,0 +1,69 @@
+import logging
+import os
+import shutil
+import unittest
+from pathlib import Path
+
+from esm.EsmReplicator import EsmReplicator
+from TestTools import TestTools
+
+log = logging.getLogger(__name__)
+
+class test_EsmReplicator(unittest.TestCase):
+
+    def setUp(self):
+        self.baseDir, savegame = TestTools.createSavegameFixture("esm-replication-test-", "rollingMirrorBackup1/Saves/Games/EsmDediGame", repeat=100)
+        self.backup = self.baseDir.joinpath("rollingMirrorBackup1")
+        savegame.joinpath("global.db").write_bytes(os.urandom(3 * 1024 * 1024))
+        self.target = self.baseDir.joinpath("offsite")
+
+    def tearDown(self):
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+    def createReplicator(self, source):
+        return EsmReplicator(source=source, destination=self.target, manifestPath=self.baseDir.joinpath("replication.manifest"),
+                             checkpointPath=self.baseDir.joinpath("replication.checkpoint"), threads=2)
+
+    def assertTargetEquals(self, source):
+        expected = {path.relative_to(source).as_posix(): (path.read_bytes() if path.is_file() else None) for path in source.rglob("*")}
+        actual = {path.relative_to(self.target).as_posix(): (path.read_bytes() if path.is_file() else None) for path in self.target.rglob("*")}
+        self.assertDictEqual(expected, actual)
+
+    def test_replicateOnlyChanges(self):
+        stats = self.createReplicator(self.backup).synchronize()
+        self.assertEqual(11, stats.copied)
+        self.assertEqual(stats.copiedBytes, stats.transferredBytes)
+        self.assertTargetEquals(self.backup)
+
+        # the next backup is in another folder, with one changed and one deleted file
+        nextBackup = self.baseDir.joinpath("rollingMirrorBackup2")
+        shutil.copytree(self.backup, nextBackup)
+        nextBackup.joinpath("Saves/Games/EsmDediGame/Playfields/Playfield1/terrain.dat").write_text("changed")
+        shutil.rmtree(nextBackup.joinpath("Saves/Games/EsmDediGame/Playfields/Playfield2"))
+        stats = self.createReplicator(nextBackup).synchronize()
+        self.assertEqual(1, stats.copied)
+        self.assertEqual(len("changed"), stats.transferredBytes)
+        self.assertTargetEquals(nextBackup)
+
+    def test_resumeInterruptedTransfer(self):
+        replicator = self.createReplicator(self.backup)
+        replicator.CHECKPOINTINTERVAL = 1024 * 1024
+        # interrupt the transfer of the database after two checkpoints
+        original = replicator.saveProgress
+        def interrupt(relativePath, progress):
+            original(relativePath, progress)
+            if progress is not None and progress[2] >= 2 * 1024 * 1024:
+                raise KeyboardInterrupt()
+        replicator.saveProgress = interrupt
+        with self.assertRaises(KeyboardInterrupt):
+            replicator.synchronize()
+        self.assertTrue(self.target.joinpath("Saves/Games/EsmDediGame/global.db.esm-partial").exists())
+        self.assertFalse(self.target.joinpath("Saves/Games/EsmDediGame/global.db").exists())
+
+        stats = self.createReplicator(self.backup).synchronize()
+        self.assertEqual(1, stats.resumed)
+        # the other files were done already, only the rest of the database is transferred
+        self.assertEqual(1, stats.copied)
+        self.assertEqual(1024 * 1024, stats.transferredBytes)
+        self.assertTargetEquals(self.backup)
+        self.assertFalse(self.baseDir.joinpath("replication.checkpoint").exists())
@@ -0,0 +1,122 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+
+from esm.EsmArchiver import EsmArchiver
+from esm.EsmDifferentialBackup import createStaticArchive
+from esm.EsmPackedMirror import EsmPackedMirror
+from esm.EsmSelectiveRestore import EsmSelectiveRestore, FolderRestoreSource, PackedRestoreSource, RestoreSelection, ZipRestoreSource
+from esm.exceptions import BackupFailedError, WrongParameterError
+
+log = logging.getLogger(__name__)
+
+class test_EsmSelectiveRestore(unittest.TestCase):
+
+    PREFIX = "Saves/Games/EsmDediGame/"
+
+    def setUp(self):
+        self.baseDir = Path(tempfile.mkdtemp(prefix="esm-restore-test-"))
+        self.backup = self.baseDir.joinpath("rollingMirrorBackup1")
+        self.backupSavegame = self.backup.joinpath(self.PREFIX)
+        for i in range(5):
+            for folder in ["Playfields", "Templates"]:
+                playfield = self.backupSavegame.joinpath(f"{folder}/Playfield{i}")
+                playfield.mkdir(parents=True)
+                playfield.joinpath("terrain.dat").write_text(f"backup {folder} {i}")
+            self.backupSavegame.joinpath(f"Shared/{1000 + i}").mkdir(parents=True)
+            self.backupSavegame.joinpath(f"Shared/{1000 + i}/ents.dat").write_text(f"backup entity {i}")
+        self.backupSavegame.joinpath("global.db").write_text("backup db")
+        self.savegame = self.baseDir.joinpath("Savegame")
+        shutil.copytree(self.backupSavegame, self.savegame)
+        for path in self.savegame.rglob("*"):
+            if path.is_file():
+                path.write_text("current")
+        self.savegame.joinpath("Playfields/Playfield1/broken.dat").write_text("broken")
+        self.savegame.joinpath("global.db-wal").write_text("current wal")
+
+    def tearDown(self):
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+    def createSelection(self):
+        return RestoreSelection(playfields=["Playfield1", "Missing"], entities=["1002"], database=True)
+
+    def assertRestored(self, source):
+        selection = self.createSelection()
+        plan = {entry.unit: entry for entry in EsmSelectiveRestore(source, selection, self.savegame).plan()}
+        self.assertEqual(1, plan["Playfields/Playfield1"].files)
+        self.assertFalse(plan["Playfields/Missing"].inBackup)
+        self.assertEqual("current", self.savegame.joinpath("global.db").read_text())
+
+        stats = EsmSelectiveRestore(source, selection, self.savegame).restore()
+        self.assertEqual(0, stats.failed)
+        self.assertEqual(4, stats.copied)
+        self.assertEqual("backup Playfields 1", self.savegame.joinpath("Playfields/Playfield1/terrain.dat").read_text())
+        self.assertFalse(self.savegame.joinpath("Playfields/Playfield1/broken.dat").exists())
+        self.assertEqual("backup Templates 1", self.savegame.joinpath("Templates/Playfield1/terrain.dat").read_text())
+        self.assertEqual("backup entity 2", self.savegame.joinpath("Shared/1002/ents.dat").read_text())
+        self.assertEqual("backup db", self.savegame.joinpath("global.db").read_text())
+        # the journal of the current database must not be applied to the restored one
+        self.assertFalse(self.savegame.joinpath("global.db-wal").exists())
+        # everything else is left as it is
+        self.assertEqual("current", self.savegame.joinpath("Playfields/Playfield2/terrain.dat").read_text())
+        self.assertEqual("current", self.savegame.joinpath("Shared/1001/ents.dat").read_text())
+        self.assertFalse(self.baseDir.joinpath("Savegame.esm-restore").exists())
+
+    def test_restoreFromFolder(self):
+        self.assertRestored(FolderRestoreSource(self.backupSavegame))
+
+    def test_restoreFromPackedMirror(self):
+        packedPath = self.baseDir.joinpath("packed")
+        EsmPackedMirror(source=self.backupSavegame, packedPath=packedPath).synchronize()
+        self.assertRestored(PackedRestoreSource(packedPath))
+
+    def test_restoreFromBackupOfPackedMirror(self):
+        packedPath = self.baseDir.joinpath("packed")
+        EsmPackedMirror(source=self.backupSavegame, packedPath=packedPath).synchronize()
+        # a deduplicated backup that shares its files with an older one, and has a file the mirror doesn't have
+        olderSavegame = self.baseDir.joinpath("rollingMirrorBackup2").joinpath(self.PREFIX)
+        shutil.copytree(self.backupSavegame, olderSavegame)
+        olderTerrain = olderSavegame.joinpath("Playfields/Playfield1/terrain.dat")
+        olderTerrain.write_text("older")
+        backupSavegame = self.baseDir.joinpath("rollingMirrorBackup3").joinpath(self.PREFIX)
+        backupSavegame.joinpath("Playfields/Playfield1").mkdir(parents=True)
+        os.link(olderTerrain, backupSavegame.joinpath("Playfields/Playfield1/terrain.dat"))
+        backupSavegame.joinpath("stale.dat").write_text("stale")
+
+        stats = EsmPackedMirror(source=None, packedPath=packedPath).unpack(backupSavegame, verify=True, replace=True)
+        self.assertEqual(0, stats.failed)
+        self.assertEqual("older", olderTerrain.read_text())
+        self.assertFalse(backupSavegame.joinpath("stale.dat").exists())
+        self.assertRestored(FolderRestoreSource(backupSavegame))
+
+    def test_restoreFromZips(self):
+        zipPath = self.baseDir.joinpath("20231001_000000_EsmDediGame.zip")
+        EsmArchiver(threads=2, volumes=True).createArchive(self.backup, zipPath)
+        volume = self.baseDir.joinpath("20231001_000000_EsmDediGame.Saves.zip")
+        self.assertRestored(ZipRestoreSource.fromZips([zipPath, volume], self.PREFIX))
+
+    def test_restoreFromManifest(self):
+        stats, manifest = createStaticArchive(EsmArchiver(threads=2), self.backup, self.baseDir.joinpath("20231001_000000_EsmDediGame.zip"))
+        self.assertRestored(ZipRestoreSource.fromManifest(manifest, self.PREFIX))
+
+    def test_brokenBackupLeavesSavegameUntouched(self):
+        zipPath = self.baseDir.joinpath("broken.zip")
+        with zipfile.ZipFile(zipPath, "w") as zip:
+            zip.writestr(f"{self.PREFIX}Playfields/Playfield1/terrain.dat", "backup")
+        source = ZipRestoreSource.fromZips([zipPath], self.PREFIX)
+        # a member that is listed in the central directory but can't be read
+        source.members["Playfields/Playfield1/other.dat"] = (zipPath, f"{self.PREFIX}Playfields/Playfield1/other.dat", 5, 0, None)
+        with self.assertRaises(BackupFailedError):
+            EsmSelectiveRestore(source, self.createSelection(), self.savegame).restore()
+        self.assertEqual("broken", self.savegame.joinpath("Playfields/Playfield1/broken.dat").read_text())
+        self.assertFalse(self.baseDir.joinpath("Savegame.esm-restore").exists())
+
+    def test_invalidNames(self):
+        with self.assertRaises(WrongParameterError):
+            RestoreSelection(playfields=["../Shared"])
+        with self.assertRaises(WrongParameterError):
+            RestoreSelection(entities=[".."])
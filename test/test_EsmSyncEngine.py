@@ -0,0 +1,158 @@
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from esm.EsmSyncEngine import EsmSyncEngine
+from TestTools import TestTools
+
+log = logging.getLogger(__name__)
+
+class test_EsmSyncEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.baseDir, self.source = TestTools.createSavegameFixture("esm-sync-test-", "ram/EsmDediGame")
+        self.destination = self.baseDir.joinpath("mirror/EsmDediGame_Mirror")
+        self.manifestPath = self.baseDir.joinpath("mirror/EsmDediGame_Mirror.esm-sync-manifest")
+        self.source.joinpath("Shared").mkdir()
+        self.source.joinpath("global.db").write_text("db")
+
+    def tearDown(self):
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+    def createEngine(self):
+        return EsmSyncEngine(source=self.source, destination=self.destination, manifestPath=self.manifestPath, threads=4)
+
+    def assertTreesEqual(self, first: Path, second: Path):
+        firstEntries = sorted(path.relative_to(first).as_posix() for path in first.rglob("*"))
+        secondEntries = sorted(path.relative_to(second).as_posix() for path in second.rglob("*"))
+        self.assertListEqual(firstEntries, secondEntries)
+
+    def test_initialSyncCopiesEverything(self):
+        stats = self.createEngine().synchronize()
+        # 10 playfield folders with a file each, Playfields, Shared and the db
+        self.assertEqual(23, stats.scanned)
+        self.assertEqual(11, stats.copied)
+        self.assertEqual(0, stats.deleted)
+        self.assertEqual(0, stats.failed)
+        self.assertTreesEqual(self.source, self.destination)
+        self.assertTrue(self.manifestPath.exists())
+
+        stats = self.createEngine().synchronize()
+        self.assertEqual(0, stats.copied)
+        self.assertEqual(0, stats.deleted)
+
+    def test_lowPriorityKeepsTheCallersPriority(self):
+        lowered = []
+        with mock.patch("esm.EsmSyncEngine.lowerThreadPriority", lambda: lowered.append(threading.current_thread())):
+            engine = EsmSyncEngine(source=self.source, destination=self.destination, manifestPath=self.manifestPath, threads=4, lowPriority=True)
+            stats = engine.synchronize()
+        self.assertEqual(11, stats.copied)
+        self.assertTreesEqual(self.source, self.destination)
+        self.assertGreater(len(lowered), 0)
+        self.assertNotIn(threading.current_thread(), lowered)
+
+    def test_incrementalSyncUsesManifest(self):
+        self.createEngine().synchronize()
+
+        changed = self.source.joinpath("Playfields/Playfield1/terrain.dat")
+        changed.write_text("changed terrain")
+        os.utime(changed, ns=(changed.stat().st_atime_ns, changed.stat().st_mtime_ns + 1000000000))
+        self.source.joinpath("Playfields/Playfield2/new.dat").write_text("new")
+        shutil.rmtree(self.source.joinpath("Playfields/Playfield3"))
+        self.source.joinpath("global.db").unlink()
+        # the manifest is the truth for the destination, so changes to the destination itself are not noticed
+        self.destination.joinpath("Playfields/Playfield4/terrain.dat").write_text("tampered")
+
+        stats = self.createEngine().synchronize()
+        self.assertEqual(2, stats.copied)
+        # the playfield folder, its file and the db
+        self.assertEqual(3, stats.deleted)
+        self.assertTreesEqual(self.source, self.destination)
+        self.assertEqual("changed terrain", self.destination.joinpath("Playfields/Playfield1/terrain.dat").read_text())
+        self.assertEqual("tampered", self.destination.joinpath("Playfields/Playfield4/terrain.dat").read_text())
+
+        # a full scan compares with the destination instead
+        stats = self.createEngine().synchronize(fullScan=True)
+        self.assertEqual(1, stats.copied)
+        self.assertEqual("terrain4", self.destination.joinpath("Playfields/Playfield4/terrain.dat").read_text())
+
+    def test_syncSticksToTheBudget(self):
+        for i in range(10):
+            self.source.joinpath(f"Playfields/Playfield{i}/terrain.dat").write_text("x" * 1000)
+        engine = EsmSyncEngine(source=self.source, destination=self.destination, manifestPath=self.manifestPath, threads=4, bytesPerSecond=5000)
+        stats = engine.synchronize()
+        # 10002 bytes with a burst of 5000 bytes
+        self.assertGreaterEqual(stats.elapsedTime.total_seconds(), 0.9)
+        self.assertGreater(stats.throttledTime.total_seconds(), 0)
+        self.assertTreesEqual(self.source, self.destination)
+        self.assertEqual("x" * 1000, self.destination.joinpath("Playfields/Playfield0/terrain.dat").read_text())
+
+        self.source.joinpath("Playfields/Playfield0/terrain.dat").unlink()
+        self.source.joinpath("Playfields/Playfield1/terrain.dat").unlink()
+        self.source.joinpath("Playfields/Playfield2/terrain.dat").unlink()
+        engine = EsmSyncEngine(source=self.source, destination=self.destination, manifestPath=self.manifestPath, threads=4, filesPerSecond=20)
+        engine.filesBucket.tokens = 0
+        stats = engine.synchronize()
+        self.assertEqual(3, stats.deleted)
+        self.assertGreaterEqual(stats.elapsedTime.total_seconds(), 0.1)
+
+    def test_priorityPathsAreCopiedFirst(self):
+        readyEvent = threading.Event()
+        engine = EsmSyncEngine(source=self.source, destination=self.destination, manifestPath=self.manifestPath, threads=1,
+                               priorityPaths=["global.db", "Playfields/Playfield7", "Playfields/Playfield3"], readyEvent=readyEvent)
+        copied = []
+        copyFile = engine.copyFile
+        def recordingCopyFile(relativePath):
+            if len(copied) == 3:
+                self.assertTrue(readyEvent.is_set())
+            copied.append(relativePath)
+            return copyFile(relativePath)
+        engine.copyFile = recordingCopyFile
+
+        stats = engine.synchronize()
+        self.assertEqual(["global.db", "Playfields/Playfield7/terrain.dat", "Playfields/Playfield3/terrain.dat"], copied[:3])
+        self.assertEqual(11, len(copied))
+        self.assertIsNotNone(stats.timeToReady)
+        self.assertLessEqual(stats.timeToReady, stats.elapsedTime)
+        self.assertTreesEqual(self.source, self.destination)
+
+    def test_typeChangesAreMirrored(self):
+        self.createEngine().synchronize()
+
+        shutil.rmtree(self.source.joinpath("Shared"))
+        self.source.joinpath("Shared").write_text("now a file")
+        shutil.rmtree(self.source.joinpath("Playfields/Playfield0"))
+        self.source.joinpath("Playfields/Playfield0").mkdir()
+        self.source.joinpath("global.db").unlink()
+        self.source.joinpath("global.db").mkdir()
+
+        self.createEngine().synchronize()
+        self.assertTreesEqual(self.source, self.destination)
+        self.assertTrue(self.destination.joinpath("Shared").is_file())
+        self.assertTrue(self.destination.joinpath("global.db").is_dir())
+
+    def test_databaseIsCaptured(self):
+        shutil.copy(Path("test/test.db"), self.source.joinpath("global.db"))
+        # a leftover wal file in the mirror would not fit the captured database
+        self.destination.mkdir(parents=True)
+        self.destination.joinpath("global.db-wal").write_text("stale")
+
+        engine = EsmSyncEngine(source=self.source, destination=self.destination, manifestPath=self.manifestPath, threads=4,
+                               databaseFiles=["global.db"], databaseQuickCheckProbability=1)
+        stats = engine.synchronize()
+        self.assertEqual(0, stats.failed)
+        self.assertEqual(120, stats.databasePages)
+        self.assertTrue(stats.databaseChecked)
+        self.assertFalse(self.destination.joinpath("global.db-wal").exists())
+
+        connection = sqlite3.connect(self.destination.joinpath("global.db"))
+        try:
+            self.assertEqual("ok", connection.execute("PRAGMA quick_check").fetchone()[0])
+            self.assertGreater(connection.execute("SELECT COUNT(*) FROM Playfields").fetchone()[0], 0)
+        finally:
+            connection.close()
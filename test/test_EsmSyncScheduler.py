@@ -0,0 +1,113 @@
+import logging
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from esm.ConfigModels import ConfigRamdisk
+from esm.EsmSyncScheduler import GameLogSaveDetector, SyncReason, SyncScheduler
+
+log = logging.getLogger(__name__)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class test_EsmSyncScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.baseDir = Path(tempfile.mkdtemp(prefix="esm-scheduler-test-"))
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+    def test_stalenessAndChangeVolume(self):
+        changes = {"count": 0}
+        scheduler = SyncScheduler(maxStaleness=3600, minInterval=300, changeThreshold=100, countChanges=lambda: changes["count"], clock=self.clock)
+
+        self.clock.now += 100
+        changes["count"] = 150
+        # too early after the last sync for the change volume to count
+        self.assertIsNone(scheduler.poll())
+        nextSync = scheduler.getNextSync()
+        self.assertEqual(SyncReason.CHANGEVOLUME, nextSync.reason)
+        self.assertEqual(200, nextSync.dueIn)
+
+        self.clock.now += 200
+        self.assertEqual(SyncReason.CHANGEVOLUME, scheduler.poll())
+        scheduler.syncDone()
+        changes["count"] = 0
+
+        self.clock.now += 3599
+        self.assertIsNone(scheduler.poll())
+        self.clock.now += 1
+        self.assertEqual(SyncReason.STALENESS, scheduler.poll())
+
+    def test_saveEventAndDeferral(self):
+        logsPath = self.baseDir.joinpath("Logs")
+        logFile = logsPath.joinpath("4243/Dedicated_231017-190050-00.log")
+        logFile.parent.mkdir(parents=True)
+        logFile.write_text("old line about a SaveGame\n")
+        runningJobs = []
+        detector = GameLogSaveDetector(logsPath, r"(?i)\bsav(e|ed|ing) ?game\b", clock=self.clock)
+        scheduler = SyncScheduler(maxStaleness=3600, minInterval=0, saveDetector=detector, saveEventDelay=15, getRunningJobs=lambda: runningJobs, clock=self.clock)
+
+        # the save that happened before the detector was created does not count
+        self.assertIsNone(scheduler.poll())
+        with open(logFile, "a") as file:
+            file.write("12:00:00 player joined\n12:00:01 Saving game")
+        self.assertIsNone(scheduler.poll())
+        with open(logFile, "a") as file:
+            file.write(" done\n")
+        self.assertIsNone(scheduler.poll())
+        self.clock.now += 15
+
+        runningJobs.append("rolling backup")
+        self.assertIsNone(scheduler.poll())
+        nextSync = scheduler.getNextSync()
+        self.assertEqual(SyncReason.SAVEEVENT, nextSync.reason)
+        self.assertEqual(["rolling backup"], nextSync.deferredBy)
+
+        runningJobs.clear()
+        self.assertEqual(SyncReason.SAVEEVENT, scheduler.poll())
+        scheduler.syncDone()
+        self.assertIsNone(scheduler.poll())
+
+    def test_robocopyKeepsTheIntervalSchedule(self):
+        logsPath = self.baseDir.joinpath("Logs")
+        logFile = logsPath.joinpath("4243/Dedicated_231017-190050-00.log")
+        logFile.parent.mkdir(parents=True)
+        logFile.write_text("")
+        self.assertFalse(ConfigRamdisk().synchronizeOnSave)
+        # even with the save events enabled, a robocopy sync of the whole savegame is only done at the interval
+        settings = ConfigRamdisk(synchronizer="robocopy", synchronizeOnSave=True)
+        scheduler = SyncScheduler.fromConfig(settings, maxStaleness=3600, logsPath=logsPath, countChanges=lambda: 10000, clock=self.clock)
+        for _ in range(11):
+            with open(logFile, "a") as file:
+                file.write("Saving game\n")
+            self.clock.now += 300
+            self.assertIsNone(scheduler.poll())
+        self.clock.now += 300
+        self.assertEqual(SyncReason.STALENESS, scheduler.poll())
+
+        settings = ConfigRamdisk(synchronizer="native", synchronizeOnSave=True)
+        scheduler = SyncScheduler.fromConfig(settings, maxStaleness=3600, logsPath=logsPath, countChanges=lambda: 10000, clock=self.clock)
+        self.clock.now += 300
+        self.assertEqual(SyncReason.CHANGEVOLUME, scheduler.poll())
+
+    def test_stalenessIsNotDeferredForever(self):
+        scheduler = SyncScheduler(maxStaleness=3600, getRunningJobs=lambda: ["cache prune"], clock=self.clock)
+        self.clock.now += 3600
+        self.assertIsNone(scheduler.poll())
+        # the job never ends, but the mirror may be behind by twice the staleness at most
+        self.clock.now += 3599
+        self.assertIsNone(scheduler.poll())
+        self.clock.now += 1
+        self.assertEqual(SyncReason.STALENESS, scheduler.poll())
+        scheduler.syncDone()
+        self.clock.now += 3600
+        self.assertIsNone(scheduler.poll())
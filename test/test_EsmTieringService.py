@@ -0,0 +1,77 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from esm.ConfigModels import MainConfig
+from esm.EsmFileSystem import EsmFileSystem
+from esm.EsmTieringService import EsmTieringService
+from esm.FsTools import FsTools
+
+log = logging.getLogger(__name__)
+
+class test_EsmTieringService(unittest.TestCase):
+
+    def setUp(self):
+        self.baseDir = Path(tempfile.mkdtemp(prefix="esm-tiering-test-"))
+        self.savegamePath = self.baseDir.joinpath("Saves/Games/EsmDediGame")
+        self.coldTierPath = self.baseDir.joinpath("Saves/GamesMirror/EsmDediGame_ColdPlayfields")
+        self.savegamePath.mkdir(parents=True)
+        shutil.copy(Path("test/test.db"), self.savegamePath.joinpath("global.db"))
+
+        config = MainConfig.model_validate({"server": {"dedicatedYaml": "esm-dedicated.yaml"}, "paths": {"install": str(self.baseDir)}, "ramdisk": {"tieringColdAfterDays": 1}})
+        fileSystem = EsmFileSystem()
+        fileSystem.config = config
+        # junctions need windows, symlinks do the same job here
+        fileSystem.createHardLink = lambda linkPath, linkTargetPath: os.symlink(linkTargetPath, linkPath, target_is_directory=True) or True
+        self.tieringService = EsmTieringService()
+        self.tieringService.config = config
+        self.tieringService.fileSystem = fileSystem
+
+    def tearDown(self):
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+    def createPlayfield(self, parent: Path, name: str):
+        playfield = parent.joinpath(name)
+        playfield.mkdir(parents=True)
+        playfield.joinpath("terrain.dat").write_text("x" * 1000)
+        return playfield
+
+    def test_applyTieringDemotesAndPromotes(self):
+        playfieldsPath = self.savegamePath.joinpath("Playfields")
+        # visited recently and contains a player
+        haven = self.createPlayfield(playfieldsPath, "Haven")
+        # never visited
+        akua = self.createPlayfield(playfieldsPath, "Akua")
+        # visited recently, but was moved to the cold tier before
+        self.createPlayfield(self.coldTierPath, "Adech")
+        self.tieringService.relinkColdPlayfields(savegamePath=self.savegamePath, coldTierPath=self.coldTierPath)
+        adech = playfieldsPath.joinpath("Adech")
+        self.assertTrue(FsTools.isHardLink(adech))
+
+        demoted, promoted = self.tieringService.applyTiering(savegamePath=self.savegamePath, coldTierPath=self.coldTierPath, dryrun=True)
+        self.assertListEqual([akua], demoted)
+        self.assertListEqual([adech], promoted)
+        self.assertFalse(FsTools.isHardLink(akua))
+
+        self.tieringService.applyTiering(savegamePath=self.savegamePath, coldTierPath=self.coldTierPath, dryrun=False)
+        self.assertTrue(FsTools.isHardLink(akua))
+        self.assertEqual("x" * 1000, akua.joinpath("terrain.dat").read_text())
+        self.assertFalse(FsTools.isHardLink(adech))
+        self.assertTrue(adech.joinpath("terrain.dat").exists())
+        self.assertFalse(FsTools.isHardLink(haven))
+        self.assertListEqual(["Akua"], [entry.name for entry in self.coldTierPath.iterdir()])
+
+        hotSize, coldSize = self.tieringService.getTierSizes(playfieldsPath, self.coldTierPath)
+        self.assertEqual(2000, hotSize)
+        self.assertEqual(1000, coldSize)
+
+    def test_everythingIsColdWithoutVisits(self):
+        playfieldsPath = self.savegamePath.joinpath("Playfields")
+        self.createPlayfield(playfieldsPath, "Akua")
+        self.createPlayfield(playfieldsPath, "Omicron")
+        demote, promote = self.tieringService.planTiering(playfieldsPath, hotPlayfields=set())
+        self.assertListEqual(["Akua", "Omicron"], [path.name for path in demote])
+        self.assertEqual(0, len(promote))
@@ -0,0 +1,93 @@
+import logging
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from threading import Event
+
+from esm.ConfigModels import MainConfig
+from esm.EsmTrashService import EsmTrashService
+from esm.exceptions import SafetyException
+
+log = logging.getLogger(__name__)
+
+class test_EsmTrashService(unittest.TestCase):
+
+    def setUp(self):
+        self.installDir = Path(tempfile.mkdtemp(prefix="esm-trash-test-"))
+        self.trashService = EsmTrashService()
+        self.trashService.config = MainConfig.model_validate({
+            "server": {"dedicatedYaml": "esm-dedicated.yaml"},
+            "paths": {"install": str(self.installDir)},
+            "general": {"useRamdisk": False}
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.installDir, ignore_errors=True)
+
+    def createSavegameFixture(self, amount=10):
+        savegame = self.installDir.joinpath("Saves/Games/EsmDediGame")
+        for i in range(amount):
+            playfield = savegame.joinpath(f"Playfields/Playfield{i}")
+            playfield.mkdir(parents=True)
+            playfield.joinpath("terrain.dat").write_text("terrain")
+        return savegame
+
+    def test_moveToTrashIsReclaimed(self):
+        savegame = self.createSavegameFixture()
+
+        self.assertTrue(self.trashService.moveToTrash(savegame))
+        self.assertFalse(savegame.exists())
+
+        trashFolder = self.trashService.getInstallTrashFolder()
+        self.assertEqual(1, len(list(trashFolder.iterdir())))
+
+        # 10 files, 10 playfield folders, the playfields folder and the savegame folder
+        deleted, elapsedTime = self.trashService.reclaim(rate=0)
+        self.assertEqual(22, deleted)
+        self.assertEqual(0, len(list(trashFolder.iterdir())))
+
+    def test_reclaimResumesAfterInterruption(self):
+        savegame = self.createSavegameFixture(amount=200)
+        self.trashService.moveToTrash(savegame)
+
+        # simulate a shutdown (or crash) in the middle of the reclaim
+        event = Event()
+        event.set()
+        deleted, elapsedTime = self.trashService.reclaim(rate=0, event=event)
+        self.assertEqual(0, deleted)
+
+        # a fresh reclaimer just picks up whatever is left in the trash
+        deleted, elapsedTime = self.trashService.reclaim(rate=0)
+        self.assertEqual(402, deleted)
+        self.assertEqual(0, len(list(self.trashService.getInstallTrashFolder().iterdir())))
+
+    def test_reclaimIsThrottled(self):
+        savegame = self.createSavegameFixture(amount=100)
+        self.trashService.moveToTrash(savegame)
+
+        deleted, elapsedTime = self.trashService.reclaim(rate=1000)
+        self.assertEqual(202, deleted)
+        self.assertGreaterEqual(elapsedTime.total_seconds(), 0.2)
+
+    def test_reclaimIsThrottledByBandwidth(self):
+        savegame = self.createSavegameFixture(amount=40)
+        for terrain in savegame.rglob("terrain.dat"):
+            terrain.write_bytes(b"x" * 10000)
+        self.trashService.moveToTrash(savegame)
+
+        # 400 KB at 200 KB/s, minus the second worth of bytes that is available right away
+        deleted, elapsedTime = self.trashService.reclaim(rate=0, bytesPerSecond=200000)
+        self.assertEqual(82, deleted)
+        self.assertGreaterEqual(elapsedTime.total_seconds(), 0.9)
+
+    def test_moveToTrashRefusesTrashParents(self):
+        self.trashService.getInstallTrashFolder().mkdir(parents=True)
+        self.assertFalse(self.trashService.moveToTrash(self.installDir))
+        self.assertTrue(self.installDir.exists())
+
+    def test_reclaimRefusesOtherFolders(self):
+        savegame = self.createSavegameFixture(amount=1)
+        with self.assertRaises(SafetyException):
+            self.trashService.reclaim(trashFolders=[savegame], rate=0)
+        self.assertTrue(savegame.exists())
@@ -58,3 +58,18 @@ class test_Tools(unittest.TestCase):
         self.assertEqual(len(parts), 2)
         self.assertEqual(parts[0], "Hello, how are you? This is a very long sentence that should be split in at least two parts, and...")
         self.assertEqual(parts[1], "the first part should have an ellipsis.")
+
+    def test_tokenBucket(self):
+        bucket = Tools.TokenBucket(rate=100, capacity=10)
+        # the first 10 are for free, the next 10 need 0.1s
+        with Tools.Timer() as timer:
+            waited = sum(bucket.consume(1) for i in range(20))
+        self.assertGreaterEqual(timer.elapsedTime.total_seconds(), 0.09)
+        self.assertGreater(waited, 0)
+
+        # amounts larger than the capacity are booked as debt
+        bucket = Tools.TokenBucket(rate=100, capacity=10)
+        self.assertAlmostEqual(0.2, bucket.consume(30), delta=0.01)
+
+        unlimited = Tools.TokenBucket(rate=0)
+        self.assertEqual(0, unlimited.consume(1000000))